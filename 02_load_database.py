@@ -1,8 +1,28 @@
 # -*- coding: utf-8 -*-
+import argparse
+
 from database_loader.loader import load_database
+from database_loader.profiling import DEFAULT_PROFILE_MODE, PROFILE_MODES
+from database_loader.watcher import IngestDaemon
 
 if __name__ == '__main__':
 
+    # Command line options
+    parser = argparse.ArgumentParser(description="Load the raw data into the database")
+    parser.add_argument("--profile", metavar="FOLDER", default=None,
+                        help="profile the load, writing a profile per table to FOLDER")
+    parser.add_argument("--profile-tables", metavar="TABLE", nargs="+", default=None,
+                        help="only profile these tables (default: all tables)")
+    parser.add_argument("--profile-mode", choices=PROFILE_MODES, default=DEFAULT_PROFILE_MODE,
+                        help="profile with cProfile (a pstats file per table) or by sampling the stacks of all of the "
+                             "threads (a collapsed-stack file per table) (default: %(default)s)")
+    parser.add_argument("--resume", action="store_true",
+                        help="resume an interrupted load from the last committed batch (MariaDB backend)")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running, loading the new files in the raw data folder as they are written "
+                             "(MariaDB backend)")
+    args = parser.parse_args()
+
     # Location where the raw-data is to be stored
     raw_data_path = "../raw-data/"
 
@@ -21,5 +41,98 @@ if __name__ == '__main__':
                  "password": "pass",
                  "database-name": "comet"}
 
-    # Load the SQL database
-    load_database(raw_data_path, delimiter, encapsulator, encoding, true_values, false_values, db_params)
+    # Database backend ('mariadb', 'postgresql' or 'parquet')
+    # For the 'parquet' backend db_params holds {"output-path": ..., "row-group-size": ...}
+    backend = "mariadb"
+
+    # Optional metrics outputs (JSON report and Prometheus text file)
+    metrics_path = None
+    prometheus_path = None
+
+    # Number of rows per INSERT statement and transaction, and whether to record the progress after each batch
+    batch_size = 1000
+    checkpoint = True
+
+    # Size the SQL types (e.g. TINYINT, VARCHAR(n), DATE) from the statistics of each column?
+    narrow_types = False
+
+    # Extended type inference of dates, datetimes and decimals (None for int, float, boolean and string only)
+    inference_params = {"date-formats": ["%Y-%m-%d", "%d/%m/%Y"],
+                        "datetime-formats": ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"],
+                        "decimals": True}
+
+    # Merge the tables sharing the 'id' column into a single wide table (None to load each table as is)
+    # The generated files are sorted by id, so they can be merged without sorting them first
+    assembly_params = None
+
+    # Remove the duplicate rows of each table before inserting them, e.g. {"key": ["id"], "sorted": True}
+    # (None to load every row; not supported with checkpointing)
+    dedup_params = None
+
+    # Memory budget of the load, e.g. "2G" (None to only monitor the memory use)
+    memory_limit = None
+
+    # Only log exceeding the memory budget instead of failing the load
+    soft_memory_limit = False
+
+    # Quarantine the rows that can't be loaded in a per-table reject file, failing the load if more than the maximum
+    # fraction of the rows are rejected, e.g. {"path": "./rejects/", "max-error-rate": 0.01} (None to fail on the
+    # first bad row)
+    reject_params = None
+
+    # How to find the files to load, e.g. {"recursive": True, "table-name-from": "folder", "exclude": ["*/tmp/*"]} or
+    # {"manifest": "../raw-data/manifest.txt"} (None to list the CSV files in raw_data_path)
+    discovery_params = None
+
+    # Columns to load from every table, e.g. {"exclude": ["reason"]} to skip a bulky free-text field or
+    # {"include": ["id", "alive"]} (None to load all of the columns)
+    column_params = None
+
+    # Cache the inferred schema of each file, so that reloading the unchanged files skips the schema inference, e.g.
+    # {"path": "./parse-cache/"} (None to infer the schemas every time)
+    cache_params = None
+
+    # Partition the tables on a column and insert into the partitions with parallel writers (MariaDB), e.g.
+    # {"column": "id", "method": "hash", "partitions": 8, "writers": 4} or {"column": "id", "method": "range",
+    # "bounds": [10000, 20000]} (None for unpartitioned tables; not supported with checkpointing)
+    partition_params = None
+
+    # Merge the rows into the existing tables by a key column instead of reloading them, e.g. {"key": ["id"]} to apply
+    # a corrected extract (None to drop and reload the tables)
+    merge_params = None
+
+    # Adapt the batch size (and the number of active partition writers) of each table to the measured throughput,
+    # starting from batch_size, e.g. {"max-batch-size": 20000, "target-latency": 1.0} (None to keep batch_size)
+    tune_params = None
+
+    # Profile the columns of each table in the schema inference pass (NULLs, distinct values, value ranges and lengths)
+    # and write a JSON profile per table, e.g. {"path": "./column-profiles/"} (None not to profile the columns)
+    column_profile_params = None
+
+    # Write the log records from a background thread during the load?
+    async_logging = False
+
+    # Seconds between scans of the raw data folder and seconds a file must be unchanged before it is loaded (--watch)
+    poll_interval = 2.0
+    settle_seconds = 5.0
+
+    if args.watch:
+        daemon = IngestDaemon(raw_data_path, delimiter, encapsulator, encoding, true_values, false_values, db_params,
+                              poll_interval, settle_seconds, batch_size, inference_params, reject_params,
+                              column_params=column_params)
+        try:
+            daemon.run()
+        except KeyboardInterrupt:
+            daemon.close()
+    else:
+        # Load the SQL database
+        load_database(raw_data_path, delimiter, encapsulator, encoding, true_values, false_values, db_params,
+                      backend=backend, metrics_path=metrics_path, prometheus_path=prometheus_path,
+                      async_logging=async_logging, profile_path=args.profile, profile_tables=args.profile_tables,
+                      profile_mode=args.profile_mode, batch_size=batch_size, checkpoint=checkpoint, resume=args.resume,
+                      narrow_types=narrow_types,
+                      inference_params=inference_params, assembly_params=assembly_params,
+                      dedup_params=dedup_params, memory_limit=memory_limit, reject_params=reject_params,
+                      discovery_params=discovery_params, column_params=column_params, cache_params=cache_params,
+                      partition_params=partition_params, merge_params=merge_params, tune_params=tune_params,
+                      column_profile_params=column_profile_params, soft_memory_limit=soft_memory_limit)
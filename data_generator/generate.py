@@ -28,11 +28,11 @@ def remove_csv_files(filepath):
         pathname = filepath + "*.csv"
 
     files_to_remove = glob.glob(pathname)
-    module_logger.info("Deleting %d file(s) from %s" % (len(files_to_remove), filepath))
+    module_logger.info("Deleting %d file(s) from %s", len(files_to_remove), filepath)
 
     # Remove each of the files identified
     for p in files_to_remove:
-        module_logger.info("Deleting file: %s" % p)
+        module_logger.info("Deleting file: %s", p)
         os.remove(p)
 
 
@@ -158,7 +158,7 @@ def build_datasets(filepath, num_entries, max_entries_per_file, delimiter, encap
         # Determine if a new file needs to be written
         if i != 0 and i % max_entries_per_file == 0:
             file_index += 1
-            module_logger.info("Starting to write to file index: %d" % file_index)
+            module_logger.info("Starting to write to file index: %d", file_index)
 
         # Generate the random sample of data with a given ID
         sample = generate_sample(i)
@@ -181,7 +181,7 @@ def build_datasets(filepath, num_entries, max_entries_per_file, delimiter, encap
                 row = build_csv_row(sample, fields, delimiter, encapsulator)
                 fp.write(row)
 
-    module_logger.info("Generated %d samples" % num_entries)
+    module_logger.info("Generated %d samples", num_entries)
 
 
 def generate_raw_data(filepath, num_entries, max_entries_per_file, delimiter, encapsulator):
@@ -203,14 +203,14 @@ def generate_raw_data(filepath, num_entries, max_entries_per_file, delimiter, en
     assert isinstance(encapsulator, str)
 
     # Log the parameters
-    module_logger.info("Path for the raw data: %s" % filepath)
-    module_logger.info("Number of entries to generate: %d" % num_entries)
-    module_logger.info("CSV file delimiter: %s" % delimiter)
-    module_logger.info("CSV file encapsulator: %s" % encapsulator)
+    module_logger.info("Path for the raw data: %s", filepath)
+    module_logger.info("Number of entries to generate: %d", num_entries)
+    module_logger.info("CSV file delimiter: %s", delimiter)
+    module_logger.info("CSV file encapsulator: %s", encapsulator)
 
     # Remove any CSV files in the output directory
     remove_csv_files(filepath)
 
     # Create the data files
     build_datasets(filepath, num_entries, max_entries_per_file, delimiter, encapsulator)
-    module_logger.info("Datasets written to: %s" % filepath)
+    module_logger.info("Datasets written to: %s", filepath)
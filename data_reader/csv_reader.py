@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
+import codecs
+import collections
 import csv
 import logging
+import operator
 import os
 from logger import logger
 
@@ -8,22 +11,288 @@ from logger import logger
 logger.initialise_logger("loader", log_level=logging.INFO)
 module_logger = logging.getLogger('loader')
 
+# Position in a file just after a record: byte offset and number of data rows read (excluding the header)
+SourcePosition = collections.namedtuple("SourcePosition", ["offset", "row_number"])
+
+# Number of bytes at the start of a file checked for its line endings
+LINE_ENDING_SAMPLE_BYTES = 65536
+
+
+def is_ascii_compatible(encoding):
+    """
+    Can the records of a file in an encoding be split on the bytes of the ASCII delimiters and newlines?
+
+    This holds for UTF-8 (the bytes of a multibyte character are never ASCII) and the single-byte encodings (e.g.
+    latin-1 or cp1252), but not for e.g. UTF-16 or Shift JIS.
+
+    :param encoding: Encoding of the file.
+    :return: True if the encoding is ASCII-compatible.
+    """
+
+    name = codecs.lookup(encoding).name
+    if name in ["utf-8", "utf-8-sig"]:
+        return True
+
+    # A single-byte encoding decodes each byte to one character and the ASCII bytes to themselves
+    return len(bytes(range(256)).decode(encoding, "replace")) == 256 and \
+        bytes(range(128)).decode(encoding, "replace") == bytes(range(128)).decode("ascii")
+
+
+def split_lines(fp):
+    """
+    Split the lines of a file opened in binary mode on the line endings of the universal newlines mode.
+
+    A line ends with a newline, a carriage return and a newline, or a lone carriage return. The lines keep their line
+    endings, so their lengths add up to the bytes read.
+
+    :param fp: File opened in binary mode.
+    :return: Generator of lines (bytes).
+    """
+
+    for line in fp:
+        start = 0
+        index = line.find(b"\r")
+        while 0 <= index < len(line) - 1:
+            if line[index + 1] != 0x0A:
+                yield line[start:index + 1]
+                start = index + 1
+            index = line.find(b"\r", index + 1)
+        yield line[start:] if start > 0 else line
+
+
+def normalise_line_endings(line):
+    """
+    Replace the line endings in a decoded line with newlines (as the universal newlines mode does).
+
+    :param line: Decoded line.
+    :return: Line with newlines in place of carriage returns (followed by a newline or not).
+    """
+
+    if "\r" not in line:
+        return line
+
+    return line.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def has_lone_carriage_returns(fp):
+    """
+    Does the start of a file have line endings that are lone carriage returns (e.g. a classic Mac OS file)?
+
+    :param fp: File opened in binary mode at its start (which is left there).
+    :return: True if the start of the file has a carriage return that isn't followed by a newline.
+    """
+
+    sample = fp.read(LINE_ENDING_SAMPLE_BYTES)
+    fp.seek(0)
+
+    # A carriage return at the end of the sample may be followed by a newline
+    if len(sample) == LINE_ENDING_SAMPLE_BYTES:
+        sample = sample.rstrip(b"\r")
+
+    return sample.count(b"\r") > sample.count(b"\r\n")
+
 
 class DelimitedSource(object):
 
     # Maximum number of characters in a single field
     FIELD_LIMIT = 10000000
 
-    def __init__(self, filepath, delimiter, encapsulator, encoding):
+    def __init__(self, filepath, delimiter, encapsulator, encoding, on_malformed=None, columns=None,
+                 exclude_columns=None):
+        """
+        :param filepath: Path of the file to read.
+        :param delimiter: Delimiter used in the file.
+        :param encapsulator: Encapsulator used in the file.
+        :param encoding: Encoding of the file.
+        :param on_malformed: Function called with (row number, list of values, reason) for each row whose number of
+            fields doesn't match the header; such rows are skipped. If None, the values are paired with the field
+            names regardless.
+        :param columns: List of the only field names to read (if None, all of the fields are read).
+        :param exclude_columns: List of field names not to read (optional).
+        """
+
         self.filepath = filepath
         self.delimiter = delimiter
         self.encapsulator = encapsulator
         self.encoding = encoding
+        self.on_malformed = on_malformed
+        self.columns = columns
+        self.exclude_columns = exclude_columns
+
+        # Number of the row last read (excluding the header)
+        self.row_number = 0
+
+        module_logger.info("Initialising CSV reader to read: %s", self.filepath)
+        module_logger.debug("Delimiter set to: %s", delimiter)
+        module_logger.debug("Encapsulator set to: %s", encapsulator)
+        module_logger.debug("Encoding set to: %s", self.encoding)
+
+    def field_names(self):
+        """
+        Read the field names from the header of the file.
+
+        :return: List of field names.
+        """
+
+        # Preconditions
+        if not os.path.isfile(self.filepath):
+            raise ValueError("File path isn't valid: %s" % self.filepath)
+
+        with open(self.filepath, 'r', encoding=self.encoding) as fp:
+            reader = csv.reader(fp, delimiter=self.delimiter, quotechar=self.encapsulator)
+            field_names = next(reader, None)
+
+        if field_names is None:
+            raise ValueError("Unable to read the header of the CSV file")
+
+        return field_names
+
+    def select_columns(self, field_names):
+        """
+        Select the fields to read from the header of the file.
+
+        :param field_names: Field names from the header.
+        :return: Tuple of (list of the selected field names in the order of the header, list of their indices in the
+            header, function selecting their values from a full row), where the indices and function are None if all
+            of the fields are selected.
+        """
 
-        module_logger.info("Initialising CSV reader to read: %s" % self.filepath)
-        module_logger.info("Delimiter set to: %s" % delimiter)
-        module_logger.info("Encapsulator set to: %s" % encapsulator)
-        module_logger.info("Encoding set to: %s " % self.encoding)
+        if self.columns is None and self.exclude_columns is None:
+            return field_names, None, None
+
+        for setting, names in [("columns", self.columns), ("excluded columns", self.exclude_columns)]:
+            missing = [name for name in (names or []) if name not in field_names]
+            if len(missing) > 0:
+                raise ValueError("Unknown %s %s in the header of %s" % (setting, missing, self.filepath))
+
+        indices = [index for index, name in enumerate(field_names)
+                   if (self.columns is None or name in self.columns) and name not in (self.exclude_columns or [])]
+        if len(indices) == 0:
+            raise ValueError("No columns of %s are selected" % self.filepath)
+
+        # The values are picked from the row in C (itemgetter of a single index returns the value itself)
+        if len(indices) == 1:
+            index = indices[0]
+
+            def select(values):
+                return [values[index]]
+        else:
+            select = operator.itemgetter(*indices)
+
+        return [field_names[index] for index in indices], indices, select
+
+    def is_malformed(self, field_names, line, row_number):
+        """
+        Check the number of fields of a row, reporting it if it doesn't match the header.
+
+        :param field_names: Field names from the header.
+        :param line: List of values of the row.
+        :param row_number: Number of the row (excluding the header).
+        :return: True if the row is malformed or blank (and should be skipped).
+        """
+
+        if self.on_malformed is None or len(line) == len(field_names):
+            return False
+
+        # Blank lines are skipped without being reported
+        if len(line) == 0:
+            return True
+
+        self.on_malformed(row_number, line, "Expected %d fields, found %d" % (len(field_names), len(line)))
+        return True
+
+    def read_rows(self, fp, start_offset=0, start_row_number=0, positions=False):
+        """
+        Read the rows of a file opened in binary mode.
+
+        If the encoding is ASCII-compatible, a line without the encapsulator is decoded in one go and split on the
+        delimiter, bypassing csv.reader (the ASCII newline can't be part of another character, so each such line is a
+        record). The other lines, and all of the lines in other encodings, are parsed by csv.reader, which reads the
+        further lines of a quoted field spanning several lines. As in the universal newlines mode, a line ending
+        within a quoted field is read as a newline. The lines are split on lone carriage returns too if the start of
+        the file has any (otherwise such a carriage return is left to csv.reader).
+
+        :param fp: File opened in binary mode at its start.
+        :param start_offset: Byte offset to resume from (0 to start at the first data row).
+        :param start_row_number: Number of data rows before start_offset.
+        :param positions: Yield the position just after each record with the row?
+        :return: Generator of dictionaries of field name to value (or of (SourcePosition, dictionary) if positions is
+            True).
+        """
+
+        encoding = self.encoding
+        delimiter = self.delimiter
+        encapsulator = self.encapsulator
+        fast = is_ascii_compatible(encoding)
+
+        # The offset is updated as each line is read, and a record isn't read beyond its end, so after each record the
+        # offset is the start of the next one
+        offset = 0
+
+        # Line read ahead of csv.reader
+        pending = []
+        split = has_lone_carriage_returns(fp)
+        raw_lines = split_lines(fp) if split else fp
+
+        def lines():
+            nonlocal offset
+            while True:
+                if len(pending) > 0:
+                    line = pending.pop()
+                else:
+                    line = next(raw_lines, None)
+                    if line is None:
+                        return
+                    offset += len(line)
+                yield normalise_line_endings(line.decode(encoding))
+
+        reader = csv.reader(lines(), delimiter=delimiter, quotechar=encapsulator)
+
+        # Get the header
+        field_names = next(reader, None)
+        if field_names is None:
+            raise ValueError("Unable to read the header of the CSV file")
+        num_fields = len(field_names)
+        selected_names, indices, select = self.select_columns(field_names)
+
+        # Skip to the position to resume from
+        if start_offset > offset:
+            fp.seek(start_offset)
+            offset = start_offset
+            raw_lines = split_lines(fp) if split else fp
+
+        row_number = start_row_number
+        for line in raw_lines:
+            offset += len(line)
+
+            values = None
+            if fast:
+                text = line.decode(encoding).rstrip("\r\n")
+
+                # A carriage return within a line is left to csv.reader
+                if encapsulator not in text and "\r" not in text:
+                    values = text.split(delimiter) if len(text) > 0 else []
+
+            if values is None:
+                pending.append(line)
+                values = next(reader, None)
+                if values is None:
+                    break
+
+            row_number += 1
+            self.row_number = row_number
+            if len(values) == num_fields:
+                if select is not None:
+                    values = select(values)
+            elif self.is_malformed(field_names, values, row_number):
+                continue
+            elif select is not None:
+                values = [values[index] for index in indices if index < len(values)]
+
+            if positions:
+                yield SourcePosition(offset, row_number), dict(zip(selected_names, values))
+            else:
+                yield dict(zip(selected_names, values))
 
     def parse(self):
 
@@ -34,6 +303,15 @@ class DelimitedSource(object):
         # Change the limit on the size of a field
         csv.field_size_limit(self.FIELD_LIMIT)
 
+        # Split the records of an ASCII-compatible file on its lines (unless it has lone carriage returns, which are
+        # left to the universal newlines mode, so that the file isn't read in one go as a single line)
+        if is_ascii_compatible(self.encoding):
+            self.row_number = 0
+            with open(self.filepath, 'rb') as fp:
+                if not has_lone_carriage_returns(fp):
+                    yield from self.read_rows(fp)
+                    return
+
         # Open the file for reading
         with open(self.filepath, 'r', encoding=self.encoding) as fp:
             reader = csv.reader(fp, delimiter=self.delimiter, quotechar=self.encapsulator)
@@ -42,7 +320,41 @@ class DelimitedSource(object):
             field_names = next(reader)
             if field_names is None:
                 raise ValueError("Unable to read the header of the CSV file")
+            selected_names, indices, select = self.select_columns(field_names)
 
             # Create the generator for reading a line at a time
+            self.row_number = 0
             for line in reader:
-                yield dict(zip(field_names, line))
+                self.row_number += 1
+                if not self.is_malformed(field_names, line, self.row_number):
+                    if select is not None:
+                        line = [line[index] for index in indices if index < len(line)]
+                    yield dict(zip(selected_names, line))
+
+    def parse_with_positions(self, start_offset=0, start_row_number=0):
+        """
+        Parse the file, yielding the position just after each record so that a later parse can resume from it.
+
+        The file is read in binary mode and decoded a line at a time, so only ASCII-compatible encodings (those in
+        which a newline is the single byte 0x0A) are supported. A file whose lines end with lone carriage returns is
+        read in one go, as the lines are split after reading up to a newline.
+
+        :param start_offset: Byte offset to resume from (0 to start at the first data row).
+        :param start_row_number: Number of data rows before start_offset.
+        :return: Generator of (SourcePosition, dictionary of field name to value).
+        """
+
+        # Preconditions
+        if not os.path.isfile(self.filepath):
+            raise ValueError("File path isn't valid: %s" % self.filepath)
+
+        codec_name = codecs.lookup(self.encoding).name
+        if codec_name.startswith("utf-16") or codec_name.startswith("utf-32"):
+            raise ValueError("Encoding isn't supported when tracking positions: %s" % self.encoding)
+
+        # Change the limit on the size of a field
+        csv.field_size_limit(self.FIELD_LIMIT)
+
+        self.row_number = start_row_number
+        with open(self.filepath, 'rb') as fp:
+            yield from self.read_rows(fp, start_offset, start_row_number, positions=True)
@@ -1,4 +1,9 @@
-from data_reader.csv_reader import DelimitedSource
+import csv
+import os
+
+import pytest
+
+from data_reader.csv_reader import DelimitedSource, is_ascii_compatible
 
 
 def test_csv_reader_parse():
@@ -16,3 +21,114 @@ def test_csv_reader_parse():
                     {'Pedal name': 'Timeline', 'Manufacturer': 'Strymon', 'Type of effect': 'Delay'},
                     {'Pedal name': 'BigSky', 'Manufacturer': 'Strymon', 'Type of effect': 'Reverb'}]
 
+
+
+def test_csv_reader_field_names():
+    csv_reader = DelimitedSource("./data_reader/test_data/test_data1.csv", ",", "|", "utf-8")
+    assert csv_reader.field_names() == ['Pedal name', 'Manufacturer', 'Type of effect']
+
+
+def test_csv_reader_parse_with_positions():
+    filepath = "./data_reader/test_data/test_data1.csv"
+    csv_reader = DelimitedSource(filepath, ",", "|", "utf-8")
+
+    records = list(csv_reader.parse_with_positions())
+    assert [data for _, data in records] == list(csv_reader.parse())
+    assert [position.row_number for position, _ in records] == [1, 2, 3]
+
+    # Resume after the first record
+    position = records[0][0]
+    resumed = list(csv_reader.parse_with_positions(position.offset, position.row_number))
+    assert resumed == records[1:]
+
+
+def test_csv_reader_malformed_rows():
+    malformed = []
+
+    def on_malformed(row_number, values, reason):
+        malformed.append((row_number, values, reason))
+
+    csv_reader = DelimitedSource("./data_reader/test_data/malformed1.csv", ",", "|", "utf-8", on_malformed)
+    data = list(csv_reader.parse())
+
+    assert [d['Pedal name'] for d in data] == ['TS-808', 'Flint']
+    assert malformed == [(2, ['Timeline', 'Strymon'], 'Expected 3 fields, found 2'),
+                         (3, ['BigSky', 'Strymon', 'Reverb', 'Extra'], 'Expected 3 fields, found 4')]
+    assert csv_reader.row_number == 5
+
+
+def test_csv_reader_selected_columns():
+    filepath = "./data_reader/test_data/test_data1.csv"
+
+    # The fields are read in the order of the header
+    csv_reader = DelimitedSource(filepath, ",", "|", "utf-8", columns=["Type of effect", "Pedal name"])
+    assert list(csv_reader.parse())[0] == {'Pedal name': 'TS-808', 'Type of effect': 'Overdrive'}
+
+    csv_reader = DelimitedSource(filepath, ",", "|", "utf-8", exclude_columns=["Manufacturer", "Type of effect"])
+    assert [data for _, data in csv_reader.parse_with_positions()] == [{'Pedal name': 'TS-808'},
+                                                                       {'Pedal name': 'Timeline'},
+                                                                       {'Pedal name': 'BigSky'}]
+
+    # The rows are checked against the full header
+    malformed = []
+    csv_reader = DelimitedSource("./data_reader/test_data/malformed1.csv", ",", "|", "utf-8",
+                                 lambda *args: malformed.append(args), columns=["Pedal name"])
+    assert [d['Pedal name'] for d in csv_reader.parse()] == ['TS-808', 'Flint']
+    assert len(malformed) == 2
+
+    with pytest.raises(ValueError):
+        list(DelimitedSource(filepath, ",", "|", "utf-8", columns=["Pedal"]).parse())
+
+    with pytest.raises(ValueError):
+        list(DelimitedSource(filepath, ",", "|", "utf-8", exclude_columns=["Pedal name", "Manufacturer",
+                                                                           "Type of effect"]).parse())
+
+
+def test_is_ascii_compatible():
+    assert is_ascii_compatible("utf-8")
+    assert is_ascii_compatible("latin-1")
+    assert is_ascii_compatible("cp1252")
+    assert not is_ascii_compatible("utf-16")
+    assert not is_ascii_compatible("shift_jis")
+
+
+def test_csv_reader_quoted_records():
+    filepath = "./data_reader/test_data/quoted1.csv"
+
+    # The unquoted lines are split directly and the quoted ones (including a field spanning two lines) by csv.reader,
+    # with the same result as csv.reader alone
+    with open(filepath, 'r', encoding="utf-8") as fp:
+        reader = csv.reader(fp, delimiter=",", quotechar="|")
+        field_names = next(reader)
+        expected = [dict(zip(field_names, values)) for values in reader]
+    assert expected[2] == {}
+
+    csv_reader = DelimitedSource(filepath, ",", "|", "utf-8")
+    assert list(csv_reader.parse()) == expected
+    assert expected[1]['Notes'] == 'Reverb\nwith |shimmer| mode'
+    assert expected[3]['Pedal name'] == 'Rätt'
+
+    records = list(csv_reader.parse_with_positions())
+    assert [data for _, data in records] == expected
+    assert records[-1][0] == (os.path.getsize(filepath), 4)
+
+
+def test_csv_reader_carriage_returns():
+    filepath = "./data_reader/test_data/carriage_returns1.csv"
+    expected = [{'Pedal name': 'Big Sky', 'Notes': 'Reverb\nwith shimmer'},
+                {'Pedal name': 'Timeline', 'Notes': 'Delay'}]
+
+    # The lines end with lone carriage returns and the quoted field spans a carriage return and newline
+    with open(filepath, 'rb') as fp:
+        assert fp.read().count(b"\r") == 4
+
+    csv_reader = DelimitedSource(filepath, ",", "|", "utf-8")
+    assert list(csv_reader.parse()) == expected
+
+    records = list(csv_reader.parse_with_positions())
+    assert [data for _, data in records] == expected
+    assert records[-1][0] == (os.path.getsize(filepath), 2)
+
+    # Resume after the first record
+    position = records[0][0]
+    assert list(csv_reader.parse_with_positions(position.offset, position.row_number)) == records[1:]
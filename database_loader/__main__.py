@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import argparse
+
+from database_loader.config import read_config, load_arguments, generate_arguments
+
+
+def build_parser():
+    """
+    Build the command line parser.
+
+    :return: ArgumentParser.
+    """
+
+    parser = argparse.ArgumentParser(prog="python -m database_loader",
+                                     description="Generate raw data or load it into a database from a TOML or YAML "
+                                                 "configuration file")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    load = commands.add_parser("load", help="load the CSV files into the database")
+    load.add_argument("config", help="TOML (.toml) or YAML (.yaml) configuration file")
+    load.add_argument("--profile", metavar="FOLDER", default=None,
+                      help="profile the load, writing a profile per table to FOLDER")
+    load.add_argument("--profile-tables", metavar="TABLE", nargs="+", default=None,
+                      help="only profile these tables (default: all tables)")
+    load.add_argument("--profile-mode", choices=["cprofile", "sampling"], default="cprofile",
+                      help="profile with cProfile (a pstats file per table) or by sampling the stacks of all of the "
+                           "threads (a collapsed-stack file per table) (default: %(default)s)")
+    load.add_argument("--resume", action="store_true",
+                      help="resume an interrupted load from the last committed batch (MariaDB backend)")
+    load.add_argument("--watch", action="store_true",
+                      help="keep running, loading the new files in the source folder as they are written "
+                           "(MariaDB backend)")
+
+    coordinate = commands.add_parser("coordinate", help="create the tables and publish their files to the work queue "
+                                                         "of a distributed load (MariaDB backend)")
+    coordinate.add_argument("config", help="TOML (.toml) or YAML (.yaml) configuration file")
+    coordinate.add_argument("--wait", action="store_true",
+                            help="wait for the workers to load the files and mark the tables complete")
+
+    work = commands.add_parser("work", help="load the files claimed from the work queue of a distributed load")
+    work.add_argument("config", help="TOML (.toml) or YAML (.yaml) configuration file")
+    work.add_argument("--name", default=None, help="name of the worker (default: the host name and process id)")
+
+    generate = commands.add_parser("generate", help="generate the raw data")
+    generate.add_argument("config", help="TOML (.toml) or YAML (.yaml) configuration file")
+
+    return parser
+
+
+def run_load(config, args):
+    """
+    Load the database (or watch the source folder) as configured.
+
+    :param config: Configuration.
+    :param args: Parsed command line arguments.
+    """
+
+    arguments = load_arguments(config)
+
+    if args.watch:
+        from database_loader.watcher import IngestDaemon
+
+        # Only pass the configured settings, so that the daemon's defaults apply to the others
+        watch = config.get("watch", {})
+        settings = {}
+        for name, value in [("poll_interval", watch.get("poll-interval")),
+                            ("settle_seconds", watch.get("settle-seconds")),
+                            ("batch_size", arguments.get("batch_size")),
+                            ("inference_params", arguments.get("inference_params")),
+                            ("reject_params", arguments.get("reject_params")),
+                            ("column_params", arguments.get("column_params"))]:
+            if value is not None:
+                settings[name] = value
+
+        daemon = IngestDaemon(arguments["filepath"], arguments["delimiter"], arguments["encapsulator"],
+                              arguments["encoding"], arguments["true_values"], arguments["false_values"],
+                              arguments["db_params"], **settings)
+        try:
+            daemon.run()
+        except KeyboardInterrupt:
+            daemon.close()
+        return
+
+    from database_loader.loader import load_database
+
+    load_database(profile_path=args.profile, profile_tables=args.profile_tables, profile_mode=args.profile_mode,
+                  resume=args.resume, **arguments)
+
+
+def run_distributed(config, args):
+    """
+    Coordinate a distributed load or run one of its workers, as configured in the [distribute] section.
+
+    :param config: Configuration.
+    :param args: Parsed command line arguments.
+    """
+
+    from database_loader import distributed
+
+    arguments = load_arguments(config)
+    if arguments["backend"] != "mariadb":
+        raise ValueError("Distributed loading is only supported by the MariaDB backend")
+
+    distribute = config.get("distribute", {})
+    if "queue-path" not in distribute:
+        raise ValueError("The configuration has no [distribute] queue-path")
+    queue_path = distribute["queue-path"]
+    poll_interval = distribute.get("poll-interval", distributed.DEFAULT_POLL_INTERVAL)
+
+    if args.command == "coordinate":
+        distributed.coordinate_load(arguments["filepath"], arguments["delimiter"], arguments["encapsulator"],
+                                    arguments["encoding"], arguments["true_values"], arguments["false_values"],
+                                    arguments["db_params"], queue_path, arguments.get("narrow_types", False),
+                                    arguments.get("inference_params"), arguments.get("discovery_params"),
+                                    arguments.get("column_params"),
+                                    distribute.get("max-attempts", distributed.DEFAULT_MAX_ATTEMPTS))
+        if args.wait:
+            distributed.wait_for_load(arguments["db_params"], queue_path, poll_interval)
+    else:
+        worker = distributed.QueueWorker(queue_path, arguments["db_params"], args.name,
+                                         arguments.get("batch_size", distributed.DEFAULT_BATCH_SIZE),
+                                         distribute.get("lease-seconds", distributed.DEFAULT_LEASE_SECONDS),
+                                         poll_interval)
+        worker.run()
+
+
+def main(argv=None):
+    """
+    Run the command line.
+
+    :param argv: List of arguments (defaults to sys.argv[1:]).
+    """
+
+    args = build_parser().parse_args(argv)
+    config = read_config(args.config)
+
+    if args.command == "generate":
+        from data_generator.generate import generate_raw_data
+
+        generate_raw_data(**generate_arguments(config))
+    elif args.command in ["coordinate", "work"]:
+        run_distributed(config, args)
+    else:
+        run_load(config, args)
+
+
+if __name__ == '__main__':
+    main()
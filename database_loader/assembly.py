@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+import csv
+import heapq
+import logging
+import os
+import pickle
+import tempfile
+
+from data_reader.csv_reader import DelimitedSource
+from database_loader.ordering import key_order, file_order
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Default maximum number of rows sorted in memory before a sorted run is spilled to disk
+DEFAULT_RUN_SIZE = 100000
+
+
+def tables_with_key(table_name_to_files, key, delimiter, encapsulator, encoding):
+    """
+    Find the tables whose files contain the key column.
+
+    :param table_name_to_files: Dictionary of table name to list of files.
+    :param key: Name of the key column.
+    :param delimiter: Delimiter in the CSV files.
+    :param encapsulator: Encapsulator in the CSV files.
+    :param encoding: Encoding of the CSV files.
+    :return: Sorted list of table names.
+    """
+
+    table_names = []
+    for table_name, files in table_name_to_files.items():
+        field_names = DelimitedSource(files[0], delimiter, encapsulator, encoding).field_names()
+        if key in field_names:
+            table_names.append(table_name)
+
+    return sorted(table_names)
+
+
+def read_table_rows(files, delimiter, encapsulator, encoding):
+    """
+    Read the rows of the files of a table, in file order.
+
+    :param files: List of files of the table.
+    :param delimiter: Delimiter in the CSV files.
+    :param encapsulator: Encapsulator in the CSV files.
+    :param encoding: Encoding of the CSV files.
+    :return: Generator of dictionaries of field name to value.
+    """
+
+    for file in sorted(files, key=file_order):
+        for data_dict in DelimitedSource(file, delimiter, encapsulator, encoding).parse():
+            yield data_dict
+
+
+def check_sorted(rows, key, table_name):
+    """
+    Pass the rows through, checking that their keys are in order (a key may repeat, see merge_sorted_tables).
+
+    :param rows: Iterable of dictionaries of field name to value.
+    :param key: Name of the key column.
+    :param table_name: Name of the table (for the error message).
+    :return: Generator of dictionaries of field name to value.
+    """
+
+    previous = None
+    for data in rows:
+        order = key_order(data[key])
+        if previous is not None and order < previous:
+            raise ValueError("Table %s isn't sorted by %s at: %s" % (table_name, key, data[key]))
+        previous = order
+        yield data
+
+
+def write_run(rows, spill_path):
+    """
+    Write a sorted run of rows to a temporary file.
+
+    :param rows: List of sorted rows.
+    :param spill_path: Folder to write the run to.
+    :return: Path of the run file.
+    """
+
+    fd, path = tempfile.mkstemp(suffix=".run", dir=spill_path)
+    with os.fdopen(fd, "wb") as fp:
+        for data in rows:
+            pickle.dump(data, fp, pickle.HIGHEST_PROTOCOL)
+
+    return path
+
+
+def read_run(path):
+    """
+    Read the rows of a run file, removing the file once it has been read.
+
+    :param path: Path of the run file.
+    :return: Generator of rows.
+    """
+
+    try:
+        with open(path, "rb") as fp:
+            while True:
+                try:
+                    yield pickle.load(fp)
+                except EOFError:
+                    break
+    finally:
+        os.remove(path)
+
+
+def external_sort(rows, key, run_size=DEFAULT_RUN_SIZE, spill_path=None):
+    """
+    Sort rows by their key, holding at most run_size rows in memory.
+
+    Rows are sorted in runs of run_size rows; if there is more than one run, the runs are spilled to disk and merged.
+
+    :param rows: Iterable of dictionaries of field name to value.
+    :param key: Name of the key column.
+    :param run_size: Maximum number of rows to sort in memory.
+    :param spill_path: Folder to spill the sorted runs to (if None, the system's temporary folder).
+    :return: Generator of rows sorted by key.
+    """
+
+    # Preconditions
+    assert run_size > 0
+
+    def sort_key(data):
+        return key_order(data[key])
+
+    run_paths = []
+    run = []
+    for data in rows:
+        run.append(data)
+        if len(run) == run_size:
+            run.sort(key=sort_key)
+            run_paths.append(write_run(run, spill_path))
+            run = []
+
+    run.sort(key=sort_key)
+    if len(run_paths) == 0:
+        for data in run:
+            yield data
+        return
+
+    module_logger.info("Merging %d sorted runs", len(run_paths) + 1)
+    for data in heapq.merge(*([read_run(path) for path in run_paths] + [iter(run)]), key=sort_key):
+        yield data
+
+
+def wide_field_names(table_fields, key):
+    """
+    Name the columns of the wide table, prefixing a field with its table name if more than one table has it.
+
+    :param table_fields: List of tuples of (table name, list of field names).
+    :param key: Name of the key column.
+    :return: List of (table name, list of (field name, wide field name)).
+    """
+
+    counts = {}
+    for _, field_names in table_fields:
+        for name in field_names:
+            if name != key:
+                counts[name] = counts.get(name, 0) + 1
+
+    return [(table_name, [(name, name if counts[name] == 1 else "%s_%s" % (table_name, name))
+                          for name in field_names if name != key])
+            for table_name, field_names in table_fields]
+
+
+def merge_sorted_tables(streams, key):
+    """
+    Merge streams of rows sorted by key into wide rows (a full outer join on the key).
+
+    A field of a table without a row for a key is left empty (i.e. NULL). One of the tables may have several rows for
+    a key (a one-to-many join), in which case there is a wide row for each of them with the values of the other
+    tables repeated, whereas the other tables must have at most one row for the key. The rows of a key are held in
+    memory.
+
+    :param streams: List of (iterator of rows sorted by key, list of (field name, wide field name)).
+    :param key: Name of the key column.
+    :return: Generator of dictionaries of wide field name to value.
+    """
+
+    iterators = [iter(rows) for rows, _ in streams]
+    heads = [next(it, None) for it in iterators]
+
+    while True:
+        orders = [key_order(head[key]) for head in heads if head is not None]
+        if len(orders) == 0:
+            return
+        current = min(orders)
+
+        # Read the rows of each table with the current key
+        groups = []
+        for index in range(len(streams)):
+            group = []
+            while heads[index] is not None and key_order(heads[index][key]) == current:
+                group.append(heads[index])
+                heads[index] = next(iterators[index], None)
+            groups.append(group)
+
+        repeated = [index for index, group in enumerate(groups) if len(group) > 1]
+        if len(repeated) > 1:
+            raise ValueError("More than one table has several rows with the key %s (a many-to-many join)" %
+                             groups[repeated[0]][0][key])
+
+        wide_row = {}
+        for group, (_, fields) in zip(groups, streams):
+            if len(group) > 0:
+                wide_row[key] = group[0][key]
+            for name, wide_name in fields:
+                wide_row[wide_name] = group[0][name] if len(group) > 0 else ""
+
+        if len(repeated) == 0:
+            yield wide_row
+            continue
+
+        # A wide row for each row of the table with several rows for the key
+        fields = streams[repeated[0]][1]
+        for data in groups[repeated[0]]:
+            row = dict(wide_row)
+            for name, wide_name in fields:
+                row[wide_name] = data[name]
+            yield row
+
+
+def assemble_table(table_name_to_files, table_names, key, output_file, delimiter, encapsulator, encoding,
+                   sorted_inputs=True, run_size=DEFAULT_RUN_SIZE, spill_path=None):
+    """
+    Assemble narrow tables sharing a key column into a single wide CSV file.
+
+    :param table_name_to_files: Dictionary of table name to list of files.
+    :param table_names: Names of the tables to assemble.
+    :param key: Name of the key column.
+    :param output_file: Path of the wide CSV file to write.
+    :param delimiter: Delimiter in the CSV files.
+    :param encapsulator: Encapsulator in the CSV files.
+    :param encoding: Encoding of the CSV files.
+    :param sorted_inputs: Are the files of each table already sorted by key? If not, each table is sorted with an
+        external sort.
+    :param run_size: Maximum number of rows per table to sort in memory.
+    :param spill_path: Folder to spill the sorted runs to (if None, the system's temporary folder).
+    :return: Number of rows written.
+    """
+
+    # Preconditions
+    assert len(table_names) > 0
+
+    table_fields = [(table_name, DelimitedSource(table_name_to_files[table_name][0], delimiter, encapsulator,
+                                                 encoding).field_names())
+                    for table_name in table_names]
+    wide_fields = wide_field_names(table_fields, key)
+
+    streams = []
+    for table_name, fields in wide_fields:
+        rows = read_table_rows(table_name_to_files[table_name], delimiter, encapsulator, encoding)
+        if not sorted_inputs:
+            rows = external_sort(rows, key, run_size, spill_path)
+        streams.append((check_sorted(rows, key, table_name), fields))
+
+    header = [key] + [wide_name for _, fields in wide_fields for _, wide_name in fields]
+    module_logger.info("Assembling tables %s into %s with fields: %s", table_names, output_file, header)
+
+    num_rows = 0
+    progress = logger.ProgressReporter(module_logger, "Assembling %s" % output_file)
+
+    with open(output_file, "w", encoding=encoding, newline="") as fp:
+        writer = csv.writer(fp, delimiter=delimiter, quotechar=encapsulator, lineterminator="\n")
+        writer.writerow(header)
+        for wide_row in merge_sorted_tables(streams, key):
+            writer.writerow([wide_row[name] for name in header])
+            num_rows += 1
+            progress.update()
+
+    progress.finish()
+    return num_rows
+
+
+def assemble_tables(table_name_to_files, assembly_params, delimiter, encapsulator, encoding, work_path):
+    """
+    Replace the narrow tables sharing the key column with a single wide table.
+
+    :param table_name_to_files: Dictionary of table name to list of files.
+    :param assembly_params: Dictionary of assembly parameters: 'table-name' (name of the wide table), 'key' (name of
+        the key column) and optionally 'sorted' (are the inputs sorted by key?) and 'run-size'.
+    :param delimiter: Delimiter in the CSV files.
+    :param encapsulator: Encapsulator in the CSV files.
+    :param encoding: Encoding of the CSV files.
+    :param work_path: Folder to write the wide CSV file (and any sorted runs) to.
+    :return: Dictionary of table name to list of files, with the wide table in place of the narrow tables.
+    """
+
+    key = assembly_params['key']
+    wide_table_name = assembly_params['table-name']
+
+    if wide_table_name in table_name_to_files:
+        raise ValueError("The wide table name is already used by the files: %s" % wide_table_name)
+
+    table_names = tables_with_key(table_name_to_files, key, delimiter, encapsulator, encoding)
+    if len(table_names) < 2:
+        module_logger.info("Fewer than two tables have the key column %s, so none were assembled", key)
+        return table_name_to_files
+
+    output_file = os.path.join(work_path, "%s.csv" % wide_table_name)
+    assemble_table(table_name_to_files, table_names, key, output_file, delimiter, encapsulator, encoding,
+                   assembly_params.get('sorted', True), assembly_params.get('run-size', DEFAULT_RUN_SIZE), work_path)
+
+    assembled = dict([(name, files) for name, files in table_name_to_files.items() if name not in table_names])
+    assembled[wide_table_name] = [output_file]
+    return assembled
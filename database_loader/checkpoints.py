@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import collections
+import json
+import logging
+
+from database_loader.type_inference import DataType
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("database-loader", log_level=logging.INFO)
+module_logger = logging.getLogger('database-loader')
+
+# State tables holding the progress of the loads
+SCHEMA_TABLE = "loader____schema"
+CHECKPOINT_TABLE = "loader____checkpoint"
+
+# Progress through a file: position after the last committed row, rows inserted and whether the file is finished
+FileCheckpoint = collections.namedtuple("FileCheckpoint", ["byte_offset", "row_number", "rows_inserted", "complete"])
+
+
+def create_state_tables_statements():
+    """
+    Build the statements to create the state tables (if they don't exist).
+
+    :return: List of CREATE TABLE statements.
+    """
+
+    return ["CREATE TABLE IF NOT EXISTS %s (table_name VARCHAR(255) NOT NULL, table_schema TEXT NOT NULL, "
+            "complete BOOLEAN NOT NULL, PRIMARY KEY (table_name));" % SCHEMA_TABLE,
+            "CREATE TABLE IF NOT EXISTS %s (table_name VARCHAR(255) NOT NULL, file_path VARCHAR(512) NOT NULL, "
+            "byte_offset BIGINT NOT NULL, rows_read BIGINT NOT NULL, rows_inserted BIGINT NOT NULL, "
+            "complete BOOLEAN NOT NULL, PRIMARY KEY (table_name, file_path));" % CHECKPOINT_TABLE]
+
+
+def schema_to_json(schema):
+    """
+    Serialise a schema to JSON (preserving the order of the fields).
+
+    :param schema: Dictionary of field name to inferred type.
+    :return: JSON string.
+    """
+
+    return json.dumps([[name, tpe.name] for name, tpe in schema.items()])
+
+
+def schema_from_json(str_schema):
+    """
+    Deserialise a schema from JSON.
+
+    :param str_schema: JSON string from schema_to_json().
+    :return: Dictionary of field name to inferred type.
+    """
+
+    return dict([(name, DataType[type_name]) for name, type_name in json.loads(str_schema)])
+
+
+def create_state_tables(cursor):
+    """
+    Create the state tables (if they don't exist).
+
+    :param cursor: Database cursor.
+    """
+
+    for stmt in create_state_tables_statements():
+        cursor.execute(stmt)
+
+
+def clear_table_state(cursor, table_name):
+    """
+    Remove the schema and checkpoints of a table.
+
+    :param cursor: Database cursor.
+    :param table_name: Table name.
+    """
+
+    module_logger.info("Clearing the checkpoints of table %s", table_name)
+    cursor.execute("DELETE FROM %s WHERE table_name = %%s" % SCHEMA_TABLE, (table_name,))
+    cursor.execute("DELETE FROM %s WHERE table_name = %%s" % CHECKPOINT_TABLE, (table_name,))
+
+
+def save_schema(cursor, table_name, schema):
+    """
+    Record the schema of a table whose load has started.
+
+    :param cursor: Database cursor.
+    :param table_name: Table name.
+    :param schema: Dictionary of field name to inferred type.
+    """
+
+    cursor.execute("REPLACE INTO %s (table_name, table_schema, complete) VALUES (%%s, %%s, false)" % SCHEMA_TABLE,
+                   (table_name, schema_to_json(schema)))
+
+
+def mark_table_complete(cursor, table_name):
+    """
+    Record that the load of a table has finished.
+
+    :param cursor: Database cursor.
+    :param table_name: Table name.
+    """
+
+    cursor.execute("UPDATE %s SET complete = true WHERE table_name = %%s" % SCHEMA_TABLE, (table_name,))
+
+
+def load_table_state(cursor, table_name):
+    """
+    Get the recorded schema of a table and whether its load finished.
+
+    :param cursor: Database cursor.
+    :param table_name: Table name.
+    :return: Tuple of (schema, complete), or (None, False) if the table has no recorded state.
+    """
+
+    cursor.execute("SELECT table_schema, complete FROM %s WHERE table_name = %%s" % SCHEMA_TABLE, (table_name,))
+    result = cursor.fetchone()
+
+    if result is None:
+        return None, False
+    return schema_from_json(result[0]), bool(result[1])
+
+
+def save_file_checkpoint(cursor, table_name, file_path, file_checkpoint):
+    """
+    Record the progress through a file.
+
+    This should be executed in the same transaction as the rows it covers, so that the checkpoint and the rows are
+    committed together.
+
+    :param cursor: Database cursor.
+    :param table_name: Table name.
+    :param file_path: File path.
+    :param file_checkpoint: FileCheckpoint.
+    """
+
+    cursor.execute("REPLACE INTO %s (table_name, file_path, byte_offset, rows_read, rows_inserted, complete) "
+                   "VALUES (%%s, %%s, %%s, %%s, %%s, %%s)" % CHECKPOINT_TABLE,
+                   (table_name, file_path, file_checkpoint.byte_offset, file_checkpoint.row_number,
+                    file_checkpoint.rows_inserted, file_checkpoint.complete))
+
+
+def load_file_checkpoints(cursor, table_name):
+    """
+    Get the recorded progress through each file of a table.
+
+    :param cursor: Database cursor.
+    :param table_name: Table name.
+    :return: Dictionary of file path to FileCheckpoint.
+    """
+
+    cursor.execute("SELECT file_path, byte_offset, rows_read, rows_inserted, complete FROM %s "
+                   "WHERE table_name = %%s" % CHECKPOINT_TABLE, (table_name,))
+
+    return dict([(row[0], FileCheckpoint(row[1], row[2], row[3], bool(row[4]))) for row in cursor.fetchall()])
+
+
+def create_file_checkpoint(cursor, table_name, file_path):
+    """
+    Record a file as not started, unless its progress is already recorded (so that its checkpoint can be locked).
+
+    :param cursor: Database cursor.
+    :param table_name: Table name.
+    :param file_path: File path.
+    """
+
+    cursor.execute("INSERT IGNORE INTO %s (table_name, file_path, byte_offset, rows_read, rows_inserted, complete) "
+                   "VALUES (%%s, %%s, 0, 0, 0, false)" % CHECKPOINT_TABLE, (table_name, file_path))
+
+
+def lock_file_checkpoint(cursor, table_name, file_path):
+    """
+    Get the recorded progress through a file, locking it until the end of the transaction.
+
+    :param cursor: Database cursor.
+    :param table_name: Table name.
+    :param file_path: File path.
+    :return: FileCheckpoint, or None if the file has no recorded progress.
+    """
+
+    cursor.execute("SELECT byte_offset, rows_read, rows_inserted, complete FROM %s "
+                   "WHERE table_name = %%s AND file_path = %%s FOR UPDATE" % CHECKPOINT_TABLE,
+                   (table_name, file_path))
+    row = cursor.fetchone()
+
+    if row is None:
+        return None
+    return FileCheckpoint(row[0], row[1], row[2], bool(row[3]))
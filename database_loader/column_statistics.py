@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+import collections
+import datetime
+import json
+import os
+import re
+
+from database_loader.database_utilities import safe_name
+from database_loader.sketches import HyperLogLog, QuantileSketch, histogram_quantile
+from database_loader.type_inference import DataType
+
+# Temporal formats recognised in String columns: name to (regular expression, strptime format)
+TEMPORAL_FORMATS = {"date": (re.compile(r"^\d{4}-\d{2}-\d{2}$"), "%Y-%m-%d"),
+                    "datetime": (re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}$"), None),
+                    "time": (re.compile(r"^\d{2}:\d{2}:\d{2}$"), "%H:%M:%S")}
+
+# Types whose values are added to the value sketch of a profile
+NUMERIC_TYPES = [DataType.int, DataType.float, DataType.decimal]
+
+# Quantiles of the values and lengths of a column in its profile
+PROFILE_QUANTILES = [0.5, 0.9, 0.99]
+
+# Default folder of the column profiles
+DEFAULT_PROFILE_PATH = "./column-profiles/"
+
+
+def is_temporal(str_value, name):
+    """
+    Is the String value a valid date, datetime or time?
+
+    :param str_value: String value to test.
+    :param name: Name of the temporal format ('date', 'datetime' or 'time').
+    :return: True if the value is valid.
+    """
+
+    pattern, fmt = TEMPORAL_FORMATS[name]
+    if pattern.match(str_value) is None:
+        return False
+
+    if name == "datetime":
+        fmt = "%Y-%m-%dT%H:%M:%S" if str_value[10] == "T" else "%Y-%m-%d %H:%M:%S"
+
+    try:
+        datetime.datetime.strptime(str_value, fmt)
+        return True
+    except ValueError:
+        return False
+
+
+class ColumnStatistics(object):
+    """
+    Statistics of a column gathered during schema inference, used to choose a narrower SQL type.
+
+    If profiled, the statistics also hold mergeable sketches of the column's distinct values (HyperLogLog), numeric
+    values (QuantileSketch) and lengths (a histogram), from which its profile is built.
+    """
+
+    # Maximum number of distinct values to hold when checking whether all of the values are distinct
+    DISTINCT_LIMIT = 100000
+
+    def __init__(self, profiled=False):
+        """
+        :param profiled: Gather the sketches of the column's profile?
+        """
+
+        self.count = 0
+        self.null_count = 0
+        self.integer_digits = 0
+        self.scale = 0
+        self.min_int = None
+        self.max_int = None
+        self.min_length = None
+        self.max_length = 0
+        self.temporal_formats = set(TEMPORAL_FORMATS.keys())
+
+        # Distinct values (None once the limit is exceeded or a duplicate is seen)
+        self.distinct_values = set()
+        self.all_distinct = True
+
+        # Sketches of the profile (None unless profiled)
+        self.distinct_sketch = HyperLogLog() if profiled else None
+        self.value_sketch = QuantileSketch() if profiled else None
+        self.length_counts = collections.Counter() if profiled else None
+        self.min_string = None
+        self.max_string = None
+
+    def update(self, str_value, datatype, value):
+        """
+        Update the statistics with a value.
+
+        :param str_value: String value read from the file.
+        :param datatype: Inferred type of the value.
+        :param value: Value converted to the inferred type.
+        """
+
+        # NULLs only contribute to the number of NULLs
+        if datatype == DataType.null:
+            self.null_count += 1
+            return
+
+        self.count += 1
+
+        # Digits either side of the decimal point
+        if datatype in [DataType.int, DataType.decimal]:
+            digits = str_value.strip().lstrip("+-").split(".")
+            self.integer_digits = max(self.integer_digits, len(digits[0].lstrip("0")))
+            if len(digits) > 1:
+                self.scale = max(self.scale, len(digits[1]))
+
+        # Range of integers
+        if datatype == DataType.int:
+            if self.min_int is None or value < self.min_int:
+                self.min_int = value
+            if self.max_int is None or value > self.max_int:
+                self.max_int = value
+
+        # Lengths of the values
+        length = len(str_value)
+        if self.min_length is None or length < self.min_length:
+            self.min_length = length
+        if length > self.max_length:
+            self.max_length = length
+
+        # Temporal formats that all of the values match
+        if len(self.temporal_formats) > 0:
+            self.temporal_formats = set([name for name in self.temporal_formats if is_temporal(str_value, name)])
+
+        # Are all of the values distinct?
+        if self.distinct_values is not None:
+            if str_value in self.distinct_values:
+                self.all_distinct = False
+                self.distinct_values = None
+            elif len(self.distinct_values) >= self.DISTINCT_LIMIT:
+                self.distinct_values = None
+            else:
+                self.distinct_values.add(str_value)
+
+        # Sketches of the profile
+        if self.distinct_sketch is not None:
+            self.distinct_sketch.add(str_value)
+            self.length_counts[length] += 1
+            if datatype in NUMERIC_TYPES:
+                self.value_sketch.add(value)
+            elif self.min_string is None:
+                self.min_string = self.max_string = str_value
+            elif str_value < self.min_string:
+                self.min_string = str_value
+            elif str_value > self.max_string:
+                self.max_string = str_value
+
+    def merge(self, other):
+        """
+        Merge the statistics of two parts of the same column (e.g. from two files).
+
+        :param other: Other ColumnStatistics.
+        :return: Merged ColumnStatistics.
+        """
+
+        merged = ColumnStatistics()
+        merged.count = self.count + other.count
+        merged.null_count = self.null_count + other.null_count
+        merged.integer_digits = max(self.integer_digits, other.integer_digits)
+        merged.scale = max(self.scale, other.scale)
+
+        int_mins = [v for v in [self.min_int, other.min_int] if v is not None]
+        int_maxs = [v for v in [self.max_int, other.max_int] if v is not None]
+        merged.min_int = min(int_mins) if len(int_mins) > 0 else None
+        merged.max_int = max(int_maxs) if len(int_maxs) > 0 else None
+
+        lengths = [v for v in [self.min_length, other.min_length] if v is not None]
+        merged.min_length = min(lengths) if len(lengths) > 0 else None
+        merged.max_length = max(self.max_length, other.max_length)
+
+        merged.temporal_formats = self.temporal_formats & other.temporal_formats
+
+        merged.all_distinct = self.all_distinct and other.all_distinct
+        if merged.all_distinct and self.distinct_values is not None and other.distinct_values is not None and \
+                len(self.distinct_values) + len(other.distinct_values) <= self.DISTINCT_LIMIT:
+            merged.all_distinct = self.distinct_values.isdisjoint(other.distinct_values)
+            merged.distinct_values = self.distinct_values | other.distinct_values if merged.all_distinct else None
+        else:
+            merged.distinct_values = None
+
+        if self.distinct_sketch is not None and other.distinct_sketch is not None:
+            merged.distinct_sketch = self.distinct_sketch.merge(other.distinct_sketch)
+            merged.value_sketch = self.value_sketch.merge(other.value_sketch)
+            merged.length_counts = self.length_counts + other.length_counts
+            strings = [v for v in [self.min_string, self.max_string, other.min_string, other.max_string]
+                       if v is not None]
+            merged.min_string = min(strings, default=None)
+            merged.max_string = max(strings, default=None)
+
+        return merged
+
+    def drop_distinct_values(self):
+        """Stop tracking the distinct values (e.g. to release memory); the column is then not known to be unique."""
+
+        self.distinct_values = None
+
+    def is_unique(self):
+        """
+        Are all of the values known to be distinct?
+
+        :return: True if no duplicate was seen and all of the values could be checked.
+        """
+
+        return self.all_distinct and self.distinct_values is not None and self.count > 0
+
+    def temporal_type(self):
+        """
+        Get the temporal format that all of the values match.
+
+        :return: 'date', 'datetime', 'time' or None.
+        """
+
+        if self.count == 0:
+            return None
+
+        for name in ["date", "datetime", "time"]:
+            if name in self.temporal_formats:
+                return name
+
+        return None
+
+    def is_fixed_length(self):
+        """
+        Do all of the values have the same length?
+
+        :return: True if so.
+        """
+
+        return self.count > 0 and self.min_length == self.max_length
+
+    def profile(self):
+        """
+        Build the profile of the column from its statistics and sketches (if profiled).
+
+        :return: Dictionary of the number of values and NULLs, the estimated number of distinct values, the range and
+            quantiles of the numeric values, the range of the other values and the range, mean, quantiles and
+            histogram of the lengths (JSON-serialisable).
+        """
+
+        profile = {"count": self.count,
+                   "null_count": self.null_count,
+                   "unique": self.is_unique()}
+
+        if self.distinct_sketch is None:
+            return profile
+
+        # The distinct values are known exactly while they are all distinct
+        if self.is_unique():
+            profile["distinct"] = self.count
+        else:
+            profile["distinct"] = min(self.count, self.distinct_sketch.estimate())
+
+        if self.value_sketch.count > 0 or self.value_sketch.num_non_finite > 0:
+            profile["values"] = {"count": self.value_sketch.count,
+                                 "non_finite": self.value_sketch.num_non_finite,
+                                 "min": self.value_sketch.min,
+                                 "max": self.value_sketch.max}
+            for q in PROFILE_QUANTILES:
+                profile["values"]["p%d" % round(q * 100)] = self.value_sketch.quantile(q)
+
+        if self.min_string is not None:
+            profile["strings"] = {"min": self.min_string, "max": self.max_string}
+
+        if self.count > 0:
+            total_length = sum([length * count for length, count in self.length_counts.items()])
+            profile["lengths"] = {"min": self.min_length,
+                                  "max": self.max_length,
+                                  "mean": total_length / self.count}
+            for q in PROFILE_QUANTILES:
+                profile["lengths"]["p%d" % round(q * 100)] = histogram_quantile(self.length_counts, q)
+            profile["lengths"]["histogram"] = dict([(str(length), count)
+                                                    for length, count in sorted(self.length_counts.items())])
+
+        return profile
+
+
+def merge_column_statistics(statistics1, statistics2):
+    """
+    Merge the field name to ColumnStatistics dictionaries.
+
+    :param statistics1: First dictionary of field name to ColumnStatistics.
+    :param statistics2: Second dictionary of field name to ColumnStatistics.
+    :return: Merged dictionary of field name to ColumnStatistics.
+    """
+
+    # Preconditions
+    assert type(statistics1) == dict
+    assert type(statistics2) == dict
+    assert statistics1.keys() == statistics2.keys()
+
+    return dict([(key, statistics1[key].merge(statistics2[key])) for key in statistics1.keys()])
+
+
+def write_column_profiles(path, table_name, schema, column_statistics):
+    """
+    Write the profile of each column of a table as JSON to <path>/<safe table name>.json.
+
+    :param path: Folder to write the profile to.
+    :param table_name: Table name.
+    :param schema: Dictionary of field name to inferred type.
+    :param column_statistics: Dictionary of field name to (profiled) ColumnStatistics.
+    :return: Path of the JSON file.
+    """
+
+    # Preconditions
+    assert schema.keys() == column_statistics.keys()
+
+    columns = {}
+    for name, datatype in schema.items():
+        columns[name] = {"type": datatype.name}
+        columns[name].update(column_statistics[name].profile())
+
+    os.makedirs(path, exist_ok=True)
+    profile_path = os.path.join(path, "%s.json" % safe_name(table_name))
+    with open(profile_path, "w") as fp:
+        json.dump({"table": table_name, "columns": columns}, fp, indent=2)
+
+    return profile_path
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+import os
+
+# Settings of each section of a configuration file ('backends' and 'tables' hold a dictionary per backend or table)
+SECTION_SETTINGS = {
+    "source": ["path", "delimiter", "encapsulator", "encoding", "true-values", "false-values"],
+    "load": ["backend", "copy-format", "batch-size", "checkpoint", "narrow-types", "memory-limit", "soft-memory-limit",
+             "metrics-path", "prometheus-path", "async-logging", "inference", "assembly", "dedup", "rejects",
+             "discovery", "columns", "cache", "partition", "merge", "tune", "column-profile"],
+    "watch": ["poll-interval", "settle-seconds"],
+    "distribute": ["queue-path", "lease-seconds", "max-attempts", "poll-interval"],
+    "generate": ["path", "num-entries", "max-entries-per-file", "delimiter", "encapsulator"],
+    "backends": None,
+    "tables": None,
+}
+
+# Default settings of the source files
+DEFAULT_SOURCE = {"delimiter": ",",
+                  "encapsulator": "|",
+                  "encoding": "utf-8",
+                  "true-values": ["True"],
+                  "false-values": ["False"]}
+
+# Settings holding a dictionary of options that are disabled with false (TOML has no null)
+OPTIONAL_SETTINGS = ["inference", "assembly", "dedup", "rejects", "discovery", "memory-limit", "columns", "cache",
+                     "partition", "merge", "tune", "column-profile"]
+
+# Keyword arguments of load_database that aren't named after their setting
+LOAD_ARGUMENT_NAMES = {"inference": "inference_params",
+                       "assembly": "assembly_params",
+                       "dedup": "dedup_params",
+                       "rejects": "reject_params",
+                       "discovery": "discovery_params",
+                       "columns": "column_params",
+                       "cache": "cache_params",
+                       "partition": "partition_params",
+                       "merge": "merge_params",
+                       "tune": "tune_params",
+                       "column-profile": "column_profile_params"}
+
+
+def parse_config(text, file_format):
+    """
+    Parse the text of a configuration file.
+
+    The TOML and YAML parsers are only imported when they are needed.
+
+    :param text: Text of the configuration file.
+    :param file_format: 'toml' or 'yaml'.
+    :return: Dictionary of section name to dictionary of settings.
+    """
+
+    if file_format == "toml":
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        return tomllib.loads(text)
+    elif file_format == "yaml":
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("YAML configuration files require the PyYAML package")
+        return yaml.safe_load(text) or {}
+
+    raise ValueError("Unknown configuration file format: %s" % file_format)
+
+
+def check_config(config):
+    """
+    Check the sections and settings of a configuration.
+
+    :param config: Dictionary of section name to dictionary of settings.
+    """
+
+    for section, settings in config.items():
+        if section not in SECTION_SETTINGS:
+            raise ValueError("Unknown configuration section: %s" % section)
+        if type(settings) != dict:
+            raise ValueError("Configuration section %s must be a table of settings" % section)
+        if SECTION_SETTINGS[section] is None:
+            continue
+        for setting in settings.keys():
+            if setting not in SECTION_SETTINGS[section]:
+                raise ValueError("Unknown setting %s in configuration section %s" % (setting, section))
+
+
+def read_config(config_path):
+    """
+    Read a TOML (.toml) or YAML (.yaml or .yml) configuration file.
+
+    :param config_path: Path of the configuration file.
+    :return: Dictionary of section name to dictionary of settings.
+    """
+
+    extension = os.path.splitext(config_path)[1].lower()
+    if extension == ".toml":
+        file_format = "toml"
+    elif extension in [".yaml", ".yml"]:
+        file_format = "yaml"
+    else:
+        raise ValueError("Configuration files must be .toml, .yaml or .yml: %s" % config_path)
+
+    with open(config_path, encoding="utf-8") as fp:
+        config = parse_config(fp.read(), file_format)
+
+    check_config(config)
+    return config
+
+
+def backend_params(config, backend):
+    """
+    Get the connection (or output) parameters of a backend.
+
+    :param config: Configuration.
+    :param backend: Backend name.
+    :return: Dictionary of database parameters.
+    """
+
+    backends = config.get("backends", {})
+    if backend not in backends:
+        raise ValueError("The configuration has no [backends.%s] section" % backend)
+
+    return backends[backend]
+
+
+def source_settings(config):
+    """
+    Get the settings of the source files, with the defaults filled in.
+
+    :param config: Configuration.
+    :return: Dictionary of the settings of the source files.
+    """
+
+    source = dict(DEFAULT_SOURCE)
+    source.update(config.get("source", {}))
+    if "path" not in source:
+        raise ValueError("The configuration has no source path")
+
+    return source
+
+
+def optional_value(setting, value):
+    """
+    Get the value of a setting, mapping false to None for the optional settings.
+
+    :param setting: Setting name.
+    :param value: Value read from the configuration.
+    :return: Value.
+    """
+
+    if setting in OPTIONAL_SETTINGS and value is False:
+        return None
+
+    return value
+
+
+def load_arguments(config):
+    """
+    Build the arguments of load_database from a configuration.
+
+    :param config: Configuration.
+    :return: Dictionary of keyword arguments.
+    """
+
+    source = source_settings(config)
+    load = config.get("load", {})
+    backend = load.get("backend", "mariadb")
+
+    # Per-table overrides (checked by the loader), with the parameters of the table's backend
+    table_params = {}
+    for table_name, overrides in config.get("tables", {}).items():
+        table_params[table_name] = {}
+        for setting, value in overrides.items():
+            table_params[table_name][setting] = optional_value(setting, value)
+        if "backend" in overrides:
+            table_params[table_name]["db-params"] = backend_params(config, overrides["backend"])
+
+    arguments = {"filepath": source["path"],
+                 "delimiter": source["delimiter"],
+                 "encapsulator": source["encapsulator"],
+                 "encoding": source["encoding"],
+                 "true_values": source["true-values"],
+                 "false_values": source["false-values"],
+                 "db_params": backend_params(config, backend),
+                 "backend": backend,
+                 "table_params": table_params}
+
+    # The other load settings are the keyword arguments with underscores (e.g. batch-size is batch_size)
+    for setting, value in load.items():
+        if setting != "backend":
+            arguments[LOAD_ARGUMENT_NAMES.get(setting, setting.replace("-", "_"))] = optional_value(setting, value)
+
+    return arguments
+
+
+def generate_arguments(config):
+    """
+    Build the arguments of generate_raw_data from a configuration.
+
+    :param config: Configuration.
+    :return: Dictionary of keyword arguments.
+    """
+
+    source = source_settings(config)
+    generate = config.get("generate", {})
+
+    return {"filepath": generate.get("path", source["path"]),
+            "num_entries": generate.get("num-entries", 10),
+            "max_entries_per_file": generate.get("max-entries-per-file", 5),
+            "delimiter": generate.get("delimiter", source["delimiter"]),
+            "encapsulator": generate.get("encapsulator", source["encapsulator"])}
@@ -1,14 +1,84 @@
+import bisect
+import functools
 import logging
-import mysql.connector as mariadb
 
-from database_loader.type_inference import DataType
+from database_loader.type_inference import DataType, is_null
+from database_loader.value_cache import ValueCache
 from logger import logger
 
 # Initialise the module logger
-logger.initialise_logger("database-loader", log_level=logging.DEBUG)
+logger.initialise_logger("database-loader", log_level=logging.INFO)
 module_logger = logging.getLogger('database-loader')
 
 
+# Integer types from the narrowest to the widest with their (signed) ranges
+INTEGER_TYPES = [("TINYINT", -2 ** 7, 2 ** 7 - 1),
+                 ("SMALLINT", -2 ** 15, 2 ** 15 - 1),
+                 ("MEDIUMINT", -2 ** 23, 2 ** 23 - 1),
+                 ("INT", -2 ** 31, 2 ** 31 - 1),
+                 ("BIGINT", -2 ** 63, 2 ** 63 - 1)]
+
+# Temporal types of String columns whose values are all dates, datetimes or times
+TEMPORAL_TYPES = {"date": "DATE",
+                  "datetime": "DATETIME",
+                  "time": "TIME"}
+
+# Maximum precision and scale of DECIMAL columns
+DECIMAL_MAX_PRECISION = 65
+DECIMAL_MAX_SCALE = 30
+
+# Maximum lengths of String columns stored as CHAR(n) (all values of the same length) and VARCHAR(n)
+CHAR_MAX_LENGTH = 32
+VARCHAR_MAX_LENGTH = 1024
+
+# Methods of partitioning a table on a column and the default number of HASH partitions
+PARTITION_METHODS = ["hash", "range"]
+DEFAULT_NUM_PARTITIONS = 4
+
+
+def mariadb_connector():
+    """
+    Import the MariaDB (MySQL) connector on first use, so that runs that don't connect to MariaDB don't pay for it.
+
+    :return: mysql.connector module.
+    """
+
+    import mysql.connector
+    return mysql.connector
+
+
+def database_errors():
+    """
+    Get the errors raised by the database when a statement fails.
+
+    :return: Tuple of exception types.
+    """
+
+    return (mariadb_connector().Error,)
+
+
+def row_errors():
+    """
+    Get the errors raised by the database when a statement fails because of the values of its rows (rather than,
+    e.g., a lost connection, which fails any statement).
+
+    :return: Tuple of exception types.
+    """
+
+    connector = mariadb_connector()
+    return connector.DataError, connector.IntegrityError, connector.ProgrammingError
+
+
+def duplicate_key_errors():
+    """
+    Get the errors raised by the database when a row duplicates the key of another row.
+
+    :return: Tuple of exception types.
+    """
+
+    return (mariadb_connector().IntegrityError,)
+
+
 def build_database_connection(db_params, set_db=True):
     """
     Build a database connection given the database parameters.
@@ -18,6 +88,7 @@ def build_database_connection(db_params, set_db=True):
     :return: Database connection.
     """
 
+    mariadb = mariadb_connector()
     if set_db:
         return mariadb.connect(host=db_params['host'],
                                user=db_params['user'],
@@ -37,13 +108,13 @@ def create_database(db_params):
     """
 
     # Check if the database already
-    module_logger.info("Checking database: %s" % db_params['database-name'])
+    module_logger.info("Checking database: %s", db_params['database-name'])
 
     # Create the database
     mydb = build_database_connection(db_params, False)
     mycursor = mydb.cursor()
     create_string = "CREATE DATABASE IF NOT EXISTS %s" % db_params['database-name']
-    module_logger.info("Creating database with: %s" % create_string)
+    module_logger.info("Creating database with: %s", create_string)
     mycursor.execute(create_string)
     mycursor.close()
 
@@ -59,7 +130,7 @@ def drop_table(db_params, table_name):
 
     # Get the SQL 'safe' version of the table name
     safe_table_name = safe_name(table_name)
-    module_logger.info("Safe table name for %s is %s" % (table_name, safe_table_name))
+    module_logger.info("Safe table name for %s is %s", table_name, safe_table_name)
 
     # Get a database connection
     mydb = build_database_connection(db_params)
@@ -70,19 +141,87 @@ def drop_table(db_params, table_name):
     result = cursor.fetchone()
 
     if result:
-        module_logger.info("Table %s already exists" % safe_table_name)
+        module_logger.info("Table %s already exists", safe_table_name)
         drop_stmt = "DROP TABLE {0}".format(safe_table_name)
-        module_logger.info("Dropping table with: %s" % drop_stmt)
+        module_logger.info("Dropping table with: %s", drop_stmt)
         cursor.execute(drop_stmt)
         table_dropped = True
     else:
-        module_logger.info("Table %s doesn't exist" % safe_table_name)
+        module_logger.info("Table %s doesn't exist", safe_table_name)
         table_dropped = False
 
     cursor.close()
     return table_dropped
 
 
+def table_exists(db_params, table_name):
+    """
+    Does a database table exist?
+
+    :param db_params: Database parameters.
+    :param table_name: Name of the table.
+    :return: True if the table exists.
+    """
+
+    mydb = build_database_connection(db_params)
+    cursor = mydb.cursor()
+    cursor.execute("SHOW TABLES LIKE '{0}'".format(safe_name(table_name)))
+    result = cursor.fetchone()
+    cursor.close()
+
+    return bool(result)
+
+
+def add_unique_key_statement(table_name, key_columns):
+    """
+    Build the ALTER TABLE statement to add a unique key to a table.
+
+    :param table_name: Database table name.
+    :param key_columns: List of the columns of the unique key.
+    :return: ALTER statement.
+    """
+
+    # Preconditions
+    assert len(key_columns) > 0
+
+    return "ALTER TABLE %s ADD UNIQUE KEY %s____KEY (%s);" % (safe_name(table_name), safe_name(table_name),
+                                                            ", ".join([safe_name(name) for name in key_columns]))
+
+
+def ensure_unique_key(db_params, table_name, key_columns):
+    """
+    Add a unique key on the key columns to an existing table, unless the table already has a unique index on exactly
+    those columns (e.g. a table created by a load that didn't merge the rows by their key).
+
+    Adding the key fails if the table already holds rows with the same key.
+
+    :param db_params: Database parameters.
+    :param table_name: Database table name.
+    :param key_columns: List of the columns of the unique key.
+    :return: True if the key was added.
+    """
+
+    mydb = build_database_connection(db_params)
+    cursor = mydb.cursor()
+
+    # Each row of SHOW INDEX is a column of an index: (Table, Non_unique, Key_name, Seq_in_index, Column_name, ...)
+    cursor.execute("SHOW INDEX FROM %s" % safe_name(table_name))
+    unique_indexes = {}
+    for row in cursor.fetchall():
+        if not int(row[1]):
+            unique_indexes.setdefault(row[2], set()).add(row[4])
+
+    key_added = False
+    if set([safe_name(name) for name in key_columns]) not in unique_indexes.values():
+        stmt = add_unique_key_statement(table_name, key_columns)
+        module_logger.info("Adding the unique key of the merge with: %s", stmt)
+        cursor.execute(stmt)
+        key_added = True
+
+    cursor.close()
+    return key_added
+
+
 def drop_tables(db_params, table_names):
     """
     Drop the tables specified in the list of table_names if they already exist.
@@ -107,7 +246,11 @@ def datatype_to_sql_conversion(datatype):
     mappings = {DataType.int: "BIGINT",
                 DataType.float: "DOUBLE",
                 DataType.string: "TEXT",
-                DataType.boolean: "BOOLEAN"}
+                DataType.boolean: "BOOLEAN",
+                DataType.date: "DATE",
+                DataType.datetime: "DATETIME",
+                DataType.decimal: "DECIMAL(%d, %d)" % (DECIMAL_MAX_PRECISION, DECIMAL_MAX_SCALE),
+                DataType.null: "TEXT"}
 
     if datatype not in mappings:
         raise ValueError("Unknown data type: %s" % datatype)
@@ -115,6 +258,45 @@ def datatype_to_sql_conversion(datatype):
     return mappings[datatype]
 
 
+def narrowed_sql_type(datatype, statistics, integer_types=INTEGER_TYPES, temporal_types=TEMPORAL_TYPES,
+                      conversion=datatype_to_sql_conversion):
+    """
+    Convert the inferred data type to the narrowest suitable SQL type given the statistics of the column.
+
+    :param datatype: Datatype.
+    :param statistics: ColumnStatistics of the column (or None to use the default type).
+    :param integer_types: List of (type, minimum, maximum) from the narrowest to the widest integer type.
+    :param temporal_types: Dictionary of temporal format name to SQL type.
+    :param conversion: Function to get the default SQL type of a datatype.
+    :return: SQL type.
+    """
+
+    if statistics is None or statistics.count == 0:
+        return conversion(datatype)
+
+    if datatype == DataType.int and statistics.min_int is not None:
+        for sql_type, minimum, maximum in integer_types:
+            if minimum <= statistics.min_int and statistics.max_int <= maximum:
+                return sql_type
+
+    if datatype == DataType.decimal and statistics.scale <= DECIMAL_MAX_SCALE and \
+            0 < statistics.integer_digits + statistics.scale <= DECIMAL_MAX_PRECISION:
+        return "DECIMAL(%d, %d)" % (statistics.integer_digits + statistics.scale, statistics.scale)
+
+    if datatype == DataType.string:
+        temporal_type = statistics.temporal_type()
+        if temporal_type is not None:
+            return temporal_types[temporal_type]
+
+        if statistics.is_fixed_length() and 0 < statistics.max_length <= CHAR_MAX_LENGTH:
+            return "CHAR(%d)" % statistics.max_length
+
+        if statistics.max_length <= VARCHAR_MAX_LENGTH:
+            return "VARCHAR(%d)" % max(statistics.max_length, 1)
+
+    return conversion(datatype)
+
+
 def safe_name(name):
     """
     Create a SQL-safe name.
@@ -130,12 +312,23 @@ def safe_name(name):
     return "".join(safe_chars)
 
 
-def create_table_statement(table_name, schema):
+def create_table_statement(table_name, schema, column_statistics=None, partition_params=None, key_columns=None,
+                           temporary=False):
     """
     Build the CREATE TABLE statement.
 
+    Each table has an AUTO_INCREMENT ____ID column as its primary key (with the partitioning column of a partitioned
+    table). The multi-row INSERT statements of the loader are 'simple inserts' for InnoDB, which only hold a
+    lightweight mutex while their IDs are allocated, unless innodb_autoinc_lock_mode is 0 (see
+    check_autoinc_lock_mode).
+
     :param table_name: Database table name.
     :param schema: Inferred schema.
+    :param column_statistics: Dictionary of field name to ColumnStatistics to narrow the types (optional).
+    :param partition_params: Dictionary of partitioning parameters (see check_partition_params), or None for an
+        unpartitioned table.
+    :param key_columns: List of the columns of a unique key (optional).
+    :param temporary: Create a temporary table?
     :return: CREATE statement.
     """
 
@@ -143,29 +336,188 @@ def create_table_statement(table_name, schema):
     assert type(schema) == dict
 
     # Create a list of field name and SQL type
-    name_type = ["%s %s" % (safe_name(name), datatype_to_sql_conversion(tpe)) for name, tpe in schema.items()]
+    if column_statistics is None:
+        name_type = ["%s %s" % (safe_name(name), datatype_to_sql_conversion(tpe)) for name, tpe in schema.items()]
+    else:
+        name_type = ["%s %s" % (safe_name(name), narrowed_sql_type(tpe, column_statistics.get(name)))
+                     for name, tpe in schema.items()]
 
+    # Every unique key of a partitioned table must include the partitioning column
     id_field_name = "%s____ID" % safe_name(table_name)
-    primary_key = "PRIMARY KEY (%s)" % id_field_name
+    key_fields = [id_field_name]
+    if partition_params is not None:
+        key_fields.append(safe_name(partition_params['column']))
+
+    primary_key = "PRIMARY KEY (%s)" % ", ".join(key_fields)
     field_spec = "%s INT NOT NULL AUTO_INCREMENT, %s, %s" % (id_field_name, ", ".join(name_type), primary_key)
+    if key_columns is not None:
+        field_spec += ", UNIQUE KEY %s____KEY (%s)" % (safe_name(table_name),
+                                                      ", ".join([safe_name(name) for name in key_columns]))
+
+    stmt = "CREATE %sTABLE %s (%s)" % ("TEMPORARY " if temporary else "", safe_name(table_name), field_spec)
+    if partition_params is not None:
+        stmt += " " + partition_clause(partition_params)
+
+    return stmt + ";"
+
+
+def check_autoinc_lock_mode(db_params):
+    """
+    Warn if InnoDB's auto-increment lock serialises the concurrent inserts into a table.
+
+    Under innodb_autoinc_lock_mode 0 ('traditional'), each INSERT into a table with an AUTO_INCREMENT column holds a
+    table-level lock until the end of the statement, so the writers of a partitioned table insert one at a time.
+    Under modes 1 (the MariaDB default) and 2, the multi-row INSERT statements only hold a lightweight mutex.
+
+    :param db_params: Database parameters.
+    :return: innodb_autoinc_lock_mode, or None if it isn't known.
+    """
+
+    mydb = build_database_connection(db_params)
+    cursor = mydb.cursor()
+    cursor.execute("SELECT @@innodb_autoinc_lock_mode")
+    result = cursor.fetchone()
+    cursor.close()
+    mydb.close()
+
+    lock_mode = int(result[0]) if result is not None and result[0] is not None else None
+    if lock_mode == 0:
+        module_logger.warning("innodb_autoinc_lock_mode is 0, so the concurrent INSERT statements into a table are "
+                              "serialised by its AUTO_INCREMENT lock (set it to 1 or 2)")
+
+    return lock_mode
+
+
+def check_partition_params(schema, partition_params, column_statistics=None):
+    """
+    Check the parameters to partition a table on a column.
+
+    The parameters are the 'column' to partition on (an integer column without NULLs, as it is part of the primary
+    key), the 'method' ('hash' or 'range'), the number of 'partitions' of a HASH partitioned table, the ascending
+    upper 'bounds' of the RANGE partitions (a last partition holds the values from the last bound upwards) and
+    optionally the number of 'writers'.
+
+    :param schema: Dictionary of field name to inferred type.
+    :param partition_params: Dictionary of partitioning parameters.
+    :param column_statistics: Dictionary of field name to ColumnStatistics to check for NULLs (optional).
+    """
+
+    column = partition_params.get('column')
+    if column not in schema:
+        raise ValueError("Unknown partitioning column: %s" % column)
+    if schema[column] != DataType.int:
+        raise ValueError("Partitioning column %s must be an integer column, not %s" % (column, schema[column]))
+    if column_statistics is not None and column in column_statistics and column_statistics[column].null_count > 0:
+        raise ValueError("Partitioning column %s has %d NULLs, but is part of the primary key (NOT NULL)" %
+                         (column, column_statistics[column].null_count))
+
+    method = partition_params.get('method', "hash")
+    if method not in PARTITION_METHODS:
+        raise ValueError("Unknown partitioning method: %s" % method)
+
+    if method == "hash" and partition_params.get('partitions', DEFAULT_NUM_PARTITIONS) < 1:
+        raise ValueError("Number of partitions must be at least 1: %s" % partition_params['partitions'])
+
+    if method == "range":
+        bounds = partition_params.get('bounds', [])
+        if len(bounds) == 0 or any(lower >= upper for lower, upper in zip(bounds, bounds[1:])):
+            raise ValueError("Range partition bounds must be a non-empty ascending list: %s" % bounds)
+
+
+def num_partitions(partition_params):
+    """
+    Get the number of partitions of a table.
+
+    :param partition_params: Dictionary of partitioning parameters.
+    :return: Number of partitions.
+    """
+
+    if partition_params.get('method', "hash") == "range":
+        return len(partition_params['bounds']) + 1
+
+    return partition_params.get('partitions', DEFAULT_NUM_PARTITIONS)
+
+
+def partition_clause(partition_params):
+    """
+    Build the PARTITION BY clause of the CREATE TABLE statement.
+
+    :param partition_params: Dictionary of partitioning parameters (see check_partition_params).
+    :return: PARTITION BY clause.
+    """
+
+    column = safe_name(partition_params['column'])
+    if partition_params.get('method', "hash") == "hash":
+        return "PARTITION BY HASH (%s) PARTITIONS %d" % (column, num_partitions(partition_params))
+
+    partitions = ["PARTITION p%d VALUES LESS THAN (%d)" % (index, bound)
+                  for index, bound in enumerate(partition_params['bounds'])]
+    partitions.append("PARTITION p%d VALUES LESS THAN MAXVALUE" % len(partition_params['bounds']))
+
+    return "PARTITION BY RANGE (%s) (%s)" % (column, ", ".join(partitions))
 
-    stmt = "CREATE TABLE %s (%s);" % (safe_name(table_name), field_spec)
 
-    return stmt
+def partition_router(partition_params):
+    """
+    Build the function that finds the partition of a row, as MariaDB does (MOD of the value for HASH partitions and
+    the first bound above the value for RANGE partitions).
+
+    :param partition_params: Dictionary of partitioning parameters (see check_partition_params).
+    :return: Function of a row (dictionary of field name to raw String value) returning the partition index.
+    """
+
+    column = partition_params['column']
+
+    if partition_params.get('method', "hash") == "hash":
+        partitions = num_partitions(partition_params)
+
+        def route(data_dict):
+            value = data_dict[column]
+            return abs(int(value)) % partitions if not is_null(value) else 0
+    else:
+        bounds = partition_params['bounds']
 
+        def route(data_dict):
+            value = data_dict[column]
+            return bisect.bisect_right(bounds, int(value)) if not is_null(value) else 0
 
-def create_table(db_params, table_name, schema):
+    return route
+
+
+def alter_table_statement(table_name, schema):
+    """
+    Build the ALTER TABLE statement to change the types of columns.
+
+    :param table_name: Database table name.
+    :param schema: Dictionary of field name to the new type of each column to change.
+    :return: ALTER statement.
+    """
+
+    # Preconditions
+    assert type(schema) == dict
+    assert len(schema) > 0
+
+    modify = ["MODIFY COLUMN %s %s" % (safe_name(name), datatype_to_sql_conversion(tpe)) for name, tpe in schema.items()]
+
+    return "ALTER TABLE %s %s;" % (safe_name(table_name), ", ".join(modify))
+
+
+def create_table(db_params, table_name, schema, column_statistics=None, partition_params=None, key_columns=None):
     """
     Create the database table based on the inferred schema.
 
     :param db_params: Database parameters.
     :param table_name: Database table name.
     :param schema: List of tuples of field name to inferred type.
+    :param column_statistics: Dictionary of field name to ColumnStatistics to narrow the types (optional).
+    :param partition_params: Dictionary of partitioning parameters (see check_partition_params), or None for an
+        unpartitioned table.
+    :param key_columns: List of the columns of a unique key (optional).
     """
 
     # Create the statement
-    stmt = create_table_statement(table_name, schema)
-    module_logger.info("Creating table with: %s" % stmt)
+    stmt = create_table_statement(table_name, schema, column_statistics, partition_params, key_columns)
+    module_logger.info("Creating table with: %s", stmt)
 
     # Get a database connection
     mydb = build_database_connection(db_params)
@@ -175,6 +527,84 @@ def create_table(db_params, table_name, schema):
     cursor.execute(stmt)
 
 
+def sql_value(value, datatype, true_values, false_values, temporal_detector=None):
+    """
+    Transform a value into its SQL value.
+
+    :param value: String value.
+    :param datatype: Inferred type of the value's field.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param temporal_detector: ColumnTypeDetector to convert a date or datetime to ISO format (optional).
+    :return: SQL value.
+    """
+
+    if datatype != DataType.string and is_null(value):
+        return 'NULL'
+    elif temporal_detector is not None:
+        return "\"%s\"" % temporal_detector.temporal_value(value)
+    elif datatype == DataType.boolean:
+        if value in true_values:
+            return 'true'
+        elif value in false_values:
+            return 'false'
+        else:
+            raise ValueError("Unable to parse Boolean value: %s" % value)
+
+    return "\"%s\"" % value
+
+
+def build_value_caches(schema, true_values, false_values, temporal_detectors=None):
+    """
+    Build the caches of the SQL values of the columns whose values are converted (Booleans, dates and datetimes).
+
+    :param schema: Dictionary of field name to inferred type.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param temporal_detectors: Dictionary of field name to ColumnTypeDetector (optional).
+    :return: Dictionary of field name to ValueCache.
+    """
+
+    value_caches = {}
+    for fieldname, datatype in schema.items():
+        detector = temporal_detectors.get(fieldname) if temporal_detectors is not None else None
+        if detector is not None or datatype == DataType.boolean:
+            value_caches[fieldname] = ValueCache(functools.partial(sql_value, datatype=datatype,
+                                                                   true_values=true_values,
+                                                                   false_values=false_values,
+                                                                   temporal_detector=detector))
+
+    return value_caches
+
+
+def transform_values(schema, data, true_values, false_values, temporal_detectors=None, value_caches=None):
+    """
+    Apply the data type-specific transforms to a row of data.
+
+    :param schema: Dictionary of field name to inferred type.
+    :param data: Dictionary of field name to value.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param temporal_detectors: Dictionary of field name to ColumnTypeDetector to convert the dates and datetimes to ISO
+        format (if None, they are assumed to already be in ISO format).
+    :param value_caches: Dictionary of field name to ValueCache of the SQL values (see build_value_caches).
+    :return: List of SQL values (in the order of the fields in data).
+    """
+
+    list_values = []
+
+    for fieldname, value in data.items():
+        if value_caches is not None and fieldname in value_caches:
+            value = value_caches[fieldname].get(value)
+        else:
+            detector = temporal_detectors.get(fieldname) if temporal_detectors is not None else None
+            value = sql_value(value, schema[fieldname], true_values, false_values, detector)
+
+        list_values.append(value)
+
+    return list_values
+
+
 def insert_data_statement(table_name, schema, data, true_values, false_values):
     """
     Build the INSERT statement to put the data into the database.
@@ -193,30 +623,80 @@ def insert_data_statement(table_name, schema, data, true_values, false_values):
     assert type(data) == dict
 
     # Map the field names to their safe variants and apply data type-specific transforms
-    list_column_names = []
-    list_values = []
+    str_list_column_names = ", ".join([safe_name(fieldname) for fieldname in data.keys()])
+    str_list_values = ", ".join(transform_values(schema, data, true_values, false_values))
 
-    for fieldname, value in data.items():
-        safe_column_name = safe_name(fieldname)
-
-        if schema[fieldname] == DataType.boolean:
-            if data[fieldname] in true_values:
-                value = 'true'
-            elif data[fieldname] in false_values:
-                value = 'false'
-            else:
-                raise ValueError("Unable to parse Boolean value: %s" % data[fieldname])
-        else:
-            value = "\"%s\"" % value
+    # Return the INSERT statement
+    return "INSERT INTO %s (%s) VALUES (%s);" % (safe_name(table_name), str_list_column_names, str_list_values)
 
-        list_column_names.append(safe_column_name)
-        list_values.append(value)
 
-    str_list_column_names = ", ".join(list_column_names)
-    str_list_values = ", ".join(list_values)
+def insert_data_batch_statement(table_name, column_names, list_values):
+    """
+    Build a multi-row INSERT statement from rows of transformed values.
 
-    # Return the INSERT statement
-    return "INSERT INTO %s (%s) VALUES (%s);" % (safe_name(table_name), str_list_column_names, str_list_values)
+    :param table_name: Database table name.
+    :param column_names: Field names (in the order of the values).
+    :param list_values: List of rows, each a list of SQL values from transform_values().
+    :return: INSERT statement.
+    """
+
+    # Preconditions
+    assert type(table_name) == str
+    assert len(list_values) > 0
+
+    str_list_column_names = ", ".join([safe_name(fieldname) for fieldname in column_names])
+    str_rows = ", ".join(["(%s)" % ", ".join(values) for values in list_values])
+
+    return "INSERT INTO %s (%s) VALUES %s;" % (safe_name(table_name), str_list_column_names, str_rows)
+
+
+def upsert_data_batch_statement(table_name, column_names, list_values, key_columns):
+    """
+    Build a multi-row INSERT statement that updates the existing rows with the same key.
+
+    :param table_name: Database table name.
+    :param column_names: Field names (in the order of the values).
+    :param list_values: List of rows, each a list of SQL values from transform_values().
+    :param key_columns: List of the columns of the table's unique key.
+    :return: INSERT ... ON DUPLICATE KEY UPDATE statement.
+    """
+
+    stmt = insert_data_batch_statement(table_name, column_names, list_values)
+
+    return "%s ON DUPLICATE KEY UPDATE %s;" % (stmt[:-1], update_assignments(column_names, key_columns))
+
+
+def merge_staged_statement(table_name, stage_table_name, column_names, key_columns):
+    """
+    Build the statement that merges the rows of a staging table into a table, in the order they were staged.
+
+    :param table_name: Database table name.
+    :param stage_table_name: Name of the staging table (created by create_table_statement).
+    :param column_names: Field names.
+    :param key_columns: List of the columns of the table's unique key.
+    :return: INSERT ... SELECT ... ON DUPLICATE KEY UPDATE statement.
+    """
+
+    str_list_column_names = ", ".join([safe_name(fieldname) for fieldname in column_names])
+
+    return "INSERT INTO %s (%s) SELECT %s FROM %s ORDER BY %s____ID ON DUPLICATE KEY UPDATE %s;" % (
+        safe_name(table_name), str_list_column_names, str_list_column_names, safe_name(stage_table_name),
+        safe_name(stage_table_name), update_assignments(column_names, key_columns))
+
+
+def update_assignments(column_names, key_columns):
+    """
+    Build the assignments of the ON DUPLICATE KEY UPDATE clause, which set the columns outside the key.
+
+    :param column_names: Field names.
+    :param key_columns: List of the columns of the unique key.
+    :return: String of assignments.
+    """
+
+    # A table with only key columns still needs an assignment (that leaves the row unchanged)
+    update_columns = [name for name in column_names if name not in key_columns] or key_columns[:1]
+
+    return ", ".join(["%s = VALUES(%s)" % (safe_name(name), safe_name(name)) for name in update_columns])
 
 
 def insert_data(db_params, table_name, schema, data, true_values, false_values):
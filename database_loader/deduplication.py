@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+import heapq
+import logging
+
+from database_loader.assembly import read_run, write_run
+from database_loader.ordering import key_order
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Default maximum number of keys (or rows, when sorting) held in memory before spilling to disk
+DEFAULT_MAX_KEYS = 1000000
+
+# Minimum number of keys (or rows) held in memory before spilling early because of memory pressure
+MIN_PRESSURE_SPILL = 1000
+
+
+def row_key(data, key_columns):
+    """
+    Get the deduplication key of a row.
+
+    :param data: Dictionary of field name to value.
+    :param key_columns: List of the key columns (or None to use the whole row).
+    :return: Tuple of values.
+    """
+
+    if key_columns is None:
+        return tuple(data.values())
+
+    return tuple([data[column] for column in key_columns])
+
+
+def sort_key(entry):
+    """
+    Get the sort order of a (key, row) entry (the key values in numeric-aware order).
+
+    Values with the same numeric order (such as '1' and '01') are ordered by the values themselves, so that the entries
+    of each key are adjacent.
+
+    :param entry: Tuple of (key, row).
+    :return: Sortable tuple.
+    """
+
+    return tuple([(key_order(value), value) for value in entry[0]])
+
+
+class Deduplicator(object):
+    """
+    Removes duplicate rows from a stream, keeping the first row with each key.
+
+    The keys seen are held in a hash set of up to max_keys entries. When the set is full, it is spilled to disk as a
+    sorted run of keys and the remaining rows are written to sorted runs; the runs are then merged so that the
+    duplicates of each key are adjacent. If sort_output is True, all of the rows are emitted in key order.
+
+    If a MemoryBudget is under pressure, the keys (or rows) are spilled before max_keys is reached.
+    """
+
+    def __init__(self, key_columns=None, max_keys=DEFAULT_MAX_KEYS, sort_output=False, spill_path=None,
+                 memory_budget=None):
+        """
+        :param key_columns: List of the key columns (or None to use the whole row).
+        :param max_keys: Maximum number of keys (or rows, when sorting) held in memory.
+        :param sort_output: Emit the rows in key order?
+        :param spill_path: Folder to spill the sorted runs to (if None, the system's temporary folder).
+        :param memory_budget: MemoryBudget to spill early under memory pressure (optional).
+        """
+
+        assert max_keys > 0
+
+        self.key_columns = key_columns
+        self.max_keys = max_keys
+        self.sort_output = sort_output
+        self.spill_path = spill_path
+        self.memory_budget = memory_budget
+
+        self.num_rows = 0
+        self.num_duplicates = 0
+        self.num_runs = 0
+
+    def _is_full(self, num_keys):
+        """Should num_keys keys (or rows) held in memory be spilled?"""
+
+        if num_keys >= self.max_keys:
+            return True
+
+        return self.memory_budget is not None and self.memory_budget.under_pressure and \
+            num_keys >= MIN_PRESSURE_SPILL
+
+    def _spill(self, entries, run_paths):
+        """Write entries of (key, row) to a sorted run."""
+
+        entries.sort(key=sort_key)
+        run_paths.append(write_run(entries, self.spill_path))
+        self.num_runs += 1
+
+        # Release the entries before checking the memory
+        del entries[:]
+        if self.memory_budget is not None:
+            self.memory_budget.relieve_pressure()
+
+    def _merge(self, run_paths, entries):
+        """Merge the sorted runs and the entries still in memory, yielding the first row of each key."""
+
+        entries.sort(key=sort_key)
+        runs = [read_run(path) for path in run_paths] + [iter(entries)]
+
+        # Runs are merged in the order they were written, so the first entry of a key is the first seen; a row of
+        # None marks a key that has already been emitted
+        previous = None
+        for key, data in heapq.merge(*runs, key=sort_key):
+            if key == previous:
+                self.num_duplicates += 1
+                continue
+            previous = key
+            if data is not None:
+                yield data
+
+    def deduplicate(self, rows):
+        """
+        Remove the duplicate rows from a stream.
+
+        :param rows: Iterable of dictionaries of field name to value.
+        :return: Generator of the rows without duplicates.
+        """
+
+        run_paths = []
+
+        if self.sort_output:
+            # Hold the first row of each key, spilling sorted runs when memory is full
+            first_rows = {}
+            for data in rows:
+                self.num_rows += 1
+                key = row_key(data, self.key_columns)
+                if key in first_rows:
+                    self.num_duplicates += 1
+                    continue
+                first_rows[key] = data
+                if self._is_full(len(first_rows)):
+                    items = list(first_rows.items())
+                    first_rows = {}
+                    self._spill(items, run_paths)
+
+            for data in self._merge(run_paths, list(first_rows.items())):
+                yield data
+            return
+
+        # Emit the rows as they arrive until the hash set of keys is full
+        seen = set()
+        rows = iter(rows)
+        for data in rows:
+            self.num_rows += 1
+            key = row_key(data, self.key_columns)
+            if key in seen:
+                self.num_duplicates += 1
+                continue
+            seen.add(key)
+            yield data
+
+            if self._is_full(len(seen)):
+                break
+        else:
+            return
+
+        # Spill the keys already emitted and sort the remaining rows in runs
+        module_logger.info("Deduplication holds %d keys, spilling to disk", len(seen))
+        entries = [(key, None) for key in seen]
+        seen = None
+        self._spill(entries, run_paths)
+
+        # The spilled list is emptied, so it is reused for the remaining rows
+        for data in rows:
+            self.num_rows += 1
+            entries.append((row_key(data, self.key_columns), data))
+            if self._is_full(len(entries)):
+                self._spill(entries, run_paths)
+
+        for data in self._merge(run_paths, entries):
+            yield data
+
+
+def deduplicate_rows(rows, dedup_params, memory_budget=None):
+    """
+    Remove the duplicate rows from a stream given the deduplication parameters.
+
+    :param rows: Iterable of dictionaries of field name to value.
+    :param dedup_params: Dictionary of deduplication parameters: 'key' (list of the key columns, or None for the whole
+        row), 'max-keys', 'sorted' (emit the rows in key order?) and 'spill-path' (all optional).
+    :param memory_budget: MemoryBudget to spill early under memory pressure (optional).
+    :return: Generator of the rows without duplicates.
+    """
+
+    deduplicator = Deduplicator(dedup_params.get('key'), dedup_params.get('max-keys', DEFAULT_MAX_KEYS),
+                                dedup_params.get('sorted', False), dedup_params.get('spill-path'), memory_budget)
+
+    for data in deduplicator.deduplicate(rows):
+        yield data
+
+    module_logger.info("Removed %d duplicate rows of %d (%d runs spilled to disk)", deduplicator.num_duplicates,
+                       deduplicator.num_rows, deduplicator.num_runs)
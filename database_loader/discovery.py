@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+import collections
+import fnmatch
+import logging
+import os
+import re
+
+from database_loader.ordering import file_order
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Numeric suffix of a filename without its extension (e.g. m001_dob_12)
+TABLE_NAME_PATTERN = re.compile(r"^(.*?)_\d+$")
+
+# Extension of the files to load
+CSV_EXTENSION = ".csv"
+
+# A file found by the discovery and its size in bytes (used to schedule the load)
+DiscoveredFile = collections.namedtuple("DiscoveredFile", ["path", "size"])
+
+
+def table_name_from_filename(file_path):
+    """
+    Get the table name from a filename.
+
+    :param file_path: File path.
+    :return: Database table name to files that should be used to populate that table.
+    """
+
+    # Extract the filename part from the path and remove the file extension
+    filename_minus_ext = os.path.splitext(os.path.basename(file_path))[0]
+
+    # If the end of the filename is of the form _<number> then remove it
+    m = TABLE_NAME_PATTERN.match(filename_minus_ext)
+    if m is not None:
+        return m.group(1)
+
+    return filename_minus_ext
+
+
+def compile_patterns(patterns):
+    """
+    Compile a list of glob patterns (e.g. 'm00*' or 'archive/*') into a single regular expression.
+
+    :param patterns: List of glob patterns (or None).
+    :return: Compiled regular expression, or None if there are no patterns.
+    """
+
+    if not patterns:
+        return None
+
+    return re.compile("|".join([fnmatch.translate(pattern) for pattern in patterns]))
+
+
+def scan_files(folder, recursive=False, extension=CSV_EXTENSION):
+    """
+    List the files in a folder with os.scandir, taking the sizes from the directory entries in the same pass.
+
+    Hidden files and folders (starting with a '.') are skipped.
+
+    :param folder: Folder to list.
+    :param recursive: Also list the files in the sub-folders?
+    :param extension: Extension of the files to include.
+    :return: Generator of DiscoveredFile.
+    """
+
+    folders = [folder]
+    while len(folders) > 0:
+        with os.scandir(folders.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir():
+                    if recursive:
+                        folders.append(entry.path)
+                elif entry.name.endswith(extension) and entry.is_file():
+                    yield DiscoveredFile(entry.path, entry.stat().st_size)
+
+
+def read_manifest(manifest_path):
+    """
+    Read the files to load from a manifest instead of listing a folder.
+
+    Each line of the manifest is a file path (relative to the manifest's folder unless absolute), optionally followed
+    by a tab and the size of the file in bytes. Blank lines and lines starting with '#' are ignored.
+
+    :param manifest_path: Path of the manifest.
+    :return: List of DiscoveredFile.
+    """
+
+    manifest_folder = os.path.dirname(manifest_path)
+    files = []
+
+    with open(manifest_path, encoding="utf-8") as fp:
+        for line_number, line in enumerate(fp, 1):
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+
+            parts = line.split("\t")
+            path = os.path.join(manifest_folder, parts[0])
+            if len(parts) == 1:
+                size = os.path.getsize(path)
+            elif len(parts) == 2 and parts[1].isdigit():
+                size = int(parts[1])
+            else:
+                raise ValueError("Invalid line %d of manifest %s: %s" % (line_number, manifest_path, line))
+
+            files.append(DiscoveredFile(path, size))
+
+    return files
+
+
+def table_name_of(file_path, folder, table_name_from="file"):
+    """
+    Get the table name of a discovered file.
+
+    :param file_path: File path.
+    :param folder: Folder the file was discovered in.
+    :param table_name_from: 'file' to take the table name from the filename, or 'folder' to take it from the top-level
+        sub-folder of a partitioned layout (e.g. <folder>/people/date=2020-01-01/part_1.csv is in table people).
+    :return: Table name.
+    """
+
+    if table_name_from == "folder":
+        relative_folder = os.path.dirname(os.path.relpath(file_path, folder))
+        if len(relative_folder) > 0 and not relative_folder.startswith(".."):
+            return relative_folder.split(os.sep)[0]
+    elif table_name_from != "file":
+        raise ValueError("Unknown table name source: %s" % table_name_from)
+
+    return table_name_from_filename(file_path)
+
+
+def discover_files(folder, discovery_params=None):
+    """
+    Find the files to load.
+
+    :param folder: Folder containing the CSV files.
+    :param discovery_params: Dictionary of discovery parameters (see discover_tables), or None to list the folder.
+    :return: List of DiscoveredFile.
+    """
+
+    if discovery_params is None:
+        discovery_params = {}
+
+    if discovery_params.get('manifest') is not None:
+        files = read_manifest(discovery_params['manifest'])
+    else:
+        files = scan_files(folder, discovery_params.get('recursive', False))
+
+    # Match the include and exclude patterns against the path relative to the folder
+    include = compile_patterns(discovery_params.get('include'))
+    exclude = compile_patterns(discovery_params.get('exclude'))
+    if include is None and exclude is None:
+        return list(files)
+
+    selected = []
+    for discovered in files:
+        relative_path = os.path.relpath(discovered.path, folder).replace(os.sep, "/")
+        if include is not None and include.match(relative_path) is None:
+            continue
+        if exclude is not None and exclude.match(relative_path) is not None:
+            continue
+        selected.append(discovered)
+
+    return selected
+
+
+def discover_tables(folder, discovery_params=None):
+    """
+    Find the files to load and group them into tables.
+
+    :param folder: Folder containing the CSV files.
+    :param discovery_params: Dictionary of discovery parameters (all optional): 'recursive' (also search the
+        sub-folders?), 'include' and 'exclude' (lists of glob patterns matched against the path relative to the
+        folder), 'manifest' (file listing the files to load instead of the folder) and 'table-name-from' ('file' or
+        'folder').
+    :return: Dictionary of table name to list of DiscoveredFile in natural order (e.g. _2 before _10).
+    """
+
+    table_name_from = (discovery_params or {}).get('table-name-from', "file")
+
+    table_name_to_files = {}
+    for discovered in discover_files(folder, discovery_params):
+        table_name = table_name_of(discovered.path, folder, table_name_from)
+        table_name_to_files.setdefault(table_name, []).append(discovered)
+
+    for files in table_name_to_files.values():
+        files.sort(key=lambda discovered: file_order(discovered.path))
+
+    module_logger.info("Discovered %d files in %d tables", sum([len(files) for files in table_name_to_files.values()]),
+                       len(table_name_to_files))
+
+    return table_name_to_files
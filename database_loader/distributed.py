@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+import collections
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from database_loader import checkpoints, database_utilities
+from database_loader.database_utilities import database_errors
+from database_loader.discovery import discover_tables
+from database_loader.loader import build_schema_from_files, insert_data_from_files, DEFAULT_BATCH_SIZE
+from database_loader.metrics import LoadMetrics
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Default number of seconds a worker holds a task without renewing its lease
+DEFAULT_LEASE_SECONDS = 60.0
+
+# Default number of times a task is claimed before it is failed
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Default number of seconds a worker waits when the remaining tasks are all held by other workers
+DEFAULT_POLL_INTERVAL = 2.0
+
+# Number of seconds SQLite waits for the lock of the queue held by another process
+QUEUE_LOCK_TIMEOUT = 30.0
+
+# States of a task
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+class LeaseLost(Exception):
+    """Raised to abort the load of a file whose task is no longer leased by the worker."""
+
+
+# Task claimed by a worker
+Task = collections.namedtuple("Task", ["task_id", "table_name", "file_path", "attempts"])
+
+
+def create_queue_statements():
+    """
+    Build the statements that create the tables of the work queue.
+
+    :return: List of SQL statements.
+    """
+
+    return ["CREATE TABLE IF NOT EXISTS queue_tables (table_name TEXT PRIMARY KEY, table_schema TEXT NOT NULL, "
+            "settings TEXT NOT NULL)",
+            "CREATE TABLE IF NOT EXISTS queue_tasks (task_id INTEGER PRIMARY KEY, table_name TEXT NOT NULL, "
+            "file_path TEXT NOT NULL UNIQUE, state TEXT NOT NULL, worker TEXT, lease_expires REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, rows_inserted INTEGER, error TEXT)"]
+
+
+class WorkQueue(object):
+    """
+    Queue of the files to load, in a SQLite database on storage shared by the coordinator and the workers.
+
+    A worker claims a task by leasing it for lease_seconds, renews the lease while it loads the file and reports the
+    task done or failed. A task whose lease expires (e.g. as its worker crashed) is claimed again, until it has been
+    claimed max_attempts times. Each claim is made in an immediate transaction, so that two workers never claim the
+    same task. The lease times are wall-clock times, so the clocks of the hosts must be synchronised.
+    """
+
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        :param path: Path of the SQLite database (created if it doesn't exist).
+        :param max_attempts: Number of times a task is claimed before it is failed.
+        """
+
+        assert max_attempts > 0
+
+        self.path = path
+        self.max_attempts = max_attempts
+
+        # Transactions are begun explicitly
+        self._connection = sqlite3.connect(path, timeout=QUEUE_LOCK_TIMEOUT, isolation_level=None)
+        for stmt in create_queue_statements():
+            self._connection.execute(stmt)
+
+    def _transaction(self):
+        """Begin a transaction holding the write lock of the queue (committed or rolled back by the caller)."""
+
+        self._connection.execute("BEGIN IMMEDIATE")
+        return self._connection
+
+    def _execute(self, stmt, params=()):
+        """Execute a statement in its own transaction."""
+
+        connection = self._transaction()
+        try:
+            cursor = connection.execute(stmt, params)
+            connection.execute("COMMIT")
+            return cursor
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        """Remove all of the tables and tasks."""
+
+        connection = self._transaction()
+        connection.execute("DELETE FROM queue_tasks")
+        connection.execute("DELETE FROM queue_tables")
+        connection.execute("COMMIT")
+
+    def publish_table(self, table_name, schema, settings, files):
+        """
+        Publish the files of a table as pending tasks.
+
+        :param table_name: Table name.
+        :param schema: Dictionary of field name to type of the table.
+        :param settings: Dictionary of the settings the workers read the files with (JSON-serialisable).
+        :param files: List of the files of the table.
+        """
+
+        connection = self._transaction()
+        connection.execute("REPLACE INTO queue_tables (table_name, table_schema, settings) VALUES (?, ?, ?)",
+                           (table_name, checkpoints.schema_to_json(schema), json.dumps(settings)))
+        connection.executemany("REPLACE INTO queue_tasks (table_name, file_path, state) VALUES (?, ?, ?)",
+                               [(table_name, file_path, PENDING) for file_path in files])
+        connection.execute("COMMIT")
+
+    def table(self, table_name):
+        """
+        Get the schema and settings of a table.
+
+        :param table_name: Table name.
+        :return: Tuple of (schema, settings).
+        """
+
+        row = self._connection.execute("SELECT table_schema, settings FROM queue_tables WHERE table_name = ?",
+                                       (table_name,)).fetchone()
+        if row is None:
+            raise ValueError("Table %s isn't in the work queue" % table_name)
+
+        return checkpoints.schema_from_json(row[0]), json.loads(row[1])
+
+    def claim(self, worker, lease_seconds=DEFAULT_LEASE_SECONDS, now=None):
+        """
+        Claim the next pending task (or a task whose lease has expired).
+
+        :param worker: Name of the worker.
+        :param lease_seconds: Number of seconds the task is leased for.
+        :param now: Current time (defaults to time.time()).
+        :return: Task, or None if no task can be claimed.
+        """
+
+        now = time.time() if now is None else now
+
+        connection = self._transaction()
+        try:
+            # The tasks that have used up their attempts aren't claimed again
+            connection.execute("UPDATE queue_tasks SET state = ?, error = ? WHERE state = ? AND lease_expires < ? "
+                               "AND attempts >= ?", (FAILED, "Lease expired", LEASED, now, self.max_attempts))
+
+            row = connection.execute("SELECT task_id, table_name, file_path, attempts FROM queue_tasks "
+                                     "WHERE state = ? OR (state = ? AND lease_expires < ?) ORDER BY task_id LIMIT 1",
+                                     (PENDING, LEASED, now)).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+
+            connection.execute("UPDATE queue_tasks SET state = ?, worker = ?, lease_expires = ?, "
+                               "attempts = attempts + 1 WHERE task_id = ?",
+                               (LEASED, worker, now + lease_seconds, row[0]))
+            connection.execute("COMMIT")
+
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        return Task(row[0], row[1], row[2], row[3] + 1)
+
+    def renew(self, task, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Renew the lease of a task.
+
+        :param task: Task.
+        :param worker: Name of the worker.
+        :param lease_seconds: Number of seconds the task is leased for from now.
+        :return: True if the worker still holds the lease.
+        """
+
+        cursor = self._execute("UPDATE queue_tasks SET lease_expires = ? WHERE task_id = ? AND state = ? AND "
+                               "worker = ?", (time.time() + lease_seconds, task.task_id, LEASED, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, task, worker, rows_inserted):
+        """
+        Report a task done.
+
+        :param task: Task.
+        :param worker: Name of the worker.
+        :param rows_inserted: Number of rows inserted.
+        :return: True if the worker still held the lease.
+        """
+
+        cursor = self._execute("UPDATE queue_tasks SET state = ?, rows_inserted = ?, lease_expires = NULL "
+                               "WHERE task_id = ? AND state = ? AND worker = ?",
+                               (DONE, rows_inserted, task.task_id, LEASED, worker))
+        return cursor.rowcount == 1
+
+    def fail(self, task, worker, error):
+        """
+        Report a task failed, making it pending again unless it has used up its attempts.
+
+        :param task: Task.
+        :param worker: Name of the worker.
+        :param error: Error message.
+        """
+
+        state = FAILED if task.attempts >= self.max_attempts else PENDING
+        self._execute("UPDATE queue_tasks SET state = ?, error = ?, lease_expires = NULL "
+                      "WHERE task_id = ? AND state = ? AND worker = ?",
+                      (state, error, task.task_id, LEASED, worker))
+
+    def counts(self):
+        """
+        Count the tasks in each state.
+
+        :return: Dictionary of state to number of tasks.
+        """
+
+        counts = dict([(state, 0) for state in [PENDING, LEASED, DONE, FAILED]])
+        for state, count in self._connection.execute("SELECT state, COUNT(*) FROM queue_tasks GROUP BY state"):
+            counts[state] = count
+
+        return counts
+
+    def table_counts(self):
+        """
+        Count the tasks of each table in each state.
+
+        :return: Dictionary of table name to dictionary of state to number of tasks.
+        """
+
+        table_counts = {}
+        for table_name, state, count in self._connection.execute("SELECT table_name, state, COUNT(*) "
+                                                                 "FROM queue_tasks GROUP BY table_name, state"):
+            table_counts.setdefault(table_name, {})[state] = count
+
+        return table_counts
+
+    def is_finished(self):
+        """
+        Are all of the tasks done or failed?
+
+        :return: True if no task is pending or leased.
+        """
+
+        counts = self.counts()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def close(self):
+        """Close the connection to the queue."""
+
+        self._connection.close()
+
+
+def coordinate_load(filepath, delimiter, encapsulator, encoding, true_values, false_values, db_params, queue_path,
+                    narrow_types=False, inference_params=None, discovery_params=None, column_params=None,
+                    max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Prepare a distributed load (MariaDB backend): find the tables, infer their schemas, create them and publish their
+    files as tasks to the work queue, from which the workers load them.
+
+    Rerunning the coordinator restarts the load, as the tables are dropped and the queue is cleared.
+
+    :param filepath: Folder containing the CSV files (at the same path on every worker).
+    :param delimiter: Delimiter in the CSV files.
+    :param encapsulator: Encapsulator in the CSV files.
+    :param encoding: Encoding of the CSV files.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param db_params: Dictionary of database parameters.
+    :param queue_path: Path of the SQLite work queue (on storage shared with the workers).
+    :param narrow_types: Size the SQL types from the statistics of each column?
+    :param inference_params: Dictionary of extended inference parameters (None for the basic inference).
+    :param discovery_params: Dictionary of parameters to find the files (see discovery.discover_tables), or None to
+        list the CSV files in the folder.
+    :param column_params: Dictionary of the columns to load ('include' and 'exclude'), or None to load all of them.
+    :param max_attempts: Number of times a task is claimed before it is failed.
+    :return: Number of tasks published.
+    """
+
+    metrics = LoadMetrics()
+    discovered = discover_tables(filepath, discovery_params)
+    module_logger.info("Coordinating the load of %d tables through the work queue %s", len(discovered), queue_path)
+
+    # The workers checkpoint each file, so that a task claimed again resumes from the last committed batch
+    database_utilities.create_database(db_params)
+    mydb = database_utilities.build_database_connection(db_params)
+    cursor = mydb.cursor()
+    checkpoints.create_state_tables(cursor)
+    mydb.commit()
+
+    queue = WorkQueue(queue_path, max_attempts)
+    queue.clear()
+
+    settings = {"delimiter": delimiter,
+                "encapsulator": encapsulator,
+                "encoding": encoding,
+                "true-values": true_values,
+                "false-values": false_values,
+                "inference": inference_params,
+                "columns": column_params}
+
+    num_tasks = 0
+    for table_name, discovered_files in discovered.items():
+        files = [f.path for f in discovered_files]
+
+        database_utilities.drop_table(db_params, table_name)
+        checkpoints.clear_table_state(cursor, table_name)
+        mydb.commit()
+
+        column_statistics = {} if narrow_types else None
+        schema = build_schema_from_files(files, delimiter, encapsulator, encoding, true_values, false_values, metrics,
+                                         table_name, column_statistics, inference_params, column_params=column_params)
+        database_utilities.create_table(db_params, table_name, schema, column_statistics)
+        checkpoints.save_schema(cursor, table_name, schema)
+        mydb.commit()
+
+        queue.publish_table(table_name, schema, settings, files)
+        module_logger.info("Published %d files of table %s", len(files), table_name)
+        num_tasks += len(files)
+
+    cursor.close()
+    mydb.close()
+    queue.close()
+
+    return num_tasks
+
+
+def wait_for_load(db_params, queue_path, poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    Wait for the workers to finish the tasks of a distributed load, then record the tables whose files were all
+    loaded as complete.
+
+    :param db_params: Dictionary of database parameters.
+    :param queue_path: Path of the SQLite work queue.
+    :param poll_interval: Number of seconds between checks of the queue.
+    :return: Dictionary of state to number of tasks.
+    """
+
+    queue = WorkQueue(queue_path)
+    while not queue.is_finished():
+        module_logger.info("Tasks: %s", queue.counts())
+        time.sleep(poll_interval)
+
+    mydb = database_utilities.build_database_connection(db_params)
+    cursor = mydb.cursor()
+    for table_name, counts in queue.table_counts().items():
+        if counts.get(FAILED, 0) > 0:
+            module_logger.error("Table %s has %d failed files", table_name, counts[FAILED])
+        else:
+            checkpoints.mark_table_complete(cursor, table_name)
+    mydb.commit()
+    cursor.close()
+    mydb.close()
+
+    counts = queue.counts()
+    queue.close()
+    module_logger.info("Distributed load finished: %s", counts)
+
+    return counts
+
+
+class QueueWorker(object):
+    """
+    Loads the files claimed from a work queue into the tables created by the coordinator (MariaDB backend).
+
+    While a file is loaded, a thread renews its lease every third of lease_seconds. The progress through each file is
+    checkpointed in the same transaction as each batch, so a task claimed again after its worker crashed resumes from
+    the last committed batch rather than inserting the file's rows twice. Each batch first locks the file's checkpoint
+    and checks that it is still the one the worker last committed, so a worker that lost its lease (e.g. after a long
+    pause) aborts instead of inserting rows that the worker now holding the task also inserts. The worker stops once
+    no task is pending or leased.
+    """
+
+    def __init__(self, queue_path, db_params, worker_name=None, batch_size=DEFAULT_BATCH_SIZE,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=DEFAULT_POLL_INTERVAL):
+        """
+        :param queue_path: Path of the SQLite work queue.
+        :param db_params: Dictionary of database parameters.
+        :param worker_name: Name of the worker (defaults to the host name and process id).
+        :param batch_size: Maximum number of rows per INSERT statement and transaction.
+        :param lease_seconds: Number of seconds a task is leased for.
+        :param poll_interval: Number of seconds to wait when the remaining tasks are all held by other workers.
+        """
+
+        # Preconditions
+        assert lease_seconds > 0
+        assert poll_interval > 0
+
+        self.queue_path = queue_path
+        self.db_params = db_params
+        self.worker_name = worker_name or "%s-%d" % (socket.gethostname(), os.getpid())
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+
+        self.metrics = LoadMetrics()
+        self.num_tasks = 0
+        self.num_rows = 0
+
+    def _renew_lease(self, task, stop, lost):
+        """
+        Renew the lease of a task until stop is set (with the thread's own connection to the queue), setting lost if
+        the lease can't be renewed.
+        """
+
+        queue = WorkQueue(self.queue_path)
+        try:
+            while not stop.wait(self.lease_seconds / 3):
+                if not queue.renew(task, self.worker_name, self.lease_seconds):
+                    module_logger.error("Worker %s lost the lease of %s", self.worker_name, task.file_path)
+                    lost.set()
+                    return
+        finally:
+            queue.close()
+
+    def load_task(self, queue, task, lost=None):
+        """
+        Load the file of a task.
+
+        :param queue: WorkQueue.
+        :param task: Task.
+        :param lost: threading.Event set when the lease of the task is lost (optional).
+        :return: Number of rows inserted.
+        """
+
+        schema, settings = queue.table(task.table_name)
+
+        def fence(cursor, file, committed_checkpoint):
+            if lost is not None and lost.is_set():
+                raise LeaseLost("Worker %s lost the lease of %s" % (self.worker_name, file))
+
+            # The checkpoint moved on if another worker has loaded batches of the file since this worker's last commit
+            recorded = checkpoints.lock_file_checkpoint(cursor, task.table_name, file)
+            if recorded is None or (recorded.byte_offset, recorded.row_number) != \
+                    (committed_checkpoint.byte_offset, committed_checkpoint.row_number):
+                raise LeaseLost("Checkpoint of %s was moved on by another worker" % file)
+
+        mydb = database_utilities.build_database_connection(self.db_params)
+        try:
+            cursor = mydb.cursor()
+
+            # The file's checkpoint is recorded before its first batch so that the batches can lock it
+            checkpoints.create_file_checkpoint(cursor, task.table_name, task.file_path)
+            mydb.commit()
+            file_checkpoints = checkpoints.load_file_checkpoints(cursor, task.table_name)
+            cursor.close()
+
+            file_checkpoints = dict([(path, file_checkpoint) for path, file_checkpoint in file_checkpoints.items()
+                                     if path == task.file_path])
+            return insert_data_from_files([task.file_path], settings["delimiter"], settings["encapsulator"],
+                                          settings["encoding"], self.db_params, task.table_name, schema,
+                                          settings["true-values"], settings["false-values"], self.metrics,
+                                          self.batch_size, True, file_checkpoints, settings["inference"],
+                                          connection=mydb, column_params=settings["columns"], fence=fence)
+        finally:
+            mydb.close()
+
+    def run(self, max_tasks=None):
+        """
+        Claim and load tasks until none is pending or leased.
+
+        :param max_tasks: Maximum number of tasks to load (if None, load until the queue is finished).
+        :return: Number of tasks loaded.
+        """
+
+        module_logger.info("Worker %s taking tasks from %s", self.worker_name, self.queue_path)
+        queue = WorkQueue(self.queue_path)
+
+        while max_tasks is None or self.num_tasks < max_tasks:
+            task = queue.claim(self.worker_name, self.lease_seconds)
+            if task is None:
+                if queue.is_finished():
+                    break
+                time.sleep(self.poll_interval)
+                continue
+
+            module_logger.info("Worker %s loading %s into table %s (attempt %d)", self.worker_name, task.file_path,
+                               task.table_name, task.attempts)
+            stop = threading.Event()
+            lost = threading.Event()
+            renewer = threading.Thread(target=self._renew_lease, args=(task, stop, lost), name="lease-renewer")
+            renewer.daemon = True
+            renewer.start()
+            try:
+                num_rows = self.load_task(queue, task, lost)
+            except LeaseLost as e:
+                # The task is left to the worker that holds it now
+                module_logger.warning("Worker %s stopped loading %s: %s", self.worker_name, task.file_path, e)
+                continue
+            except (ValueError, OSError) + database_errors() as e:
+                module_logger.exception("Worker %s failed to load %s", self.worker_name, task.file_path)
+                queue.fail(task, self.worker_name, str(e))
+                continue
+            finally:
+                stop.set()
+                renewer.join()
+
+            if not queue.complete(task, self.worker_name, num_rows):
+                module_logger.warning("Worker %s loaded %s after losing its lease", self.worker_name, task.file_path)
+            self.num_tasks += 1
+            self.num_rows += num_rows
+
+        queue.close()
+        module_logger.info("Worker %s loaded %d rows from %d files", self.worker_name, self.num_rows, self.num_tasks)
+
+        return self.num_tasks
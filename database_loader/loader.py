@@ -1,75 +1,134 @@
 # -*- coding: utf-8 -*-
-import glob
+import importlib
+import itertools
 import logging
 import os
-import re
+import shutil
+import tempfile
+import time
 
 from data_reader.csv_reader import DelimitedSource
-from database_loader.database_utilities import create_database, drop_table, create_table, insert_data
-from database_loader.type_inference import build_field_type, update_field_type, merge_field_types
+from database_loader import assembly, checkpoints, database_utilities
+from database_loader.checkpoints import FileCheckpoint
+from database_loader.column_statistics import ColumnStatistics, merge_column_statistics, write_column_profiles, \
+    DEFAULT_PROFILE_PATH
+from database_loader.discovery import discover_tables, table_name_from_filename
+from database_loader.deduplication import deduplicate_rows, DEFAULT_MAX_KEYS
+from database_loader.memory import MemoryBudget, estimate_row_bytes
+from database_loader.merge import TableMerger, check_merge_params, DEFAULT_STAGE_ROWS, DEFAULT_FILTER_CAPACITY
+from database_loader.database_utilities import insert_data_batch_statement, transform_values, row_errors, \
+    build_value_caches, check_partition_params, num_partitions, partition_router
+from database_loader.metrics import LoadMetrics
+from database_loader.parse_cache import ParseCache, DEFAULT_CACHE_PATH
+from database_loader.partitioning import PartitionWriter, DEFAULT_QUEUE_DEPTH
+from database_loader.profiling import DEFAULT_PROFILE_MODE, TableProfiler
+from database_loader.rejects import RejectWriter, bisect_execute, DEFAULT_MAX_ERROR_RATE
+from database_loader.tuning import LoadTuner, statement_row_bytes, DEFAULT_MIN_BATCH_SIZE, DEFAULT_MAX_BATCH_SIZE, \
+    DEFAULT_TARGET_LATENCY, DEFAULT_MAX_PACKET_BYTES
+from database_loader.type_inference import merge_field_types, check_values, SchemaInference, infer_type_and_value, \
+    infer_best_type, build_temporal_detectors, ColumnTypeDetector
+from database_loader.value_cache import log_cache_reports
 from logger import logger
 
 # Initialise the module logger
 logger.initialise_logger("loader", log_level=logging.INFO)
 module_logger = logging.getLogger('loader')
 
+# Default number of rows per INSERT statement and transaction
+DEFAULT_BATCH_SIZE = 1000
 
-def table_name_from_filename(file_path):
-    """
-    Get the table name from a filename.
+# Number of rows sampled to estimate the memory used per row
+SAMPLE_ROWS = 100
 
-    :param file_path: File path.
-    :return: Database table name to files that should be used to populate that table.
-    """
+# Default folder of the reject files
+DEFAULT_REJECT_PATH = "./rejects/"
 
-    # Extract the filename part from the path
-    filename = os.path.basename(file_path)
+# Loggers used during a load
+LOGGER_NAMES = ["loader", "database-loader"]
 
-    # Remove the file extension
-    filename_minus_ext = os.path.splitext(filename)[0]
+# Database backends that can be loaded (backend name to the module implementing it)
+BACKENDS = {"mariadb": "database_loader.database_utilities",
+            "postgresql": "database_loader.postgres_utilities",
+            "parquet": "database_loader.parquet_writer"}
 
-    # If the end of the filename is of the form _<number> then remove it
-    m = re.search("(.*?)_\d+$", filename_minus_ext)
-    if m is not None:
-        name = m.group(1)
-    else:
-        name = filename_minus_ext
+# Settings that can be overridden per table (see load_database)
+TABLE_SETTINGS = ["backend", "db-params", "copy-format", "batch-size", "checkpoint", "narrow-types", "inference",
+                  "dedup", "rejects", "memory-limit", "columns", "partition",
+                  "merge", "tune", "column-profile"]
+
+
+def backend_module(backend):
+    """
+    Import the module of a backend on first use, so that runs that don't use PostgreSQL or Parquet don't pay for
+    psycopg2 or pyarrow.
+
+    :param backend: Database backend (see BACKENDS).
+    :return: Module implementing the backend.
+    """
 
-    # Return the table name
-    return name
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend: %s" % backend)
+    return importlib.import_module(BACKENDS[backend])
 
 
-def table_names_from_path(filepath):
+def table_names_from_path(filepath, discovery_params=None):
     """
     Determine the database table names based on the filenames in a given folder.
 
     :param filepath: Folder in which
+    :param discovery_params: Dictionary of discovery parameters (see discovery.discover_tables), or None to list the
+        CSV files in the folder.
     :return: Map of table names to the files to use to populate each table.
     """
 
-    # Search for CSV files
-    if filepath.endswith("/"):
-        pattern = filepath + "*.csv"
-    else:
-        pattern = filepath + "/*.csv"
+    table_name_to_files = discover_tables(filepath, discovery_params)
 
-    # Get a list of filenames based on the folder specified
-    files = glob.glob(pattern)
+    return dict([(table_name, [discovered.path for discovered in files])
+                 for table_name, files in table_name_to_files.items()])
 
-    # Get and return the table names from the filenames
-    table_name_to_files = {}
-    for f in files:
-        table_name = table_name_from_filename(f)
 
-        if table_name not in table_name_to_files:
-            table_name_to_files[table_name] = [f]
-        else:
-            table_name_to_files[table_name].append(f)
+def build_source(file, delimiter, encapsulator, encoding, on_malformed=None, column_params=None):
+    """
+    Build the reader of a file, selecting the columns to read.
+
+    :param file: File to read.
+    :param delimiter: Delimiter used in the CSV file.
+    :param encapsulator: Encapsulator used in the CSV file.
+    :param encoding: Encoding format of the CSV file.
+    :param on_malformed: Function called for each malformed row (see DelimitedSource).
+    :param column_params: Dictionary of the columns to read ('include' and 'exclude', lists of field names), or None to
+        read all of the columns.
+    :return: DelimitedSource.
+    """
+
+    selection = column_params or {}
+    return DelimitedSource(file, delimiter, encapsulator, encoding, on_malformed, selection.get('include'),
+                           selection.get('exclude'))
+
+
+def sample_row_bytes(files, delimiter, encapsulator, encoding, num_rows=SAMPLE_ROWS, column_params=None):
+    """
+    Estimate the memory used by a row of a table from a sample of the rows of its first file.
+
+    :param files: List of files of the table.
+    :param delimiter: Delimiter used in the CSV files.
+    :param encapsulator: Encapsulator used in the CSV files.
+    :param encoding: Encoding format of the CSV files.
+    :param num_rows: Number of rows to sample.
+    :param column_params: Dictionary of the columns to read (see build_source), or None to read all of the columns.
+    :return: Estimated number of bytes per row.
+    """
+
+    rows = build_source(files[0], delimiter, encapsulator, encoding, column_params=column_params).parse()
+    sample = list(itertools.islice(rows, num_rows))
+    rows.close()
 
-    return table_name_to_files
+    return estimate_row_bytes(sample)
 
 
-def build_schema_from_file(filepath, delimiter, encapsulator, encoding, true_values, false_values):
+def build_schema_from_file(filepath, delimiter, encapsulator, encoding, true_values, false_values,
+                           column_statistics=None, inference_params=None, memory_budget=None, column_params=None,
+                           parse_cache=None, profiled=False):
     """
     Build the schema from the data in a single file.
 
@@ -79,6 +138,14 @@ def build_schema_from_file(filepath, delimiter, encapsulator, encoding, true_val
     :param encoding: Encoding format of the CSV file.
     :param true_values: List of values deemed True.
     :param false_values: List of values deemed False.
+    :param column_statistics: Empty dictionary to populate with field name to ColumnStatistics (optional).
+    :param inference_params: Dictionary of extended inference parameters to also infer dates, datetimes and decimals
+        ('date-formats', 'datetime-formats' and 'decimals'), or None for the basic inference.
+    :param memory_budget: MemoryBudget; under memory pressure, the distinct values of the columns are dropped from
+        the statistics (optional).
+    :param column_params: Dictionary of the columns to read (see build_source), or None to read all of the columns.
+    :param parse_cache: ParseCache of the inferred schemas (optional; the schema is only cached without statistics).
+    :param profiled: Also gather the sketches of the columns' profiles in the statistics (see ColumnStatistics)?
     :return: Dictionary of the field name to inferred data type.
     """
 
@@ -89,31 +156,88 @@ def build_schema_from_file(filepath, delimiter, encapsulator, encoding, true_val
     assert len(false_values) > 0
 
     # Open the CSV file for reading
-    csv_reader = DelimitedSource(filepath, delimiter, encapsulator, encoding)
+    csv_reader = build_source(filepath, delimiter, encapsulator, encoding, column_params=column_params)
 
     # Read each data line
     num_lines_read = 0
     dict_fieldname_to_type = {}
+    detectors = None
+    track_distinct = memory_budget is not None
+    progress = logger.ProgressReporter(module_logger, "Inferring schema from %s" % filepath)
 
+    # Without statistics, only the candidate types of each column are tracked, and the file is no longer read once
+    # every column is a string
+    if column_statistics is None:
+        schema_path = None
+        if parse_cache is not None:
+            schema_path = parse_cache.schema_path(filepath, delimiter, encapsulator, encoding, true_values,
+                                                  false_values, column_params, inference_params)
+            schema = parse_cache.load_schema(schema_path)
+            if schema is not None:
+                module_logger.info("Read the schema of %s from the cache", filepath)
+                return schema
+
+        inference = SchemaInference(true_values, false_values, inference_params)
+        for data_dict in csv_reader.parse():
+            inference.update(data_dict)
+            num_lines_read += 1
+            progress.update()
+
+            if inference.is_resolved():
+                module_logger.info("All of the columns of %s are strings after %d lines", filepath, num_lines_read)
+                break
+
+        module_logger.info("Read %d lines from %s", num_lines_read, filepath)
+        log_cache_reports(filepath, inference.column_caches())
+        if schema_path is not None:
+            parse_cache.save_schema(schema_path, inference.schema())
+        return inference.schema()
+
+    # Otherwise, infer the types (caching the detected formats per column) and gather the statistics from the same
+    # converted values
     for data_dict in csv_reader.parse():
 
         if num_lines_read == 0:
-            # For the first line
-            dict_fieldname_to_type = build_field_type(data_dict, true_values, false_values)
+            if inference_params is not None:
+                detectors = dict([(key, ColumnTypeDetector(true_values, false_values, inference_params))
+                                  for key in data_dict.keys()])
+            for key in data_dict.keys():
+                column_statistics[key] = ColumnStatistics(profiled)
         else:
-            # For second lines and onwards
-            dict_fieldname_to_type = update_field_type(dict_fieldname_to_type, data_dict, true_values, false_values)
+            assert dict_fieldname_to_type.keys() == data_dict.keys()
+
+        for key, str_value in data_dict.items():
+            if detectors is not None:
+                inferred_type, value = detectors[key].infer(str_value)
+            else:
+                inferred_type, value = infer_type_and_value(str_value, true_values, false_values)
+            column_statistics[key].update(str_value, inferred_type, value)
+            if num_lines_read == 0:
+                dict_fieldname_to_type[key] = inferred_type
+            else:
+                dict_fieldname_to_type[key] = infer_best_type(dict_fieldname_to_type[key], inferred_type)
+
+        # Under memory pressure, release the distinct values held by the statistics
+        if track_distinct and memory_budget.under_pressure:
+            module_logger.warning("Memory pressure: no longer tracking the distinct values of %s", filepath)
+            for statistics in column_statistics.values():
+                statistics.drop_distinct_values()
+            track_distinct = False
+            memory_budget.relieve_pressure()
 
         num_lines_read += 1
+        progress.update()
 
-    module_logger.info("Read %d lines from %s" % (num_lines_read, filepath))
-    module_logger.info("Field names read: %s" % dict_fieldname_to_type.keys())
+    module_logger.info("Read %d lines from %s", num_lines_read, filepath)
+    module_logger.info("Field names read: %s", dict_fieldname_to_type.keys())
 
     # Return a dictionary of the field name to its inferred type
     return dict_fieldname_to_type
 
 
-def build_schema_from_files(files, delimiter, encapsulator, encoding, true_values, false_values):
+def build_schema_from_files(files, delimiter, encapsulator, encoding, true_values, false_values, metrics=None,
+                            table_name=None, column_statistics=None, inference_params=None, memory_budget=None,
+                            column_params=None, parse_cache=None, profiled=False):
     """
     Build the schema from the data in multiple files.
 
@@ -123,62 +247,992 @@ def build_schema_from_files(files, delimiter, encapsulator, encoding, true_value
     :param encoding: Encoding format of the CSV file.
     :param true_values: List of values deemed True.
     :param false_values: List of values deemed False.
+    :param metrics: LoadMetrics to record the time taken per file (optional).
+    :param table_name: Table name under which to record the metrics.
+    :param column_statistics: Empty dictionary to populate with field name to ColumnStatistics (optional).
+    :param inference_params: Dictionary of extended inference parameters (None for the basic inference).
+    :param memory_budget: MemoryBudget to apply backpressure with (optional).
+    :param column_params: Dictionary of the columns to read (see build_source), or None to read all of the columns.
+    :param parse_cache: ParseCache of the inferred schemas (optional).
+    :param profiled: Also gather the sketches of the columns' profiles in the statistics (merged across the files)?
     :return: Dictionary of the field name to inferred data type.
     """
 
     # Preconditions
     assert len(files) > 0
 
-    module_logger.info("Building schema from files: %s" % files)
+    if metrics is None:
+        metrics = LoadMetrics()
+
+    module_logger.info("Building schema from files: %s", files)
 
     num_files_processed = 0
     overall_schema = {}
 
     for file in files:
-        module_logger.info("Going to infer schema from file: %s" % file)
-        schema = build_schema_from_file(file, delimiter, encapsulator, encoding, true_values, false_values)
+        module_logger.info("Going to infer schema from file: %s", file)
+        file_statistics = {} if column_statistics is not None else None
+        with metrics.timed("schema-inference", table_name, file):
+            schema = build_schema_from_file(file, delimiter, encapsulator, encoding, true_values, false_values,
+                                            file_statistics, inference_params, memory_budget, column_params,
+                                            parse_cache, profiled)
 
         if num_files_processed == 0:
             overall_schema = schema
         else:
             overall_schema = merge_field_types(overall_schema, schema)
 
+        if column_statistics is not None:
+            if num_files_processed > 0:
+                file_statistics = merge_column_statistics(column_statistics, file_statistics)
+            column_statistics.clear()
+            column_statistics.update(file_statistics)
+
         num_files_processed += 1
 
-    module_logger.info("Processed %d files" % num_files_processed)
+    module_logger.info("Processed %d files", num_files_processed)
 
     # Return the inferred schema
     return overall_schema
 
 
 def insert_data_from_files(files_to_process, delimiter, encapsulator, encoding, db_params, table_name, schema,
-                           true_values, false_values):
+                           true_values, false_values, metrics=None, batch_size=DEFAULT_BATCH_SIZE, checkpoint=False,
+                           file_checkpoints=None, inference_params=None, dedup_params=None, memory_budget=None,
+                           rejects=None, connection=None, column_params=None, merger=None, tuner=None, fence=None):
     """
     Insert the data from a list of files into the database using the inferred schema.
 
+    A single connection is used for the table (the given connection is left open). The rows are inserted with
+    multi-row INSERT statements of up to batch_size rows, each committed in its own transaction. If checkpointing is
+    enabled, the position reached in the file is recorded in the same transaction as each batch, so that an
+    interrupted load can resume from the last committed batch without duplicating or losing rows.
+
+    If deduplication is enabled, the files are read as a single stream from which the duplicate rows are removed
+    before they are inserted (checkpointing isn't supported in that case).
+
+    If a RejectWriter is given, the rows that can't be parsed or converted are quarantined and a batch that the
+    database rejects is split in halves until the bad rows are isolated and quarantined.
+
+    If a TableMerger is given, each batch is merged into the table by its key (see TableMerger) rather than inserted.
+
+    If a LoadTuner is given, the batch size is adapted to the measured time to insert and commit each batch.
+
+    If a fence is given (with checkpointing), it is called at the start of the transaction of each batch with the
+    cursor, the file and the FileCheckpoint last committed by this load, and raises to abort the load if another
+    process has taken over the file (e.g. by checking that the recorded checkpoint is still the one last committed).
+
     :param files_to_process: List of files to process.
     :param delimiter: Delimiter in the CSV file.
     :param encapsulator: Encapsulator in the CSV file.
     :param encoding: Encoding of the CSV file.
     :param db_params: Dictionary of database parameters.
     :param table_name: Name of the database table.
-    :param schema: Dictionary of
-    :param true_values:
-    :param false_values:
-    :return:
+    :param schema: Dictionary of field name to inferred type.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param metrics: LoadMetrics to record the parse, transform, insert and commit times (optional).
+    :param batch_size: Maximum number of rows per INSERT statement and transaction.
+    :param checkpoint: Record the progress through each file after each batch?
+    :param file_checkpoints: Dictionary of file path to FileCheckpoint to resume from (optional).
+    :param inference_params: Dictionary of extended inference parameters used to parse the dates and datetimes.
+    :param dedup_params: Dictionary of deduplication parameters (see deduplicate_rows), or None to insert every row.
+    :param memory_budget: MemoryBudget; under memory pressure the batch size is halved (optional).
+    :param rejects: RejectWriter to quarantine the bad rows in, or None to fail on the first bad row.
+    :param connection: Open database connection to use (if None, a connection is opened for the table).
+    :param column_params: Dictionary of the columns to read (see build_source), or None to read all of the columns.
+    :param merger: TableMerger to merge the rows into the table by their key, or None to insert every row.
+    :param tuner: LoadTuner to adapt the batch size with, or None to keep batch_size.
+    :param fence: Callable fence(cursor, file, FileCheckpoint) called in each batch's transaction (optional).
+    :return: Number of rows inserted (or merged).
+    """
+
+    # Preconditions
+    assert batch_size > 0
+    assert dedup_params is None or not checkpoint
+
+    if metrics is None:
+        metrics = LoadMetrics()
+    if file_checkpoints is None:
+        file_checkpoints = {}
+
+    temporal_detectors = build_temporal_detectors(schema, true_values, false_values, inference_params)
+    value_caches = build_value_caches(schema, true_values, false_values, temporal_detectors)
+
+    def sources():
+        """Generate (file, FileCheckpoint to start from, generator of (position, row)) to insert."""
+
+        # The deduplicated rows are validated (and accepted) as they are inserted, so that each row is counted once
+        if dedup_params is not None:
+            rows = read_data_from_files(files_to_process, delimiter, encapsulator, encoding, metrics, table_name,
+                                        rejects, None, column_params)
+            rows = deduplicate_rows(rows, dedup_params, memory_budget)
+            yield None, FileCheckpoint(0, 0, 0, False), ((None, data) for data in rows)
+            return
+
+        for file in files_to_process:
+
+            # Resume from the last committed batch (if any)
+            start = file_checkpoints.get(file, FileCheckpoint(0, 0, 0, False))
+            if start.complete:
+                module_logger.info("Skipping file (already loaded): %s", file)
+                continue
+            elif start.row_number > 0:
+                module_logger.info("Resuming file %s after row %d (byte offset %d)", file, start.row_number,
+                                   start.byte_offset)
+            else:
+                module_logger.info("Inserting data from file: %s", file)
+
+            # Open the CSV file for reading
+            csv_reader = build_source(file, delimiter, encapsulator, encoding, malformed_row_handler(file, rejects),
+                                      column_params)
+            yield file, start, csv_reader.parse_with_positions(start.byte_offset, start.row_number)
+
+    def execute_batch(items):
+        """Insert a list of (values, (file, row number, row)[, key]) with one INSERT statement (or merge them)."""
+        if merger is not None:
+            merger.execute(cursor, column_names, [item[0] for item in items], [item[2] for item in items])
+        else:
+            cursor.execute(insert_data_batch_statement(table_name, column_names, [item[0] for item in items]))
+
+    def reject_item(item, e):
+        """Quarantine a (values, (file, row number, row)) rejected by the database."""
+        rejects.reject(item[1][0], item[1][1], item[1][2], str(e))
+
+    mydb = connection if connection is not None else database_utilities.build_database_connection(db_params)
+    cursor = mydb.cursor()
+    total_rows = 0
+    progress = logger.ProgressReporter(module_logger, "Inserting into %s" % table_name)
+    try:
+        if merger is not None:
+            merger.load_keys(cursor)
+
+        for file, start, records in sources():
+
+            # Accumulate the stage timings locally to keep the per-row overhead low
+            num_rows = 0
+            rows_inserted = start.rows_inserted
+            parse_seconds = 0.0
+            transform_seconds = 0.0
+            insert_seconds = 0.0
+            commit_seconds = 0.0
+
+            column_names = None
+            batch = []
+            batch_sources = []
+            batch_keys = []
+            position = None
+            committed_checkpoint = start
+
+            while True:
+                before_parse = time.perf_counter()
+                record = next(records, None)
+                parsed = time.perf_counter()
+                parse_seconds += parsed - before_parse
+
+                if record is not None:
+                    position, data_dict = record
+                    if column_names is None:
+                        column_names = list(data_dict.keys())
+                    if rejects is None:
+                        batch.append(transform_values(schema, data_dict, true_values, false_values, temporal_detectors,
+                                                      value_caches))
+                        if merger is not None:
+                            batch_keys.append(merger.row_key(data_dict))
+                    else:
+                        row_number = position.row_number if position is not None else None
+                        try:
+                            check_values(schema, data_dict, true_values, false_values, temporal_detectors)
+                            key = merger.row_key(data_dict) if merger is not None else None
+                            batch.append(transform_values(schema, data_dict, true_values, false_values,
+                                                          temporal_detectors, value_caches))
+                            batch_sources.append((file, row_number, list(data_dict.values())))
+                            batch_keys.append(key)
+                        except ValueError as e:
+                            rejects.reject(file, row_number, data_dict.values(), str(e))
+                    transform_seconds += time.perf_counter() - parsed
+
+                if len(batch) >= batch_size or (record is None and (len(batch) > 0 or checkpoint)):
+                    before_insert = time.perf_counter()
+                    if fence is not None and checkpoint:
+                        fence(cursor, file, committed_checkpoint)
+                    num_batch_rows = len(batch)
+                    row_bytes = statement_row_bytes(batch) if tuner is not None else 0
+                    if rejects is not None:
+                        num_batch_rows = bisect_execute(execute_batch, list(zip(batch, batch_sources, batch_keys)),
+                                                        reject_item, row_errors())
+                        rejects.accept(num_batch_rows)
+                    elif len(batch) > 0 and merger is not None:
+                        merger.execute(cursor, column_names, batch, batch_keys)
+                    elif len(batch) > 0:
+                        cursor.execute(insert_data_batch_statement(table_name, column_names, batch))
+                    rows_inserted += num_batch_rows
+                    num_rows += num_batch_rows
+                    progress.update(num_batch_rows)
+                    batch = []
+                    batch_sources = []
+                    batch_keys = []
+
+                    if checkpoint:
+                        file_checkpoint = FileCheckpoint(position.offset if position else start.byte_offset,
+                                                         position.row_number if position else start.row_number,
+                                                         rows_inserted, record is None)
+                        checkpoints.save_file_checkpoint(cursor, table_name, file, file_checkpoint)
+
+                    before_commit = time.perf_counter()
+                    mydb.commit()
+                    committed = time.perf_counter()
+                    if checkpoint:
+                        committed_checkpoint = file_checkpoint
+                    insert_seconds += before_commit - before_insert
+                    commit_seconds += committed - before_commit
+
+                    if tuner is not None:
+                        tuner.record(num_batch_rows, row_bytes, committed - before_insert)
+                        batch_size = tuner.batch_size
+
+                    # Apply backpressure by flushing smaller batches
+                    if memory_budget is not None and memory_budget.under_pressure:
+                        if batch_size > 1:
+                            batch_size = max(1, batch_size // 2)
+                            module_logger.warning("Memory pressure: reducing the batch size to %d", batch_size)
+                            if tuner is not None:
+                                tuner.limit_batch_size(batch_size)
+                        memory_budget.relieve_pressure()
+
+                if record is None:
+                    break
+
+            metrics.add_time("parse", parse_seconds, table_name, file)
+            metrics.add_time("transform", transform_seconds, table_name, file)
+            metrics.add_time("insert", insert_seconds, table_name, file)
+            metrics.add_time("commit", commit_seconds, table_name, file)
+            if file is not None:
+                metrics.add_rows(num_rows, table_name, file)
+                metrics.add_bytes(os.path.getsize(file) - start.byte_offset, table_name, file)
+            total_rows += num_rows
+    finally:
+        # Close the connection only if it was opened here
+        cursor.close()
+        if connection is None:
+            mydb.close()
+
+    progress.finish()
+    log_cache_reports("inserts into %s" % table_name, value_caches)
+    if merger is not None:
+        merger.log_report()
+    if tuner is not None:
+        tuner.log_report(table_name)
+
+    return total_rows
+
+
+def insert_partitioned_data_from_files(files_to_process, delimiter, encapsulator, encoding, db_params, table_name,
+                                       schema, true_values, false_values, partition_params, metrics=None,
+                                       batch_size=DEFAULT_BATCH_SIZE, inference_params=None, dedup_params=None,
+                                       memory_budget=None, rejects=None, column_params=None, num_writers=None,
+                                       queue_depth=DEFAULT_QUEUE_DEPTH, tuner=None):
+    """
+    Insert the data from a list of files into a partitioned table with a writer per group of partitions.
+
+    The rows are read and transformed in the calling thread and routed to the partition they belong in. Each partition
+    is assigned to one of num_writers PartitionWriters, which insert the batches of its partitions with their own
+    connection, so the inserts into a table are spread across connections without contending on the same pages.
+
+    If a LoadTuner is given, the batch size and the number of active writers (to which the partitions are assigned)
+    are adapted to the measured throughput of the writers.
+
+    :param files_to_process: List of files to process.
+    :param delimiter: Delimiter in the CSV file.
+    :param encapsulator: Encapsulator in the CSV file.
+    :param encoding: Encoding of the CSV file.
+    :param db_params: Dictionary of database parameters.
+    :param table_name: Name of the database table.
+    :param schema: Dictionary of field name to inferred type.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param partition_params: Dictionary of partitioning parameters (see database_utilities.check_partition_params).
+    :param metrics: LoadMetrics to record the parse, transform, insert and commit times (optional).
+    :param batch_size: Maximum number of rows per INSERT statement and transaction.
+    :param inference_params: Dictionary of extended inference parameters used to parse the dates and datetimes.
+    :param dedup_params: Dictionary of deduplication parameters (see deduplicate_rows), or None to insert every row.
+    :param memory_budget: MemoryBudget; under memory pressure the batch size is halved (optional).
+    :param rejects: RejectWriter to quarantine the bad rows in, or None to fail on the first bad row.
+    :param column_params: Dictionary of the columns to read (see build_source), or None to read all of the columns.
+    :param num_writers: Number of writers (if None, the 'writers' partitioning parameter or one per partition).
+    :param queue_depth: Maximum number of batches queued for each writer.
+    :param tuner: LoadTuner to adapt the batch size and number of active writers with (sized for num_writers), or
+        None to keep batch_size and num_writers.
+    :return: Number of rows inserted.
+    """
+
+    # Preconditions
+    assert batch_size > 0
+
+    if metrics is None:
+        metrics = LoadMetrics()
+    if num_writers is None:
+        num_writers = partition_params.get('writers', num_partitions(partition_params))
+    num_writers = max(1, min(num_writers, num_partitions(partition_params)))
+
+    temporal_detectors = build_temporal_detectors(schema, true_values, false_values, inference_params)
+    value_caches = build_value_caches(schema, true_values, false_values, temporal_detectors)
+    route = partition_router(partition_params)
+
+    def records():
+        """Generate (file, row number, row) to insert."""
+
+        if dedup_params is not None:
+            rows = read_data_from_files(files_to_process, delimiter, encapsulator, encoding, metrics, table_name,
+                                        rejects, None, column_params)
+            for data_dict in deduplicate_rows(rows, dedup_params, memory_budget):
+                yield None, None, data_dict
+            return
+
+        for file in files_to_process:
+            module_logger.info("Inserting data from file: %s", file)
+            csv_reader = build_source(file, delimiter, encapsulator, encoding, malformed_row_handler(file, rejects),
+                                      column_params)
+            num_rows = 0
+            for data_dict in csv_reader.parse():
+                num_rows += 1
+                yield file, csv_reader.row_number, data_dict
+
+            metrics.add_rows(num_rows, table_name, file)
+            metrics.add_bytes(os.path.getsize(file), table_name, file)
+
+    def flush(index):
+        """Queue the batch of a writer."""
+
+        writer = writers[index]
+        if writer.error is not None:
+            raise writer.error
+
+        writer.put(column_names, batches[index], batch_sources[index] if rejects is not None else None)
+        progress.update(len(batches[index]))
+        batches[index] = []
+        batch_sources[index] = []
+
+    module_logger.info("Inserting into %d partitions of table %s with %d writers", num_partitions(partition_params),
+                       table_name, num_writers)
+    writers = [PartitionWriter(index, db_params, table_name, queue_depth, rejects, tuner)
+               for index in range(num_writers)]
+    for writer in writers:
+        writer.start()
+
+    batches = [[] for _ in writers]
+    batch_sources = [[] for _ in writers]
+    column_names = None
+    parse_seconds = 0.0
+    transform_seconds = 0.0
+    progress = logger.ProgressReporter(module_logger, "Inserting into %s" % table_name)
+
+    try:
+        rows = records()
+        while True:
+            before_parse = time.perf_counter()
+            record = next(rows, None)
+            parsed = time.perf_counter()
+            parse_seconds += parsed - before_parse
+            if record is None:
+                break
+
+            file, row_number, data_dict = record
+            if column_names is None:
+                column_names = list(data_dict.keys())
+
+            try:
+                if rejects is not None:
+                    check_values(schema, data_dict, true_values, false_values, temporal_detectors)
+                values = transform_values(schema, data_dict, true_values, false_values, temporal_detectors,
+                                          value_caches)
+                index = route(data_dict) % (tuner.active_writers if tuner is not None else num_writers)
+            except ValueError as e:
+                if rejects is None:
+                    raise
+                rejects.reject(file, row_number, data_dict.values(), str(e))
+                continue
+
+            batches[index].append(values)
+            if rejects is not None:
+                batch_sources[index].append((file, row_number, list(data_dict.values())))
+            transform_seconds += time.perf_counter() - parsed
+
+            if tuner is not None:
+                batch_size = tuner.batch_size
+            if len(batches[index]) >= batch_size:
+                flush(index)
+
+                # Apply backpressure by flushing smaller batches
+                if memory_budget is not None and memory_budget.under_pressure:
+                    if batch_size > 1:
+                        batch_size = max(1, batch_size // 2)
+                        module_logger.warning("Memory pressure: reducing the batch size to %d", batch_size)
+                        if tuner is not None:
+                            tuner.limit_batch_size(batch_size)
+                    memory_budget.relieve_pressure()
+
+        for index in range(num_writers):
+            if len(batches[index]) > 0:
+                flush(index)
+
+    finally:
+        for writer in writers:
+            writer.finish()
+
+    for writer in writers:
+        if writer.error is not None:
+            raise writer.error
+
+    metrics.add_time("parse", parse_seconds, table_name)
+    metrics.add_time("transform", transform_seconds, table_name)
+    metrics.add_time("insert", sum([writer.insert_seconds for writer in writers]), table_name)
+    metrics.add_time("commit", sum([writer.commit_seconds for writer in writers]), table_name)
+    for writer in writers:
+        module_logger.info("Partition writer %d of table %s inserted %d rows in %d batches", writer.index, table_name,
+                           writer.num_rows, writer.num_batches)
+
+    progress.finish()
+    log_cache_reports("inserts into %s" % table_name, value_caches)
+    if tuner is not None:
+        tuner.log_report(table_name)
+
+    return sum([writer.num_rows for writer in writers])
+
+
+def malformed_row_handler(file, rejects):
+    """
+    Build the function that quarantines the malformed rows of a file.
+
+    :param file: File being read.
+    :param rejects: RejectWriter (or None to keep the malformed rows).
+    :return: Function of (row number, values, reason) for DelimitedSource, or None.
+    """
+
+    if rejects is None:
+        return None
+
+    def on_malformed(row_number, values, reason):
+        rejects.reject(file, row_number, values, reason)
+
+    return on_malformed
+
+
+def build_row_validator(schema, true_values, false_values, temporal_detectors, rejects):
+    """
+    Build the function that checks that the values of a row can be loaded.
+
+    :param schema: Dictionary of field name to type.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param temporal_detectors: Dictionary of field name to ColumnTypeDetector to parse the dates and datetimes.
+    :param rejects: RejectWriter (or None if the rows aren't validated).
+    :return: Function that raises a ValueError for a bad row, or None.
+    """
+
+    if rejects is None:
+        return None
+
+    def validate(data_dict):
+        check_values(schema, data_dict, true_values, false_values, temporal_detectors)
+
+    return validate
+
+
+def read_file_rows(file, delimiter, encapsulator, encoding, rejects=None, validate=None, column_params=None):
+    """
+    Read the rows of a file, quarantining the malformed rows and the rows that fail validation.
+
+    :param file: File to read.
+    :param delimiter: Delimiter in the CSV file.
+    :param encapsulator: Encapsulator in the CSV file.
+    :param encoding: Encoding of the CSV file.
+    :param rejects: RejectWriter to quarantine the bad rows in (optional).
+    :param validate: Function that raises a ValueError for a bad row (optional, requires rejects).
+    :param column_params: Dictionary of the columns to read (see build_source), or None to read all of the columns.
+    :return: Generator of dictionaries of field name to value.
+    """
+
+    csv_reader = build_source(file, delimiter, encapsulator, encoding, malformed_row_handler(file, rejects),
+                              column_params)
+    for data_dict in csv_reader.parse():
+        if validate is not None:
+            try:
+                validate(data_dict)
+            except ValueError as e:
+                rejects.reject(file, csv_reader.row_number, data_dict.values(), str(e))
+                continue
+            rejects.accept()
+        yield data_dict
+
+
+def read_data_from_files(files_to_process, delimiter, encapsulator, encoding, metrics=None, table_name=None,
+                         rejects=None, validate=None, column_params=None):
+    """
+    Read the data from a list of files as a single stream of rows.
+
+    :param files_to_process: List of files to process.
+    :param delimiter: Delimiter in the CSV file.
+    :param encapsulator: Encapsulator in the CSV file.
+    :param encoding: Encoding of the CSV file.
+    :param metrics: LoadMetrics to record the rows and bytes read per file (optional).
+    :param table_name: Table name under which to record the metrics.
+    :param rejects: RejectWriter to quarantine the bad rows in (optional).
+    :param validate: Function that raises a ValueError for a bad row (optional, requires rejects).
+    :param column_params: Dictionary of the columns to read (see build_source), or None to read all of the columns.
+    :return: Generator of dictionaries of field name to value.
     """
 
     for file in files_to_process:
-        module_logger.info("Inserting data from file: %s" % file)
+        module_logger.info("Reading data from file: %s", file)
 
-        # Open the CSV file for reading
-        csv_reader = DelimitedSource(file, delimiter, encapsulator, encoding)
+        num_rows = 0
+        progress = logger.ProgressReporter(module_logger, "Reading %s" % file)
+        for data_dict in read_file_rows(file, delimiter, encapsulator, encoding, rejects, validate, column_params):
+            num_rows += 1
+            progress.update()
+            yield data_dict
+
+        if metrics is not None:
+            metrics.add_rows(num_rows, table_name, file)
+            metrics.add_bytes(os.path.getsize(file), table_name, file)
 
-        for data_dict in csv_reader.parse():
-            insert_data(db_params, table_name, schema, data_dict, true_values, false_values)
 
+def copy_data_from_files(files_to_process, delimiter, encapsulator, encoding, db_params, table_name, schema,
+                         true_values, false_values, copy_format="csv", metrics=None, inference_params=None,
+                         dedup_params=None, memory_budget=None, rejects=None, column_params=None):
+    """
+    Stream the data from a list of files into a PostgreSQL table using COPY.
+
+    If a RejectWriter is given, the rows are validated before they are streamed and the bad rows are quarantined (a
+    row the database rejects still fails the COPY).
+
+    :param files_to_process: List of files to process.
+    :param delimiter: Delimiter in the CSV file.
+    :param encapsulator: Encapsulator in the CSV file.
+    :param encoding: Encoding of the CSV file.
+    :param db_params: Dictionary of database parameters.
+    :param table_name: Name of the database table.
+    :param schema: Dictionary of field name to inferred type.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param copy_format: COPY format ('csv' or 'binary').
+    :param metrics: LoadMetrics to record the time taken by the COPY (optional).
+    :param inference_params: Dictionary of extended inference parameters used to parse the dates and datetimes.
+    :param dedup_params: Dictionary of deduplication parameters (see deduplicate_rows), or None to copy every row.
+    :param memory_budget: MemoryBudget to apply backpressure with (optional).
+    :param rejects: RejectWriter to quarantine the bad rows in, or None to fail on the first bad row.
+    :param column_params: Dictionary of the columns to read (see build_source), or None to read all of the columns.
+    :return: Number of rows copied.
+    """
+
+    if metrics is None:
+        metrics = LoadMetrics()
+
+    temporal_detectors = build_temporal_detectors(schema, true_values, false_values, inference_params)
+    validate = build_row_validator(schema, true_values, false_values, temporal_detectors, rejects)
+
+    # Parsing is interleaved with the COPY, so the whole stream is recorded as the insert stage
+    rows = read_data_from_files(files_to_process, delimiter, encapsulator, encoding, metrics, table_name, rejects,
+                                validate, column_params)
+    if dedup_params is not None:
+        rows = deduplicate_rows(rows, dedup_params, memory_budget)
+
+    with metrics.timed("insert", table_name):
+        return backend_module("postgresql").copy_data(db_params, table_name, schema, rows, true_values, false_values,
+                                                      copy_format, temporal_detectors)
+
+
+def write_data_from_files(files_to_process, delimiter, encapsulator, encoding, db_params, table_name, schema,
+                          true_values, false_values, metrics=None, inference_params=None, dedup_params=None,
+                          memory_budget=None, rejects=None, column_params=None):
+    """
+    Write the data from a list of files to a table's Parquet dataset (one part file per input file, or a single part
+    file if the rows are deduplicated).
+
+    If a RejectWriter is given, the rows are validated before they are written and the bad rows are quarantined.
+
+    :param files_to_process: List of files to process.
+    :param delimiter: Delimiter in the CSV file.
+    :param encapsulator: Encapsulator in the CSV file.
+    :param encoding: Encoding of the CSV file.
+    :param db_params: Dictionary of output parameters.
+    :param table_name: Name of the table.
+    :param schema: Dictionary of field name to inferred type.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param metrics: LoadMetrics to record the time taken per file (optional).
+    :param inference_params: Dictionary of extended inference parameters used to parse the dates and datetimes.
+    :param dedup_params: Dictionary of deduplication parameters (see deduplicate_rows), or None to write every row.
+    :param memory_budget: MemoryBudget to apply backpressure with (optional).
+    :param rejects: RejectWriter to quarantine the bad rows in, or None to fail on the first bad row.
+    :param column_params: Dictionary of the columns to read (see build_source), or None to read all of the columns.
+    :return: Number of rows written.
+    """
+
+    if metrics is None:
+        metrics = LoadMetrics()
+
+    temporal_detectors = build_temporal_detectors(schema, true_values, false_values, inference_params)
+    validate = build_row_validator(schema, true_values, false_values, temporal_detectors, rejects)
+
+    if dedup_params is not None:
+        rows = deduplicate_rows(read_data_from_files(files_to_process, delimiter, encapsulator, encoding, metrics,
+                                                     table_name, rejects, validate, column_params),
+                                dedup_params, memory_budget)
+        with metrics.timed("insert", table_name):
+            return backend_module("parquet").write_data(db_params, table_name, schema, rows, true_values, false_values,
+                                                        0, temporal_detectors)
+
+    num_rows = 0
+    for part_index, file in enumerate(files_to_process):
+        module_logger.info("Writing data from file: %s", file)
+
+        rows = read_file_rows(file, delimiter, encapsulator, encoding, rejects, validate, column_params)
+        with metrics.timed("insert", table_name, file):
+            num_file_rows = backend_module("parquet").write_data(db_params, table_name, schema, rows, true_values,
+                                                                 false_values, part_index, temporal_detectors)
+
+        metrics.add_rows(num_file_rows, table_name, file)
+        metrics.add_bytes(os.path.getsize(file), table_name, file)
+        num_rows += num_file_rows
+
+    return num_rows
+
+
+def check_table_params(table_params):
+    """
+    Check the per-table overrides of the load settings.
+
+    :param table_params: Dictionary of table name to dictionary of settings (see TABLE_SETTINGS), or None.
+    """
 
-def load_database(filepath, delimiter, encapsulator, encoding, true_values, false_values, db_params):
+    for table_name, overrides in (table_params or {}).items():
+        for setting in overrides.keys():
+            if setting not in TABLE_SETTINGS:
+                raise ValueError("Unknown setting %s of table %s" % (setting, table_name))
+        if overrides.get('backend', "mariadb") not in BACKENDS:
+            raise ValueError("Unknown backend of table %s: %s" % (table_name, overrides['backend']))
+
+
+def load_table(table_name, files_to_process, delimiter, encapsulator, encoding, true_values, false_values, db_params,
+               backend="mariadb", copy_format="csv", metrics=None, batch_size=DEFAULT_BATCH_SIZE, checkpoint=False,
+               resume=False, narrow_types=False, inference_params=None, dedup_params=None, memory_budget=None,
+               reject_params=None, column_params=None, parse_cache=None, partition_params=None, merge_params=None,
+               tune_params=None, column_profile_params=None):
+    """
+    Load a single table from its files: drop it, infer its schema, create it and insert the data.
+
+    :param table_name: Name of the table.
+    :param files_to_process: List of files to populate the table with.
+    :param delimiter: Delimiter in the CSV files.
+    :param encapsulator: Encapsulator in the CSV files.
+    :param encoding: Encoding of the CSV files.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param db_params: Dictionary of database parameters (or output parameters for the Parquet backend).
+    :param backend: Database backend ('mariadb', 'postgresql' or 'parquet').
+    :param copy_format: COPY format used by the PostgreSQL backend ('csv' or 'binary').
+    :param metrics: LoadMetrics to record the timings in (optional).
+    :param batch_size: Maximum number of rows per INSERT statement and transaction (MariaDB backend).
+    :param checkpoint: Record the schema and the progress through each file in state tables (MariaDB backend)?
+    :param resume: Resume from the recorded progress instead of reloading the table (implies checkpoint).
+    :param narrow_types: Size the SQL types (e.g. TINYINT, VARCHAR(n), DATE) from the statistics of each column?
+    :param inference_params: Dictionary of extended inference parameters to also infer dates, datetimes and decimals
+        (None for the basic inference).
+    :param dedup_params: Dictionary of deduplication parameters (see deduplicate_rows), or None to load every row.
+    :param memory_budget: MemoryBudget to size the batches and deduplication from and apply backpressure with.
+    :param reject_params: Dictionary of parameters to quarantine the bad rows ('path' and 'max-error-rate'), or None
+        to fail on the first bad row.
+    :param column_params: Dictionary of the columns to load ('include' and 'exclude', lists of field names), or None
+        to load all of the columns.
+    :param parse_cache: ParseCache of the inferred schemas of the files (optional).
+    :param partition_params: Dictionary of parameters to partition the table on a column and insert into the
+        partitions in parallel (see database_utilities.check_partition_params, MariaDB backend), or None for an
+        unpartitioned table.
+    :param merge_params: Dictionary of parameters to merge the rows into the table by a unique key ('key', a list of
+        columns, and optionally 'stage-rows' and 'filter-capacity'), keeping the table if it exists, or None to reload
+        the table (MariaDB backend).
+    :param tune_params: Dictionary of parameters to adapt the batch size (and the number of active partition writers)
+        to the measured throughput ('min-batch-size', 'max-batch-size', 'target-latency' and 'max-packet-bytes', see
+        tuning.LoadTuner), starting from batch_size (MariaDB backend), or None to keep batch_size.
+    :param column_profile_params: Dictionary of parameters to profile the columns during schema inference and write
+        the profile as JSON ('path'), or None not to profile the columns.
+    """
+
+    target = backend_module(backend)
+
+    checkpoint = checkpoint or resume
+    if checkpoint and backend != "mariadb":
+        raise ValueError("Checkpointing is only supported by the MariaDB backend")
+    if checkpoint and dedup_params is not None:
+        raise ValueError("Checkpointing isn't supported when deduplicating the rows")
+    if narrow_types and backend == "postgresql" and copy_format == "binary":
+        raise ValueError("Type narrowing isn't supported with the binary COPY format")
+    if partition_params is not None and backend != "mariadb":
+        raise ValueError("Partitioning is only supported by the MariaDB backend")
+    if partition_params is not None and checkpoint:
+        raise ValueError("Checkpointing isn't supported when inserting into the partitions in parallel")
+    if merge_params is not None and backend != "mariadb":
+        raise ValueError("Merging is only supported by the MariaDB backend")
+    if merge_params is not None and partition_params is not None:
+        raise ValueError("Merging isn't supported when inserting into the partitions in parallel")
+    if tune_params is not None and backend != "mariadb":
+        raise ValueError("Tuning the batch size is only supported by the MariaDB backend")
+
+    if metrics is None:
+        metrics = LoadMetrics()
+
+    module_logger.info("Processing table %s ...", table_name)
+    table_start = time.perf_counter()
+
+    # Size the batches (and the deduplication and partition writers) from the memory budget
+    num_writers = None
+    queue_depth = DEFAULT_QUEUE_DEPTH
+    if partition_params is not None:
+        num_writers = min(partition_params.get('writers', num_partitions(partition_params)),
+                          num_partitions(partition_params))
+    if memory_budget is not None and memory_budget.limit_bytes is not None:
+        row_bytes = sample_row_bytes(files_to_process, delimiter, encapsulator, encoding, column_params=column_params)
+        batch_size = memory_budget.batch_size(batch_size, row_bytes)
+        if backend == "parquet":
+            db_params = dict(db_params)
+            db_params['row-group-size'] = memory_budget.batch_size(
+                db_params.get('row-group-size', target.DEFAULT_ROW_GROUP_SIZE), row_bytes)
+        if dedup_params is not None and 'max-keys' not in dedup_params:
+            dedup_params = dict(dedup_params)
+            dedup_params['max-keys'] = memory_budget.spill_size(DEFAULT_MAX_KEYS, row_bytes)
+        if tune_params is not None:
+            tune_params = dict(tune_params)
+            tune_params['max-batch-size'] = memory_budget.batch_size(
+                tune_params.get('max-batch-size', DEFAULT_MAX_BATCH_SIZE), row_bytes)
+        if partition_params is not None:
+            batch_bytes = batch_size * row_bytes
+            num_writers = memory_budget.worker_count(num_writers, queue_depth * batch_bytes)
+            queue_depth = memory_budget.queue_depth(queue_depth, batch_bytes, num_writers)
+            module_logger.info("Partition writers %d, queue depth %d", num_writers, queue_depth)
+        module_logger.info("Estimated %d bytes per row, batch size %d", row_bytes, batch_size)
+
+    # Get the recorded state of the table
+    schema = None
+    file_checkpoints = {}
+
+    if checkpoint:
+        mydb = database_utilities.build_database_connection(db_params)
+        cursor = mydb.cursor()
+        checkpoints.create_state_tables(cursor)
+
+        if resume:
+            schema, complete = checkpoints.load_table_state(cursor, table_name)
+            if complete:
+                module_logger.info("Table %s has already been loaded", table_name)
+                cursor.close()
+                mydb.close()
+                return
+            elif schema is not None:
+                file_checkpoints = checkpoints.load_file_checkpoints(cursor, table_name)
+                module_logger.info("Resuming table %s with the recorded schema: %s", table_name, schema)
+
+        if schema is None:
+            checkpoints.clear_table_state(cursor, table_name)
+
+        mydb.commit()
+        cursor.close()
+        mydb.close()
+
+    if schema is None:
+
+        # Drop the tables that already exist in the database (unless the rows are merged into them)
+        table_exists = False
+        if merge_params is not None:
+            with metrics.timed("ddl", table_name):
+                table_exists = database_utilities.table_exists(db_params, table_name)
+            module_logger.info("Merging into %s table %s", "the existing" if table_exists else "a new", table_name)
+        else:
+            module_logger.info("Dropping table ...")
+            with metrics.timed("ddl", table_name):
+                target.drop_table(db_params, table_name)
+
+        # Determine the schema of each of the table
+        module_logger.info("Determining schema ...")
+        column_statistics = {} if narrow_types or column_profile_params is not None or partition_params is not None \
+            else None
+        schema = build_schema_from_files(files_to_process, delimiter, encapsulator, encoding, true_values,
+                                         false_values, metrics, table_name, column_statistics, inference_params,
+                                         memory_budget, column_params, parse_cache, column_profile_params is not None)
+
+        # Write the profile of the columns from the statistics gathered in the same pass
+        if column_profile_params is not None:
+            profile_path = write_column_profiles(column_profile_params.get('path', DEFAULT_PROFILE_PATH), table_name,
+                                                 schema, column_statistics)
+            module_logger.info("Profile of the columns of table %s written to %s", table_name, profile_path)
+
+        # The partitioning column is part of the primary key, so it can't hold NULLs
+        if partition_params is not None:
+            check_partition_params(schema, partition_params, column_statistics)
+
+        if narrow_types:
+            candidate_keys = [name for name, statistics in column_statistics.items() if statistics.is_unique()]
+            module_logger.info("Columns with distinct values: %s", candidate_keys)
+        else:
+            column_statistics = None
+
+        if merge_params is not None:
+            check_merge_params(schema, merge_params)
+
+        # Create the table
+        module_logger.info("Creating table ...")
+        with metrics.timed("ddl", table_name):
+            if merge_params is not None:
+                if not table_exists:
+                    target.create_table(db_params, table_name, schema, column_statistics,
+                                        key_columns=merge_params['key'])
+                else:
+                    # The upserts only update the existing rows if the table has a unique key on the key columns
+                    database_utilities.ensure_unique_key(db_params, table_name, merge_params['key'])
+            elif partition_params is not None:
+                target.create_table(db_params, table_name, schema, column_statistics, partition_params)
+            else:
+                target.create_table(db_params, table_name, schema, column_statistics)
+
+            if checkpoint:
+                mydb = database_utilities.build_database_connection(db_params)
+                cursor = mydb.cursor()
+                checkpoints.save_schema(cursor, table_name, schema)
+                mydb.commit()
+                cursor.close()
+                mydb.close()
+
+    # Quarantine the bad rows (appending to the reject file of an interrupted load, less the rows read again)
+    rejects = None
+    if reject_params is not None:
+        rejects = RejectWriter(reject_params.get('path', DEFAULT_REJECT_PATH), table_name,
+                               reject_params.get('max-error-rate', DEFAULT_MAX_ERROR_RATE),
+                               append=len(file_checkpoints) > 0)
+        rejects.discard_replayed(files_to_process, file_checkpoints)
+
+    # Adapt the batch size (and number of active writers) to the throughput
+    tuner = None
+    if tune_params is not None:
+        tuner = LoadTuner(batch_size, num_writers or 1,
+                          tune_params.get('min-batch-size', DEFAULT_MIN_BATCH_SIZE),
+                          tune_params.get('max-batch-size', DEFAULT_MAX_BATCH_SIZE),
+                          tune_params.get('target-latency', DEFAULT_TARGET_LATENCY),
+                          tune_params.get('max-packet-bytes', DEFAULT_MAX_PACKET_BYTES))
+
+    # Insert the data into the database
+    module_logger.info("Inserting data ...")
+    if backend == "postgresql":
+        copy_data_from_files(files_to_process, delimiter, encapsulator, encoding, db_params, table_name, schema,
+                             true_values, false_values, copy_format, metrics, inference_params, dedup_params,
+                             memory_budget, rejects, column_params)
+    elif backend == "parquet":
+        write_data_from_files(files_to_process, delimiter, encapsulator, encoding, db_params, table_name, schema,
+                              true_values, false_values, metrics, inference_params, dedup_params, memory_budget,
+                              rejects, column_params)
+    elif partition_params is not None:
+        database_utilities.check_autoinc_lock_mode(db_params)
+        insert_partitioned_data_from_files(files_to_process, delimiter, encapsulator, encoding, db_params, table_name,
+                                           schema, true_values, false_values, partition_params, metrics, batch_size,
+                                           inference_params, dedup_params, memory_budget, rejects, column_params,
+                                           num_writers, queue_depth, tuner)
+    else:
+        merger = None
+        if merge_params is not None:
+            merger = TableMerger(table_name, schema, merge_params['key'],
+                                 merge_params.get('stage-rows', DEFAULT_STAGE_ROWS),
+                                 merge_params.get('filter-capacity', DEFAULT_FILTER_CAPACITY))
+        insert_data_from_files(files_to_process, delimiter, encapsulator, encoding, db_params, table_name, schema,
+                               true_values, false_values, metrics, batch_size, checkpoint, file_checkpoints,
+                               inference_params, dedup_params, memory_budget, rejects, column_params=column_params,
+                               merger=merger, tuner=tuner)
+
+    if rejects is not None:
+        rejects.check_error_rate(final=True)
+        rejects.close()
+
+    if checkpoint:
+        mydb = database_utilities.build_database_connection(db_params)
+        cursor = mydb.cursor()
+        checkpoints.mark_table_complete(cursor, table_name)
+        mydb.commit()
+        cursor.close()
+        mydb.close()
+
+    metrics.set_table_seconds(table_name, time.perf_counter() - table_start)
+
+
+def load_database(filepath, delimiter, encapsulator, encoding, true_values, false_values, db_params,
+                  backend="mariadb", copy_format="csv", metrics_path=None, prometheus_path=None, async_logging=False,
+                  profile_path=None, profile_tables=None, batch_size=DEFAULT_BATCH_SIZE, checkpoint=False,
+                  resume=False, narrow_types=False, inference_params=None, assembly_params=None,
+                  dedup_params=None, memory_limit=None, reject_params=None, discovery_params=None, table_params=None,
+                  column_params=None, cache_params=None, partition_params=None, merge_params=None, tune_params=None,
+                  column_profile_params=None, soft_memory_limit=False, profile_mode=DEFAULT_PROFILE_MODE):
+    """
+    Load the CSV files in a folder into the database, one table per group of files.
+
+    :param filepath: Folder containing the CSV files.
+    :param delimiter: Delimiter in the CSV files.
+    :param encapsulator: Encapsulator in the CSV files.
+    :param encoding: Encoding of the CSV files.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param db_params: Dictionary of database parameters (or output parameters for the Parquet backend).
+    :param backend: Database backend ('mariadb', 'postgresql' or 'parquet').
+    :param copy_format: COPY format used by the PostgreSQL backend ('csv' or 'binary').
+    :param metrics_path: File to write the JSON metrics report to (optional).
+    :param prometheus_path: File to write the metrics to in the Prometheus text format (optional).
+    :param async_logging: Write the log records from a background thread for the duration of the load?
+    :param profile_path: Folder to write a profile per table to (optional).
+    :param profile_tables: Names of the tables to profile (if None, all tables are profiled).
+    :param batch_size: Maximum number of rows per INSERT statement and transaction (MariaDB backend).
+    :param checkpoint: Record the schema and the progress through each file in state tables (MariaDB backend)?
+    :param resume: Resume an interrupted load from the recorded progress (implies checkpoint).
+    :param narrow_types: Size the SQL types (e.g. TINYINT, VARCHAR(n), DATE) from the statistics of each column?
+    :param inference_params: Dictionary of extended inference parameters to also infer dates, datetimes and decimals
+        ('date-formats', 'datetime-formats' and 'decimals'), or None for the basic inference.
+    :param assembly_params: Dictionary of parameters to merge the tables sharing a key column into one wide table
+        ('table-name', 'key' and optionally 'sorted', 'run-size' and 'work-path'), or None to load each table as is.
+    :param dedup_params: Dictionary of parameters to remove the duplicate rows of each table before they are inserted
+        ('key', 'max-keys', 'sorted' and 'spill-path', all optional), or None to load every row.
+    :param memory_limit: Memory budget in bytes (or a String such as '2G') used to size the batches, deduplication and
+        sort runs and to apply backpressure, failing the load with a MemoryError if it is still exceeded after
+        backpressure (if None, the memory use is only monitored).
+    :param reject_params: Dictionary of parameters to quarantine the rows that can't be loaded in a per-table reject
+        file ('path' and 'max-error-rate', the maximum fraction of rejected rows before the load fails), or None to
+        fail on the first bad row.
+    :param discovery_params: Dictionary of parameters to find the files ('recursive', 'include', 'exclude',
+        'manifest' and 'table-name-from', see discovery.discover_tables), or None to list the CSV files in the folder.
+    :param table_params: Dictionary of table name to a dictionary of the settings that override the arguments for
+        that table: 'backend' and 'db-params', 'copy-format', 'batch-size', 'checkpoint', 'narrow-types', 'inference',
+        'dedup', 'rejects', 'memory-limit' (a separate budget for the table), 'columns', 'partition', 'merge', 'tune'
+        and 'column-profile'.
+    :param column_params: Dictionary of the columns to load ('include' and 'exclude', lists of field names that are
+        skipped by the reader, so they aren't inferred, created or inserted), or None to load all of the columns.
+    :param cache_params: Dictionary of parameters to cache the inferred schema of each file ('path'), so that a later
+        load of the unchanged files skips the schema inference, or None to infer the schemas every time.
+    :param partition_params: Dictionary of parameters to partition the tables on a column ('column', 'method',
+        'partitions' or 'bounds', and 'writers', see database_utilities.check_partition_params) and insert into the
+        partitions with parallel writers (MariaDB backend), or None for unpartitioned tables.
+    :param merge_params: Dictionary of parameters to merge the rows into the existing tables by a unique key ('key', a
+        list of columns, and optionally 'stage-rows', the number of rows of a batch to upsert from which they are
+        staged in a temporary table, and 'filter-capacity', see merge.TableMerger) instead of reloading the tables
+        (MariaDB backend), or None to reload the tables.
+    :param tune_params: Dictionary of parameters to adapt the batch size and the number of active partition writers
+        of each table to the measured throughput ('min-batch-size', 'max-batch-size', 'target-latency' and
+        'max-packet-bytes', see tuning.LoadTuner), starting from batch_size (MariaDB backend), or None to keep
+        batch_size.
+    :param column_profile_params: Dictionary of parameters to profile the columns of each table during schema
+        inference ('path', the folder to write a JSON profile per table to), with the number of NULLs, estimated
+        distinct values, value range and quantiles and length distribution of each column, or None not to profile the
+        columns.
+    :param soft_memory_limit: Only log exceeding the memory budgets (of the load and of the tables) instead of failing
+        the load?
+    :param profile_mode: Profiler of the tables: 'cprofile' (a pstats file per table) or 'sampling' (a collapsed-stack
+        file per table, sampling the stacks of all of the threads).
+    :return: Metrics report (dictionary).
+    """
 
     # Preconditions
     assert type(delimiter) == str
@@ -187,39 +1241,129 @@ def load_database(filepath, delimiter, encapsulator, encoding, true_values, fals
     assert type(false_values) == list
     assert type(db_params) == dict
 
-    module_logger.info("Processing files in: %s" % filepath)
-    module_logger.info("CSV delimiter: %s" % delimiter)
-    module_logger.info("CSV encapsulator: %s" % encapsulator)
-    module_logger.info("CSV encoding: %s" % encoding)
-    module_logger.info("Values defined as True: %s" % true_values)
-    module_logger.info("Values defined as False: %s" % false_values)
+    target = backend_module(backend)
+    check_table_params(table_params)
 
-    # Get the table names based on the files within the specified folder
-    table_name_to_files = table_names_from_path(filepath)
-    table_names = list(table_name_to_files.keys())
-    module_logger.info("Table names: %s" % table_names)
+    # The checkpoints of the wide table refer to the assembled file, so it must be kept between runs
+    if assembly_params is not None and (checkpoint or resume) and assembly_params.get('work-path') is None:
+        raise ValueError("Checkpointing an assembled table requires a 'work-path' in the assembly parameters")
 
-    # If the database doesn't exist, create it
-    create_database(db_params)
+    with logger.asynchronous_logging(LOGGER_NAMES, logging.INFO, async_logging):
+        module_logger.info("Processing files in: %s", filepath)
+        module_logger.info("CSV delimiter: %s", delimiter)
+        module_logger.info("CSV encapsulator: %s", encapsulator)
+        module_logger.info("CSV encoding: %s", encoding)
+        module_logger.info("Values defined as True: %s", true_values)
+        module_logger.info("Values defined as False: %s", false_values)
+        module_logger.info("Database backend: %s", backend)
+        module_logger.info("Extended type inference: %s", inference_params)
 
-    # Walk through each table
-    for table_name in table_names:
-        module_logger.info("Processing table %s ..." % table_name)
+        metrics = LoadMetrics()
+        profiler = TableProfiler(profile_path, profile_tables, mode=profile_mode)
+        memory_budget = MemoryBudget(memory_limit, soft=soft_memory_limit)
+        memory_budget.start()
+        module_logger.info("Memory budget: %s bytes", memory_budget.limit_bytes)
 
-        # Drop the tables that already exist in the database
-        module_logger.info("Dropping table ...")
-        drop_table(db_params, table_name)
+        work_path = None
+        try:
+            parse_cache = None
+            if cache_params is not None:
+                parse_cache = ParseCache(cache_params.get('path', DEFAULT_CACHE_PATH))
 
-        # Determine the schema of each of the table
-        module_logger.info("Determining schema ...")
-        files_to_process = table_name_to_files[table_name]
-        schema = build_schema_from_files(files_to_process, delimiter, encapsulator, encoding, true_values, false_values)
+            # Get the table names based on the files within the specified folder (or manifest), the largest table first
+            with metrics.timed("glob"):
+                discovered = discover_tables(filepath, discovery_params)
+            table_sizes = dict([(table_name, sum([f.size for f in files])) for table_name, files in discovered.items()])
+            table_name_to_files = dict([(table_name, [f.path for f in discovered[table_name]])
+                                        for table_name in sorted(table_sizes, key=table_sizes.get, reverse=True)])
+            module_logger.info("Bytes per table: %s", table_sizes)
 
-        # Create the table
-        module_logger.info("Creating table ...")
-        create_table(db_params, table_name, schema)
+            # Assemble the tables sharing the key column into a wide table (in a temporary folder unless specified)
+            if assembly_params is not None:
+                work_path = assembly_params.get('work-path') or tempfile.mkdtemp(prefix="assembly-")
+                os.makedirs(work_path, exist_ok=True)
+                if memory_budget.limit_bytes is not None and 'run-size' not in assembly_params:
+                    files = list(table_name_to_files.values())[0]
+                    assembly_params = dict(assembly_params)
+                    assembly_params['run-size'] = memory_budget.spill_size(
+                        assembly.DEFAULT_RUN_SIZE, sample_row_bytes(files, delimiter, encapsulator, encoding))
+                with metrics.timed("assembly"):
+                    table_name_to_files = assembly.assemble_tables(table_name_to_files, assembly_params, delimiter,
+                                                                   encapsulator, encoding, work_path)
 
-        # Insert the data into the database
-        module_logger.info("Inserting data ...")
-        insert_data_from_files(files_to_process, delimiter, encapsulator, encoding, db_params, table_name, schema,
-                               true_values, false_values)
+            table_names = list(table_name_to_files.keys())
+            module_logger.info("Table names: %s", table_names)
+
+            # If the database doesn't exist, create it
+            with metrics.timed("ddl"):
+                target.create_database(db_params)
+
+            # Walk through each table, applying its overrides (if any)
+            created_backends = set([backend])
+            for table_name in table_names:
+                overrides = (table_params or {}).get(table_name, {})
+                table_backend = overrides.get('backend', backend)
+                table_db_params = overrides.get('db-params', db_params)
+                if table_backend not in created_backends:
+                    with metrics.timed("ddl"):
+                        backend_module(table_backend).create_database(table_db_params)
+                    created_backends.add(table_backend)
+
+                table_budget = memory_budget
+                if 'memory-limit' in overrides:
+                    table_budget = MemoryBudget(overrides['memory-limit'], soft=soft_memory_limit)
+                    table_budget.start()
+
+                try:
+                    with profiler.profile(table_name):
+                        load_table(table_name, table_name_to_files[table_name], delimiter, encapsulator, encoding,
+                                   true_values, false_values, table_db_params, table_backend,
+                                   overrides.get('copy-format', copy_format), metrics,
+                                   overrides.get('batch-size', batch_size), overrides.get('checkpoint', checkpoint),
+                                   resume and overrides.get('checkpoint', True),
+                                   overrides.get('narrow-types', narrow_types),
+                                   overrides.get('inference', inference_params), overrides.get('dedup', dedup_params),
+                                   table_budget, overrides.get('rejects', reject_params),
+                                   overrides.get('columns', column_params), parse_cache,
+                                   overrides.get('partition', partition_params), overrides.get('merge', merge_params),
+                                   overrides.get('tune', tune_params),
+                                   overrides.get('column-profile', column_profile_params))
+                finally:
+                    if table_budget is not memory_budget:
+                        table_budget.stop()
+
+                # A table's memory limit may be disabled (None), in which case its memory use is only monitored
+                if table_budget is not memory_budget:
+                    if table_budget.limit_bytes is None:
+                        module_logger.info("Memory high-water mark of table %s: %d bytes", table_name,
+                                           table_budget.high_water_bytes)
+                    else:
+                        module_logger.info("Memory high-water mark of table %s: %d bytes (budget %d bytes)",
+                                           table_name, table_budget.high_water_bytes, table_budget.limit_bytes)
+        finally:
+            # Remove the temporary assembly folder and stop the memory monitor even if a table failed to load
+            if work_path is not None and assembly_params.get('work-path') is None:
+                shutil.rmtree(work_path, ignore_errors=True)
+            memory_budget.stop()
+
+        if parse_cache is not None:
+            module_logger.info("Parse cache: read %d schemas from %s", parse_cache.num_schemas_read, parse_cache.folder)
+
+        # Report the metrics
+        metrics.set_memory(memory_budget.report())
+        metrics.finish()
+        report = metrics.report()
+        module_logger.info("Loaded %d rows (%d bytes) in %.3f s (%.1f rows/s), peak RSS %s bytes", report["rows"],
+                           report["bytes"], report["seconds"], report["rows_per_second"], report["peak_rss_bytes"])
+        module_logger.info("Memory high-water mark %d bytes (budget %s bytes)", memory_budget.high_water_bytes,
+                           memory_budget.limit_bytes)
+
+        if metrics_path is not None:
+            module_logger.info("Writing metrics report to: %s", metrics_path)
+            metrics.write_json(metrics_path)
+
+        if prometheus_path is not None:
+            module_logger.info("Writing Prometheus metrics to: %s", prometheus_path)
+            metrics.write_prometheus(prometheus_path)
+
+        return report
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+import gc
+import logging
+import os
+import re
+import sys
+import threading
+
+from database_loader.metrics import peak_rss_bytes
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Fraction of the budget above which backpressure is applied
+SOFT_LIMIT_FRACTION = 0.9
+
+# Fraction of the budget below which the backpressure is released
+LOW_WATERMARK_FRACTION = 0.75
+
+# Fraction of the budget by which the resident set size must grow after a stage has released memory before
+# backpressure is applied again (the freed memory is often kept by the allocator, so the RSS may not fall)
+REARM_FRACTION = 0.05
+
+# Fractions of the budget given to a batch of rows and to a deduplication or sort stage
+BATCH_FRACTION = 0.05
+SPILL_FRACTION = 0.25
+
+# Default interval in seconds between samples of the resident set size
+DEFAULT_SAMPLE_INTERVAL = 0.1
+
+# Sizes such as 512M or 2G
+SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", re.IGNORECASE)
+SIZE_UNITS = {"": 1, "k": 2 ** 10, "m": 2 ** 20, "g": 2 ** 30, "t": 2 ** 40}
+
+
+def parse_size(size):
+    """
+    Parse a memory size.
+
+    :param size: Number of bytes, or a String such as '512M' or '2GB' (binary units).
+    :return: Number of bytes.
+    """
+
+    if isinstance(size, (int, float)):
+        return int(size)
+
+    m = SIZE_PATTERN.match(size)
+    if m is None:
+        raise ValueError("Invalid memory size: %s" % size)
+
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2).lower()])
+
+
+def current_rss_bytes():
+    """
+    Get the current resident set size of the process.
+
+    :return: RSS in bytes (the peak RSS if the current RSS can't be read on this platform).
+    """
+
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def estimate_row_bytes(rows):
+    """
+    Estimate the memory used by a row of String data from a sample of rows.
+
+    :param rows: List of dictionaries of field name to value.
+    :return: Average number of bytes per row (including the Python object overheads).
+    """
+
+    if len(rows) == 0:
+        return 0
+
+    total = 0
+    for data in rows:
+        total += sys.getsizeof(data) + sum([sys.getsizeof(k) + sys.getsizeof(v) for k, v in data.items()])
+
+    return total // len(rows)
+
+
+class MemoryBudget(object):
+    """
+    Memory budget of a load.
+
+    The budget sizes the memory-hungry stages (batches, deduplication and sort runs, queues and workers) and a
+    background thread samples the resident set size, recording its high-water mark and flagging when the soft limit
+    is approached so that the stages can apply backpressure (e.g. by flushing smaller batches).
+
+    The flag has hysteresis: it is cleared once the RSS falls below the low watermark, and after a stage has released
+    memory it is only raised again if the RSS grows further, so that the stages don't keep shrinking while the RSS
+    stays high because the allocator keeps the freed memory.
+
+    The budget is hard by default: if the RSS still exceeds the budget once a stage has released memory, a MemoryError
+    is raised to fail the load. A soft budget only logs (and counts) the times it is exceeded.
+    """
+
+    def __init__(self, limit_bytes=None, sample_interval=DEFAULT_SAMPLE_INTERVAL, soft=False):
+        """
+        :param limit_bytes: Budget in bytes (or a String such as '2G'); if None, the memory use is only monitored.
+        :param sample_interval: Interval in seconds between samples of the resident set size.
+        :param soft: Log exceeding the budget instead of raising a MemoryError?
+        """
+
+        assert sample_interval > 0
+
+        self.limit_bytes = parse_size(limit_bytes) if limit_bytes is not None else None
+        self.sample_interval = sample_interval
+        self.soft = soft
+
+        self.high_water_bytes = 0
+        self.under_pressure = False
+        self.num_over_budget = 0
+        self._relieved_bytes = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        if self.limit_bytes is not None:
+            assert self.limit_bytes > 0
+
+    def sample(self):
+        """
+        Sample the resident set size, updating the high-water mark and the pressure flag.
+
+        :return: RSS in bytes.
+        """
+
+        rss = current_rss_bytes()
+        if rss is None:
+            return None
+
+        if rss > self.high_water_bytes:
+            self.high_water_bytes = rss
+        if self.limit_bytes is not None:
+            if rss < self.limit_bytes * LOW_WATERMARK_FRACTION:
+                self.under_pressure = False
+                self._relieved_bytes = None
+            elif rss >= self.limit_bytes * SOFT_LIMIT_FRACTION and \
+                    (self._relieved_bytes is None or rss >= self._relieved_bytes + self.limit_bytes * REARM_FRACTION):
+                self.under_pressure = True
+
+        return rss
+
+    def _run(self):
+        while not self._stop.wait(self.sample_interval):
+            self.sample()
+
+    def start(self):
+        """Start sampling the resident set size in a background thread."""
+
+        self.sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="memory-monitor")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling the resident set size."""
+
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.sample()
+
+    def relieve_pressure(self):
+        """
+        Called by a stage after it has released memory (e.g. flushed a batch) under pressure: collect garbage and
+        clear the pressure flag until the resident set size grows further (or falls below the low watermark).
+
+        :return: True if the process is still under pressure.
+        :raises MemoryError: If the budget is hard and the resident set size still exceeds it.
+        """
+
+        if not self.under_pressure:
+            return False
+
+        gc.collect()
+        rss = current_rss_bytes()
+        if rss is None:
+            return self.under_pressure
+
+        if rss > self.limit_bytes:
+            self.num_over_budget += 1
+            if not self.soft:
+                raise MemoryError("The resident set size (%d bytes) exceeds the memory budget (%d bytes)" %
+                                  (rss, self.limit_bytes))
+            module_logger.warning("The resident set size (%d bytes) exceeds the memory budget (%d bytes)",
+                                  rss, self.limit_bytes)
+
+        self.under_pressure = False
+        self._relieved_bytes = rss
+        self.sample()
+
+        return self.under_pressure
+
+    def _share(self, fraction, item_bytes, default, minimum=1):
+        """Number of items of item_bytes that fit in a fraction of the budget (capped at default)."""
+
+        if self.limit_bytes is None or item_bytes <= 0:
+            return default
+
+        return max(minimum, min(default, int(self.limit_bytes * fraction // item_bytes)))
+
+    def batch_size(self, default, row_bytes):
+        """
+        Size a batch of rows.
+
+        :param default: Requested batch size.
+        :param row_bytes: Estimated number of bytes per row.
+        :return: Batch size.
+        """
+
+        return self._share(BATCH_FRACTION, row_bytes, default)
+
+    def spill_size(self, default, row_bytes):
+        """
+        Size the number of rows (or keys) held in memory by a deduplication or sort stage before it spills to disk.
+
+        :param default: Requested number of rows.
+        :param row_bytes: Estimated number of bytes per row.
+        :return: Number of rows.
+        """
+
+        return self._share(SPILL_FRACTION, row_bytes, default)
+
+    def queue_depth(self, default, item_bytes, num_queues=1):
+        """
+        Size the depth of the queues between threads.
+
+        :param default: Requested queue depth.
+        :param item_bytes: Estimated number of bytes per queued item (e.g. a batch of rows).
+        :param num_queues: Number of queues sharing the budget.
+        :return: Queue depth.
+        """
+
+        return self._share(BATCH_FRACTION * 2 / num_queues, item_bytes, default)
+
+    def worker_count(self, default, worker_bytes):
+        """
+        Size the number of workers.
+
+        :param default: Requested number of workers.
+        :param worker_bytes: Estimated number of bytes used by each worker.
+        :return: Number of workers.
+        """
+
+        return self._share(SPILL_FRACTION, worker_bytes, default)
+
+    def report(self):
+        """
+        Build the report of the memory use.
+
+        :return: Dictionary of the budget and the high-water mark in bytes.
+        """
+
+        return {"budget_bytes": self.limit_bytes, "high_water_bytes": self.high_water_bytes}
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+
+from database_loader import database_utilities
+from database_loader.database_utilities import create_table_statement, insert_data_batch_statement, \
+    upsert_data_batch_statement, merge_staged_statement, safe_name
+from database_loader.type_inference import DataType, is_null
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Default number of keys the key filter is sized for (it is enlarged to twice the number of rows already loaded) and
+# its false positive rate
+DEFAULT_FILTER_CAPACITY = 1000000
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+
+# Number of bits of the key filter set per key (fewer than the optimal number for the false positive rate, which is
+# made up for with more bits, as hashing costs more than memory)
+FILTER_HASHES = 4
+
+# Default number of rows of a batch to upsert at or above which they are staged in a temporary table and merged
+DEFAULT_STAGE_ROWS = 10000
+
+# Number of rows per INSERT statement into the staging table
+STAGE_CHUNK_ROWS = 1000
+
+# Value hashed with a key by the key filter (hashing a tuple mixes the bits of e.g. consecutive integer keys, whose own
+# hashes are the integers themselves)
+FILTER_SALT = 0x9e3779b9
+
+
+class KeyFilter(object):
+    """
+    Bloom filter of the keys loaded into a table.
+
+    A key that isn't in the filter has certainly not been loaded, whereas a key that is may have been (a false
+    positive), so the filter only decides whether a row can take the plain INSERT path.
+    """
+
+    def __init__(self, capacity=DEFAULT_FILTER_CAPACITY, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):
+        """
+        :param capacity: Number of keys the filter is sized for.
+        :param false_positive_rate: False positive rate at capacity.
+        """
+
+        assert capacity > 0
+        assert 0.0 < false_positive_rate < 1.0
+
+        # With k hashes, the false positive rate at capacity is (1 - exp(-k n / m)) ^ k
+        self.num_hashes = FILTER_HASHES
+        self.num_bits = max(8, int(math.ceil(-self.num_hashes * capacity /
+                                             math.log(1 - false_positive_rate ** (1 / self.num_hashes)))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.num_keys = 0
+
+    def add(self, key):
+        """
+        Add a key to the filter.
+
+        :param key: Hashable key.
+        :return: True if the key may already have been added, False if it certainly hasn't.
+        """
+
+        # Derive the bit positions from the two halves of a 64-bit hash (double hashing)
+        bits = self.bits
+        num_bits = self.num_bits
+        key_hash = hash((key, FILTER_SALT))
+        position = key_hash % num_bits
+        step = ((key_hash >> 32) | 1) % num_bits
+
+        present = True
+        for _ in range(self.num_hashes):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                present = False
+            position = (position + step) % num_bits
+
+        if not present:
+            self.num_keys += 1
+        return present
+
+    def __contains__(self, key):
+        bits = self.bits
+        num_bits = self.num_bits
+        key_hash = hash((key, FILTER_SALT))
+        position = key_hash % num_bits
+        step = ((key_hash >> 32) | 1) % num_bits
+
+        for _ in range(self.num_hashes):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            position = (position + step) % num_bits
+        return True
+
+
+def normalise_key_value(value, datatype):
+    """
+    Normalise a value of a key column, so that a raw String value from a file and the value read from the table
+    compare equal.
+
+    :param value: Raw String value or value read from the database.
+    :param datatype: Inferred type of the column.
+    :return: Normalised value, or None for a NULL.
+    """
+
+    if datatype == DataType.int or datatype == DataType.float:
+        try:
+            return int(value) if datatype == DataType.int else float(value)
+        except (TypeError, ValueError):
+            if value is None or is_null(value):
+                return None
+            raise
+
+    if value is None or (isinstance(value, str) and is_null(value)):
+        return None
+
+    return str(value)
+
+
+def check_merge_params(schema, merge_params):
+    """
+    Check the parameters of the merge mode: the 'key' columns (a list of field names) and optionally the number of
+    'stage-rows' and the 'filter-capacity'.
+
+    :param schema: Dictionary of field name to inferred type.
+    :param merge_params: Dictionary of merge parameters.
+    """
+
+    key_columns = merge_params.get('key')
+    if type(key_columns) != list or len(key_columns) == 0:
+        raise ValueError("The merge key must be a non-empty list of columns: %s" % key_columns)
+
+    missing = [name for name in key_columns if name not in schema]
+    if len(missing) > 0:
+        raise ValueError("Unknown merge key columns: %s" % missing)
+
+
+class TableMerger(object):
+    """
+    Applies the batches of rows to a table with a unique key, inserting the new rows and updating the rows whose key
+    has already been loaded.
+
+    The rows whose key isn't in the KeyFilter (of the keys already in the table and those inserted since) take the fast
+    path of a plain multi-row INSERT. The others are upserted with INSERT ... ON DUPLICATE KEY UPDATE or, if there are
+    at least stage_rows of them in a batch, inserted into a temporary staging table and merged with one
+    INSERT ... SELECT. If the plain INSERT hits a duplicate key that the filter didn't know of (e.g. a String key equal
+    under the column's collation), its rows are upserted instead.
+    """
+
+    def __init__(self, table_name, schema, key_columns, stage_rows=DEFAULT_STAGE_ROWS,
+                 filter_capacity=DEFAULT_FILTER_CAPACITY):
+        """
+        :param table_name: Name of the database table.
+        :param schema: Dictionary of field name to inferred type.
+        :param key_columns: List of the columns of the table's unique key.
+        :param stage_rows: Number of rows of a batch to upsert at or above which they are staged and merged.
+        :param filter_capacity: Minimum number of keys the key filter is sized for.
+        """
+
+        assert stage_rows > 0
+
+        self.table_name = table_name
+        self.schema = schema
+        self.key_columns = key_columns
+        self.key_types = [schema[name] for name in key_columns]
+        self.stage_rows = stage_rows
+        self.filter_capacity = filter_capacity
+        self.stage_table_name = "%s____STAGE" % safe_name(table_name)
+
+        self.key_filter = KeyFilter(filter_capacity)
+        self.stage_created = False
+        self.num_inserted = 0
+        self.num_upserted = 0
+        self.num_staged = 0
+
+    def row_key(self, data_dict):
+        """
+        Get the normalised key of a row.
+
+        :param data_dict: Dictionary of field name to raw String value.
+        :return: Key value (a tuple of the values of a key of several columns), or None if a key value is NULL (as a
+            NULL key never duplicates another).
+        """
+
+        if len(self.key_columns) == 1:
+            return normalise_key_value(data_dict[self.key_columns[0]], self.key_types[0])
+
+        key = tuple([normalise_key_value(data_dict[name], datatype)
+                     for name, datatype in zip(self.key_columns, self.key_types)])
+
+        return None if None in key else key
+
+    def load_keys(self, cursor):
+        """
+        Add the keys already in the table to the key filter (sizing it for twice their number).
+
+        :param cursor: Database cursor.
+        """
+
+        cursor.execute("SELECT COUNT(*) FROM %s;" % safe_name(self.table_name))
+        num_rows = cursor.fetchone()[0]
+        self.key_filter = KeyFilter(max(self.filter_capacity, 2 * num_rows))
+
+        if num_rows > 0:
+            cursor.execute("SELECT %s FROM %s;" % (", ".join([safe_name(name) for name in self.key_columns]),
+                                                   safe_name(self.table_name)))
+            for values in cursor:
+                key = self.row_key(dict(zip(self.key_columns, values)))
+                if key is not None:
+                    self.key_filter.add(key)
+
+        module_logger.info("Loaded %d keys of table %s into the key filter", num_rows, self.table_name)
+
+    def execute(self, cursor, column_names, list_values, keys):
+        """
+        Apply a batch of rows (without committing).
+
+        :param cursor: Database cursor.
+        :param column_names: Field names (in the order of the values).
+        :param list_values: List of rows, each a list of SQL values from transform_values().
+        :param keys: List of the keys of the rows (from row_key).
+        """
+
+        inserts = []
+        upserts = []
+        key_filter = self.key_filter
+        for values, key in zip(list_values, keys):
+            if key is not None and key_filter.add(key):
+                upserts.append(values)
+            else:
+                inserts.append(values)
+
+        # The new rows are inserted first, so that a later row with the same key updates them
+        if len(inserts) > 0:
+            try:
+                cursor.execute(insert_data_batch_statement(self.table_name, column_names, inserts))
+                self.num_inserted += len(inserts)
+            except database_utilities.duplicate_key_errors():
+                upserts = inserts + upserts
+
+        if len(upserts) >= self.stage_rows:
+            self.merge_staged(cursor, column_names, upserts)
+        elif len(upserts) > 0:
+            cursor.execute(upsert_data_batch_statement(self.table_name, column_names, upserts, self.key_columns))
+        self.num_upserted += len(upserts)
+
+    def merge_staged(self, cursor, column_names, list_values):
+        """
+        Stage rows in the temporary staging table and merge them into the table.
+
+        :param cursor: Database cursor.
+        :param column_names: Field names (in the order of the values).
+        :param list_values: List of rows, each a list of SQL values from transform_values().
+        """
+
+        if not self.stage_created:
+            stage_schema = dict([(name, self.schema[name]) for name in column_names])
+            cursor.execute(create_table_statement(self.stage_table_name, stage_schema, temporary=True))
+            self.stage_created = True
+
+        for start in range(0, len(list_values), STAGE_CHUNK_ROWS):
+            cursor.execute(insert_data_batch_statement(self.stage_table_name, column_names,
+                                                       list_values[start:start + STAGE_CHUNK_ROWS]))
+
+        cursor.execute(merge_staged_statement(self.table_name, self.stage_table_name, column_names, self.key_columns))
+        cursor.execute("DELETE FROM %s;" % self.stage_table_name)
+        self.num_staged += len(list_values)
+
+    def log_report(self):
+        """Log the number of rows inserted and upserted."""
+
+        module_logger.info("Merged into table %s: %d rows inserted, %d rows upserted (%d staged)", self.table_name,
+                           self.num_inserted, self.num_upserted, self.num_staged)
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Stages of a load, in the order in which they run
+STAGES = ["glob", "assembly", "schema-inference", "ddl", "parse", "transform", "insert", "commit"]
+
+
+def peak_rss_bytes():
+    """
+    Get the peak resident set size of the process.
+
+    :return: Peak RSS in bytes (or None if it can't be determined on this platform).
+    """
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports the value in kilobytes, macOS in bytes
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+def rate(count, seconds):
+    """
+    Calculate a rate (e.g. rows per second), guarding against a zero duration.
+
+    :param count: Count.
+    :param seconds: Duration in seconds.
+    :return: Rate per second.
+    """
+
+    if seconds <= 0:
+        return 0.0
+    return count / seconds
+
+
+def new_counters():
+    """Build an empty set of counters for a table or file."""
+
+    return {"stages": dict([(stage, 0.0) for stage in STAGES]), "rows": 0, "bytes": 0}
+
+
+class LoadMetrics(object):
+    """
+    Collects the per-table and per-file timings and throughput of a load.
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.end_time = None
+        self.stages = dict([(stage, 0.0) for stage in STAGES])
+        self.tables = {}
+        self.table_seconds = {}
+        self.memory = None
+
+    def _counters(self, table_name, file_path):
+        """Get the table counters and, if a file is given, the file counters."""
+
+        if table_name not in self.tables:
+            self.tables[table_name] = new_counters()
+            self.tables[table_name]["files"] = {}
+
+        table_counters = self.tables[table_name]
+        if file_path is None:
+            return table_counters, None
+
+        if file_path not in table_counters["files"]:
+            table_counters["files"][file_path] = new_counters()
+
+        return table_counters, table_counters["files"][file_path]
+
+    def add_time(self, stage, seconds, table_name=None, file_path=None):
+        """
+        Record time spent in a stage.
+
+        :param stage: Stage name (see STAGES).
+        :param seconds: Duration in seconds.
+        :param table_name: Table name (or None for stages that aren't table-specific).
+        :param file_path: File path (or None for stages that aren't file-specific).
+        """
+
+        assert stage in STAGES
+
+        self.stages[stage] += seconds
+
+        if table_name is not None:
+            table_counters, file_counters = self._counters(table_name, file_path)
+            table_counters["stages"][stage] += seconds
+            if file_counters is not None:
+                file_counters["stages"][stage] += seconds
+
+    def add_rows(self, num_rows, table_name, file_path=None):
+        """
+        Record rows processed.
+
+        :param num_rows: Number of rows.
+        :param table_name: Table name.
+        :param file_path: File path (optional).
+        """
+
+        table_counters, file_counters = self._counters(table_name, file_path)
+        table_counters["rows"] += num_rows
+        if file_counters is not None:
+            file_counters["rows"] += num_rows
+
+    def add_bytes(self, num_bytes, table_name, file_path=None):
+        """
+        Record bytes processed.
+
+        :param num_bytes: Number of bytes.
+        :param table_name: Table name.
+        :param file_path: File path (optional).
+        """
+
+        table_counters, file_counters = self._counters(table_name, file_path)
+        table_counters["bytes"] += num_bytes
+        if file_counters is not None:
+            file_counters["bytes"] += num_bytes
+
+    def set_table_seconds(self, table_name, seconds):
+        """
+        Record the wall-clock time taken to load a table.
+
+        :param table_name: Table name.
+        :param seconds: Duration in seconds.
+        """
+
+        self._counters(table_name, None)
+        self.table_seconds[table_name] = seconds
+
+    @contextlib.contextmanager
+    def timed(self, stage, table_name=None, file_path=None):
+        """
+        Context manager to time a stage.
+
+        :param stage: Stage name (see STAGES).
+        :param table_name: Table name (optional).
+        :param file_path: File path (optional).
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start, table_name, file_path)
+
+    def finish(self):
+        """Mark the end of the load."""
+
+        self.end_time = time.time()
+
+    def set_memory(self, memory_report):
+        """
+        Record the memory budget and the high-water mark of the resident set size.
+
+        :param memory_report: Dictionary built by MemoryBudget.report().
+        """
+
+        self.memory = memory_report
+
+    def report(self):
+        """
+        Build the structured report of the load.
+
+        :return: Dictionary that can be serialised to JSON.
+        """
+
+        end_time = self.end_time if self.end_time is not None else time.time()
+        total_seconds = end_time - self.start_time
+
+        tables = {}
+        for table_name, counters in self.tables.items():
+            seconds = self.table_seconds.get(table_name, sum(counters["stages"].values()))
+            files = {}
+            for file_path, file_counters in counters["files"].items():
+                file_seconds = sum(file_counters["stages"].values())
+                files[file_path] = {"stages": file_counters["stages"],
+                                    "rows": file_counters["rows"],
+                                    "bytes": file_counters["bytes"],
+                                    "seconds": file_seconds,
+                                    "rows_per_second": rate(file_counters["rows"], file_seconds)}
+
+            tables[table_name] = {"stages": counters["stages"],
+                                  "rows": counters["rows"],
+                                  "bytes": counters["bytes"],
+                                  "seconds": seconds,
+                                  "rows_per_second": rate(counters["rows"], seconds),
+                                  "files": files}
+
+        total_rows = sum([t["rows"] for t in tables.values()])
+        total_bytes = sum([t["bytes"] for t in tables.values()])
+
+        report = {"start_time": self.start_time,
+                  "end_time": end_time,
+                  "seconds": total_seconds,
+                  "rows": total_rows,
+                  "bytes": total_bytes,
+                  "rows_per_second": rate(total_rows, total_seconds),
+                  "peak_rss_bytes": peak_rss_bytes(),
+                  "memory": self.memory,
+                  "stages": self.stages,
+                  "tables": tables}
+
+        return report
+
+    def write_json(self, path):
+        """
+        Write the report as JSON.
+
+        :param path: Output file path.
+        """
+
+        with open(path, "w") as fp:
+            json.dump(self.report(), fp, indent=2)
+
+    def write_prometheus(self, path):
+        """
+        Write the report in the Prometheus text exposition format.
+
+        :param path: Output file path.
+        """
+
+        with open(path, "w") as fp:
+            fp.write(prometheus_text(self.report()))
+
+
+def escape_label_value(value):
+    """
+    Escape a Prometheus label value.
+
+    :param value: Label value.
+    :return: Escaped value.
+    """
+
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def prometheus_text(report):
+    """
+    Convert a load report to the Prometheus text exposition format.
+
+    :param report: Report built by LoadMetrics.report().
+    :return: Text.
+    """
+
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s gauge" % name)
+        for labels, value in samples:
+            if value is None:
+                continue
+            if labels:
+                label_str = ",".join(["%s=\"%s\"" % (k, escape_label_value(v)) for k, v in labels])
+                lines.append("%s{%s} %s" % (name, label_str, repr(float(value))))
+            else:
+                lines.append("%s %s" % (name, repr(float(value))))
+
+    tables = report["tables"]
+
+    metric("loader_duration_seconds", "Wall-clock duration of the load.", [([], report["seconds"])])
+    metric("loader_peak_rss_bytes", "Peak resident set size of the loader process.",
+           [([], report["peak_rss_bytes"])])
+    if report.get("memory") is not None:
+        metric("loader_memory_budget_bytes", "Memory budget of the load.", [([], report["memory"]["budget_bytes"])])
+        metric("loader_memory_high_water_bytes", "High-water mark of the resident set size during the load.",
+               [([], report["memory"]["high_water_bytes"])])
+    metric("loader_stage_seconds", "Time spent in each stage of the load.",
+           [([("stage", stage)], seconds) for stage, seconds in report["stages"].items()])
+    metric("loader_table_stage_seconds", "Time spent in each stage of the load per table.",
+           [([("table", name), ("stage", stage)], seconds)
+            for name, t in tables.items() for stage, seconds in t["stages"].items()])
+    metric("loader_table_rows", "Rows processed per table.",
+           [([("table", name)], t["rows"]) for name, t in tables.items()])
+    metric("loader_table_bytes", "Bytes processed per table.",
+           [([("table", name)], t["bytes"]) for name, t in tables.items()])
+    metric("loader_table_rows_per_second", "Throughput per table.",
+           [([("table", name)], t["rows_per_second"]) for name, t in tables.items()])
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import re
+
+# Numeric suffix of a file name (e.g. m001_dob_12.csv)
+FILE_NUMBER_PATTERN = re.compile(r"_(\d+)\.[^.]*$")
+
+
+def key_order(value):
+    """
+    Get the sort order of a key value: integers in numeric order, followed by any other values in String order.
+
+    :param value: String value of the key.
+    :return: Sortable tuple.
+    """
+
+    try:
+        return 0, int(value), ""
+    except ValueError:
+        return 1, 0, value
+
+
+def file_order(file_path):
+    """
+    Get the sort order of a file of a table, so that m001_dob_2.csv comes before m001_dob_10.csv.
+
+    :param file_path: File path.
+    :return: Sortable tuple.
+    """
+
+    m = FILE_NUMBER_PATTERN.search(file_path)
+    return (int(m.group(1)) if m is not None else -1), file_path
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+import datetime
+import decimal
+import logging
+import os
+import shutil
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from database_loader.database_utilities import safe_name
+from database_loader.type_inference import DataType, is_null
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("database-loader", log_level=logging.INFO)
+module_logger = logging.getLogger('database-loader')
+
+# Default number of rows in each Parquet row group (and in each record batch held in memory)
+DEFAULT_ROW_GROUP_SIZE = 65536
+
+# Default Parquet compression codec
+DEFAULT_COMPRESSION = "snappy"
+
+# Precision and scale of decimal columns
+DECIMAL_PRECISION = 38
+DECIMAL_SCALE = 18
+
+
+def check_pyarrow():
+    """Check that pyarrow is available."""
+
+    if pyarrow is None:
+        raise ImportError("The Parquet backend requires the pyarrow package")
+
+
+def datatype_to_arrow_conversion(datatype):
+    """
+    Convert the inferred data type to a suitable Arrow type.
+
+    :param datatype: Datatype.
+    :return: Arrow type.
+    """
+
+    check_pyarrow()
+
+    mappings = {DataType.int: pyarrow.int64(),
+                DataType.float: pyarrow.float64(),
+                DataType.string: pyarrow.string(),
+                DataType.boolean: pyarrow.bool_(),
+                DataType.date: pyarrow.date32(),
+                DataType.datetime: pyarrow.timestamp("us"),
+                DataType.decimal: pyarrow.decimal128(DECIMAL_PRECISION, DECIMAL_SCALE),
+                DataType.null: pyarrow.string()}
+
+    if datatype not in mappings:
+        raise ValueError("Unknown data type: %s" % datatype)
+
+    return mappings[datatype]
+
+
+def arrow_schema(schema):
+    """
+    Build the Arrow schema from the inferred schema.
+
+    :param schema: Dictionary of field name to inferred type.
+    :return: Arrow schema.
+    """
+
+    # Preconditions
+    assert type(schema) == dict
+
+    return pyarrow.schema([(safe_name(name), datatype_to_arrow_conversion(tpe)) for name, tpe in schema.items()])
+
+
+def table_path(db_params, table_name):
+    """
+    Get the folder holding the Parquet dataset of a table.
+
+    :param db_params: Output parameters (the 'output-path' key holds the root folder).
+    :param table_name: Table name.
+    :return: Folder path.
+    """
+
+    return os.path.join(db_params['output-path'], safe_name(table_name))
+
+
+def create_database(db_params):
+    """
+    Create the root folder of the Parquet datasets if it doesn't exist.
+
+    :param db_params: Output parameters.
+    """
+
+    check_pyarrow()
+
+    module_logger.info("Checking Parquet output folder: %s", db_params['output-path'])
+    os.makedirs(db_params['output-path'], exist_ok=True)
+
+
+def drop_table(db_params, table_name):
+    """
+    Remove the Parquet dataset of a table (if it exists).
+
+    :param db_params: Output parameters.
+    :param table_name: Name of the table to drop.
+    :return: True if the dataset was removed, otherwise False.
+    """
+
+    path = table_path(db_params, table_name)
+
+    if os.path.isdir(path):
+        module_logger.info("Removing Parquet dataset: %s", path)
+        shutil.rmtree(path)
+        return True
+    else:
+        module_logger.info("Parquet dataset %s doesn't exist", path)
+        return False
+
+
+def create_table(db_params, table_name, schema, column_statistics=None):
+    """
+    Create the folder of the Parquet dataset of a table.
+
+    :param db_params: Output parameters.
+    :param table_name: Table name.
+    :param schema: Dictionary of field name to inferred type.
+    :param column_statistics: Unused (Parquet's encodings already size the columns to their values).
+    """
+
+    path = table_path(db_params, table_name)
+    module_logger.info("Creating Parquet dataset %s with schema: %s", path, arrow_schema(schema))
+    os.makedirs(path, exist_ok=True)
+
+
+def build_record_batch(rows, schema, true_values, false_values, temporal_detectors=None):
+    """
+    Convert rows of String data into a typed Arrow record batch.
+
+    :param rows: List of dictionaries of field name to value.
+    :param schema: Dictionary of field name to inferred type.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param temporal_detectors: Dictionary of field name to ColumnTypeDetector to convert the dates and datetimes
+        (if None, they are assumed to be in ISO format).
+    :return: Arrow record batch.
+    """
+
+    arrays = []
+    for fieldname, tpe in schema.items():
+        values = [data[fieldname] for data in rows]
+
+        if tpe in [DataType.string, DataType.null]:
+            pass
+        elif tpe == DataType.int:
+            values = [None if is_null(v) else int(v) for v in values]
+        elif tpe == DataType.float:
+            values = [None if is_null(v) else float(v) for v in values]
+        elif tpe == DataType.decimal:
+            values = [None if is_null(v) else decimal.Decimal(v) for v in values]
+        elif temporal_detectors is not None and fieldname in temporal_detectors:
+            values = [temporal_detectors[fieldname].temporal_value(v) for v in values]
+        elif tpe == DataType.date:
+            values = [None if is_null(v) else datetime.date.fromisoformat(v) for v in values]
+        elif tpe == DataType.datetime:
+            values = [None if is_null(v) else datetime.datetime.fromisoformat(v) for v in values]
+        elif tpe == DataType.boolean:
+            converted = []
+            for v in values:
+                if is_null(v):
+                    converted.append(None)
+                elif v in true_values:
+                    converted.append(True)
+                elif v in false_values:
+                    converted.append(False)
+                else:
+                    raise ValueError("Unable to parse Boolean value: %s" % v)
+            values = converted
+
+        arrays.append(pyarrow.array(values, type=datatype_to_arrow_conversion(tpe)))
+
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=arrow_schema(schema))
+
+
+def write_data(db_params, table_name, schema, rows, true_values, false_values, part_index=0,
+               temporal_detectors=None):
+    """
+    Stream rows of data into one part file of a table's Parquet dataset.
+
+    At most one row group of rows is held in memory at a time.
+
+    :param db_params: Output parameters ('output-path' and optionally 'row-group-size' and 'compression').
+    :param table_name: Name of the table.
+    :param schema: Schema (dictionary of field name to type).
+    :param rows: Iterable of dictionaries of the data (field name to value).
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param part_index: Index of the part file within the dataset.
+    :param temporal_detectors: Dictionary of field name to ColumnTypeDetector to convert the dates and datetimes
+        (if None, they are assumed to be in ISO format).
+    :return: Number of rows written.
+    """
+
+    # Preconditions
+    assert type(db_params) == dict
+    assert type(schema) == dict
+
+    check_pyarrow()
+
+    row_group_size = db_params.get('row-group-size', DEFAULT_ROW_GROUP_SIZE)
+    compression = db_params.get('compression', DEFAULT_COMPRESSION)
+    assert row_group_size > 0
+
+    path = os.path.join(table_path(db_params, table_name), "part-%05d.parquet" % part_index)
+    module_logger.info("Writing Parquet file: %s", path)
+
+    num_rows = 0
+    batch = []
+    progress = logger.ProgressReporter(module_logger, "Writing %s" % path)
+
+    with pyarrow.parquet.ParquetWriter(path, arrow_schema(schema), compression=compression) as writer:
+        for data in rows:
+            batch.append(data)
+
+            if len(batch) == row_group_size:
+                writer.write_batch(build_record_batch(batch, schema, true_values, false_values, temporal_detectors))
+                num_rows += len(batch)
+                progress.update(len(batch))
+                batch = []
+
+        if len(batch) > 0:
+            writer.write_batch(build_record_batch(batch, schema, true_values, false_values, temporal_detectors))
+            num_rows += len(batch)
+            progress.update(len(batch))
+
+    progress.finish()
+    return num_rows
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+
+from database_loader.checkpoints import schema_to_json, schema_from_json
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Version of the cache files (part of their keys, so a change of format ignores the old files)
+CACHE_VERSION = 2
+
+# Default folder of the cache
+DEFAULT_CACHE_PATH = "./parse-cache/"
+
+
+def file_fingerprint(file):
+    """
+    Get the fingerprint of a file, which changes whenever the file is rewritten.
+
+    :param file: File path.
+    :return: List of the absolute path, size and modification time in nanoseconds.
+    """
+
+    stat = os.stat(file)
+    return [os.path.abspath(file), stat.st_size, stat.st_mtime_ns]
+
+
+def cache_key(*parts):
+    """
+    Build the key of a cache file from the settings it depends on.
+
+    :param parts: Values that can be serialised to JSON.
+    :return: Hexadecimal digest.
+    """
+
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ParseCache(object):
+    """
+    Caches the inferred schema of each CSV file, so that a later load of an unchanged file doesn't read the file to
+    infer its schema again.
+
+    A schema is keyed by the fingerprint of the file (its path, size and modification time), the parse settings
+    (delimiter, encapsulator, encoding and column selection) and the inference settings.
+    """
+
+    def __init__(self, folder=DEFAULT_CACHE_PATH):
+        """
+        :param folder: Folder of the cache files.
+        """
+
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+        self.num_schemas_read = 0
+
+    def schema_path(self, file, delimiter, encapsulator, encoding, true_values, false_values, column_params=None,
+                    inference_params=None):
+        """
+        Get the path of the cache file of the inferred schema of a file.
+
+        :param file: CSV file.
+        :param delimiter: Delimiter in the CSV file.
+        :param encapsulator: Encapsulator in the CSV file.
+        :param encoding: Encoding of the CSV file.
+        :param true_values: List of values deemed True.
+        :param false_values: List of values deemed False.
+        :param column_params: Dictionary of the columns read (optional).
+        :param inference_params: Dictionary of extended inference parameters (optional).
+        :return: Path of the cache file.
+        """
+
+        key = cache_key(CACHE_VERSION, file_fingerprint(file), delimiter, encapsulator, encoding, column_params,
+                        true_values, false_values, inference_params)
+        return os.path.join(self.folder, "%s.schema.json" % key)
+
+    def load_schema(self, schema_path):
+        """
+        Load a cached schema.
+
+        :param schema_path: Path of the cache file of the schema.
+        :return: Dictionary of field name to type, or None if the schema hasn't been cached.
+        """
+
+        if not os.path.isfile(schema_path):
+            return None
+
+        with open(schema_path, encoding="utf-8") as fp:
+            schema = schema_from_json(fp.read())
+
+        self.num_schemas_read += 1
+        return schema
+
+    def save_schema(self, schema_path, schema):
+        """
+        Cache the inferred schema of a file.
+
+        :param schema_path: Path of the cache file of the schema.
+        :param schema: Dictionary of field name to type.
+        """
+
+        temporary_path = "%s.%d.tmp" % (schema_path, os.getpid())
+        with open(temporary_path, "w", encoding="utf-8") as fp:
+            fp.write(schema_to_json(schema))
+        os.replace(temporary_path, schema_path)
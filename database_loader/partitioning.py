@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import logging
+import queue
+import threading
+import time
+
+from database_loader import database_utilities
+from database_loader.database_utilities import insert_data_batch_statement
+from database_loader.rejects import bisect_execute
+from database_loader.tuning import statement_row_bytes
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Default number of batches queued for each writer
+DEFAULT_QUEUE_DEPTH = 4
+
+
+class PartitionWriter(object):
+    """
+    Inserts the batches of rows of some of the partitions of a table from a queue, in a thread with its own connection.
+
+    Each partition is written by a single writer, so the writers insert into separate partitions (and B-trees) rather
+    than contending on the same pages. If an insert fails, the error is kept (and raised by the loader) and the
+    remaining batches are discarded, so the reader is never blocked on a full queue.
+    """
+
+    def __init__(self, index, db_params, table_name, queue_depth=DEFAULT_QUEUE_DEPTH, rejects=None, tuner=None):
+        """
+        :param index: Index of the writer.
+        :param db_params: Dictionary of database parameters.
+        :param table_name: Name of the database table.
+        :param queue_depth: Maximum number of batches queued.
+        :param rejects: RejectWriter to quarantine the rows the database rejects in, or None to fail on the first
+            bad row.
+        :param tuner: LoadTuner to record the time taken by each batch in (optional).
+        """
+
+        self.index = index
+        self.db_params = db_params
+        self.table_name = table_name
+        self.rejects = rejects
+        self.tuner = tuner
+
+        self.queue = queue.Queue(queue_depth)
+        self.error = None
+        self.num_rows = 0
+        self.num_batches = 0
+        self.insert_seconds = 0.0
+        self.commit_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="partition-writer-%d" % index)
+        self._thread.daemon = True
+
+    def start(self):
+        """Start the writer's thread."""
+
+        self._thread.start()
+
+    def put(self, column_names, batch, batch_sources=None):
+        """
+        Queue a batch of rows to insert (blocking while the queue is full).
+
+        :param column_names: Field names (in the order of the values).
+        :param batch: List of rows, each a list of SQL values from transform_values().
+        :param batch_sources: List of (file, row number, list of raw values) of the rows (required with rejects).
+        """
+
+        self.queue.put((column_names, batch, batch_sources))
+
+    def finish(self):
+        """Insert the queued batches and stop the writer's thread."""
+
+        self.queue.put(None)
+        self._thread.join()
+
+    def reject_item(self, item, e):
+        """Quarantine a (values, (file, row number, row)) rejected by the database."""
+
+        self.rejects.reject(item[1][0], item[1][1], item[1][2], str(e))
+
+    def insert(self, cursor, column_names, batch, batch_sources):
+        """
+        Insert a batch of rows with one INSERT statement (bisecting it to quarantine the bad rows if there are rejects).
+
+        :return: Number of rows inserted.
+        """
+
+        if self.rejects is None:
+            cursor.execute(insert_data_batch_statement(self.table_name, column_names, batch))
+            return len(batch)
+
+        def execute_batch(items):
+            cursor.execute(insert_data_batch_statement(self.table_name, column_names, [values for values, _ in items]))
+
+        num_rows = bisect_execute(execute_batch, list(zip(batch, batch_sources)), self.reject_item,
+                                  database_utilities.row_errors())
+        self.rejects.accept(num_rows)
+
+        return num_rows
+
+    def _run(self):
+        mydb = None
+        finished = False
+        try:
+            mydb = database_utilities.build_database_connection(self.db_params)
+            cursor = mydb.cursor()
+
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    finished = True
+                    break
+
+                before_insert = time.perf_counter()
+                num_rows = self.insert(cursor, *item)
+                before_commit = time.perf_counter()
+                mydb.commit()
+                committed = time.perf_counter()
+                self.insert_seconds += before_commit - before_insert
+                self.commit_seconds += committed - before_commit
+                self.num_rows += num_rows
+                self.num_batches += 1
+
+                if self.tuner is not None:
+                    self.tuner.record(num_rows, statement_row_bytes(item[1]), committed - before_insert)
+
+            cursor.close()
+
+        except Exception as e:
+            module_logger.error("Partition writer %d of table %s failed: %s", self.index, self.table_name, e)
+            self.error = e
+
+            # Discard the remaining batches
+            while not finished and self.queue.get() is not None:
+                pass
+
+        finally:
+            if mydb is not None:
+                mydb.close()
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+import csv
+import datetime
+import io
+import logging
+import struct
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+from database_loader.database_utilities import narrowed_sql_type, safe_name
+from database_loader.type_inference import DataType, is_null
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("database-loader", log_level=logging.INFO)
+module_logger = logging.getLogger('database-loader')
+
+# Header and trailer of the PostgreSQL binary COPY format
+BINARY_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+BINARY_COPY_HEADER = BINARY_COPY_SIGNATURE + struct.pack(">ii", 0, 0)
+BINARY_COPY_TRAILER = struct.pack(">h", -1)
+BINARY_COPY_NULL = struct.pack(">i", -1)
+
+# Epoch of the PostgreSQL binary date and timestamp representations
+POSTGRES_EPOCH = datetime.datetime(2000, 1, 1)
+
+# Integer types from the narrowest to the widest with their ranges
+INTEGER_TYPES = [("SMALLINT", -2 ** 15, 2 ** 15 - 1),
+                 ("INTEGER", -2 ** 31, 2 ** 31 - 1),
+                 ("BIGINT", -2 ** 63, 2 ** 63 - 1)]
+
+# Temporal types of String columns whose values are all dates, datetimes or times
+TEMPORAL_TYPES = {"date": "DATE",
+                  "datetime": "TIMESTAMP",
+                  "time": "TIME"}
+
+# Supported COPY formats
+COPY_FORMATS = ["csv", "binary"]
+
+
+def build_database_connection(db_params, set_db=True):
+    """
+    Build a PostgreSQL database connection given the database parameters.
+
+    :param db_params: Database parameters.
+    :param set_db: Set the database to use? If not, the maintenance database 'postgres' is used.
+    :return: Database connection.
+    """
+
+    if psycopg2 is None:
+        raise ImportError("The PostgreSQL backend requires the psycopg2 package")
+
+    if set_db:
+        database_name = db_params['database-name']
+    else:
+        database_name = "postgres"
+
+    return psycopg2.connect(host=db_params['host'],
+                            port=db_params.get('port', 5432),
+                            user=db_params['user'],
+                            password=db_params['password'],
+                            dbname=database_name)
+
+
+def create_database(db_params):
+    """
+    Create the database if it doesn't exist.
+
+    :param db_params: Database parameters.
+    """
+
+    module_logger.info("Checking database: %s", db_params['database-name'])
+
+    # CREATE DATABASE can't run inside a transaction block
+    mydb = build_database_connection(db_params, False)
+    mydb.autocommit = True
+    cursor = mydb.cursor()
+
+    cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db_params['database-name'],))
+    if cursor.fetchone() is None:
+        create_string = "CREATE DATABASE %s" % db_params['database-name']
+        module_logger.info("Creating database with: %s", create_string)
+        cursor.execute(create_string)
+
+    cursor.close()
+    mydb.close()
+
+
+def drop_table(db_params, table_name):
+    """
+    Drop a database table (if it exists).
+
+    :param db_params: Database parameters.
+    :param table_name: Name of the table to drop.
+    :return: True if the table was dropped, otherwise False.
+    """
+
+    # Get the SQL 'safe' version of the table name (PostgreSQL folds unquoted names to lower case)
+    safe_table_name = safe_name(table_name)
+    module_logger.info("Safe table name for %s is %s", table_name, safe_table_name)
+
+    mydb = build_database_connection(db_params)
+    cursor = mydb.cursor()
+
+    cursor.execute("SELECT 1 FROM information_schema.tables WHERE table_name = %s", (safe_table_name.lower(),))
+    result = cursor.fetchone()
+
+    if result:
+        module_logger.info("Table %s already exists", safe_table_name)
+        drop_stmt = "DROP TABLE {0}".format(safe_table_name)
+        module_logger.info("Dropping table with: %s", drop_stmt)
+        cursor.execute(drop_stmt)
+        table_dropped = True
+    else:
+        module_logger.info("Table %s doesn't exist", safe_table_name)
+        table_dropped = False
+
+    mydb.commit()
+    cursor.close()
+    mydb.close()
+    return table_dropped
+
+
+def datatype_to_sql_conversion(datatype):
+    """
+    Convert the inferred data type to a suitable PostgreSQL type.
+
+    :param datatype: Datatype.
+    :return: PostgreSQL type.
+    """
+
+    mappings = {DataType.int: "BIGINT",
+                DataType.float: "DOUBLE PRECISION",
+                DataType.string: "TEXT",
+                DataType.boolean: "BOOLEAN",
+                DataType.date: "DATE",
+                DataType.datetime: "TIMESTAMP",
+                DataType.decimal: "NUMERIC",
+                DataType.null: "TEXT"}
+
+    if datatype not in mappings:
+        raise ValueError("Unknown data type: %s" % datatype)
+
+    return mappings[datatype]
+
+
+def create_table_statement(table_name, schema, column_statistics=None):
+    """
+    Build the CREATE TABLE statement.
+
+    :param table_name: Database table name.
+    :param schema: Inferred schema.
+    :param column_statistics: Dictionary of field name to ColumnStatistics to narrow the types (optional).
+    :return: CREATE statement.
+    """
+
+    # Preconditions
+    assert type(schema) == dict
+
+    # Create a list of field name and SQL type
+    if column_statistics is None:
+        name_type = ["%s %s" % (safe_name(name), datatype_to_sql_conversion(tpe)) for name, tpe in schema.items()]
+    else:
+        name_type = ["%s %s" % (safe_name(name), narrowed_sql_type(tpe, column_statistics.get(name), INTEGER_TYPES,
+                                                                   TEMPORAL_TYPES, datatype_to_sql_conversion))
+                     for name, tpe in schema.items()]
+
+    id_field_name = "%s____ID" % safe_name(table_name)
+    field_spec = "%s BIGSERIAL PRIMARY KEY, %s" % (id_field_name, ", ".join(name_type))
+
+    return "CREATE TABLE %s (%s);" % (safe_name(table_name), field_spec)
+
+
+def create_table(db_params, table_name, schema, column_statistics=None):
+    """
+    Create the database table based on the inferred schema.
+
+    :param db_params: Database parameters.
+    :param table_name: Database table name.
+    :param schema: Dictionary of field name to inferred type.
+    :param column_statistics: Dictionary of field name to ColumnStatistics to narrow the types (optional).
+    """
+
+    stmt = create_table_statement(table_name, schema, column_statistics)
+    module_logger.info("Creating table with: %s", stmt)
+
+    mydb = build_database_connection(db_params)
+    cursor = mydb.cursor()
+    cursor.execute(stmt)
+    mydb.commit()
+    cursor.close()
+    mydb.close()
+
+
+def copy_statement(table_name, schema, copy_format):
+    """
+    Build the COPY ... FROM STDIN statement.
+
+    :param table_name: Database table name.
+    :param schema: Dictionary of field name to inferred type.
+    :param copy_format: COPY format ('csv' or 'binary').
+    :return: COPY statement.
+    """
+
+    if copy_format not in COPY_FORMATS:
+        raise ValueError("Unknown COPY format: %s" % copy_format)
+
+    column_names = ", ".join([safe_name(name) for name in schema.keys()])
+    options = "FORMAT %s" % copy_format
+
+    # In the CSV format, empty values of the non-String columns are NULLs (the values are always quoted)
+    nullable_names = [safe_name(name) for name, tpe in schema.items() if tpe != DataType.string]
+    if copy_format == "csv" and len(nullable_names) > 0:
+        options += ", FORCE_NULL (%s)" % ", ".join(nullable_names)
+
+    return "COPY %s (%s) FROM STDIN WITH (%s)" % (safe_name(table_name), column_names, options)
+
+
+def boolean_value(str_value, true_values, false_values):
+    """
+    Convert the String representation of a Boolean to its value.
+
+    :param str_value: String value.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :return: True or False.
+    """
+
+    if str_value in true_values:
+        return True
+    elif str_value in false_values:
+        return False
+    else:
+        raise ValueError("Unable to parse Boolean value: %s" % str_value)
+
+
+def encode_csv_rows(rows, schema, true_values, false_values, temporal_detectors=None):
+    """
+    Encode rows of data in the CSV COPY format.
+
+    :param rows: List of dictionaries of field name to value.
+    :param schema: Dictionary of field name to inferred type.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param temporal_detectors: Dictionary of field name to ColumnTypeDetector to convert the dates and datetimes to ISO
+        format (if None, they are assumed to already be in ISO format).
+    :return: Encoded rows (bytes).
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+
+    for data in rows:
+        values = []
+        for fieldname, tpe in schema.items():
+            if tpe != DataType.string and is_null(data[fieldname]):
+                values.append("")
+            elif temporal_detectors is not None and fieldname in temporal_detectors:
+                values.append(str(temporal_detectors[fieldname].temporal_value(data[fieldname])))
+            elif tpe == DataType.boolean:
+                values.append("t" if boolean_value(data[fieldname], true_values, false_values) else "f")
+            else:
+                values.append(data[fieldname])
+        writer.writerow(values)
+
+    return buffer.getvalue().encode("utf-8")
+
+
+def temporal_value(fieldname, str_value, tpe, temporal_detectors):
+    """
+    Convert a date or datetime value (assumed to be in ISO format if there is no detector for the field).
+
+    :param fieldname: Field name.
+    :param str_value: String value.
+    :param tpe: DataType.date or DataType.datetime.
+    :param temporal_detectors: Dictionary of field name to ColumnTypeDetector (or None).
+    :return: datetime.
+    """
+
+    if temporal_detectors is not None and fieldname in temporal_detectors:
+        converted = temporal_detectors[fieldname].temporal_value(str_value)
+    elif tpe == DataType.date:
+        converted = datetime.date.fromisoformat(str_value)
+    else:
+        converted = datetime.datetime.fromisoformat(str_value)
+
+    if not isinstance(converted, datetime.datetime):
+        converted = datetime.datetime(converted.year, converted.month, converted.day)
+    return converted
+
+
+def encode_binary_rows(rows, schema, true_values, false_values, temporal_detectors=None):
+    """
+    Encode rows of data in the binary COPY format (without the header and trailer).
+
+    :param rows: List of dictionaries of field name to value.
+    :param schema: Dictionary of field name to inferred type.
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param temporal_detectors: Dictionary of field name to ColumnTypeDetector to convert the dates and datetimes
+        (if None, they are assumed to be in ISO format).
+    :return: Encoded rows (bytes).
+    """
+
+    types = list(schema.items())
+    num_fields = struct.pack(">h", len(types))
+    parts = []
+
+    for data in rows:
+        parts.append(num_fields)
+        for fieldname, tpe in types:
+            value = data[fieldname]
+            if tpe != DataType.string and is_null(value):
+                parts.append(BINARY_COPY_NULL)
+            elif tpe == DataType.date:
+                days = (temporal_value(fieldname, value, tpe, temporal_detectors) - POSTGRES_EPOCH).days
+                parts.append(struct.pack(">ii", 4, days))
+            elif tpe == DataType.datetime:
+                delta = temporal_value(fieldname, value, tpe, temporal_detectors) - POSTGRES_EPOCH
+                microseconds = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+                parts.append(struct.pack(">iq", 8, microseconds))
+            elif tpe == DataType.decimal:
+                raise ValueError("The binary COPY format doesn't support decimal columns")
+            elif tpe == DataType.int:
+                parts.append(struct.pack(">iq", 8, int(value)))
+            elif tpe == DataType.float:
+                parts.append(struct.pack(">id", 8, float(value)))
+            elif tpe == DataType.boolean:
+                parts.append(struct.pack(">i?", 1, boolean_value(value, true_values, false_values)))
+            else:
+                encoded = value.encode("utf-8")
+                parts.append(struct.pack(">i", len(encoded)))
+                parts.append(encoded)
+
+    return b"".join(parts)
+
+
+class CopyStream(object):
+    """
+    File-like object that feeds COPY ... FROM STDIN from a generator of rows without materialising a file.
+    """
+
+    # Number of rows to encode at a time
+    ROWS_PER_CHUNK = 1000
+
+    def __init__(self, rows, schema, true_values, false_values, copy_format="csv", temporal_detectors=None):
+        if copy_format not in COPY_FORMATS:
+            raise ValueError("Unknown COPY format: %s" % copy_format)
+        if copy_format == "binary" and DataType.decimal in schema.values():
+            raise ValueError("The binary COPY format doesn't support decimal columns")
+
+        self.rows = iter(rows)
+        self.schema = schema
+        self.true_values = true_values
+        self.false_values = false_values
+        self.copy_format = copy_format
+        self.temporal_detectors = temporal_detectors
+        self.num_rows = 0
+
+        self._buffer = BINARY_COPY_HEADER if copy_format == "binary" else b""
+        self._exhausted = False
+
+    def _next_chunk(self):
+        """Encode the next chunk of rows, returning an empty bytes object when the rows are exhausted."""
+
+        chunk = []
+        for data in self.rows:
+            chunk.append(data)
+            if len(chunk) == self.ROWS_PER_CHUNK:
+                break
+
+        self.num_rows += len(chunk)
+
+        if len(chunk) == 0:
+            return b""
+        elif self.copy_format == "binary":
+            return encode_binary_rows(chunk, self.schema, self.true_values, self.false_values,
+                                      self.temporal_detectors)
+        else:
+            return encode_csv_rows(chunk, self.schema, self.true_values, self.false_values, self.temporal_detectors)
+
+    def read(self, size=-1):
+        """
+        Read up to size bytes of the encoded stream.
+
+        :param size: Maximum number of bytes to return (-1 for all).
+        :return: Bytes.
+        """
+
+        while not self._exhausted and (size < 0 or len(self._buffer) < size):
+            chunk = self._next_chunk()
+            if len(chunk) == 0:
+                self._exhausted = True
+                if self.copy_format == "binary":
+                    self._buffer += BINARY_COPY_TRAILER
+            else:
+                self._buffer += chunk
+
+        if size < 0:
+            size = len(self._buffer)
+
+        data = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return data
+
+
+def copy_data(db_params, table_name, schema, rows, true_values, false_values, copy_format="csv",
+              temporal_detectors=None):
+    """
+    Stream rows of data into the database table using COPY ... FROM STDIN.
+
+    :param db_params: Database parameters.
+    :param table_name: Name of the database table.
+    :param schema: Schema (dictionary of field name to type).
+    :param rows: Iterable of dictionaries of the data (field name to value).
+    :param true_values: Values deemed True.
+    :param false_values: Values deemed False.
+    :param copy_format: COPY format ('csv' or 'binary').
+    :param temporal_detectors: Dictionary of field name to ColumnTypeDetector to convert the dates and datetimes
+        (if None, they are assumed to be in ISO format).
+    :return: Number of rows copied.
+    """
+
+    # Preconditions
+    assert type(db_params) == dict
+    assert type(table_name) == str
+    assert type(schema) == dict
+
+    stmt = copy_statement(table_name, schema, copy_format)
+    module_logger.info("Copying data with: %s", stmt)
+
+    stream = CopyStream(rows, schema, true_values, false_values, copy_format, temporal_detectors)
+
+    mydb = build_database_connection(db_params)
+    cursor = mydb.cursor()
+    cursor.copy_expert(stmt, stream)
+    mydb.commit()
+    cursor.close()
+    mydb.close()
+
+    module_logger.info("Copied %d rows into %s", stream.num_rows, table_name)
+    return stream.num_rows
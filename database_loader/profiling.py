@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import collections
+import contextlib
+import cProfile
+import logging
+import os
+import sys
+import threading
+
+from database_loader.database_utilities import safe_name
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Profilers of a table: cProfile (deterministic, writes a pstats file) or the stack sampler (writes collapsed stacks)
+PROFILE_MODES = ["cprofile", "sampling"]
+DEFAULT_PROFILE_MODE = "cprofile"
+
+
+def frame_label(frame):
+    """
+    Build the label of a stack frame for the collapsed-stack format.
+
+    :param frame: Stack frame.
+    :return: Label of the form module.py:function:line (without spaces or semicolons).
+    """
+
+    code = frame.f_code
+    label = "%s:%s:%d" % (os.path.basename(code.co_filename), code.co_name, code.co_firstlineno)
+    return label.replace(" ", "_").replace(";", "_")
+
+
+def collapse_stack(frame, thread_name=None):
+    """
+    Collapse a stack into a single line, root first.
+
+    :param frame: Innermost stack frame.
+    :param thread_name: Name of the thread of the stack, used as the root label (optional).
+    :return: Semicolon-separated frame labels.
+    """
+
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+
+    if thread_name is not None:
+        labels.append(thread_name.replace(" ", "_").replace(";", "_"))
+
+    labels.reverse()
+    return ";".join(labels)
+
+
+class StackSampler(object):
+    """
+    Samples the stacks of all of the threads (other than its own) at a fixed interval to build flamegraph-compatible
+    collapsed stacks, rooted at the name of each thread.
+    """
+
+    def __init__(self, interval=0.005):
+        assert interval > 0
+
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler")
+        self._thread.daemon = True
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            thread_names = dict([(thread.ident, thread.name) for thread in threading.enumerate()])
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.counts[collapse_stack(frame, thread_names.get(thread_id, str(thread_id)))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path):
+        """
+        Write the samples in the collapsed-stack format ('frame1;frame2;frame3 count' per line).
+
+        :param path: Output file path.
+        """
+
+        with open(path, "w") as fp:
+            for stack, count in sorted(self.counts.items()):
+                fp.write("%s %d\n" % (stack, count))
+
+
+class TableProfiler(object):
+    """
+    Profiles the load of each table with one profiler, so that neither distorts the other's results: cProfile, writing
+    a pstats file per table, or the stack sampler, writing a collapsed-stack file per table.
+    """
+
+    def __init__(self, output_path=None, table_names=None, sample_interval=0.005, mode=DEFAULT_PROFILE_MODE):
+        """
+        :param output_path: Folder to write the profiles to (if None, profiling is disabled).
+        :param table_names: Names of the tables to profile (if None, all tables are profiled).
+        :param sample_interval: Interval in seconds between stack samples.
+        :param mode: Profiler ('cprofile' or 'sampling').
+        """
+
+        # Preconditions
+        if mode not in PROFILE_MODES:
+            raise ValueError("Unknown profile mode %s (expected one of %s)" % (mode, ", ".join(PROFILE_MODES)))
+
+        self.output_path = output_path
+        self.table_names = table_names
+        self.sample_interval = sample_interval
+        self.mode = mode
+
+        if output_path is not None:
+            os.makedirs(output_path, exist_ok=True)
+
+    def enabled_for(self, table_name):
+        """
+        Is profiling enabled for a table?
+
+        :param table_name: Table name.
+        :return: True if the table will be profiled.
+        """
+
+        if self.output_path is None:
+            return False
+        return self.table_names is None or table_name in self.table_names
+
+    @contextlib.contextmanager
+    def profile(self, table_name):
+        """
+        Context manager to profile the load of a table.
+
+        :param table_name: Table name.
+        """
+
+        if not self.enabled_for(table_name):
+            yield
+            return
+
+        module_logger.info("Profiling table %s (%s)", table_name, self.mode)
+        base_path = os.path.join(self.output_path, safe_name(table_name))
+
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(base_path + ".pstats")
+                module_logger.info("Profile of table %s written to %s.pstats", table_name, base_path)
+        else:
+            sampler = StackSampler(self.sample_interval)
+            sampler.start()
+            try:
+                yield
+            finally:
+                sampler.stop()
+                sampler.write_collapsed(base_path + ".collapsed")
+                module_logger.info("Profile of table %s written to %s.collapsed", table_name, base_path)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import csv
+import logging
+import os
+import threading
+
+from database_loader.database_utilities import safe_name
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Default maximum fraction of the rows of a table that may be rejected
+DEFAULT_MAX_ERROR_RATE = 0.0
+
+# Minimum number of rows read before the error rate is checked during the load (it is always checked at the end)
+MIN_ROWS_FOR_ERROR_RATE = 1000
+
+# Columns of a reject file before the values of the row
+REJECT_COLUMNS = ["file", "row", "reason"]
+
+
+def reject_file_path(folder, table_name):
+    """
+    Get the path of the reject file of a table.
+
+    :param folder: Folder holding the reject files.
+    :param table_name: Table name.
+    :return: File path.
+    """
+
+    return os.path.join(folder, "%s.rejects.csv" % safe_name(table_name))
+
+
+class RejectWriter(object):
+    """
+    Writes the rows that can't be loaded to a per-table reject file with the file, row number and reason, and fails
+    the load if too many rows are rejected. The rows may be rejected and accepted from several threads.
+    """
+
+    def __init__(self, folder, table_name, max_error_rate=DEFAULT_MAX_ERROR_RATE, append=False):
+        """
+        :param folder: Folder to write the reject file to.
+        :param table_name: Table name.
+        :param max_error_rate: Maximum fraction of the rows that may be rejected.
+        :param append: Append to an existing reject file (e.g. when resuming a load)?
+        """
+
+        assert 0.0 <= max_error_rate <= 1.0
+
+        self.path = reject_file_path(folder, table_name)
+        self.table_name = table_name
+        self.max_error_rate = max_error_rate
+        self.num_loaded = 0
+        self.num_rejected = 0
+
+        os.makedirs(folder, exist_ok=True)
+        if not append and os.path.isfile(self.path):
+            os.remove(self.path)
+
+        self._fp = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def discard_replayed(self, files, file_checkpoints):
+        """
+        Remove the rejected rows that a resumed load reads again: the rows after the last committed checkpoint of the
+        unfinished files (rejected before the load was interrupted), which would otherwise be rejected twice.
+
+        :param files: List of the files being loaded.
+        :param file_checkpoints: Dictionary of file path to FileCheckpoint to resume from.
+        """
+
+        if not os.path.isfile(self.path):
+            return
+
+        # Number of the last committed row of each file read again
+        replayed = {}
+        for file in files:
+            start = file_checkpoints.get(file)
+            if start is None:
+                replayed[file] = 0
+            elif not start.complete:
+                replayed[file] = start.row_number
+
+        with self._lock:
+            num_discarded = 0
+            tmp_path = self.path + ".tmp"
+            with open(self.path, encoding="utf-8", newline="") as fp, \
+                    open(tmp_path, "w", encoding="utf-8", newline="") as tmp_fp:
+                writer = csv.writer(tmp_fp, lineterminator="\n")
+                for row in csv.reader(fp):
+                    if row[0] in replayed and row[1].isdigit() and int(row[1]) > replayed[row[0]]:
+                        num_discarded += 1
+                    else:
+                        writer.writerow(row)
+            os.replace(tmp_path, self.path)
+
+        if num_discarded > 0:
+            module_logger.info("Discarded %d rejected rows of table %s that are read again", num_discarded,
+                               self.table_name)
+
+    def reject(self, file_path, row_number, values, reason):
+        """
+        Quarantine a row.
+
+        :param file_path: File the row was read from.
+        :param row_number: Number of the row in the file (excluding the header).
+        :param values: List of the values of the row.
+        :param reason: Reason the row was rejected.
+        """
+
+        with self._lock:
+            if self._writer is None:
+                write_header = not os.path.isfile(self.path)
+                self._fp = open(self.path, "a", encoding="utf-8", newline="")
+                self._writer = csv.writer(self._fp, lineterminator="\n")
+                if write_header:
+                    self._writer.writerow(REJECT_COLUMNS + ["values..."])
+
+            self._writer.writerow([file_path, row_number, reason] + list(values))
+            self.num_rejected += 1
+            module_logger.debug("Rejected row %s of %s: %s", row_number, file_path, reason)
+
+            self.check_error_rate()
+
+    def accept(self, num_rows=1):
+        """
+        Record rows that have been loaded.
+
+        :param num_rows: Number of rows.
+        """
+
+        with self._lock:
+            self.num_loaded += num_rows
+
+    def check_error_rate(self, final=False):
+        """
+        Check the fraction of the rows read that have been rejected.
+
+        :param final: Have all of the rows been read? If not, the rate is only checked once enough rows have been read.
+        """
+
+        num_rows = self.num_loaded + self.num_rejected
+        if self.num_rejected == 0 or (not final and num_rows < MIN_ROWS_FOR_ERROR_RATE):
+            return
+
+        error_rate = self.num_rejected / num_rows
+        if error_rate > self.max_error_rate:
+            self.close()
+            raise ValueError("Rejected %d of %d rows of table %s (%.2f%%), more than the maximum error rate of "
+                             "%.2f%% (see %s)" % (self.num_rejected, num_rows, self.table_name, 100 * error_rate,
+                                                  100 * self.max_error_rate, self.path))
+
+    def close(self):
+        """Close the reject file."""
+
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+            self._writer = None
+
+        if self.num_rejected > 0:
+            module_logger.warning("Rejected %d rows of table %s, see %s", self.num_rejected, self.table_name,
+                                  self.path)
+
+
+def bisect_execute(execute, items, on_failure, errors):
+    """
+    Execute a batch, splitting it in halves on failure until the items that fail are isolated.
+
+    A batch with b bad items out of n is resolved in O(b log n) executions.
+
+    :param execute: Function that executes a list of items (e.g. as one multi-row INSERT).
+    :param items: List of items.
+    :param on_failure: Function called with (item, exception) for each item that fails on its own.
+    :param errors: Tuple of the exception types that indicate a bad item.
+    :return: Number of items executed successfully.
+    """
+
+    if len(items) == 0:
+        return 0
+
+    try:
+        execute(items)
+        return len(items)
+    except errors as e:
+        if len(items) == 1:
+            on_failure(items[0], e)
+            return 0
+
+    middle = len(items) // 2
+    return bisect_execute(execute, items[:middle], on_failure, errors) + \
+        bisect_execute(execute, items[middle:], on_failure, errors)
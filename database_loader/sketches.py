@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+import math
+
+# Default number of bits of the hash that select a HyperLogLog register (4096 registers, a standard error of 1.6%)
+DEFAULT_PRECISION = 12
+
+# Default relative accuracy of the quantiles of a QuantileSketch
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Mask of the 64 bits of a hash used by the HyperLogLog
+HASH_MASK = 2 ** 64 - 1
+
+
+class HyperLogLog(object):
+    """
+    HyperLogLog sketch estimating the number of distinct values from 2 ** precision registers.
+
+    Two sketches of the same precision merge into the sketch of the union of their values. The values are hashed
+    with Python's hash(), which is salted per process, so only sketches built in the same process can be merged.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        """
+        :param precision: Number of bits of the hash that select a register (4 to 16).
+        """
+
+        assert 4 <= precision <= 16
+
+        self.precision = precision
+        self.num_registers = 2 ** precision
+        self.registers = bytearray(self.num_registers)
+        self._rank_bits = 64 - precision
+        self._rank_mask = 2 ** self._rank_bits - 1
+
+    def add(self, value):
+        """
+        Add a value to the sketch.
+
+        :param value: Hashable value.
+        """
+
+        value_hash = hash(value) & HASH_MASK
+        index = value_hash >> self._rank_bits
+
+        # Position of the leftmost 1 bit of the remaining bits
+        rank = self._rank_bits - (value_hash & self._rank_mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """
+        Merge two sketches.
+
+        :param other: Other HyperLogLog of the same precision.
+        :return: Merged HyperLogLog.
+        """
+
+        # Preconditions
+        assert self.precision == other.precision
+
+        merged = HyperLogLog(self.precision)
+        merged.registers = bytearray(map(max, self.registers, other.registers))
+        return merged
+
+    def estimate(self):
+        """
+        Estimate the number of distinct values.
+
+        :return: Estimated number of distinct values.
+        """
+
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum([2.0 ** -rank for rank in self.registers])
+
+        # Linear counting is more accurate for small cardinalities
+        num_zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and num_zeros > 0:
+            estimate = m * math.log(m / num_zeros)
+
+        return int(round(estimate))
+
+
+class QuantileSketch(object):
+    """
+    Sketch of the distribution of numeric values, counting them in logarithmic buckets (as in DDSketch), so that each
+    quantile is estimated within relative_accuracy of a value of the column.
+
+    The values that aren't finite (infinities, NaN and integers too large for a float) are only counted, in
+    num_non_finite.
+
+    Two sketches of the same relative accuracy merge into the sketch of all of their values.
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        """
+        :param relative_accuracy: Relative accuracy of the estimated quantiles.
+        """
+
+        assert 0.0 < relative_accuracy < 1.0
+
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+
+        # Bucket index to number of values, for the positive values and the absolute negative values
+        self.positive = {}
+        self.negative = {}
+        self.num_zeros = 0
+        self.num_non_finite = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """
+        Add a value to the sketch.
+
+        :param value: Numeric value.
+        """
+
+        try:
+            value = float(value)
+        except OverflowError:
+            value = math.inf
+        if not math.isfinite(value):
+            self.num_non_finite += 1
+            return
+
+        if self.count == 0:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+        self.count += 1
+
+        if value > 0:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.positive[index] = self.positive.get(index, 0) + 1
+        elif value < 0:
+            index = math.ceil(math.log(-value) / self._log_gamma)
+            self.negative[index] = self.negative.get(index, 0) + 1
+        else:
+            self.num_zeros += 1
+
+    def merge(self, other):
+        """
+        Merge two sketches.
+
+        :param other: Other QuantileSketch of the same relative accuracy.
+        :return: Merged QuantileSketch.
+        """
+
+        # Preconditions
+        assert self.relative_accuracy == other.relative_accuracy
+
+        merged = QuantileSketch(self.relative_accuracy)
+        for buckets, other_buckets, merged_buckets in [(self.positive, other.positive, merged.positive),
+                                                       (self.negative, other.negative, merged.negative)]:
+            merged_buckets.update(buckets)
+            for index, count in other_buckets.items():
+                merged_buckets[index] = merged_buckets.get(index, 0) + count
+
+        merged.num_zeros = self.num_zeros + other.num_zeros
+        merged.num_non_finite = self.num_non_finite + other.num_non_finite
+        merged.count = self.count + other.count
+        merged.min = min([v for v in [self.min, other.min] if v is not None], default=None)
+        merged.max = max([v for v in [self.max, other.max] if v is not None], default=None)
+
+        return merged
+
+    def quantile(self, q):
+        """
+        Estimate a quantile of the values.
+
+        :param q: Quantile (between 0 and 1).
+        :return: Estimated value of the quantile, or None if there are no values.
+        """
+
+        assert 0.0 <= q <= 1.0
+
+        if self.count == 0:
+            return None
+
+        # The extremes are known exactly
+        if q == 0.0:
+            return self.min
+        if q == 1.0:
+            return self.max
+
+        # The value of each bucket is the midpoint (in relative terms) of its range (gamma ^ (i - 1), gamma ^ i]
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative.keys(), reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return max(self.min, -2 * self.gamma ** index / (self.gamma + 1))
+
+        seen += self.num_zeros
+        if seen > rank:
+            return 0.0
+
+        for index in sorted(self.positive.keys()):
+            seen += self.positive[index]
+            if seen > rank:
+                return min(self.max, 2 * self.gamma ** index / (self.gamma + 1))
+
+        return self.max
+
+
+def histogram_quantile(counts, q):
+    """
+    Get a quantile of the values counted in a histogram.
+
+    :param counts: Dictionary of value to number of occurrences.
+    :param q: Quantile (between 0 and 1).
+    :return: Value of the quantile, or None if the histogram is empty.
+    """
+
+    assert 0.0 <= q <= 1.0
+
+    total = sum(counts.values())
+    if total == 0:
+        return None
+
+    rank = q * (total - 1)
+    seen = 0
+    for value in sorted(counts.keys()):
+        seen += counts[value]
+        if seen > rank:
+            return value
@@ -0,0 +1,86 @@
+import os
+import tempfile
+
+import pytest
+
+from data_reader.csv_reader import DelimitedSource
+from database_loader.assembly import check_sorted, external_sort, wide_field_names, merge_sorted_tables, \
+    assemble_tables
+from database_loader.loader import table_names_from_path
+
+ASSEMBLY_PATH = "./database_loader/test_data/assembly/"
+
+
+def test_check_sorted():
+    # A key may repeat, but not go backwards
+    rows = [{"id": "1"}, {"id": "2"}, {"id": "2"}, {"id": "10"}]
+    assert list(check_sorted(rows, "id", "t1")) == rows
+
+    with pytest.raises(ValueError):
+        list(check_sorted([{"id": "2"}, {"id": "1"}], "id", "t1"))
+
+
+def test_external_sort():
+    rows = [{"id": str(i)} for i in [5, 3, 9, 1, 7, 2, 8]]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result = list(external_sort(rows, "id", run_size=3, spill_path=tmp_dir))
+        assert [row["id"] for row in result] == ["1", "2", "3", "5", "7", "8", "9"]
+
+        # The runs are removed once they have been merged
+        assert os.listdir(tmp_dir) == []
+
+
+def test_wide_field_names():
+    table_fields = [("t1", ["id", "name"]), ("t2", ["id", "name", "dob"])]
+    assert wide_field_names(table_fields, "id") == [("t1", [("name", "t1_name")]),
+                                                     ("t2", [("name", "t2_name"), ("dob", "dob")])]
+
+
+def test_merge_sorted_tables():
+    streams = [([{"id": "1", "a": "x"}, {"id": "3", "a": "z"}], [("a", "a")]),
+               ([{"id": "2", "b": "q"}, {"id": "3", "b": "r"}], [("b", "b")])]
+
+    assert list(merge_sorted_tables(streams, "id")) == [{"id": "1", "a": "x", "b": ""},
+                                                        {"id": "2", "a": "", "b": "q"},
+                                                        {"id": "3", "a": "z", "b": "r"}]
+
+
+def test_merge_sorted_tables_one_to_many():
+    # The second table has several rows for a key, which are joined to the first table's row
+    streams = [([{"id": "1", "a": "x"}, {"id": "2", "a": "y"}], [("a", "a")]),
+               ([{"id": "1", "b": "p"}, {"id": "1", "b": "q"}, {"id": "3", "b": "r"}], [("b", "b")])]
+
+    assert list(merge_sorted_tables(streams, "id")) == [{"id": "1", "a": "x", "b": "p"},
+                                                        {"id": "1", "a": "x", "b": "q"},
+                                                        {"id": "2", "a": "y", "b": ""},
+                                                        {"id": "3", "a": "", "b": "r"}]
+
+    # Several rows for a key in more than one table would be a many-to-many join
+    streams = [([{"id": "1", "a": "x"}, {"id": "1", "a": "y"}], [("a", "a")]),
+               ([{"id": "1", "b": "p"}, {"id": "1", "b": "q"}], [("b", "b")])]
+    with pytest.raises(ValueError):
+        list(merge_sorted_tables(streams, "id"))
+
+
+def test_assemble_tables():
+    table_name_to_files = table_names_from_path(ASSEMBLY_PATH)
+    assembly_params = {"table-name": "people", "key": "id", "sorted": False, "run-size": 2}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        assembled = assemble_tables(table_name_to_files, assembly_params, ",", "|", "utf-8", tmp_dir)
+        assert sorted(assembled.keys()) == ["people", "settings"]
+
+        rows = list(DelimitedSource(assembled["people"][0], ",", "|", "utf-8").parse())
+        assert rows == [{"id": "1", "first-name": "Ann", "dob": "2001-01-01", "alive": "False"},
+                        {"id": "2", "first-name": "Bob", "dob": "", "alive": "True"},
+                        {"id": "3", "first-name": "Cat", "dob": "2003-03-03", "alive": "True"}]
+
+
+def test_assemble_tables_unsorted():
+    table_name_to_files = table_names_from_path(ASSEMBLY_PATH)
+    assembly_params = {"table-name": "people", "key": "id"}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with pytest.raises(ValueError):
+            assemble_tables(table_name_to_files, assembly_params, ",", "|", "utf-8", tmp_dir)
@@ -0,0 +1,20 @@
+from database_loader.checkpoints import schema_to_json, schema_from_json, create_state_tables_statements, \
+    SCHEMA_TABLE, CHECKPOINT_TABLE
+from database_loader.type_inference import DataType
+
+
+def test_schema_json_round_trip():
+    schema = {"field-b": DataType.int,
+              "field-a": DataType.string,
+              "field-c": DataType.boolean}
+
+    restored = schema_from_json(schema_to_json(schema))
+    assert restored == schema
+    assert list(restored.keys()) == ["field-b", "field-a", "field-c"]
+
+
+def test_create_state_tables_statements():
+    stmts = create_state_tables_statements()
+    assert len(stmts) == 2
+    assert stmts[0].startswith("CREATE TABLE IF NOT EXISTS %s " % SCHEMA_TABLE)
+    assert stmts[1].startswith("CREATE TABLE IF NOT EXISTS %s " % CHECKPOINT_TABLE)
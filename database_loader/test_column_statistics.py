@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+
+from database_loader.column_statistics import ColumnStatistics, is_temporal, merge_column_statistics, \
+    write_column_profiles
+from database_loader.type_inference import DataType, infer_type_and_value
+
+
+def build_statistics(str_values, profiled=False):
+    statistics = ColumnStatistics(profiled)
+    for str_value in str_values:
+        datatype, value = infer_type_and_value(str_value)
+        statistics.update(str_value, datatype, value)
+    return statistics
+
+
+def test_is_temporal():
+    assert is_temporal("1998-02-28", "date")
+    assert not is_temporal("1998-02-30", "date")
+    assert not is_temporal("02/28", "date")
+    assert is_temporal("1998-02-28 13:45:00", "datetime")
+    assert is_temporal("1998-02-28T13:45:00", "datetime")
+    assert is_temporal("13:45:00", "time")
+    assert not is_temporal("25:45:00", "time")
+
+
+def test_column_statistics_int():
+    statistics = build_statistics(["3", "-7", "120"])
+    assert statistics.min_int == -7
+    assert statistics.max_int == 120
+    assert statistics.is_unique()
+
+
+def test_column_statistics_string():
+    statistics = build_statistics(["AB12 CDE", "XY98 ZZZ", "AB12 CDE"])
+    assert statistics.is_fixed_length()
+    assert statistics.max_length == 8
+    assert not statistics.is_unique()
+    assert statistics.temporal_type() is None
+
+
+def test_column_statistics_temporal():
+    assert build_statistics(["1970-01-01", "2001-12-31"]).temporal_type() == "date"
+    assert build_statistics(["1970-01-01", "hello"]).temporal_type() is None
+
+
+def test_merge_column_statistics():
+    merged = merge_column_statistics({"a": build_statistics(["1", "2"])}, {"a": build_statistics(["300", "2"])})
+    assert merged["a"].count == 4
+    assert merged["a"].min_int == 1
+    assert merged["a"].max_int == 300
+    assert merged["a"].max_length == 3
+    assert not merged["a"].is_unique()
+
+
+def test_column_statistics_profile():
+    assert build_statistics(["1", "2"]).profile() == {"count": 2, "null_count": 0, "unique": True}
+
+    profile = build_statistics(["3", "-7", "", "120", "3"], profiled=True).profile()
+    assert profile["count"] == 4
+    assert profile["null_count"] == 1
+    assert not profile["unique"]
+    assert profile["distinct"] == 3
+    assert (profile["values"]["min"], profile["values"]["max"]) == (-7, 120)
+    assert abs(profile["values"]["p50"] - 3) < 0.1
+    assert "strings" not in profile
+    assert profile["lengths"]["histogram"] == {"1": 2, "2": 1, "3": 1}
+    assert (profile["lengths"]["min"], profile["lengths"]["max"], profile["lengths"]["p50"]) == (1, 3, 1)
+
+    # The sketches are merged with the statistics
+    merged = build_statistics(["Boss", "Strymon"], profiled=True).merge(build_statistics(["Ibanez", "Boss"],
+                                                                                           profiled=True))
+    profile = merged.profile()
+    assert profile["distinct"] == 3
+    assert profile["strings"] == {"min": "Boss", "max": "Strymon"}
+    assert profile["lengths"]["histogram"] == {"4": 2, "6": 1, "7": 1}
+    assert profile["lengths"]["mean"] == 5.25
+
+    # The values that aren't finite are counted separately
+    profile = build_statistics(["1.5", "inf", "NaN", "-2.5"], profiled=True).profile()
+    assert (profile["values"]["count"], profile["values"]["non_finite"]) == (2, 2)
+    assert (profile["values"]["min"], profile["values"]["max"]) == (-2.5, 1.5)
+
+
+def test_write_column_profiles():
+    column_statistics = {"ID": build_statistics(["1", "2"], profiled=True),
+                         "Own": build_statistics(["True", ""], profiled=True)}
+    schema = {"ID": DataType.int, "Own": DataType.boolean}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = write_column_profiles(os.path.join(tmp_dir, "profiles"), "m001 pedals", schema, column_statistics)
+        assert path == os.path.join(tmp_dir, "profiles", "m001_pedals.json")
+        with open(path) as fp:
+            profile = json.load(fp)
+
+    assert profile["table"] == "m001 pedals"
+    assert profile["columns"]["ID"]["type"] == "int"
+    assert profile["columns"]["ID"]["distinct"] == 2
+    assert profile["columns"]["Own"]["type"] == "boolean"
+    assert profile["columns"]["Own"]["null_count"] == 1
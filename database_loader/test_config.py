@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+from database_loader.__main__ import build_parser
+from database_loader.config import read_config, load_arguments, generate_arguments, check_config
+
+EXAMPLE_CONFIG = "./load_config.example.toml"
+
+
+def test_read_example_config():
+    config = read_config(EXAMPLE_CONFIG)
+    arguments = load_arguments(config)
+
+    assert arguments["filepath"] == "../raw-data/"
+    assert arguments["backend"] == "mariadb"
+    assert arguments["db_params"]["database-name"] == "comet"
+    assert arguments["batch_size"] == 1000
+    assert arguments["memory_limit"] is None
+    assert arguments["inference_params"]["decimals"]
+    assert arguments["reject_params"] == {"path": "./rejects/", "max-error-rate": 0.01}
+
+    assert arguments["table_params"]["m014_reason"] == {"batch-size": 200, "inference": None}
+    assert arguments["table_params"]["m003_alive"] == {"backend": "parquet", "checkpoint": False,
+                                                       "memory-limit": "512M", "columns": {"include": ["id", "alive"]},
+                                                       "db-params": {"output-path": "../parquet/"}}
+
+    assert generate_arguments(config) == {"filepath": "../raw-data/", "num_entries": 10, "max_entries_per_file": 5,
+                                          "delimiter": ",", "encapsulator": "|"}
+
+
+def test_read_yaml_config():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, "config.yaml")
+        with open(config_path, "w") as fp:
+            fp.write("source:\n  path: ./data/\nload:\n  backend: parquet\n  dedup: {key: [id]}\n"
+                     "backends:\n  parquet:\n    output-path: ./out/\n")
+
+        arguments = load_arguments(read_config(config_path))
+        assert arguments["db_params"] == {"output-path": "./out/"}
+        assert arguments["dedup_params"] == {"key": ["id"]}
+        assert arguments["delimiter"] == ","
+
+
+def test_invalid_config():
+    with pytest.raises(ValueError):
+        check_config({"source": {"path": "./", "colour": "red"}})
+
+    with pytest.raises(ValueError):
+        check_config({"other": {}})
+
+    with pytest.raises(ValueError):
+        load_arguments({"source": {"path": "./"}, "load": {"backend": "postgresql"}})
+
+    with pytest.raises(ValueError):
+        read_config("./config.ini")
+
+
+def test_command_line():
+    args = build_parser().parse_args(["load", EXAMPLE_CONFIG, "--resume"])
+    assert args.command == "load"
+    assert args.resume
+
+    args = build_parser().parse_args(["work", EXAMPLE_CONFIG, "--name", "host-1"])
+    assert (args.command, args.name) == ("work", "host-1")
+
+    # The database connector and the data generator aren't imported until they are needed
+    result = subprocess.run([sys.executable, "-c", "import sys, database_loader.__main__; "
+                                                   "print('mysql.connector' in sys.modules, 'faker' in sys.modules)"],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False False"
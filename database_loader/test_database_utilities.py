@@ -1,5 +1,12 @@
-from database_loader.database_utilities import create_table_statement, safe_name, insert_data_statement
-from database_loader.type_inference import DataType
+import pytest
+
+from database_loader.database_utilities import create_table_statement, safe_name, insert_data_statement, \
+    insert_data_batch_statement, transform_values, narrowed_sql_type, alter_table_statement, \
+    build_value_caches, check_partition_params, partition_router, upsert_data_batch_statement, merge_staged_statement, \
+    add_unique_key_statement, ensure_unique_key, check_autoinc_lock_mode
+from database_loader import database_utilities
+from database_loader.column_statistics import ColumnStatistics
+from database_loader.type_inference import DataType, infer_type_and_value, build_temporal_detectors
 
 
 def test_create_table_statement():
@@ -12,6 +19,155 @@ def test_create_table_statement():
     assert stmt == "CREATE TABLE MYTABLE (MYTABLE____ID INT NOT NULL AUTO_INCREMENT, field1 BIGINT, field2 DOUBLE, field3 TEXT, field4 BOOLEAN, PRIMARY KEY (MYTABLE____ID));"
 
 
+def test_create_table_statement_partitioned():
+    schema = {"id": DataType.int, "alive": DataType.boolean}
+
+    stmt = create_table_statement("m003_alive", schema, partition_params={"column": "id", "partitions": 8})
+    assert stmt == "CREATE TABLE m003_alive (m003_alive____ID INT NOT NULL AUTO_INCREMENT, id BIGINT, alive BOOLEAN, " \
+                   "PRIMARY KEY (m003_alive____ID, id)) PARTITION BY HASH (id) PARTITIONS 8;"
+
+    stmt = create_table_statement("m003_alive", schema, partition_params={"column": "id", "method": "range",
+                                                                          "bounds": [100, 200]})
+    assert stmt == "CREATE TABLE m003_alive (m003_alive____ID INT NOT NULL AUTO_INCREMENT, id BIGINT, alive BOOLEAN, " \
+                   "PRIMARY KEY (m003_alive____ID, id)) PARTITION BY RANGE (id) (PARTITION p0 VALUES LESS THAN (100), " \
+                   "PARTITION p1 VALUES LESS THAN (200), PARTITION p2 VALUES LESS THAN MAXVALUE);"
+
+
+def test_create_table_statement_unique_key():
+    schema = {"id": DataType.int, "alive": DataType.boolean}
+
+    stmt = create_table_statement("m003_alive", schema, key_columns=["id"])
+    assert stmt == "CREATE TABLE m003_alive (m003_alive____ID INT NOT NULL AUTO_INCREMENT, id BIGINT, alive BOOLEAN, " \
+                   "PRIMARY KEY (m003_alive____ID), UNIQUE KEY m003_alive____KEY (id));"
+
+    stmt = create_table_statement("stage", schema, temporary=True)
+    assert stmt == "CREATE TEMPORARY TABLE stage (stage____ID INT NOT NULL AUTO_INCREMENT, id BIGINT, alive BOOLEAN, " \
+                   "PRIMARY KEY (stage____ID));"
+
+
+def test_upsert_data_batch_statement():
+    stmt = upsert_data_batch_statement("m003_alive", ["id", "alive"], [["1", "true"], ["2", "false"]], ["id"])
+    assert stmt == "INSERT INTO m003_alive (id, alive) VALUES (1, true), (2, false) " \
+                   "ON DUPLICATE KEY UPDATE alive = VALUES(alive);"
+
+    # A table with only key columns leaves the existing rows unchanged
+    stmt = upsert_data_batch_statement("m003_ids", ["id"], [["1"]], ["id"])
+    assert stmt == "INSERT INTO m003_ids (id) VALUES (1) ON DUPLICATE KEY UPDATE id = VALUES(id);"
+
+
+def test_merge_staged_statement():
+    stmt = merge_staged_statement("m003_alive", "m003_alive____STAGE", ["id", "alive"], ["id"])
+    assert stmt == "INSERT INTO m003_alive (id, alive) SELECT id, alive FROM m003_alive____STAGE " \
+                   "ORDER BY m003_alive____STAGE____ID ON DUPLICATE KEY UPDATE alive = VALUES(alive);"
+
+
+class IndexCursor(object):
+    """Cursor of a table whose SHOW INDEX lists the given indexes and that records the other statements."""
+
+    def __init__(self, indexes, executed):
+        self.indexes = indexes
+        self.executed = executed
+
+    def cursor(self):
+        return self
+
+    def execute(self, stmt):
+        if not stmt.startswith("SHOW INDEX"):
+            self.executed.append(stmt)
+
+    def fetchall(self):
+        return [("m003_alive", non_unique, key_name, seq + 1, column)
+                for key_name, non_unique, columns in self.indexes for seq, column in enumerate(columns)]
+
+    def close(self):
+        pass
+
+
+def test_ensure_unique_key(monkeypatch):
+    assert add_unique_key_statement("m003 alive", ["id", "type"]) == \
+        "ALTER TABLE m003_alive ADD UNIQUE KEY m003_alive____KEY (id, type);"
+
+    # A table created by a normal load only has the unique key of its identifier
+    executed = []
+    indexes = [("PRIMARY", 0, ["m003_alive____ID"]), ("by_id", 1, ["id"])]
+    monkeypatch.setattr(database_utilities, "build_database_connection",
+                        lambda db_params, set_db=True: IndexCursor(indexes, executed))
+    assert ensure_unique_key({}, "m003_alive", ["id"])
+    assert executed == ["ALTER TABLE m003_alive ADD UNIQUE KEY m003_alive____KEY (id);"]
+
+    # A table created by a merge already has the key
+    executed = []
+    indexes = [("PRIMARY", 0, ["m003_alive____ID"]), ("m003_alive____KEY", 0, ["id", "type"])]
+    assert not ensure_unique_key({}, "m003_alive", ["type", "id"])
+    assert executed == []
+
+
+def test_check_partition_params():
+    schema = {"id": DataType.int, "alive": DataType.boolean}
+    check_partition_params(schema, {"column": "id"})
+    check_partition_params(schema, {"column": "id", "method": "range", "bounds": [10, 20]})
+
+    with pytest.raises(ValueError, match="Unknown partitioning column"):
+        check_partition_params(schema, {"column": "reason"})
+    with pytest.raises(ValueError, match="must be an integer column"):
+        check_partition_params(schema, {"column": "alive"})
+    with pytest.raises(ValueError, match="Unknown partitioning method"):
+        check_partition_params(schema, {"column": "id", "method": "key"})
+    with pytest.raises(ValueError, match="ascending"):
+        check_partition_params(schema, {"column": "id", "method": "range", "bounds": [20, 10]})
+
+    # The partitioning column is part of the primary key, so it can't hold NULLs
+    statistics = ColumnStatistics()
+    for str_value in ["1", "", "3"]:
+        statistics.update(str_value, *infer_type_and_value(str_value))
+    with pytest.raises(ValueError, match="has 1 NULLs"):
+        check_partition_params(schema, {"column": "id"}, {"id": statistics})
+
+
+class VariableConnection(object):
+    """Connection whose SELECT of a variable returns the given value."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def cursor(self):
+        return self
+
+    def execute(self, stmt):
+        pass
+
+    def fetchone(self):
+        return (self.value,)
+
+    def close(self):
+        pass
+
+
+def test_check_autoinc_lock_mode(monkeypatch, caplog):
+    for lock_mode in [0, 1, 2]:
+        monkeypatch.setattr(database_utilities, "build_database_connection",
+                            lambda db_params, set_db=True: VariableConnection(lock_mode))
+        assert check_autoinc_lock_mode({}) == lock_mode
+
+    # Only the traditional lock mode, which serialises the inserts, is warned about
+    assert [record.message for record in caplog.records if "innodb_autoinc_lock_mode" in record.message] == \
+        ["innodb_autoinc_lock_mode is 0, so the concurrent INSERT statements into a table are serialised by its "
+         "AUTO_INCREMENT lock (set it to 1 or 2)"]
+
+
+def test_partition_router():
+    route = partition_router({"column": "id", "partitions": 4})
+    assert [route({"id": value}) for value in ["0", "5", "-6", "11", ""]] == [0, 1, 2, 3, 0]
+
+    route = partition_router({"column": "id", "method": "range", "bounds": [10, 20]})
+    assert [route({"id": value}) for value in ["-1", "9", "10", "19", "20", "1000"]] == [0, 0, 1, 1, 2, 2]
+
+
+def test_alter_table_statement():
+    stmt = alter_table_statement("my-table", {"field-1": DataType.string, "field2": DataType.float})
+    assert stmt == "ALTER TABLE my_table MODIFY COLUMN field_1 TEXT, MODIFY COLUMN field2 DOUBLE;"
+
+
 def test_safe_name():
     assert safe_name("this-is-a-test") == "this_is_a_test"
     assert safe_name("this*is/a&test") == "this_is_a_test"
@@ -27,3 +183,78 @@ def test_insert_data_statement():
 
     stmt = insert_data_statement(table_name, schema, data, true_values, false_values)
     assert stmt == """INSERT INTO MYDATA (field1, field2) VALUES ("example data", "3");"""
+
+
+def test_insert_data_batch_statement():
+    schema = {"field1": DataType.string,
+              "field2": DataType.boolean}
+    rows = [{"field1": "a", "field2": "True"},
+            {"field1": "b", "field2": "False"}]
+
+    list_values = [transform_values(schema, data, ["True"], ["False"]) for data in rows]
+    stmt = insert_data_batch_statement("MYDATA", ["field1", "field2"], list_values)
+    assert stmt == """INSERT INTO MYDATA (field1, field2) VALUES ("a", true), ("b", false);"""
+
+
+def test_create_table_statement_narrowed():
+    schema = {"id": DataType.int,
+              "count": DataType.int,
+              "dob": DataType.string,
+              "vrn": DataType.string,
+              "name": DataType.string}
+    values = {"id": ["1", "2"],
+              "count": ["1", "100000"],
+              "dob": ["1980-01-31", "1999-12-01"],
+              "vrn": ["AB12 CDE", "XY98 ZZZ"],
+              "name": ["Ibanez", "Strymon"]}
+
+    column_statistics = {}
+    for name, str_values in values.items():
+        column_statistics[name] = ColumnStatistics()
+        for str_value in str_values:
+            datatype, value = infer_type_and_value(str_value)
+            column_statistics[name].update(str_value, datatype, value)
+
+    stmt = create_table_statement("T", schema, column_statistics)
+    assert stmt == "CREATE TABLE T (T____ID INT NOT NULL AUTO_INCREMENT, id TINYINT, count MEDIUMINT, dob DATE, " \
+                   "vrn CHAR(8), name VARCHAR(7), PRIMARY KEY (T____ID));"
+
+
+def test_transform_values_nulls_and_dates():
+    schema = {"a": DataType.int, "b": DataType.string, "c": DataType.boolean, "d": DataType.date}
+    data = {"a": "", "b": "", "c": "", "d": "31/03/2019"}
+    detectors = build_temporal_detectors(schema, ["True"], ["False"], {"date-formats": ["%d/%m/%Y"]})
+
+    assert transform_values(schema, data, ["True"], ["False"], detectors) == ['NULL', '""', 'NULL', '"2019-03-31"']
+
+    # Without detectors, dates are assumed to be in ISO format
+    data["d"] = "2019-03-31"
+    assert transform_values(schema, data, ["True"], ["False"]) == ['NULL', '""', 'NULL', '"2019-03-31"']
+
+
+def test_transform_values_cached():
+    schema = {"a": DataType.int, "b": DataType.boolean, "c": DataType.date}
+    detectors = build_temporal_detectors(schema, ["True"], ["False"], {"date-formats": ["%d/%m/%Y"]})
+    value_caches = build_value_caches(schema, ["True"], ["False"], detectors)
+    assert sorted(value_caches.keys()) == ["b", "c"]
+
+    for _ in range(3):
+        data = {"a": "1", "b": "True", "c": "31/03/2019"}
+        assert transform_values(schema, data, ["True"], ["False"], detectors, value_caches) == \
+            ['"1"', 'true', '"2019-03-31"']
+
+    assert value_caches["b"].hits == 2
+    assert value_caches["c"].hit_rate() == 2 / 3
+
+
+def test_create_table_statement_extended_types():
+    schema = {"a": DataType.date, "b": DataType.datetime, "c": DataType.decimal, "d": DataType.null}
+    assert create_table_statement("T", schema) == \
+        "CREATE TABLE T (T____ID INT NOT NULL AUTO_INCREMENT, a DATE, b DATETIME, c DECIMAL(65, 30), d TEXT, " \
+        "PRIMARY KEY (T____ID));"
+
+    statistics = ColumnStatistics()
+    for value in ["12.50", "-103.2", ""]:
+        statistics.update(value, *infer_type_and_value(value, ["True"], ["False"], detect_decimals=True))
+    assert statistics.null_count == 1
+    assert narrowed_sql_type(DataType.decimal, statistics) == "DECIMAL(5, 2)"
@@ -0,0 +1,99 @@
+import os
+import tempfile
+
+import pyarrow.parquet
+
+from database_loader.deduplication import row_key, Deduplicator, deduplicate_rows
+from database_loader.loader import write_data_from_files
+from database_loader.parquet_writer import create_table
+from database_loader.type_inference import DataType
+
+
+def build_rows(ids):
+    return [{"id": str(i), "name": "name %d" % i} for i in ids]
+
+
+def test_row_key():
+    data = {"id": "1", "name": "a"}
+    assert row_key(data, None) == ("1", "a")
+    assert row_key(data, ["id"]) == ("1",)
+
+
+def test_deduplicate_in_memory():
+    rows = build_rows([3, 1, 3, 2, 1])
+    rows[2]["name"] = "other"
+
+    deduplicator = Deduplicator(["id"])
+    assert [data["id"] for data in deduplicator.deduplicate(rows)] == ["3", "1", "2"]
+    assert deduplicator.num_duplicates == 2
+    assert deduplicator.num_runs == 0
+
+    # The whole row is the default key
+    assert len(list(Deduplicator().deduplicate(rows))) == 4
+
+
+def test_deduplicate_with_spill():
+    rows = build_rows([5, 1, 5, 2, 9, 1, 7, 2, 8, 9, 7])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        deduplicator = Deduplicator(["id"], max_keys=2, spill_path=tmp_dir)
+        result = [data["id"] for data in deduplicator.deduplicate(rows)]
+
+        assert sorted(result, key=int) == ["1", "2", "5", "7", "8", "9"]
+        assert result[:2] == ["5", "1"]
+        assert deduplicator.num_duplicates == 5
+        assert deduplicator.num_runs > 0
+        assert os.listdir(tmp_dir) == []
+
+
+def test_deduplicate_with_spill_equal_numbers():
+    # '1' and '01' are different keys with the same numeric order
+    rows = [{"id": value} for value in ["1", "01", "2", "1", "01", "1", "3", "01", "2"]]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        deduplicator = Deduplicator(["id"], max_keys=2, spill_path=tmp_dir)
+        result = [data["id"] for data in deduplicator.deduplicate(rows)]
+
+        assert sorted(result) == ["01", "1", "2", "3"]
+        assert deduplicator.num_duplicates == 5
+        assert deduplicator.num_runs > 0
+
+
+def test_deduplicate_sorted():
+    rows = build_rows([10, 1, 5, 2, 10, 1, 7, 2])
+    rows[4]["name"] = "duplicate"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for max_keys in [2, 100]:
+            deduplicator = Deduplicator(["id"], max_keys=max_keys, sort_output=True, spill_path=tmp_dir)
+            result = list(deduplicator.deduplicate(rows))
+
+            assert [data["id"] for data in result] == ["1", "2", "5", "7", "10"]
+            assert result[-1]["name"] == "name 10"
+            assert deduplicator.num_duplicates == 3
+
+
+def test_write_data_from_files_deduplicated():
+    files = ["./database_loader/test_data/test_data_1.csv",
+             "./database_loader/test_data/test_data_1.csv"]
+    schema = {'ID': DataType.int,
+              'Pedal name': DataType.string,
+              'Manufacturer': DataType.string,
+              'Type of effect': DataType.string,
+              'Own': DataType.boolean}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_params = {"output-path": tmp_dir}
+        create_table(db_params, "pedals", schema)
+
+        num_rows = write_data_from_files(files, ",", "|", "utf-8", db_params, "pedals", schema, ["True"], ["False"],
+                                         dedup_params={"key": ["ID"], "sorted": True})
+        assert num_rows == 3
+
+        table = pyarrow.parquet.read_table(os.path.join(tmp_dir, "pedals"))
+        assert table.column("ID").to_pylist() == [1, 2, 3]
+
+
+def test_deduplicate_rows():
+    rows = build_rows([1, 1, 2])
+    assert len(list(deduplicate_rows(rows, {"key": ["id"]}))) == 2
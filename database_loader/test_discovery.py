@@ -0,0 +1,95 @@
+import os
+import tempfile
+
+import pytest
+
+from database_loader.discovery import table_name_from_filename, compile_patterns, scan_files, read_manifest, \
+    table_name_of, discover_files, discover_tables, DiscoveredFile
+from database_loader.loader import table_names_from_path
+
+
+def write_file(path, text="id\n1\n"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fp:
+        fp.write(text)
+
+
+def build_folder(tmp_dir):
+    for name in ["m001_dob_1.csv", "m001_dob_2.csv", "m001_dob_10.csv", "m002_alive_1.csv", "notes.txt",
+                 ".hidden_1.csv", "people/date=2020-01-01/part_1.csv", "people/date=2020-01-02/part_1.csv"]:
+        write_file(os.path.join(tmp_dir, name))
+
+
+def test_table_name_from_filename():
+    assert table_name_from_filename("./data/m001_dob_12.csv") == "m001_dob"
+    assert table_name_from_filename("m001_dob.csv") == "m001_dob"
+    assert table_name_from_filename("2020_1.csv") == "2020"
+
+
+def test_compile_patterns():
+    assert compile_patterns(None) is None
+    assert compile_patterns([]) is None
+
+    pattern = compile_patterns(["m00*", "*/part_1.csv"])
+    assert pattern.match("m001_dob_1.csv")
+    assert pattern.match("people/date=2020-01-01/part_1.csv")
+    assert not pattern.match("x001_dob_1.csv")
+
+
+def test_scan_files():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        build_folder(tmp_dir)
+
+        files = list(scan_files(tmp_dir))
+        assert sorted([os.path.basename(f.path) for f in files]) == ["m001_dob_1.csv", "m001_dob_10.csv",
+                                                                     "m001_dob_2.csv", "m002_alive_1.csv"]
+        assert all([f.size == 5 for f in files])
+
+        assert len(list(scan_files(tmp_dir, recursive=True))) == 6
+
+
+def test_table_name_of():
+    assert table_name_of("/data/people/date=1/part_1.csv", "/data", "folder") == "people"
+    assert table_name_of("/data/m001_dob_1.csv", "/data", "folder") == "m001_dob"
+    assert table_name_of("/data/people/date=1/part_1.csv", "/data") == "part"
+
+    with pytest.raises(ValueError):
+        table_name_of("/data/m001_dob_1.csv", "/data", "other")
+
+
+def test_discover_tables():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        build_folder(tmp_dir)
+
+        tables = discover_tables(tmp_dir)
+        assert sorted(tables.keys()) == ["m001_dob", "m002_alive"]
+        assert [os.path.basename(f.path) for f in tables["m001_dob"]] == ["m001_dob_1.csv", "m001_dob_2.csv",
+                                                                         "m001_dob_10.csv"]
+
+        # Partitioned layout
+        tables = discover_tables(tmp_dir, {"recursive": True, "table-name-from": "folder",
+                                           "exclude": ["m002_*"]})
+        assert sorted(tables.keys()) == ["m001_dob", "people"]
+        assert len(tables["people"]) == 2
+
+        tables = discover_tables(tmp_dir, {"recursive": True, "include": ["people/*"]})
+        assert list(tables.keys()) == ["part"]
+
+        assert table_names_from_path(tmp_dir, {"include": ["m002_*"]}) == \
+            {"m002_alive": [os.path.join(tmp_dir, "m002_alive_1.csv")]}
+
+
+def test_read_manifest():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        build_folder(tmp_dir)
+        manifest_path = os.path.join(tmp_dir, "manifest.txt")
+        write_file(manifest_path, "# Files to load\nm001_dob_1.csv\n\nm002_alive_1.csv\t1024\n")
+
+        files = read_manifest(manifest_path)
+        assert files == [DiscoveredFile(os.path.join(tmp_dir, "m001_dob_1.csv"), 5),
+                         DiscoveredFile(os.path.join(tmp_dir, "m002_alive_1.csv"), 1024)]
+        assert discover_files(tmp_dir, {"manifest": manifest_path, "exclude": ["m001*"]}) == files[1:]
+
+        write_file(manifest_path, "m001_dob_1.csv\tlarge\n")
+        with pytest.raises(ValueError):
+            read_manifest(manifest_path)
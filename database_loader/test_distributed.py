@@ -0,0 +1,261 @@
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+
+from database_loader import database_utilities
+from database_loader.distributed import WorkQueue, QueueWorker, coordinate_load, wait_for_load, PENDING, LEASED, \
+    DONE, FAILED
+from database_loader.type_inference import DataType
+
+SCHEMA = {'ID': DataType.int, 'Pedal name': DataType.string}
+
+SETTINGS = {"delimiter": ",", "encapsulator": "|", "encoding": "utf-8", "true-values": ["True"],
+            "false-values": ["False"], "inference": None, "columns": None}
+
+
+class FileConnection(object):
+    """
+    Connection that appends the committed INSERT statements and file checkpoints to a file (shared by the worker
+    processes).
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.pending = []
+        self.result = []
+
+    def cursor(self):
+        return self
+
+    def checkpoint(self, table_name, file_path):
+        if not os.path.exists(self.output_path):
+            return None
+        recorded = None
+        with open(self.output_path) as fp:
+            for line in fp:
+                values = line.split(" ", 1)[1]
+                if values.startswith("CHECKPOINT") and json.loads(values[11:])[:2] == [table_name, file_path]:
+                    recorded = tuple(json.loads(values[11:])[2:])
+        return recorded
+
+    def execute(self, stmt, params=None):
+        self.result = []
+        if stmt.startswith("INSERT IGNORE INTO loader____checkpoint"):
+            if self.checkpoint(*params) is None:
+                self.pending.append("CHECKPOINT %s" % json.dumps(list(params) + [0, 0, 0, False]))
+        elif stmt.startswith("REPLACE INTO loader____checkpoint"):
+            self.pending.append("CHECKPOINT %s" % json.dumps(list(params)))
+        elif stmt.startswith("INSERT"):
+            self.pending.append(stmt)
+        elif stmt.startswith("SELECT") and stmt.endswith("FOR UPDATE"):
+            recorded = self.checkpoint(*params)
+            self.result = [recorded] if recorded is not None else []
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return []
+
+    def commit(self):
+        with open(self.output_path, "a") as fp:
+            for stmt in self.pending:
+                fp.write("%d %s\n" % (os.getpid(), stmt))
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+class CheckpointConnection(object):
+    """Connection that commits the inserted rows and the file checkpoints to a state shared by the workers."""
+
+    def __init__(self, state, on_commit=None):
+        self.state = state
+        self.on_commit = on_commit
+        self.pending = []
+        self.result = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, stmt, params=None):
+        self.result = []
+        if stmt.startswith("INSERT IGNORE INTO loader____checkpoint"):
+            self.pending.append(lambda: self.state["checkpoints"].setdefault(params, (0, 0, 0, False)))
+        elif stmt.startswith("REPLACE INTO loader____checkpoint"):
+            self.pending.append(lambda: self.state["checkpoints"].__setitem__(params[:2], params[2:]))
+        elif stmt.startswith("INSERT"):
+            self.pending.append(lambda: self.state["inserts"].append(stmt))
+        elif stmt.startswith("SELECT") and stmt.endswith("FOR UPDATE"):
+            self.result = [self.state["checkpoints"][params]] if params in self.state["checkpoints"] else []
+        elif stmt.startswith("SELECT file_path"):
+            self.result = [(path,) + values for (table_name, path), values in self.state["checkpoints"].items()
+                           if table_name == params[0]]
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def commit(self):
+        for apply in self.pending:
+            apply()
+        self.pending = []
+        if self.on_commit is not None:
+            self.on_commit()
+
+    def close(self):
+        pass
+
+
+def use_file_connection(output_path):
+    database_utilities.build_database_connection = lambda db_params, set_db=True: FileConnection(output_path)
+
+
+def inserted_ids(output_path):
+    with open(output_path) as fp:
+        return [int(value) for value in re.findall(r'\("(\d+)", ', fp.read())]
+
+
+def claim_all(queue_path, worker):
+    queue = WorkQueue(queue_path)
+    claimed = []
+    task = queue.claim(worker)
+    while task is not None:
+        claimed.append(task.file_path)
+        queue.complete(task, worker, 1)
+        task = queue.claim(worker)
+    queue.close()
+    return claimed
+
+
+def run_worker(queue_path, output_path):
+    use_file_connection(output_path)
+    return QueueWorker(queue_path, {}, batch_size=1, poll_interval=0.1).run()
+
+
+def test_work_queue():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = WorkQueue(os.path.join(tmp_dir, "queue.db"), max_attempts=2)
+        queue.publish_table("pedals", SCHEMA, SETTINGS, ["a.csv", "b.csv"])
+        assert queue.table("pedals") == (SCHEMA, SETTINGS)
+        assert queue.counts() == {PENDING: 2, LEASED: 0, DONE: 0, FAILED: 0}
+
+        # The tasks are claimed in order
+        task_a = queue.claim("worker-1", 10, now=100.0)
+        task_b = queue.claim("worker-2", 10, now=100.0)
+        assert (task_a.file_path, task_a.attempts, task_b.file_path) == ("a.csv", 1, "b.csv")
+        assert queue.claim("worker-3", 10, now=105.0) is None
+        assert not queue.is_finished()
+
+        # A task whose lease expired is claimed again, and the worker that lost it can't complete it
+        task_a2 = queue.claim("worker-3", 10, now=111.0)
+        assert (task_a2.file_path, task_a2.attempts) == ("a.csv", 2)
+        assert not queue.complete(task_a, "worker-1", 3)
+        assert queue.complete(task_a2, "worker-3", 3)
+
+        # A failed task is pending again until it has used up its attempts
+        queue.fail(task_b, "worker-2", "Lost connection")
+        task_b2 = queue.claim("worker-2", 10)
+        assert task_b2.attempts == 2
+        queue.fail(task_b2, "worker-2", "Lost connection")
+        assert queue.counts() == {PENDING: 0, LEASED: 0, DONE: 1, FAILED: 1}
+        assert queue.is_finished()
+        assert queue.table_counts() == {"pedals": {DONE: 1, FAILED: 1}}
+
+        # An expired lease of a task without attempts left fails it
+        queue.publish_table("pedals", SCHEMA, SETTINGS, ["c.csv"])
+        queue.claim("worker-1", 10, now=100.0)
+        queue.claim("worker-1", 10, now=111.0)
+        assert queue.claim("worker-1", 10, now=122.0) is None
+        assert queue.counts()[FAILED] == 2
+
+        queue.clear()
+        assert queue.counts() == {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        queue.close()
+
+
+def test_work_queue_processes():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue_path = os.path.join(tmp_dir, "queue.db")
+        files = ["%03d.csv" % i for i in range(60)]
+        queue = WorkQueue(queue_path)
+        queue.publish_table("pedals", SCHEMA, SETTINGS, files)
+
+        # Each task is claimed by exactly one of the processes
+        with multiprocessing.get_context("spawn").Pool(4) as pool:
+            claimed = pool.starmap(claim_all, [(queue_path, "worker-%d" % i) for i in range(4)])
+        assert sorted([file_path for worker_files in claimed for file_path in worker_files]) == files
+        assert queue.counts()[DONE] == 60
+        queue.close()
+
+
+def test_distributed_load(monkeypatch):
+    files = ["./database_loader/test_data/test_data_1.csv",
+             "./database_loader/test_data/test_data_2.csv"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue_path = os.path.join(tmp_dir, "queue.db")
+        output_path = os.path.join(tmp_dir, "inserts.txt")
+        monkeypatch.setattr(database_utilities, "build_database_connection",
+                            lambda db_params, set_db=True: FileConnection(output_path))
+
+        num_tasks = coordinate_load("./database_loader/test_data/", ",", "|", "utf-8", ["True"], ["False"],
+                                    {"database-name": "test"}, queue_path,
+                                    discovery_params={"include": ["test_data_*.csv"]})
+        assert num_tasks == 2
+
+        queue = WorkQueue(queue_path)
+        schema, settings = queue.table("test_data")
+        assert schema['ID'] == DataType.int
+        assert settings["delimiter"] == ","
+
+        # A worker crashed holding the first file, whose lease has expired
+        crashed = queue.claim("crashed-worker", 1, now=0.0)
+        assert crashed.file_path in files
+        queue.close()
+
+        # The local worker processes load both files (claiming the crashed worker's file again)
+        with multiprocessing.get_context("spawn").Pool(2) as pool:
+            num_loaded = pool.starmap(run_worker, [(queue_path, output_path)] * 2)
+        assert sum(num_loaded) == 2
+
+        assert sorted(inserted_ids(output_path)) == [1, 2, 3, 4, 5, 6]
+        assert wait_for_load({}, queue_path) == {PENDING: 0, LEASED: 0, DONE: 2, FAILED: 0}
+
+
+def test_worker_lease_lost(monkeypatch):
+    file = "./database_loader/test_data/test_data_1.csv"
+    state = {"checkpoints": {}, "inserts": []}
+    connections = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue_path = os.path.join(tmp_dir, "queue.db")
+        monkeypatch.setattr(database_utilities, "build_database_connection",
+                            lambda db_params, set_db=True: connections.pop(0) if connections else
+                            CheckpointConnection(state))
+        coordinate_load("./database_loader/test_data/", ",", "|", "utf-8", ["True"], ["False"],
+                        {"database-name": "test"}, queue_path, discovery_params={"include": ["test_data_1.csv"]})
+
+        def pause_after_first_batch():
+            # Worker A pauses after its first batch until its lease expires, and worker B loads the rest of the file
+            if len(state["inserts"]) == 1 and not state.get("taken_over"):
+                state["taken_over"] = True
+                queue = WorkQueue(queue_path)
+                queue._execute("UPDATE queue_tasks SET lease_expires = 0")
+                queue.close()
+                assert QueueWorker(queue_path, {}, "worker-b", batch_size=1, poll_interval=0.1).run() == 1
+
+        # Worker A stops at its next batch, as the checkpoint has moved on since its last commit
+        connections.append(CheckpointConnection(state, pause_after_first_batch))
+        worker_a = QueueWorker(queue_path, {}, "worker-a", batch_size=1, poll_interval=0.1)
+        assert worker_a.run() == 0
+
+        assert sorted([int(value) for stmt in state["inserts"] for value in re.findall(r'\("(\d+)", ', stmt)]) == \
+            [1, 2, 3]
+        assert state["checkpoints"][("test_data", file)][1:] == (3, 3, True)
+        assert wait_for_load({}, queue_path) == {PENDING: 0, LEASED: 0, DONE: 1, FAILED: 0}
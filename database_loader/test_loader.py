@@ -1,4 +1,13 @@
+import subprocess
+import sys
+import tempfile
+import threading
+
+import pytest
+
+from database_loader import database_utilities, loader
 from database_loader.loader import table_name_from_filename, build_schema_from_file, build_schema_from_files
+from database_loader.testing_utilities import RecordingConnection, SCHEMA, FILES
 from database_loader.type_inference import DataType
 
 
@@ -19,6 +28,17 @@ def test_build_schema_from_file():
                       'Own': DataType.boolean}
 
 
+def test_build_schema_from_file_selected_columns():
+    filepath = "./database_loader/test_data/test_data_1.csv"
+    schema = build_schema_from_file(filepath, ",", "|", "utf-8", ["True"], ["False"],
+                                    column_params={"exclude": ["Pedal name", "Type of effect"]})
+    assert schema == {'ID': DataType.int, 'Manufacturer': DataType.string, 'Own': DataType.boolean}
+
+    schema = build_schema_from_file(filepath, ",", "|", "utf-8", ["True"], ["False"],
+                                    column_params={"include": ["Own", "ID"]})
+    assert schema == {'ID': DataType.int, 'Own': DataType.boolean}
+
+
 def test_build_schema_from_files():
     files = ["./database_loader/test_data/test_data_1.csv",
              "./database_loader/test_data/test_data_2.csv"]
@@ -29,3 +49,134 @@ def test_build_schema_from_files():
                       'Manufacturer': DataType.string,
                       'Type of effect': DataType.string,
                       'Own': DataType.boolean}
+
+
+def test_build_schema_from_files_with_statistics():
+    files = ["./database_loader/test_data/test_data_1.csv",
+             "./database_loader/test_data/test_data_2.csv"]
+
+    column_statistics = {}
+    schema = build_schema_from_files(files, ",", "|", "utf-8", ["True"], ["False"], column_statistics=column_statistics)
+    assert schema == build_schema_from_files(files, ",", "|", "utf-8", ["True"], ["False"])
+
+    assert column_statistics["ID"].count == 6
+    assert (column_statistics["ID"].min_int, column_statistics["ID"].max_int) == (1, 6)
+    assert column_statistics["ID"].is_unique()
+    assert column_statistics["Manufacturer"].max_length == len("Earthquaker Devices")
+    assert not column_statistics["Manufacturer"].is_unique()
+
+    # The profiles are gathered in the same pass and merged across the files
+    build_schema_from_files(files, ",", "|", "utf-8", ["True"], ["False"], column_statistics=column_statistics,
+                            profiled=True)
+    assert column_statistics["ID"].profile()["values"]["max"] == 6
+    assert column_statistics["Manufacturer"].profile()["distinct"] == 5
+    assert column_statistics["Manufacturer"].profile()["strings"] == {"min": "Boss", "max": "TC Electronic"}
+
+
+def test_build_schema_from_file_extended():
+    filepath = "./database_loader/test_data/purchases_1.csv"
+    inference_params = {"date-formats": ["%Y-%m-%d", "%d/%m/%Y"],
+                        "datetime-formats": ["%Y-%m-%d %H:%M:%S"],
+                        "decimals": True}
+
+    schema = build_schema_from_file(filepath, ",", "|", "utf-8", ["True"], ["False"],
+                                    inference_params=inference_params)
+    assert schema == {'ID': DataType.int,
+                      'Pedal': DataType.string,
+                      'Date bought': DataType.date,
+                      'Price': DataType.decimal,
+                      'Last played': DataType.datetime,
+                      'Notes': DataType.string}
+
+    # Blank cells don't abort the basic inference
+    schema = build_schema_from_file(filepath, ",", "|", "utf-8", ["True"], ["False"])
+    assert schema['ID'] == DataType.int
+    assert schema['Price'] == DataType.float
+    assert schema['Date bought'] == DataType.string
+
+
+def test_backend_module():
+    # Importing the loader doesn't import the PostgreSQL and Parquet backends (nor psycopg2 and pyarrow)
+    imported = subprocess.run([sys.executable, "-c", "import sys, database_loader.loader; "
+                               "print(' '.join(sorted(sys.modules)))"], capture_output=True, text=True, check=True)
+    modules = imported.stdout.split()
+    assert "database_loader.postgres_utilities" not in modules
+    assert "database_loader.parquet_writer" not in modules
+    assert "psycopg2" not in modules
+    assert "pyarrow" not in modules
+
+    assert loader.backend_module("mariadb") is database_utilities
+    assert loader.backend_module("parquet").__name__ == "database_loader.parquet_writer"
+    with pytest.raises(ValueError):
+        loader.backend_module("sqlite")
+
+
+def test_load_database_cleans_up_after_failure(monkeypatch):
+    def fail_to_load(table_name, *args):
+        raise ValueError("Failed to load %s" % table_name)
+
+    monkeypatch.setattr(loader, "load_table", fail_to_load)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with pytest.raises(ValueError):
+            loader.load_database("./database_loader/test_data/", ",", "|", "utf-8", ["True"], ["False"],
+                                 {"output-path": tmp_dir}, backend="parquet", memory_limit="1G",
+                                 discovery_params={"include": ["test_data_*.csv"]},
+                                 table_params={"test_data": {"memory-limit": "512M"}})
+
+    # The memory monitors of the load and of the table have been stopped
+    assert "memory-monitor" not in [thread.name for thread in threading.enumerate()]
+
+
+def test_load_database_table_without_memory_limit(monkeypatch, capsys):
+    monkeypatch.setattr(loader, "load_table", lambda *args: None)
+
+    # A table whose memory limit is disabled (memory-limit = false in a configuration file) has no budget to report
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        loader.load_database("./database_loader/test_data/", ",", "|", "utf-8", ["True"], ["False"],
+                             {"output-path": tmp_dir}, backend="parquet", memory_limit="1G",
+                             discovery_params={"include": ["test_data_*.csv"]},
+                             table_params={"test_data": {"memory-limit": None}})
+
+    assert "Logging error" not in capsys.readouterr().err
+
+
+class ClosingConnection(RecordingConnection):
+    """Connection that records whether it and its cursor have been closed."""
+
+    def __init__(self, committed, fail_on=None):
+        super().__init__(committed, fail_on)
+        self.closed = False
+        self.cursor_closed = False
+
+    def cursor(self):
+        connection = self
+
+        class Cursor(object):
+            def execute(self, stmt):
+                connection.execute(stmt)
+
+            def close(self):
+                connection.cursor_closed = True
+
+        return Cursor()
+
+    def close(self):
+        self.closed = True
+
+
+def test_insert_data_from_files_closes_connection(monkeypatch):
+    connection = ClosingConnection([], fail_on="INSERT")
+    monkeypatch.setattr(database_utilities, "build_database_connection", lambda db_params: connection)
+
+    # The connection opened for the load is closed when the load fails ...
+    with pytest.raises(ValueError):
+        loader.insert_data_from_files(FILES, ",", "|", "utf-8", {}, "pedals", SCHEMA, ["True"], ["False"])
+    assert connection.cursor_closed and connection.closed
+
+    # ... but a connection given to the load is left open
+    connection = ClosingConnection([], fail_on="INSERT")
+    with pytest.raises(ValueError):
+        loader.insert_data_from_files(FILES, ",", "|", "utf-8", {}, "pedals", SCHEMA, ["True"], ["False"],
+                                      connection=connection)
+    assert connection.cursor_closed and not connection.closed
@@ -0,0 +1,124 @@
+import tempfile
+
+import pytest
+
+from database_loader.deduplication import Deduplicator, MIN_PRESSURE_SPILL
+from database_loader.memory import parse_size, current_rss_bytes, estimate_row_bytes, MemoryBudget
+from database_loader.metrics import LoadMetrics, prometheus_text
+
+
+def test_parse_size():
+    assert parse_size(1024) == 1024
+    assert parse_size(1.5e9) == 1500000000
+    assert parse_size("512") == 512
+    assert parse_size("512M") == 512 * 2 ** 20
+    assert parse_size("2GB") == 2 * 2 ** 30
+    assert parse_size("1.5k") == 1536
+
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def test_current_rss_bytes():
+    assert current_rss_bytes() > 0
+
+
+def test_estimate_row_bytes():
+    assert estimate_row_bytes([]) == 0
+
+    small = estimate_row_bytes([{"a": "1"}])
+    large = estimate_row_bytes([{"a": "1" * 1000}])
+    assert 0 < small < large
+
+
+def test_memory_budget_sizing():
+    budget = MemoryBudget("1M")
+    assert budget.batch_size(1000, 1024) == 51
+    assert budget.batch_size(10, 1024) == 10
+    assert budget.batch_size(1000, 10 * 2 ** 20) == 1
+    assert budget.spill_size(10 ** 6, 1024) == 256
+    assert budget.queue_depth(100, 2 ** 20 // 100, num_queues=2) == 5
+    assert budget.worker_count(8, 2 ** 20) == 1
+
+    # Without a limit, the requested sizes are used
+    budget = MemoryBudget()
+    assert budget.batch_size(1000, 1024) == 1000
+    assert budget.worker_count(8, 2 ** 30) == 8
+
+
+def test_memory_budget_monitor():
+    budget = MemoryBudget(sample_interval=0.01)
+    budget.start()
+    budget.stop()
+
+    assert budget.high_water_bytes > 0
+    assert not budget.under_pressure
+    assert not budget.relieve_pressure()
+    assert budget.report() == {"budget_bytes": None, "high_water_bytes": budget.high_water_bytes}
+
+
+def test_memory_budget_pressure(monkeypatch):
+    rss = [850]
+    monkeypatch.setattr("database_loader.memory.current_rss_bytes", lambda: rss[0])
+    budget = MemoryBudget(1000)
+
+    budget.sample()
+    assert not budget.under_pressure
+    rss[0] = 900
+    budget.sample()
+    assert budget.under_pressure
+
+    # After a stage has released memory, the pressure is only applied again if the RSS grows further
+    assert not budget.relieve_pressure()
+    rss[0] = 920
+    budget.sample()
+    assert not budget.under_pressure
+    rss[0] = 950
+    budget.sample()
+    assert budget.under_pressure
+
+    # The budget is hard, so exceeding it once memory has been released fails the load ...
+    rss[0] = 1100
+    with pytest.raises(MemoryError):
+        budget.relieve_pressure()
+    assert budget.num_over_budget == 1
+
+    # ... unless it is soft, in which case it is only counted
+    budget.soft = True
+    budget.sample()
+    assert not budget.relieve_pressure()
+    assert budget.num_over_budget == 2
+
+    # The pressure is released below the low watermark and applied again at the soft limit
+    rss[0] = 700
+    budget.sample()
+    rss[0] = 900
+    budget.sample()
+    assert budget.under_pressure
+
+
+class PressureBudget(object):
+    """Budget that is always under pressure."""
+
+    under_pressure = True
+
+    def relieve_pressure(self):
+        return True
+
+
+def test_deduplicator_spills_under_pressure():
+    rows = [{"id": str(i % (MIN_PRESSURE_SPILL * 2))} for i in range(MIN_PRESSURE_SPILL * 3)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        deduplicator = Deduplicator(["id"], spill_path=tmp_dir, memory_budget=PressureBudget())
+        assert len(list(deduplicator.deduplicate(rows))) == MIN_PRESSURE_SPILL * 2
+        assert deduplicator.num_runs == 3
+
+
+def test_metrics_memory_report():
+    metrics = LoadMetrics()
+    metrics.set_memory({"budget_bytes": 2048, "high_water_bytes": 1024})
+    report = metrics.report()
+
+    assert report["memory"] == {"budget_bytes": 2048, "high_water_bytes": 1024}
+    assert "loader_memory_high_water_bytes 1024.0" in prometheus_text(report)
@@ -0,0 +1,129 @@
+import pytest
+
+from database_loader import database_utilities
+from database_loader.loader import insert_data_from_files
+from database_loader.merge import KeyFilter, TableMerger, check_merge_params, normalise_key_value
+from database_loader.type_inference import DataType
+
+SCHEMA = {'ID': DataType.int,
+          'Pedal name': DataType.string,
+          'Manufacturer': DataType.string,
+          'Type of effect': DataType.string,
+          'Own': DataType.boolean}
+
+
+class DuplicateKeyError(Exception):
+    pass
+
+
+class TableCursor(object):
+    """Cursor over a table with a unique key, which records the statements it executes."""
+
+    def __init__(self, keys=None):
+        self.keys = keys or []
+        self.statements = []
+        self.results = []
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+        if stmt.startswith("SELECT COUNT(*)"):
+            self.results = [(len(self.keys),)]
+        elif stmt.startswith("SELECT"):
+            self.results = [(key,) for key in self.keys]
+        elif stmt.startswith("INSERT INTO pedals (") and "ON DUPLICATE KEY" not in stmt:
+            if any(['("%d", ' % key in stmt for key in self.keys]):
+                raise DuplicateKeyError("Duplicate entry")
+
+    def fetchone(self):
+        return self.results[0]
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_key_filter():
+    key_filter = KeyFilter(1000)
+    assert not key_filter.add(1)
+    assert key_filter.add(1)
+
+    for key in range(1000):
+        key_filter.add((key, "a"))
+
+    # There are no false negatives and about 1% of false positives
+    assert all([(key, "a") in key_filter for key in range(1000)])
+    assert len([key for key in range(1000, 11000) if (key, "a") in key_filter]) < 300
+
+
+def test_normalise_key_value():
+    assert normalise_key_value("0042", DataType.int) == normalise_key_value(42, DataType.int) == 42
+    assert normalise_key_value("1.50", DataType.float) == 1.5
+    assert normalise_key_value("abc", DataType.string) == "abc"
+    assert normalise_key_value(" ", DataType.int) is None
+    assert normalise_key_value(None, DataType.string) is None
+
+
+def test_check_merge_params():
+    check_merge_params(SCHEMA, {"key": ["ID"]})
+
+    with pytest.raises(ValueError, match="non-empty list"):
+        check_merge_params(SCHEMA, {"key": "ID"})
+    with pytest.raises(ValueError, match="Unknown merge key columns"):
+        check_merge_params(SCHEMA, {"key": ["Serial"]})
+
+
+def test_table_merger(monkeypatch):
+    monkeypatch.setattr(database_utilities, "duplicate_key_errors", lambda: (DuplicateKeyError,))
+
+    cursor = TableCursor(keys=[1, 2])
+    merger = TableMerger("pedals", SCHEMA, ["ID"], stage_rows=3)
+    merger.load_keys(cursor)
+    cursor.statements = []
+
+    # The new keys are inserted and the loaded keys (and a repeated new key) are upserted
+    rows = [["1", "a"], ["3", "b"], ["3", "c"], ["", "d"]]
+    merger.execute(cursor, ["ID", "Pedal name"], rows, [merger.row_key({"ID": row[0]}) for row in rows])
+    assert cursor.statements == ['INSERT INTO pedals (ID, Pedal_name) VALUES (3, b), (, d);',
+                                 'INSERT INTO pedals (ID, Pedal_name) VALUES (1, a), (3, c) '
+                                 'ON DUPLICATE KEY UPDATE Pedal_name = VALUES(Pedal_name);']
+    assert (merger.num_inserted, merger.num_upserted, merger.num_staged) == (2, 2, 0)
+
+    # A batch with at least stage_rows rows to upsert is staged and merged
+    cursor.statements = []
+    rows = [["1", "e"], ["2", "f"], ["3", "g"]]
+    merger.execute(cursor, ["ID", "Pedal name"], rows, [merger.row_key({"ID": row[0]}) for row in rows])
+    assert cursor.statements[0].startswith("CREATE TEMPORARY TABLE pedals____STAGE")
+    assert cursor.statements[1:] == ['INSERT INTO pedals____STAGE (ID, Pedal_name) VALUES (1, e), (2, f), (3, g);',
+                                     'INSERT INTO pedals (ID, Pedal_name) SELECT ID, Pedal_name FROM pedals____STAGE '
+                                     'ORDER BY pedals____STAGE____ID ON DUPLICATE KEY UPDATE '
+                                     'Pedal_name = VALUES(Pedal_name);',
+                                     'DELETE FROM pedals____STAGE;']
+    assert merger.num_staged == 3
+
+    # A key the filter doesn't know of is upserted when the INSERT fails
+    cursor.keys.append(4)
+    cursor.statements = []
+    merger.execute(cursor, ["ID", "Pedal name"], [['"4"', "h"]], [4])
+    assert len(cursor.statements) == 2
+    assert cursor.statements[1].endswith("ON DUPLICATE KEY UPDATE Pedal_name = VALUES(Pedal_name);")
+
+
+def test_insert_data_from_files_merged(monkeypatch):
+    monkeypatch.setattr(database_utilities, "duplicate_key_errors", lambda: (DuplicateKeyError,))
+
+    cursor = TableCursor(keys=[2, 5])
+    merger = TableMerger("pedals", SCHEMA, ["ID"])
+    num_rows = insert_data_from_files(["./database_loader/test_data/test_data_1.csv",
+                                       "./database_loader/test_data/test_data_2.csv"], ",", "|", "utf-8", {}, "pedals",
+                                      SCHEMA, ["True"], ["False"], connection=cursor, merger=merger)
+
+    assert num_rows == 6
+    assert (merger.num_inserted, merger.num_upserted) == (4, 2)
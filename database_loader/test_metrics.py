@@ -0,0 +1,61 @@
+import json
+import os
+import tempfile
+
+from database_loader.loader import build_schema_from_files
+from database_loader.metrics import LoadMetrics, prometheus_text, escape_label_value, rate
+
+
+def test_rate():
+    assert rate(10, 2.0) == 5.0
+    assert rate(10, 0.0) == 0.0
+
+
+def test_load_metrics_report():
+    metrics = LoadMetrics()
+    metrics.add_time("glob", 0.5)
+    metrics.add_time("parse", 1.0, "table1", "file1.csv")
+    metrics.add_time("insert", 3.0, "table1", "file1.csv")
+    metrics.add_rows(8, "table1", "file1.csv")
+    metrics.add_bytes(100, "table1", "file1.csv")
+    metrics.set_table_seconds("table1", 4.0)
+    metrics.finish()
+
+    report = metrics.report()
+    assert report["stages"]["glob"] == 0.5
+    assert report["rows"] == 8
+    assert report["bytes"] == 100
+    assert report["tables"]["table1"]["rows_per_second"] == 2.0
+    assert report["tables"]["table1"]["files"]["file1.csv"]["stages"]["insert"] == 3.0
+    assert report["tables"]["table1"]["files"]["file1.csv"]["rows_per_second"] == 2.0
+
+
+def test_build_schema_from_files_metrics():
+    files = ["./database_loader/test_data/test_data_1.csv",
+             "./database_loader/test_data/test_data_2.csv"]
+
+    metrics = LoadMetrics()
+    build_schema_from_files(files, ",", "|", "utf-8", ["True"], ["False"], metrics, "pedals")
+
+    assert set(metrics.report()["tables"]["pedals"]["files"].keys()) == set(files)
+    assert metrics.report()["tables"]["pedals"]["stages"]["schema-inference"] > 0
+
+
+def test_write_json_and_prometheus():
+    metrics = LoadMetrics()
+    metrics.add_time("commit", 0.25, "table1")
+    metrics.add_rows(3, "table1")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "metrics.json")
+        metrics.write_json(json_path)
+        with open(json_path) as fp:
+            assert json.load(fp)["tables"]["table1"]["rows"] == 3
+
+    text = prometheus_text(metrics.report())
+    assert 'loader_table_stage_seconds{table="table1",stage="commit"} 0.25' in text
+    assert 'loader_table_rows{table="table1"} 3.0' in text
+
+
+def test_escape_label_value():
+    assert escape_label_value('a"b\\c') == 'a\\"b\\\\c'
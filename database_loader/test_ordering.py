@@ -0,0 +1,11 @@
+from database_loader.ordering import key_order, file_order
+
+
+def test_key_order():
+    values = ["10", "b", "2", "a", "-1"]
+    assert sorted(values, key=key_order) == ["-1", "2", "10", "a", "b"]
+
+
+def test_file_order():
+    files = ["m001_dob_10.csv", "m001_dob_2.csv", "m001_dob_1.csv"]
+    assert sorted(files, key=file_order) == ["m001_dob_1.csv", "m001_dob_2.csv", "m001_dob_10.csv"]
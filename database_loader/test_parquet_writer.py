@@ -0,0 +1,75 @@
+import datetime
+import decimal
+import os
+import tempfile
+
+import pyarrow.parquet
+
+from database_loader.loader import write_data_from_files
+from database_loader.parquet_writer import arrow_schema, create_table, write_data
+from database_loader.type_inference import DataType, build_temporal_detectors
+
+
+def test_arrow_schema():
+    schema = {"field-1": DataType.int,
+              "field2": DataType.float,
+              "field3": DataType.string,
+              "field4": DataType.boolean}
+
+    assert arrow_schema(schema) == pyarrow.schema([("field_1", pyarrow.int64()),
+                                                   ("field2", pyarrow.float64()),
+                                                   ("field3", pyarrow.string()),
+                                                   ("field4", pyarrow.bool_())])
+
+
+def test_write_data():
+    schema = {"ID": DataType.int, "Name": DataType.string, "Own": DataType.boolean}
+    rows = ({"ID": str(i), "Name": "pedal %d" % i, "Own": "True"} for i in range(5))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_params = {"output-path": tmp_dir, "row-group-size": 2}
+        create_table(db_params, "MYTABLE", schema)
+
+        assert write_data(db_params, "MYTABLE", schema, rows, ["True"], ["False"]) == 5
+
+        parquet_file = pyarrow.parquet.ParquetFile(os.path.join(tmp_dir, "MYTABLE", "part-00000.parquet"))
+        assert parquet_file.metadata.num_row_groups == 3
+        assert parquet_file.read().column("ID").to_pylist() == [0, 1, 2, 3, 4]
+
+
+def test_write_data_from_files():
+    files = ["./database_loader/test_data/test_data_1.csv",
+             "./database_loader/test_data/test_data_2.csv"]
+    schema = {'ID': DataType.int,
+              'Pedal name': DataType.string,
+              'Manufacturer': DataType.string,
+              'Type of effect': DataType.string,
+              'Own': DataType.boolean}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_params = {"output-path": tmp_dir}
+        create_table(db_params, "pedals", schema)
+
+        num_rows = write_data_from_files(files, ",", "|", "utf-8", db_params, "pedals", schema, ["True"], ["False"])
+        assert num_rows == 6
+
+        table = pyarrow.parquet.read_table(os.path.join(tmp_dir, "pedals"))
+        assert sorted(table.column("ID").to_pylist()) == [1, 2, 3, 4, 5, 6]
+
+
+def test_write_data_nulls_and_dates():
+    schema = {"ID": DataType.int, "Bought": DataType.date, "Price": DataType.decimal}
+    rows = [{"ID": "1", "Bought": "03/02/2019", "Price": "99.00"},
+            {"ID": "", "Bought": "", "Price": ""}]
+    detectors = build_temporal_detectors(schema, ["True"], ["False"], {"date-formats": ["%d/%m/%Y"]})
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_params = {"output-path": tmp_dir}
+        create_table(db_params, "MYTABLE", schema)
+        assert write_data(db_params, "MYTABLE", schema, rows, ["True"], ["False"],
+                          temporal_detectors=detectors) == 2
+
+        table = pyarrow.parquet.read_table(os.path.join(tmp_dir, "MYTABLE"))
+        assert table.column("ID").to_pylist() == [1, None]
+        assert table.column("Bought").to_pylist() == [datetime.date(2019, 2, 3), None]
+        assert table.column("Price").to_pylist() == [decimal.Decimal("99.00"), None]
@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+
+from database_loader.loader import build_schema_from_file
+from database_loader.parse_cache import ParseCache
+from database_loader.type_inference import DataType
+
+
+def test_parse_cache_schema():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, "pedals_1.csv")
+        shutil.copy("./database_loader/test_data/test_data_1.csv", filepath)
+        cache = ParseCache(os.path.join(tmp_dir, "cache"))
+
+        schema = build_schema_from_file(filepath, ",", "|", "utf-8", ["True"], ["False"], parse_cache=cache)
+        assert schema["Own"] == DataType.boolean
+        assert cache.num_schemas_read == 0
+
+        assert build_schema_from_file(filepath, ",", "|", "utf-8", ["True"], ["False"], parse_cache=cache) == schema
+        assert cache.num_schemas_read == 1
+
+        # The schema is keyed by the inference settings ...
+        schema = build_schema_from_file(filepath, ",", "|", "utf-8", ["Yes"], ["No"], parse_cache=cache)
+        assert schema["Own"] == DataType.string
+        assert cache.num_schemas_read == 1
+
+        # ... the column selection ...
+        schema = build_schema_from_file(filepath, ",", "|", "utf-8", ["True"], ["False"],
+                                        column_params={"include": ["ID"]}, parse_cache=cache)
+        assert list(schema.keys()) == ["ID"]
+        assert cache.num_schemas_read == 1
+
+        # ... and the file's fingerprint
+        with open(filepath, "a") as fp:
+            fp.write("4,Flint,Strymon,Reverb,Maybe\n")
+        schema = build_schema_from_file(filepath, ",", "|", "utf-8", ["True"], ["False"], parse_cache=cache)
+        assert schema["Own"] == DataType.string
+        assert cache.num_schemas_read == 1
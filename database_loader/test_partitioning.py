@@ -0,0 +1,46 @@
+import tempfile
+
+import pytest
+
+from database_loader import database_utilities
+from database_loader.loader import insert_partitioned_data_from_files
+from database_loader.rejects import RejectWriter
+from database_loader.testing_utilities import RecordingConnection, inserted_ids, SCHEMA, FILES
+
+def test_insert_partitioned_data_from_files(monkeypatch):
+    committed = []
+    monkeypatch.setattr(database_utilities, "build_database_connection",
+                        lambda db_params: RecordingConnection(committed))
+
+    num_rows = insert_partitioned_data_from_files(FILES, ",", "|", "utf-8", {}, "pedals", SCHEMA, ["True"], ["False"],
+                                                  {"column": "ID", "partitions": 4, "writers": 2}, batch_size=2)
+    assert num_rows == 6
+
+    # Each writer inserts the rows of its own partitions (ID % 4 % 2)
+    ids_per_writer = {}
+    for thread_name, stmt in committed:
+        ids_per_writer.setdefault(thread_name, []).extend(inserted_ids(stmt))
+    assert ids_per_writer == {"partition-writer-0": [2, 4, 6], "partition-writer-1": [1, 3, 5]}
+
+
+def test_insert_partitioned_data_from_files_rejects(monkeypatch):
+    committed = []
+    monkeypatch.setattr(database_utilities, "build_database_connection",
+                        lambda db_params: RecordingConnection(committed, fail_on="Timeline"))
+    monkeypatch.setattr(database_utilities, "row_errors", lambda: (ValueError,))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rejects = RejectWriter(tmp_dir, "pedals", max_error_rate=0.5)
+        num_rows = insert_partitioned_data_from_files(FILES, ",", "|", "utf-8", {}, "pedals", SCHEMA, ["True"],
+                                                      ["False"], {"column": "ID", "method": "range", "bounds": [4]},
+                                                      rejects=rejects)
+        rejects.close()
+
+        assert num_rows == 5
+        assert rejects.num_rejected == 1
+        assert sorted([i for _, stmt in committed for i in inserted_ids(stmt)]) == [1, 3, 4, 5, 6]
+
+    # Without a RejectWriter, the writer's error fails the load
+    with pytest.raises(ValueError, match="Rejected by the database"):
+        insert_partitioned_data_from_files(FILES, ",", "|", "utf-8", {}, "pedals", SCHEMA, ["True"], ["False"],
+                                           {"column": "ID", "partitions": 2}, batch_size=1)
@@ -0,0 +1,73 @@
+import struct
+
+from database_loader.postgres_utilities import create_table_statement, copy_statement, encode_csv_rows, \
+    encode_binary_rows, CopyStream, BINARY_COPY_HEADER, BINARY_COPY_TRAILER, BINARY_COPY_NULL
+from database_loader.type_inference import DataType, build_temporal_detectors
+
+
+def test_create_table_statement():
+    schema = {"field1": DataType.int,
+              "field2": DataType.float,
+              "field3": DataType.string,
+              "field4": DataType.boolean}
+
+    stmt = create_table_statement("MYTABLE", schema)
+    assert stmt == "CREATE TABLE MYTABLE (MYTABLE____ID BIGSERIAL PRIMARY KEY, field1 BIGINT, " \
+                   "field2 DOUBLE PRECISION, field3 TEXT, field4 BOOLEAN);"
+
+
+def test_copy_statement():
+    schema = {"field-1": DataType.int, "field-2": DataType.string}
+    assert copy_statement("MYTABLE", schema, "csv") == \
+        "COPY MYTABLE (field_1, field_2) FROM STDIN WITH (FORMAT csv, FORCE_NULL (field_1))"
+    assert copy_statement("MYTABLE", schema, "binary") == \
+        "COPY MYTABLE (field_1, field_2) FROM STDIN WITH (FORMAT binary)"
+
+
+def test_encode_csv_rows():
+    schema = {"field1": DataType.int, "field2": DataType.string, "field3": DataType.boolean}
+    rows = [{"field1": "1", "field2": "a, \"b\"", "field3": "True"},
+            {"field1": "2", "field2": "c", "field3": "False"}]
+
+    assert encode_csv_rows(rows, schema, ["True"], ["False"]) == b'"1","a, ""b""","t"\n"2","c","f"\n'
+
+
+def test_encode_binary_rows():
+    schema = {"field1": DataType.int, "field2": DataType.float, "field3": DataType.boolean, "field4": DataType.string}
+    rows = [{"field1": "7", "field2": "1.5", "field3": "False", "field4": "ab"}]
+
+    expected = struct.pack(">h", 4) + struct.pack(">iq", 8, 7) + struct.pack(">id", 8, 1.5) + \
+        struct.pack(">i?", 1, False) + struct.pack(">i", 2) + b"ab"
+    assert encode_binary_rows(rows, schema, ["True"], ["False"]) == expected
+
+
+def test_encode_binary_rows_nulls_and_dates():
+    schema = {"field1": DataType.int, "field2": DataType.date, "field3": DataType.datetime}
+    rows = [{"field1": "", "field2": "2000-01-02", "field3": "2000-01-01 00:00:01"}]
+
+    expected = struct.pack(">h", 3) + BINARY_COPY_NULL + struct.pack(">ii", 4, 1) + struct.pack(">iq", 8, 1000000)
+    assert encode_binary_rows(rows, schema, ["True"], ["False"]) == expected
+
+
+def test_encode_csv_rows_nulls_and_dates():
+    schema = {"field1": DataType.int, "field2": DataType.date}
+    rows = [{"field1": "", "field2": "02/01/2000"}]
+    detectors = build_temporal_detectors(schema, ["True"], ["False"], {"date-formats": ["%d/%m/%Y"]})
+
+    assert encode_csv_rows(rows, schema, ["True"], ["False"], detectors) == b'"","2000-01-02"\n'
+
+
+def test_copy_stream():
+    schema = {"field1": DataType.int}
+    rows = ({"field1": str(i)} for i in range(3))
+
+    stream = CopyStream(rows, schema, ["True"], ["False"], "binary")
+    data = b""
+    chunk = stream.read(5)
+    while len(chunk) > 0:
+        data += chunk
+        chunk = stream.read(5)
+
+    assert data.startswith(BINARY_COPY_HEADER)
+    assert data.endswith(BINARY_COPY_TRAILER)
+    assert stream.num_rows == 3
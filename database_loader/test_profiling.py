@@ -0,0 +1,69 @@
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+from database_loader.profiling import TableProfiler, collapse_stack
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_collapse_stack():
+    stack = collapse_stack(sys._getframe())
+    assert stack.split(";")[-1].startswith("test_profiling.py:test_collapse_stack:")
+
+    stack = collapse_stack(sys._getframe(), "Writer 1;a")
+    assert stack.startswith("Writer_1_a;")
+
+
+def test_table_profiler():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        profiler = TableProfiler(tmp_dir, ["table1"])
+
+        with profiler.profile("table1"):
+            busy_wait(0.05)
+
+        with profiler.profile("table2"):
+            busy_wait(0.01)
+
+        # Only cProfile runs by default
+        assert sorted(os.listdir(tmp_dir)) == ["table1.pstats"]
+
+        stats = pstats.Stats(os.path.join(tmp_dir, "table1.pstats"))
+        assert any([func[2] == "busy_wait" for func in stats.stats.keys()])
+
+
+def test_table_profiler_sampling():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        profiler = TableProfiler(tmp_dir, sample_interval=0.001, mode="sampling")
+
+        # The stacks of the other threads are sampled too
+        with profiler.profile("table1"):
+            worker = threading.Thread(target=busy_wait, args=(0.05,), name="worker-1")
+            worker.start()
+            busy_wait(0.05)
+            worker.join()
+
+        assert os.listdir(tmp_dir) == ["table1.collapsed"]
+
+        with open(os.path.join(tmp_dir, "table1.collapsed")) as fp:
+            stacks = [line.rsplit(" ", 1)[0] for line in fp]
+        assert any([stack.startswith("MainThread;") and "busy_wait" in stack for stack in stacks])
+        assert any([stack.startswith("worker-1;") and "busy_wait" in stack for stack in stacks])
+        assert not any([stack.startswith("stack-sampler;") for stack in stacks])
+
+    with pytest.raises(ValueError, match="Unknown profile mode"):
+        TableProfiler(mode="perf")
+
+
+def test_table_profiler_disabled():
+    profiler = TableProfiler()
+    assert not profiler.enabled_for("table1")
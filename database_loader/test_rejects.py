@@ -0,0 +1,202 @@
+import csv
+import os
+import tempfile
+
+import pyarrow.parquet
+import pytest
+
+from database_loader.checkpoints import FileCheckpoint
+from database_loader.database_utilities import mariadb_connector
+from database_loader.loader import write_data_from_files, insert_data_from_files
+from database_loader.parquet_writer import create_table
+from database_loader.rejects import RejectWriter, bisect_execute, reject_file_path
+from database_loader.testing_utilities import RecordingConnection, inserted_ids
+from database_loader.type_inference import DataType, check_values
+
+SCHEMA = {'ID': DataType.int,
+          'Pedal name': DataType.string,
+          'Manufacturer': DataType.string,
+          'Type of effect': DataType.string,
+          'Own': DataType.boolean}
+
+
+def read_rejects(path):
+    with open(path, encoding="utf-8", newline="") as fp:
+        return list(csv.reader(fp))
+
+
+def test_check_values():
+    row = {'ID': '1', 'Pedal name': 'TS-808', 'Manufacturer': 'Ibanez', 'Type of effect': '', 'Own': 'True'}
+    check_values(SCHEMA, row, ["True"], ["False"])
+
+    # NULLs are allowed in any column
+    check_values(SCHEMA, dict(row, ID=''), ["True"], ["False"])
+
+    with pytest.raises(ValueError, match="Invalid int value of ID: 1.5"):
+        check_values(SCHEMA, dict(row, ID='1.5'), ["True"], ["False"])
+
+    with pytest.raises(ValueError):
+        check_values(SCHEMA, dict(row, Own='Maybe'), ["True"], ["False"])
+
+    with pytest.raises(ValueError):
+        check_values({'Price': DataType.decimal}, {'Price': '1.2.3'}, ["True"], ["False"])
+
+    with pytest.raises(ValueError):
+        check_values({'Date': DataType.date}, {'Date': '2019-02-30'}, ["True"], ["False"])
+
+
+def test_reject_writer():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rejects = RejectWriter(tmp_dir, "pedals", max_error_rate=0.5)
+        rejects.accept(2)
+        rejects.reject("pedals_1.csv", 3, ["x", "y"], "Bad value")
+        rejects.check_error_rate(final=True)
+        rejects.close()
+
+        assert rejects.path == reject_file_path(tmp_dir, "pedals")
+        assert read_rejects(rejects.path) == [["file", "row", "reason", "values..."],
+                                              ["pedals_1.csv", "3", "Bad value", "x", "y"]]
+
+        # A resumed load appends to the reject file
+        rejects = RejectWriter(tmp_dir, "pedals", max_error_rate=0.5, append=True)
+        rejects.reject("pedals_1.csv", 4, ["z"], "Bad value")
+        rejects.close()
+        assert len(read_rejects(rejects.path)) == 3
+
+
+def test_reject_writer_discard_replayed():
+    files = ["./database_loader/test_data/rejects/pedals_1.csv"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rejects = RejectWriter(tmp_dir, "pedals", max_error_rate=0.75)
+        insert_data_from_files(files, ",", "|", "utf-8", {}, "pedals", SCHEMA, ["True"], ["False"], rejects=rejects,
+                               connection=RecordingConnection([]))
+        rejects.reject("other.csv", 7, [], "Bad value")
+        rejects.close()
+
+        # Resuming after row 2 reads rows 3 to 5 again, so only their rejects are replaced
+        committed = []
+        file_checkpoints = {files[0]: FileCheckpoint(110, 2, 1, False)}
+        rejects = RejectWriter(tmp_dir, "pedals", max_error_rate=0.75, append=True)
+        rejects.discard_replayed(files, file_checkpoints)
+        num_rows = insert_data_from_files(files, ",", "|", "utf-8", {}, "pedals", SCHEMA, ["True"], ["False"],
+                                          file_checkpoints=file_checkpoints, rejects=rejects,
+                                          connection=RecordingConnection(committed))
+        rejects.close()
+
+        assert num_rows == 1
+        assert [value for _, stmt in committed for value in inserted_ids(stmt)] == [5]
+        rows = read_rejects(rejects.path)
+        assert [(row[0], row[1]) for row in rows[1:]] == [(files[0], "2"), ("other.csv", "7"), (files[0], "3"),
+                                                         (files[0], "4")]
+
+
+def test_reject_writer_error_rate():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rejects = RejectWriter(tmp_dir, "pedals", max_error_rate=0.1)
+        rejects.accept(5)
+        rejects.reject("pedals_1.csv", 6, [], "Bad value")
+
+        # The rate is only checked during the load once enough rows have been read
+        rejects.check_error_rate()
+
+        with pytest.raises(ValueError):
+            rejects.check_error_rate(final=True)
+
+
+def test_bisect_execute():
+    executed = []
+    failed = []
+
+    def execute(items):
+        if any([item < 0 for item in items]):
+            raise RuntimeError("Bad item")
+        executed.extend(items)
+
+    def on_failure(item, e):
+        failed.append(item)
+
+    items = [1, 2, -3, 4, 5, 6, -7, 8]
+    assert bisect_execute(execute, items, on_failure, (RuntimeError,)) == 6
+    assert executed == [1, 2, 4, 5, 6, 8]
+    assert failed == [-3, -7]
+
+    assert bisect_execute(execute, [], on_failure, (RuntimeError,)) == 0
+
+
+def test_write_data_from_files_with_rejects():
+    files = ["./database_loader/test_data/rejects/pedals_1.csv"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_params = {"output-path": tmp_dir}
+        create_table(db_params, "pedals", SCHEMA)
+
+        rejects = RejectWriter(tmp_dir, "pedals", max_error_rate=0.75)
+        num_rows = write_data_from_files(files, ",", "|", "utf-8", db_params, "pedals", SCHEMA, ["True"], ["False"],
+                                         rejects=rejects)
+        rejects.check_error_rate(final=True)
+        rejects.close()
+
+        assert num_rows == 2
+        assert rejects.num_loaded == 2
+        table = pyarrow.parquet.read_table(os.path.join(tmp_dir, "pedals"))
+        assert table.column("ID").to_pylist() == [1, 5]
+
+        rows = read_rejects(rejects.path)
+        assert [row[1] for row in rows[1:]] == ["2", "3", "4"]
+        assert rows[3][2] == "Expected 5 fields, found 3"
+
+
+def test_insert_data_from_files_deduplicated_with_rejects():
+    files = ["./database_loader/test_data/rejects/pedals_1.csv"] * 2
+    committed = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rejects = RejectWriter(tmp_dir, "pedals", max_error_rate=0.75)
+        num_rows = insert_data_from_files(files, ",", "|", "utf-8", {}, "pedals", SCHEMA, ["True"], ["False"],
+                                          dedup_params={"key": ["ID"]}, rejects=rejects,
+                                          connection=RecordingConnection(committed))
+        rejects.close()
+
+        # Each row inserted is accepted once
+        assert num_rows == 2
+        assert rejects.num_loaded == 2
+        assert sorted([value for _, stmt in committed for value in inserted_ids(stmt)]) == [1, 5]
+
+
+class FailingConnection(RecordingConnection):
+    """Connection whose INSERT statements with a row of the given ID raise the given error."""
+
+    def __init__(self, committed, failing_id, error):
+        super().__init__(committed)
+        self.failing_id = failing_id
+        self.error = error
+
+    def execute(self, stmt):
+        if self.failing_id in inserted_ids(stmt):
+            raise self.error("Statement failed")
+        super().execute(stmt)
+
+
+def test_insert_data_from_files_database_errors():
+    files = ["./database_loader/test_data/test_data_1.csv"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # A row the database rejects for its values is quarantined ...
+        committed = []
+        rejects = RejectWriter(tmp_dir, "pedals", max_error_rate=0.5)
+        num_rows = insert_data_from_files(files, ",", "|", "utf-8", {}, "pedals", SCHEMA, ["True"], ["False"],
+                                          rejects=rejects,
+                                          connection=FailingConnection(committed, 2, mariadb_connector().DataError))
+        rejects.close()
+        assert num_rows == 2
+        assert rejects.num_rejected == 1
+
+        # ... but an error of the connection fails the load
+        rejects = RejectWriter(tmp_dir, "pedals", max_error_rate=0.5)
+        with pytest.raises(mariadb_connector().OperationalError):
+            insert_data_from_files(files, ",", "|", "utf-8", {}, "pedals", SCHEMA, ["True"], ["False"],
+                                   rejects=rejects,
+                                   connection=FailingConnection([], 2, mariadb_connector().OperationalError))
+        rejects.close()
+        assert rejects.num_rejected == 0
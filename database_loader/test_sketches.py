@@ -0,0 +1,70 @@
+import random
+
+from database_loader.sketches import HyperLogLog, QuantileSketch, histogram_quantile
+
+
+def test_hyperloglog():
+    sketch1 = HyperLogLog()
+    sketch2 = HyperLogLog()
+    assert sketch1.estimate() == 0
+
+    for i in range(20000):
+        sketch1.add(str(i))
+        sketch1.add(str(i))
+    for i in range(10000, 40000):
+        sketch2.add(str(i))
+
+    # Within four standard errors (1.6% each)
+    assert abs(sketch1.estimate() - 20000) < 0.065 * 20000
+    assert abs(sketch2.estimate() - 30000) < 0.065 * 30000
+    assert abs(sketch1.merge(sketch2).estimate() - 40000) < 0.065 * 40000
+
+    # Small cardinalities are counted (almost) exactly
+    sketch = HyperLogLog()
+    for value in ["Boss", "Strymon", "Boss", "Ibanez"]:
+        sketch.add(value)
+    assert sketch.estimate() == 3
+
+
+def test_quantile_sketch():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(3, 1) for _ in range(5000)] + [0.0] * 100 + \
+        [-rng.lognormvariate(1, 1) for _ in range(500)]
+
+    sketch1 = QuantileSketch()
+    sketch2 = QuantileSketch()
+    for i, value in enumerate(values):
+        (sketch1 if i % 2 == 0 else sketch2).add(value)
+    sketch = sketch1.merge(sketch2)
+
+    assert sketch.count == len(values)
+    assert (sketch.min, sketch.max) == (min(values), max(values))
+
+    values.sort()
+    for q in [0.01, 0.05, 0.5, 0.9, 0.99]:
+        expected = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - expected) <= 0.011 * abs(expected)
+    assert sketch.quantile(0.0) == values[0]
+    assert sketch.quantile(1.0) == values[-1]
+
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_quantile_sketch_non_finite():
+    sketch = QuantileSketch()
+    for value in [float("nan"), 2.0, float("inf"), float("-inf"), 10 ** 400, 5]:
+        sketch.add(value)
+    sketch = sketch.merge(QuantileSketch())
+
+    # The values that aren't finite are only counted
+    assert (sketch.count, sketch.num_non_finite) == (2, 4)
+    assert (sketch.min, sketch.max) == (2.0, 5.0)
+    assert abs(sketch.quantile(0.5) - 2.0) <= 0.02
+
+
+def test_histogram_quantile():
+    counts = {3: 4, 8: 5, 20: 1}
+    assert histogram_quantile(counts, 0.0) == 3
+    assert histogram_quantile(counts, 0.5) == 8
+    assert histogram_quantile(counts, 1.0) == 20
+    assert histogram_quantile({}, 0.5) is None
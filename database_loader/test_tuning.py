@@ -0,0 +1,93 @@
+from database_loader.loader import insert_data_from_files
+from database_loader.testing_utilities import RecordingConnection, SCHEMA, FILES
+from database_loader.tuning import LoadTuner, statement_row_bytes, INCREASE_FRACTION, WRITER_WINDOW_BATCHES
+
+
+def test_statement_row_bytes():
+    assert statement_row_bytes([]) == 0
+    assert statement_row_bytes([['"1"', '"Fuzz"'], ['"22"', 'NULL']]) == 14.5
+
+
+def test_load_tuner_increase_and_decrease():
+    tuner = LoadTuner(1000, min_batch_size=100, max_batch_size=2000, target_latency=1.0)
+    increase = int(1000 * INCREASE_FRACTION)
+
+    # Additive increase while the batches keep up the throughput
+    tuner.record(1000, 10, 0.1)
+    assert tuner.batch_size == 1000 + increase
+    tuner.record(1250, 10, 0.125)
+    assert tuner.batch_size == 1000 + 2 * increase
+
+    # Multiplicative decrease on a batch slower than the target latency ...
+    tuner.record(1500, 10, 2.0)
+    assert tuner.batch_size == 750
+
+    # ... or on a drop in the throughput
+    tuner = LoadTuner(1000)
+    tuner.record(1000, 10, 0.1)
+    tuner.record(1250, 10, 1.0)
+    assert tuner.batch_size == 625
+    assert tuner.num_decreases == 1
+
+    # The batch size is kept within its bounds
+    tuner = LoadTuner(150, min_batch_size=100, max_batch_size=160)
+    tuner.record(150, 10, 0.1)
+    assert tuner.batch_size == 160
+    for _ in range(3):
+        tuner.record(160, 10, 5.0)
+    assert tuner.batch_size == 100
+
+    report = tuner.report()
+    assert report["batches"] == 4
+    assert report["decreases"] == 3
+    assert report["active_writers"] == 1
+
+
+def test_load_tuner_packet_size():
+    # A statement may use at most half of the packet size
+    tuner = LoadTuner(1000, max_packet_bytes=100000)
+    tuner.record(1000, 100, 0.1)
+    assert tuner.batch_size == 500
+
+    tuner.limit_batch_size(200)
+    assert tuner.batch_size == 200
+    tuner.record(200, 10, 0.02)
+    assert tuner.batch_size == 200
+
+
+def test_load_tuner_writers(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("database_loader.tuning.time.perf_counter", lambda: clock[0])
+
+    def run_window(tuner, rate_per_writer, peak_writers):
+        # The aggregate rate rises with the number of writers up to peak_writers
+        rate = rate_per_writer * min(tuner.active_writers, peak_writers)
+        for _ in range(WRITER_WINDOW_BATCHES * tuner.active_writers):
+            clock[0] += 1000 / rate
+            tuner.record(1000, 10, 0.1)
+
+    tuner = LoadTuner(1000, max_writers=4)
+    assert tuner.active_writers == 4
+    for _ in range(10):
+        if tuner.writers_settled:
+            break
+        run_window(tuner, 1000.0, 2)
+
+    # The writers beyond the second don't raise the rate, so the fewest writers with the best rate are kept
+    assert tuner.writers_settled
+    assert tuner.active_writers == 2
+    assert tuner.report()["active_writers"] == 2
+
+
+def test_insert_data_from_files_tuned():
+    committed = []
+    connection = RecordingConnection(committed)
+    tuner = LoadTuner(2, min_batch_size=1)
+
+    num_rows = insert_data_from_files(FILES, ",", "|", "utf-8", {}, "pedals", SCHEMA, ["True"], ["False"],
+                                      batch_size=2, connection=connection, tuner=tuner)
+    assert num_rows == 6
+
+    # The batch size grows by a row after each committed batch (and each file's last batch is committed at its end)
+    assert [len(stmt.split("), (")) for _, stmt in committed] == [2, 1, 3]
+    assert tuner.num_batches == 3
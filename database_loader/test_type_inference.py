@@ -1,5 +1,10 @@
+import datetime
+import decimal
+
 from database_loader.type_inference import is_float, is_int, is_boolean, infer_type_and_value, infer_overall_type, \
-    DataType, infer_best_type, build_field_type, update_field_type, merge_field_types
+    DataType, infer_best_type, build_field_type, update_field_type, merge_field_types, is_null, is_decimal, is_date, \
+    is_datetime, TemporalParser, ColumnTypeDetector, build_temporal_detectors, TypeCandidates, \
+    SchemaInference, CANDIDATE_BITS
 
 
 def test_is_float():
@@ -48,6 +53,128 @@ def test_infer_type_and_value():
     assert infer_type_and_value("true") == (DataType.string, "true")
 
 
+def test_is_null():
+    assert is_null("")
+    assert is_null("  ")
+
+    assert not is_null("0")
+    assert not is_null("hello")
+
+
+def test_is_decimal():
+    assert is_decimal("12.50") == (True, decimal.Decimal("12.50"))
+    assert is_decimal("-0.1") == (True, decimal.Decimal("-0.1"))
+
+    assert is_decimal("12") == (False, None)
+    assert is_decimal("1.2e3") == (False, None)
+    assert is_decimal("hello") == (False, None)
+
+
+def test_is_date_and_datetime():
+    assert is_date("2019-03-31", ["%Y-%m-%d"]) == (True, datetime.date(2019, 3, 31))
+    assert is_date("31/03/2019", ["%Y-%m-%d", "%d/%m/%Y"]) == (True, datetime.date(2019, 3, 31))
+    assert is_date("2019-02-30", ["%Y-%m-%d"]) == (False, None)
+    assert is_date("hello", ["%Y-%m-%d"]) == (False, None)
+
+    assert is_datetime("2019-03-31 10:11:12", ["%Y-%m-%d %H:%M:%S"]) == \
+        (True, datetime.datetime(2019, 3, 31, 10, 11, 12))
+    assert is_datetime("2019-03-31", ["%Y-%m-%d %H:%M:%S"]) == (False, None)
+
+
+def test_temporal_parser_caches_format():
+    parser = TemporalParser(["%Y-%m-%d", "%d/%m/%Y"], fixed=False)
+    assert parser.last_format is None
+
+    assert parser.parse("31/03/2019") == datetime.datetime(2019, 3, 31)
+    assert parser.last_format == "%d/%m/%Y"
+
+    assert parser.parse("2019-03-31") == datetime.datetime(2019, 3, 31)
+    assert parser.last_format == "%Y-%m-%d"
+
+    assert parser.parse("hello") is None
+
+    # A fixed parser only accepts the format it detected
+    parser = TemporalParser(["%Y-%m-%d", "%d/%m/%Y"])
+    assert parser.parse("03/04/2019") == datetime.datetime(2019, 4, 3)
+    assert parser.parse("2019-04-03") is None
+    assert parser.last_format == "%d/%m/%Y"
+
+
+def test_infer_type_and_value_extended():
+    assert infer_type_and_value("") == (DataType.null, None)
+
+    date_formats = ["%Y-%m-%d"]
+    datetime_formats = ["%Y-%m-%d %H:%M:%S"]
+    assert infer_type_and_value("2019-03-31", ["True"], ["False"], date_formats, datetime_formats) == \
+        (DataType.date, datetime.date(2019, 3, 31))
+    assert infer_type_and_value("2019-03-31 10:11:12", ["True"], ["False"], date_formats, datetime_formats) == \
+        (DataType.datetime, datetime.datetime(2019, 3, 31, 10, 11, 12))
+    assert infer_type_and_value("1.5", ["True"], ["False"], detect_decimals=True) == \
+        (DataType.decimal, decimal.Decimal("1.5"))
+    assert infer_type_and_value("1.5e3", ["True"], ["False"], detect_decimals=True) == (DataType.float, 1.5e3)
+
+    # Without the formats, dates are Strings
+    assert infer_type_and_value("2019-03-31") == (DataType.string, "2019-03-31")
+
+
+def test_infer_best_type_extended():
+    assert infer_best_type(DataType.null, DataType.int) == DataType.int
+    assert infer_best_type(DataType.date, DataType.null) == DataType.date
+    assert infer_best_type(DataType.null, DataType.null) == DataType.null
+
+    assert infer_best_type(DataType.int, DataType.decimal) == DataType.decimal
+    assert infer_best_type(DataType.decimal, DataType.float) == DataType.float
+    assert infer_best_type(DataType.date, DataType.datetime) == DataType.datetime
+
+    assert infer_best_type(DataType.date, DataType.int) == DataType.string
+    assert infer_best_type(DataType.decimal, DataType.boolean) == DataType.string
+
+
+def test_column_type_detector():
+    params = {"date-formats": ["%Y-%m-%d", "%d/%m/%Y"]}
+    detector = ColumnTypeDetector(["True"], ["False"], params)
+
+    for value in ["", "31/03/2019", "01/04/2019", ""]:
+        detector.infer(value)
+    assert detector.datatype == DataType.date
+    assert detector.date_parser.last_format == "%d/%m/%Y"
+
+    detector.infer("2019-04-02 10:00:00")
+    assert detector.datatype == DataType.datetime
+
+    detector.infer("hello")
+    assert detector.datatype == DataType.string
+
+    # A value in another format than the one detected demotes the column to a string
+    detector = ColumnTypeDetector(["True"], ["False"], params)
+    detector.infer("03/04/2019")
+    assert detector.infer("2019-04-03") == (DataType.string, "2019-04-03")
+    assert detector.datatype == DataType.string
+
+    # The values of a column of a known type are converted from any of the formats
+    detector = ColumnTypeDetector(["True"], ["False"], params, DataType.date)
+    assert detector.temporal_value("03/04/2019") == datetime.date(2019, 4, 3)
+    assert detector.temporal_value("2019-04-03") == datetime.date(2019, 4, 3)
+
+    # Basic inference
+    detector = ColumnTypeDetector(["True"], ["False"])
+    for value in ["1", "", "2019-03-31"]:
+        detector.infer(value)
+    assert detector.datatype == DataType.string
+
+
+def test_build_temporal_detectors():
+    schema = {"a": DataType.int, "b": DataType.date, "c": DataType.datetime}
+    assert build_temporal_detectors(schema, ["True"], ["False"], None) is None
+
+    detectors = build_temporal_detectors(schema, ["True"], ["False"], {"date-formats": ["%d/%m/%Y"]})
+    assert sorted(detectors.keys()) == ["b", "c"]
+    assert detectors["b"].temporal_value("31/03/2019") == datetime.date(2019, 3, 31)
+    assert detectors["c"].temporal_value("2019-03-31 10:11:12") == datetime.datetime(2019, 3, 31, 10, 11, 12)
+    assert detectors["c"].temporal_value("") is None
+    assert detectors["c"].temporal_value("31/03/2019") == datetime.datetime(2019, 3, 31)
+
+
 def test_infer_best_type():
     #          | int | float | string | boolean
     #  --------|-----|-------|--------|---------
@@ -132,3 +259,68 @@ def test_merge_field_types():
     assert merge_field_types({"field-a": DataType.string, "field-b": DataType.int},
                              {"field-a": DataType.int, "field-b": DataType.int}) == \
            {"field-a": DataType.string, "field-b": DataType.int}
+
+
+def infer_candidates(values, true_values=["True"], false_values=["False"], inference_params=None):
+    candidates = TypeCandidates(true_values, false_values, inference_params)
+    for value in values:
+        candidates.update(value)
+    return candidates
+
+
+def test_type_candidates():
+    assert infer_candidates([]).datatype == DataType.null
+    assert infer_candidates(["", "1", "2"]).datatype == DataType.int
+    assert infer_candidates(["1", "1.5"]).datatype == DataType.float
+    assert infer_candidates(["1", "1.5"], inference_params={"decimals": True}).datatype == DataType.decimal
+    assert infer_candidates(["True", "False", ""]).datatype == DataType.boolean
+    assert infer_candidates(["1", "True"]).datatype == DataType.string
+
+    # A Boolean value that is also a number is a number, as with infer_type_and_value
+    assert infer_candidates(["1", "0"], ["1"], ["0"]).datatype == DataType.int
+    assert infer_candidates(["Y", "1"], ["Y", "1"], ["N"]).datatype == DataType.string
+
+    params = {"date-formats": ["%Y-%m-%d"], "datetime-formats": ["%Y-%m-%d %H:%M:%S"]}
+    assert infer_candidates(["2019-03-31", "2019-04-01 10:00:00"], inference_params=params).datatype == \
+        DataType.datetime
+    assert infer_candidates(["2019-03-31", "2019"], inference_params=params).datatype == DataType.string
+
+
+def test_type_candidates_elimination():
+    candidates = TypeCandidates(["True"], ["False"])
+    candidates.update("1.5")
+    assert candidates.candidates == CANDIDATE_BITS[DataType.float]
+
+    # A string is resolved and no longer changes
+    assert candidates.update("hello")
+    assert candidates.candidates == 0
+    assert not candidates.update("2.5")
+    assert candidates.datatype == DataType.string
+
+
+def test_schema_inference():
+    inference = SchemaInference(["True"], ["False"])
+    inference.update({"a": "1", "b": "x"})
+    assert not inference.is_resolved()
+    assert inference.unresolved == ["a"]
+
+    inference.update({"a": "y", "b": "2"})
+    assert inference.is_resolved()
+    assert inference.schema() == {"a": DataType.string, "b": DataType.string}
+
+    assert SchemaInference(["True"], ["False"]).schema() == {}
+
+
+def test_schema_inference_value_caches():
+    inference = SchemaInference(["True"], ["False"])
+    for value in ["1", "1", "1.5", "1", "1.5"]:
+        inference.update({"a": value, "b": "True"})
+
+    assert inference.schema() == {"a": DataType.float, "b": DataType.boolean}
+
+    # The cache is invalidated when the candidates change, so "1" is re-tested after "1.5"
+    caches = inference.column_caches()
+    assert (caches["a"].hits, caches["a"].misses) == (2, 3)
+    assert (caches["b"].hits, caches["b"].misses) == (4, 1)
+
+    assert SchemaInference(["True"], ["False"], value_caches=False).column_caches() == {}
@@ -0,0 +1,61 @@
+import pytest
+
+from database_loader.value_cache import ValueCache
+
+
+def test_value_cache():
+    calls = []
+
+    def convert(value):
+        calls.append(value)
+        return value.upper()
+
+    cache = ValueCache(convert)
+    assert [cache.get(v) for v in ["a", "b", "a", "a"]] == ["A", "B", "A", "A"]
+    assert calls == ["a", "b"]
+    assert cache.report() == {"hits": 2, "misses": 2, "hit_rate": 0.5, "entries": 2, "enabled": True}
+
+    # A conversion that fails isn't cached
+    with pytest.raises(ValueError):
+        cache.get("c", int)
+    assert cache.misses == 2
+
+    cache.invalidate()
+    assert cache.get("a") == "A"
+    assert calls == ["a", "b", "a"]
+
+
+def test_value_cache_bounded():
+    cache = ValueCache(str.upper, max_entries=2)
+    for value in ["a", "b", "c", "c"]:
+        cache.get(value)
+
+    assert len(cache.entries) == 2
+    assert cache.hits == 0
+
+
+def test_value_cache_disables_for_high_cardinality():
+    cache = ValueCache(str.upper, max_entries=5, check_interval=10, min_hit_rate=0.5)
+    for value in range(10):
+        cache.get(str(value))
+
+    assert not cache.enabled
+    assert len(cache.entries) == 0
+    assert cache.get("1") == "1"
+    assert cache.hits == 0
+
+    # A low-cardinality column stays enabled
+    cache = ValueCache(str.upper, check_interval=10, min_hit_rate=0.5)
+    for value in range(1000):
+        cache.get(str(value % 10))
+
+    assert cache.enabled
+    assert cache.hit_rate() == 0.99
+
+    # The hit rate is only checked once the cache is full, so a column whose distinct values all come first isn't
+    # disabled before they repeat
+    cache = ValueCache(str.upper, check_interval=5, min_hit_rate=0.5)
+    for value in list(range(10)) * 3:
+        cache.get(str(value))
+
+    assert cache.enabled
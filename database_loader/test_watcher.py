@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from database_loader.type_inference import DataType
+from database_loader.watcher import scan_folder, FileWatcher, IngestDaemon, widen_schema
+
+
+def write_file(path, text):
+    with open(path, "w") as fp:
+        fp.write(text)
+
+
+def test_scan_folder():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_file(os.path.join(tmp_dir, "a_1.csv"), "id\n1\n")
+        write_file(os.path.join(tmp_dir, "notes.txt"), "ignored")
+        os.mkdir(os.path.join(tmp_dir, "b.csv"))
+
+        states = scan_folder(tmp_dir)
+        assert list(states.keys()) == [os.path.join(tmp_dir, "a_1.csv")]
+        assert states[os.path.join(tmp_dir, "a_1.csv")].size == 5
+
+
+def test_file_watcher():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path_1 = os.path.join(tmp_dir, "a_1.csv")
+        path_2 = os.path.join(tmp_dir, "a_2.csv")
+        write_file(path_1, "id\n1\n")
+
+        watcher = FileWatcher(tmp_dir, settle_seconds=5)
+        assert watcher.poll(now=0) == []
+
+        # The file is still being written
+        write_file(path_1, "id\n1\n2\n")
+        assert watcher.poll(now=4) == []
+        assert watcher.poll(now=8) == []
+
+        # The file has settled and is only reported once
+        assert watcher.poll(now=9) == [path_1]
+        assert watcher.poll(now=20) == []
+
+        # Files that have already been loaded are ignored
+        shutil.copy(path_1, path_2)
+        watcher.ignore([path_2])
+        assert watcher.poll(now=30) == []
+        assert watcher.poll(now=40) == []
+
+
+def test_file_watcher_retry():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "a_1.csv")
+        write_file(path, "id\n1\n")
+
+        watcher = FileWatcher(tmp_dir, settle_seconds=0, retry_seconds=10)
+        assert watcher.poll(now=0) == []
+        assert watcher.poll(now=1) == [path]
+
+        # A file that failed to load is reported again after a backoff that doubles with each failure
+        watcher.retry([path], now=1)
+        assert watcher.poll(now=5) == []
+        assert watcher.poll(now=11) == []
+        assert watcher.poll(now=12) == [path]
+        watcher.retry([path], now=12)
+        assert watcher.poll(now=30) == []
+        assert watcher.poll(now=32) == []
+        assert watcher.poll(now=33) == [path]
+        assert watcher.poll(now=100) == []
+
+
+def test_ingest_daemon_failures(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "a_1.csv")
+        write_file(path, "id\n1\n")
+
+        daemon = IngestDaemon(tmp_dir, ",", "|", "utf-8", ["True"], ["False"], {}, settle_seconds=0)
+
+        def fail_to_load(table_name, files):
+            raise OSError("Share unavailable")
+
+        # A file that fails to load is retried
+        monkeypatch.setattr(daemon, "load_files", fail_to_load)
+        daemon.watcher.poll()
+        assert daemon.poll() == 0
+        assert path in daemon.watcher._retries
+
+        # A folder that can't be scanned doesn't stop the daemon
+        shutil.rmtree(tmp_dir)
+        assert daemon.poll() == 0
+        os.mkdir(tmp_dir)
+
+
+def test_widen_schema():
+    schema = {"id": DataType.int, "alive": DataType.boolean, "reason": DataType.null}
+    new_schema = {"id": DataType.int, "alive": DataType.string, "reason": DataType.string}
+
+    widened, changed = widen_schema(schema, new_schema)
+    assert widened == {"id": DataType.int, "alive": DataType.string, "reason": DataType.string}
+    assert changed == {"alive": DataType.string, "reason": DataType.string}
+
+    assert widen_schema(schema, schema) == (schema, {})
+
+    with pytest.raises(ValueError):
+        widen_schema(schema, {"id": DataType.int})
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import re
+import threading
+
+from database_loader.type_inference import DataType
+
+# Schema and files of the pedal tables shared by the tests of the insert paths
+SCHEMA = {'ID': DataType.int,
+          'Pedal name': DataType.string,
+          'Manufacturer': DataType.string,
+          'Type of effect': DataType.string,
+          'Own': DataType.boolean}
+
+FILES = ["./database_loader/test_data/test_data_1.csv",
+         "./database_loader/test_data/test_data_2.csv"]
+
+
+class RecordingConnection(object):
+    """Connection that records the committed statements with the name of the thread that executed them."""
+
+    def __init__(self, committed, fail_on=None):
+        self.committed = committed
+        self.fail_on = fail_on
+        self.pending = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, stmt):
+        if self.fail_on is not None and self.fail_on in stmt:
+            raise ValueError("Rejected by the database")
+        self.pending.append(stmt)
+
+    def commit(self):
+        self.committed.extend([(threading.current_thread().name, stmt) for stmt in self.pending])
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+def inserted_ids(stmt):
+    """Get the IDs of the rows of an INSERT statement."""
+    return [int(value) for value in re.findall(r'\("(\d+)", ', stmt)]
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Default bounds of the batch size
+DEFAULT_MIN_BATCH_SIZE = 100
+DEFAULT_MAX_BATCH_SIZE = 50000
+
+# Default time in seconds to insert and commit a batch above which the batch size is halved
+DEFAULT_TARGET_LATENCY = 1.0
+
+# Default maximum size of a statement in bytes (MariaDB's default max_allowed_packet), of which a batch may use at most
+# PACKET_FRACTION
+DEFAULT_MAX_PACKET_BYTES = 16 * 2 ** 20
+PACKET_FRACTION = 0.5
+
+# Fraction of the initial batch size added to the batch size after each batch that keeps up the throughput
+INCREASE_FRACTION = 0.25
+
+# Fraction by which the throughput of a batch may fall below the smoothed throughput before the batch size is halved
+RATE_TOLERANCE = 0.2
+
+# Weight of the latest batch in the smoothed throughput and batch size
+SMOOTHING = 0.2
+
+# Number of batches per active writer measured before the number of active writers is changed, and the number of
+# changes that fail to raise the throughput before the number of writers is settled
+WRITER_WINDOW_BATCHES = 4
+WRITER_MAX_REVERSALS = 2
+
+# Number of rows sampled to estimate the bytes per row of a statement
+SAMPLE_ROWS = 10
+
+
+def statement_row_bytes(batch):
+    """
+    Estimate the number of bytes per row of a multi-row INSERT statement from a sample of the batch.
+
+    :param batch: List of rows, each a list of SQL values from transform_values().
+    :return: Estimated bytes per row.
+    """
+
+    sample = batch[:SAMPLE_ROWS]
+    if len(sample) == 0:
+        return 0
+
+    # Each value is followed by ", " and each row is wrapped in "(...), "
+    return sum([sum([len(value) + 2 for value in values]) + 2 for values in sample]) / len(sample)
+
+
+class LoadTuner(object):
+    """
+    Adapts the batch size and the number of active writers of a table's inserts to the measured throughput.
+
+    The batch size follows an AIMD policy: after each batch it grows by a fixed step, unless the batch took longer
+    than target_latency to insert and commit or, being larger than the smoothed batch size, its rows per second fell
+    well below the smoothed rate, in which case it is halved. It is kept within its bounds and so that a statement
+    fits in the packet size.
+
+    The number of active writers (if more than one is available) is hill-climbed down from all of them: after each
+    window of batches the aggregate rows per second is compared with the previous window's, keeping the direction of
+    the last change if it paid off and reversing it otherwise. After WRITER_MAX_REVERSALS reversals the fewest writers
+    within RATE_TOLERANCE of the best rate are kept.
+
+    The batches may be recorded from several writer threads.
+    """
+
+    def __init__(self, batch_size, max_writers=1, min_batch_size=DEFAULT_MIN_BATCH_SIZE,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, target_latency=DEFAULT_TARGET_LATENCY,
+                 max_packet_bytes=DEFAULT_MAX_PACKET_BYTES):
+        """
+        :param batch_size: Initial batch size.
+        :param max_writers: Number of writers available (all of them are active initially).
+        :param min_batch_size: Minimum batch size.
+        :param max_batch_size: Maximum batch size.
+        :param target_latency: Time in seconds to insert and commit a batch above which the batch size is halved.
+        :param max_packet_bytes: Maximum size of a statement in bytes.
+        """
+
+        assert batch_size > 0
+        assert max_writers > 0
+        assert min_batch_size > 0 and max_batch_size > 0
+
+        self.min_batch_size = min(min_batch_size, batch_size)
+        self.max_batch_size = max(max_batch_size, batch_size)
+        self.target_latency = target_latency
+        self.max_packet_bytes = max_packet_bytes
+        self.increase = max(1, int(batch_size * INCREASE_FRACTION))
+
+        self.batch_size = batch_size
+        self.smoothed_batch_size = float(batch_size)
+        self.rate = None
+        self.num_batches = 0
+        self.num_decreases = 0
+
+        self.max_writers = max_writers
+        self.active_writers = max_writers
+        self.writers_settled = max_writers == 1
+        self._direction = -1
+        self._reversals = 0
+        self._window_rows = 0
+        self._window_batches = 0
+        self._window_start = time.perf_counter()
+        self._previous_window_rate = None
+        self._best_writers = (None, max_writers)
+
+        self._lock = threading.Lock()
+
+    def record(self, num_rows, row_bytes, seconds):
+        """
+        Record the insert and commit of a batch and adapt the batch size (and the number of active writers).
+
+        :param num_rows: Number of rows in the batch.
+        :param row_bytes: Estimated bytes per row of the INSERT statement.
+        :param seconds: Time taken to insert and commit the batch.
+        """
+
+        if num_rows == 0:
+            return
+
+        with self._lock:
+            rate = num_rows / max(seconds, 1e-9)
+            upper = self.max_batch_size
+            if row_bytes > 0:
+                upper = max(self.min_batch_size, min(upper, int(self.max_packet_bytes * PACKET_FRACTION // row_bytes)))
+
+            # Additive increase, multiplicative decrease (a drop in the rate is only blamed on the batch size if the
+            # batch was larger than usual, rather than e.g. on the contention between writers)
+            slower = self.rate is not None and rate < (1 - RATE_TOLERANCE) * self.rate
+            if seconds > self.target_latency or (slower and num_rows > self.smoothed_batch_size):
+                batch_size = self.batch_size // 2
+                self.num_decreases += 1
+            else:
+                batch_size = self.batch_size + self.increase
+            self.batch_size = max(self.min_batch_size, min(upper, batch_size))
+
+            self.rate = rate if self.rate is None else (1 - SMOOTHING) * self.rate + SMOOTHING * rate
+            self.smoothed_batch_size = (1 - SMOOTHING) * self.smoothed_batch_size + SMOOTHING * self.batch_size
+            self.num_batches += 1
+
+            if not self.writers_settled:
+                self._window_rows += num_rows
+                self._window_batches += 1
+                if self._window_batches >= WRITER_WINDOW_BATCHES * self.active_writers:
+                    self._adapt_writers()
+
+    def _adapt_writers(self):
+        """Hill-climb the number of active writers from the rate of the window of batches just completed."""
+
+        now = time.perf_counter()
+        window_rate = self._window_rows / max(now - self._window_start, 1e-9)
+        self._window_rows = 0
+        self._window_batches = 0
+        self._window_start = now
+
+        # Fewer writers are preferred unless they lose more than RATE_TOLERANCE of the best rate
+        best_rate, best_writers = self._best_writers
+        if best_rate is None or window_rate > best_rate:
+            self._best_writers = (window_rate, self.active_writers)
+        elif self.active_writers < best_writers and window_rate >= (1 - RATE_TOLERANCE) * best_rate:
+            self._best_writers = (best_rate, self.active_writers)
+
+        # Removing a writer is kept if it doesn't lose more than RATE_TOLERANCE of the rate, adding one only if it
+        # raises the rate
+        previous_rate = self._previous_window_rate
+        if previous_rate is not None:
+            if self._direction < 0:
+                improved = window_rate >= (1 - RATE_TOLERANCE) * previous_rate
+            else:
+                improved = window_rate > previous_rate
+            if not improved:
+                self._direction = -self._direction
+                self._reversals += 1
+        self._previous_window_rate = window_rate
+
+        if self._reversals >= WRITER_MAX_REVERSALS:
+            self.active_writers = self._best_writers[1]
+            self.writers_settled = True
+            return
+
+        active_writers = self.active_writers + self._direction
+        if active_writers < 1 or active_writers > self.max_writers:
+            self._direction = -self._direction
+            self._reversals += 1
+            active_writers = self.active_writers + self._direction
+        self.active_writers = max(1, min(self.max_writers, active_writers))
+
+    def limit_batch_size(self, batch_size):
+        """
+        Lower the maximum batch size (e.g. under memory pressure).
+
+        :param batch_size: New maximum batch size.
+        """
+
+        with self._lock:
+            self.max_batch_size = max(1, batch_size)
+            self.min_batch_size = min(self.min_batch_size, self.max_batch_size)
+            self.batch_size = min(self.batch_size, self.max_batch_size)
+
+    def report(self):
+        """
+        Build the report of the settled values.
+
+        :return: Dictionary of the batch size (latest and smoothed), the number of active writers, the smoothed rows
+            per second and the number of batches and decreases of the batch size.
+        """
+
+        return {"batch_size": self.batch_size,
+                "smoothed_batch_size": int(round(self.smoothed_batch_size)),
+                "active_writers": self.active_writers,
+                "rows_per_second": self.rate or 0.0,
+                "batches": self.num_batches,
+                "decreases": self.num_decreases}
+
+    def log_report(self, table_name):
+        """
+        Log the settled values of a table.
+
+        :param table_name: Table name.
+        """
+
+        report = self.report()
+        module_logger.info("Tuned the inserts into %s: batch size %d (smoothed %d), %d active writers, %.1f rows/s per "
+                           "batch (%d batches, %d decreases)", table_name, report["batch_size"],
+                           report["smoothed_batch_size"], report["active_writers"], report["rows_per_second"],
+                           report["batches"], report["decreases"])
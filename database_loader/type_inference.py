@@ -1,4 +1,9 @@
+import datetime
+import decimal
 import enum
+import re
+
+from database_loader.value_cache import ValueCache
 
 
 class DataType(enum.Enum):
@@ -9,6 +14,29 @@ class DataType(enum.Enum):
     float = 1
     boolean = 2
     string = 3
+    date = 4
+    datetime = 5
+    decimal = 6
+    null = 7
+
+
+# Default formats of dates and datetimes (used by the extended inference)
+DEFAULT_DATE_FORMATS = ["%Y-%m-%d"]
+DEFAULT_DATETIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S.%f"]
+
+# Fixed-point decimal (no exponent)
+DECIMAL_PATTERN = re.compile(r"^[+-]?\d+\.\d+$")
+
+
+def is_null(str_value):
+    """
+    Is the String value empty (and so represents a NULL)?
+
+    :param str_value: String value to test.
+    :return: True if the value is None, empty or only whitespace.
+    """
+
+    return str_value is None or len(str_value.strip()) == 0
 
 
 def condition_check(str_value):
@@ -66,6 +94,115 @@ def is_int(str_value):
     return potentially_int, value
 
 
+def is_decimal(str_value):
+    """
+    Is the String value a fixed-point decimal (e.g. 12.50)?
+
+    :param str_value: String value to test.
+    :return: Tuple of value is decimal (True/False) and value (Decimal or None).
+    """
+
+    # Preconditions
+    condition_check(str_value)
+
+    if DECIMAL_PATTERN.match(str_value.strip()) is None:
+        return False, None
+
+    return True, decimal.Decimal(str_value.strip())
+
+
+class TemporalParser(object):
+    """
+    Parses dates or datetimes in one of several formats, trying the format that last succeeded first.
+
+    Once the format of a column has been detected, each further value is validated with a single strptime call
+    rather than by trying every format. If the format is fixed, it is then authoritative: a value in another format
+    isn't parsed, so that a column mixing formats (e.g. 03/04/2019 and 2019-04-03, where the first is ambiguous) is
+    inferred as a string.
+    """
+
+    def __init__(self, formats, fixed=True):
+        """
+        :param formats: List of strptime formats.
+        :param fixed: Is the first format that matches the only one accepted from then on? If False, the other
+            formats are tried when it fails (e.g. to convert the values of a column whose files were inferred
+            separately).
+        """
+
+        assert len(formats) > 0
+
+        self.formats = list(formats)
+        self.fixed = fixed
+        self.last_format = None
+
+    def parse(self, str_value):
+        """
+        Parse a String value.
+
+        :param str_value: String value to parse.
+        :return: datetime, or None if the value doesn't match any of the formats.
+        """
+
+        if self.last_format is not None:
+            try:
+                return datetime.datetime.strptime(str_value, self.last_format)
+            except ValueError:
+                if self.fixed:
+                    return None
+
+        for fmt in self.formats:
+            if fmt == self.last_format:
+                continue
+            try:
+                value = datetime.datetime.strptime(str_value, fmt)
+            except ValueError:
+                continue
+            self.last_format = fmt
+            return value
+
+        return None
+
+
+def is_date(str_value, date_formats):
+    """
+    Is the String value a date in one of the formats?
+
+    :param str_value: String value to test.
+    :param date_formats: List of strptime formats of dates (or a TemporalParser).
+    :return: Tuple of value is date (True/False) and value (date or None).
+    """
+
+    # Preconditions
+    condition_check(str_value)
+
+    parser = date_formats if isinstance(date_formats, TemporalParser) else TemporalParser(date_formats)
+    value = parser.parse(str_value)
+
+    if value is None:
+        return False, None
+    return True, value.date()
+
+
+def is_datetime(str_value, datetime_formats):
+    """
+    Is the String value a datetime in one of the formats?
+
+    :param str_value: String value to test.
+    :param datetime_formats: List of strptime formats of datetimes (or a TemporalParser).
+    :return: Tuple of value is datetime (True/False) and value (datetime or None).
+    """
+
+    # Preconditions
+    condition_check(str_value)
+
+    parser = datetime_formats if isinstance(datetime_formats, TemporalParser) else TemporalParser(datetime_formats)
+    value = parser.parse(str_value)
+
+    if value is None:
+        return False, None
+    return True, value
+
+
 def is_boolean(str_value, true_values, false_values):
     """
     Is the String value potentially a Boolean?
@@ -89,24 +226,34 @@ def is_boolean(str_value, true_values, false_values):
         return False, None
 
 
-def infer_type_and_value(str_value, true_values=["True"], false_values=["False"]):
+def infer_type_and_value(str_value, true_values=["True"], false_values=["False"], date_formats=None,
+                         datetime_formats=None, detect_decimals=False):
     """
     Infer the type (and thus its value) of a String represenation of a value.
 
     :param str_value: Value to infer.
     :param true_values: List of values that are defined as True.
     :param false_values: List of values that are defined as False.
+    :param date_formats: List of strptime formats (or a TemporalParser) of dates (None to not detect dates).
+    :param datetime_formats: List of strptime formats (or a TemporalParser) of datetimes (None to not detect them).
+    :param detect_decimals: Infer fixed-point values (e.g. 12.50) as decimals rather than floats?
     :return: Tuple of (type, value).
     """
 
-    # Precondition
-    condition_check(str_value)
+    # An empty value is a NULL, which is compatible with every type
+    if is_null(str_value):
+        return DataType.null, None
 
     # Try the different types
     int_result = is_int(str_value)
     if int_result[0]:
         return DataType.int, int_result[1]
 
+    if detect_decimals:
+        decimal_result = is_decimal(str_value)
+        if decimal_result[0]:
+            return DataType.decimal, decimal_result[1]
+
     float_result = is_float(str_value)
     if float_result[0]:
         return DataType.float, float_result[1]
@@ -115,6 +262,16 @@ def infer_type_and_value(str_value, true_values=["True"], false_values=["False"]
     if boolean_result[0]:
         return DataType.boolean, boolean_result[1]
 
+    if date_formats is not None:
+        date_result = is_date(str_value, date_formats)
+        if date_result[0]:
+            return DataType.date, date_result[1]
+
+    if datetime_formats is not None:
+        datetime_result = is_datetime(str_value, datetime_formats)
+        if datetime_result[0]:
+            return DataType.datetime, datetime_result[1]
+
     # None of the above types appear to be correct, so it might be a String
     return DataType.string, str_value
 
@@ -134,25 +291,399 @@ def infer_best_type(type1, type2):
     #  float   | float  | float  | string | string
     #  string  | string | string | string | string
     #  boolean | string | string | string | boolean
+    #
+    # A null is compatible with every type, a decimal widens an int and is widened by a float, and a date is widened
+    # by a datetime. Any other combination is a string.
+
+    if type1 == DataType.null:
+        return type2
+    if type2 == DataType.null:
+        return type1
 
     if type1 == DataType.string or type2 == DataType.string:
         return DataType.string
 
-    if type1 == DataType.boolean and type2 == DataType.boolean:
-        return DataType.boolean
+    if type1 == type2:
+        return type1
 
-    if type1 == DataType.int and type2 == DataType.int:
-        return DataType.int
+    numeric = [DataType.int, DataType.decimal, DataType.float]
+    if type1 in numeric and type2 in numeric:
+        return numeric[max(numeric.index(type1), numeric.index(type2))]
 
-    if type1 == DataType.float and type2 == DataType.float:
-        return DataType.float
-
-    if (type1 == DataType.int and type2 == DataType.float) or (type1 == DataType.float and type2 == DataType.int):
-        return DataType.float
+    if set([type1, type2]) == set([DataType.date, DataType.datetime]):
+        return DataType.datetime
 
     return DataType.string
 
 
+def extended_inference_settings(inference_params):
+    """
+    Get the settings of the extended type inference.
+
+    :param inference_params: Dictionary of inference parameters ('date-formats', 'datetime-formats' and 'decimals'),
+        or None for the basic inference (int, float, boolean and string).
+    :return: Tuple of (date formats, datetime formats, detect decimals).
+    """
+
+    if inference_params is None:
+        return None, None, False
+
+    return (inference_params.get('date-formats', DEFAULT_DATE_FORMATS),
+            inference_params.get('datetime-formats', DEFAULT_DATETIME_FORMATS),
+            inference_params.get('decimals', True))
+
+
+class ColumnTypeDetector(object):
+    """
+    Infers the types of the values of a single column, caching the detected date and datetime formats.
+
+    Once a column is known to hold dates (or datetimes), each further value is first validated against the cached
+    format with a single strptime call; the full ladder of parsers is only tried when that fails. When inferring, the
+    detected format is authoritative, so a value in another format demotes the column to a string. When converting
+    the values of a column whose type is known, any of the formats is accepted, as each file was inferred separately.
+    """
+
+    def __init__(self, true_values, false_values, inference_params=None, datatype=None):
+        """
+        :param true_values: List of values deemed True.
+        :param false_values: List of values deemed False.
+        :param inference_params: Dictionary of extended inference parameters (None for the basic inference).
+        :param datatype: Type of the column, if already known (e.g. when converting values for insertion).
+        """
+
+        date_formats, datetime_formats, detect_decimals = extended_inference_settings(inference_params)
+
+        self.true_values = true_values
+        self.false_values = false_values
+        self.date_parser = TemporalParser(date_formats, datatype is None) if date_formats else None
+        self.datetime_parser = TemporalParser(datetime_formats, datatype is None) if datetime_formats else None
+        self.detect_decimals = detect_decimals
+        self.datatype = DataType.null if datatype is None else datatype
+
+    def _cached_temporal(self, str_value):
+        """Try the parser of the column's current temporal type (returns (type, value) or None)."""
+
+        if self.datatype == DataType.date and self.date_parser is not None:
+            value = self.date_parser.parse(str_value)
+            if value is not None:
+                return DataType.date, value.date()
+
+        elif self.datatype == DataType.datetime and self.datetime_parser is not None:
+            value = self.datetime_parser.parse(str_value)
+            if value is not None:
+                return DataType.datetime, value
+
+        return None
+
+    def infer(self, str_value):
+        """
+        Infer the type (and value) of a value of the column, widening the type of the column.
+
+        :param str_value: String value.
+        :return: Tuple of (type, value).
+        """
+
+        result = None
+        if not is_null(str_value):
+            result = self._cached_temporal(str_value)
+
+        if result is None:
+            result = infer_type_and_value(str_value, self.true_values, self.false_values, self.date_parser,
+                                          self.datetime_parser, self.detect_decimals)
+
+        self.datatype = infer_best_type(self.datatype, result[0])
+        return result
+
+    def temporal_value(self, str_value):
+        """
+        Convert a value of a date or datetime column.
+
+        :param str_value: String value.
+        :return: date or datetime (or None for a NULL).
+        """
+
+        if is_null(str_value):
+            return None
+
+        result = self._cached_temporal(str_value)
+        if result is None:
+            result = infer_type_and_value(str_value, self.true_values, self.false_values, self.date_parser,
+                                          self.datetime_parser, self.detect_decimals)
+
+        if result[0] not in [DataType.date, DataType.datetime]:
+            raise ValueError("Unable to parse %s value: %s" % (self.datatype.name, str_value))
+
+        # A date in a datetime column is midnight on that date
+        if self.datatype == DataType.datetime and result[0] == DataType.date:
+            return datetime.datetime(result[1].year, result[1].month, result[1].day)
+
+        return result[1]
+
+
+# Candidate types of a column as bits, in the order they are tested (the ladder of infer_type_and_value)
+CANDIDATE_ORDER = [DataType.int, DataType.decimal, DataType.float, DataType.boolean, DataType.date, DataType.datetime]
+CANDIDATE_BITS = dict([(tpe, 1 << index) for index, tpe in enumerate(CANDIDATE_ORDER)])
+
+# Candidates that remain once a value of a type has been seen (the types that widen it)
+REMAINING_CANDIDATES = {DataType.int: CANDIDATE_BITS[DataType.int] | CANDIDATE_BITS[DataType.decimal] |
+                        CANDIDATE_BITS[DataType.float],
+                        DataType.decimal: CANDIDATE_BITS[DataType.decimal] | CANDIDATE_BITS[DataType.float],
+                        DataType.float: CANDIDATE_BITS[DataType.float],
+                        DataType.boolean: CANDIDATE_BITS[DataType.boolean],
+                        DataType.date: CANDIDATE_BITS[DataType.date] | CANDIDATE_BITS[DataType.datetime],
+                        DataType.datetime: CANDIDATE_BITS[DataType.datetime]}
+
+
+class TypeCandidates(object):
+    """
+    Infers the type of a column by eliminating candidate types.
+
+    The candidates still possible are held as a bitmask. Each value is only tested against the remaining candidates
+    (in the order of infer_type_and_value) and the first that can represent it leaves only the types that widen it
+    as candidates, so an eliminated type is never tested again. A column without candidates is a string, which no
+    later value can change, so it is resolved.
+
+    A value that has already been seen since the candidates last changed can't change them, so the optional value
+    cache skips the repeated values of low-cardinality columns.
+    """
+
+    def __init__(self, true_values, false_values, inference_params=None, value_cache=None):
+        """
+        :param true_values: List of values deemed True.
+        :param false_values: List of values deemed False.
+        :param inference_params: Dictionary of extended inference parameters (None for the basic inference).
+        :param value_cache: ValueCache of the values seen since the candidates last changed (or None).
+        """
+
+        date_formats, datetime_formats, detect_decimals = extended_inference_settings(inference_params)
+
+        self.boolean_values = set(true_values) | set(false_values)
+        self.numeric_booleans = any([is_float(value)[0] for value in self.boolean_values if not is_null(value)])
+        self.date_parser = TemporalParser(date_formats) if date_formats else None
+        self.datetime_parser = TemporalParser(datetime_formats) if datetime_formats else None
+
+        self.candidates = CANDIDATE_BITS[DataType.int] | CANDIDATE_BITS[DataType.float] | \
+            CANDIDATE_BITS[DataType.boolean]
+        if detect_decimals:
+            self.candidates |= CANDIDATE_BITS[DataType.decimal]
+        if self.date_parser is not None:
+            self.candidates |= CANDIDATE_BITS[DataType.date]
+        if self.datetime_parser is not None:
+            self.candidates |= CANDIDATE_BITS[DataType.datetime]
+
+        self.datatype = DataType.null
+        self.value_cache = value_cache
+
+    def _is_numeric(self, str_value):
+        try:
+            float(str_value)
+            return True
+        except ValueError:
+            return False
+
+    def _accepts(self, tpe, str_value):
+        """Can a type represent the value (given that the narrower candidates can't)?"""
+
+        if tpe == DataType.int:
+            try:
+                int(str_value)
+                return True
+            except ValueError:
+                return False
+
+        if tpe == DataType.decimal:
+            return DECIMAL_PATTERN.match(str_value.strip()) is not None or self._accepts(DataType.int, str_value)
+
+        if tpe == DataType.float:
+            return self._is_numeric(str_value)
+
+        # A value is only a Boolean if it isn't a number
+        if tpe == DataType.boolean:
+            return str_value in self.boolean_values and not (self.numeric_booleans and self._is_numeric(str_value))
+
+        # Once a column holds dates (or datetimes), a value that parses as one is accepted, as by ColumnTypeDetector;
+        # otherwise a number or a Boolean isn't a date
+        if tpe == DataType.date:
+            return self.date_parser.parse(str_value) is not None
+
+        if self.datatype == DataType.datetime and self.datetime_parser.parse(str_value) is not None:
+            return True
+
+        if str_value in self.boolean_values or self._is_numeric(str_value):
+            return False
+
+        return self.datetime_parser.parse(str_value) is not None or \
+            (self.date_parser is not None and self.date_parser.parse(str_value) is not None)
+
+    def update(self, str_value):
+        """
+        Narrow the candidates with a value of the column.
+
+        :param str_value: String value.
+        :return: True if the column is now resolved as a string.
+        """
+
+        if self.candidates == 0 or is_null(str_value):
+            return False
+
+        if self.value_cache is not None:
+            return self.value_cache.get(str_value, self._narrow)
+
+        return self._narrow(str_value)
+
+    def _narrow(self, str_value):
+        """Narrow the candidates with a non-null value, forgetting the cached values if they change."""
+
+        for tpe in CANDIDATE_ORDER:
+            if self.candidates & CANDIDATE_BITS[tpe] and self._accepts(tpe, str_value):
+                candidates = self.candidates & REMAINING_CANDIDATES[tpe]
+                if candidates != self.candidates or tpe != self.datatype:
+                    self.candidates = candidates
+                    self.datatype = tpe
+                    if self.value_cache is not None:
+                        self.value_cache.invalidate()
+                return False
+
+        self.candidates = 0
+        self.datatype = DataType.string
+        return True
+
+
+class SchemaInference(object):
+    """
+    Infers the schema of a table from its rows, skipping the columns that have been resolved as strings.
+    """
+
+    def __init__(self, true_values, false_values, inference_params=None, value_caches=True):
+        """
+        :param true_values: List of values deemed True.
+        :param false_values: List of values deemed False.
+        :param inference_params: Dictionary of extended inference parameters (None for the basic inference).
+        :param value_caches: Skip the repeated values of each column with a ValueCache?
+        """
+
+        self.true_values = true_values
+        self.false_values = false_values
+        self.inference_params = inference_params
+        self.value_caches = value_caches
+
+        self.columns = None
+        self.unresolved = None
+
+    def update(self, dict_data):
+        """
+        Infer the types of a row.
+
+        :param dict_data: Dictionary of field name to value.
+        """
+
+        if self.columns is None:
+            self.columns = dict([(key, TypeCandidates(self.true_values, self.false_values, self.inference_params,
+                                                      ValueCache() if self.value_caches else None))
+                                 for key in dict_data.keys()])
+            self.unresolved = list(dict_data.keys())
+        else:
+            assert self.columns.keys() == dict_data.keys()
+
+        resolved = False
+        for key in self.unresolved:
+            resolved = self.columns[key].update(dict_data[key]) or resolved
+
+        if resolved:
+            self.unresolved = [key for key in self.unresolved if self.columns[key].candidates != 0]
+
+    def is_resolved(self):
+        """
+        Have all of the columns been resolved as strings (so that no further row can change the schema)?
+
+        :return: True if all of the columns are strings.
+        """
+
+        return self.unresolved is not None and len(self.unresolved) == 0
+
+    def schema(self):
+        """
+        Get the inferred schema.
+
+        :return: Dictionary of field name to type.
+        """
+
+        if self.columns is None:
+            return {}
+
+        return dict([(key, column.datatype) for key, column in self.columns.items()])
+
+    def column_caches(self):
+        """
+        Get the value caches of the columns.
+
+        :return: Dictionary of field name to ValueCache (for the columns with a cache).
+        """
+
+        if self.columns is None:
+            return {}
+
+        return dict([(key, column.value_cache) for key, column in self.columns.items()
+                     if column.value_cache is not None])
+
+
+def build_temporal_detectors(schema, true_values, false_values, inference_params):
+    """
+    Build the detectors used to convert the values of the date and datetime columns of a schema.
+
+    :param schema: Dictionary of field name to type.
+    :param true_values: List of values deemed True.
+    :param false_values: List of values deemed False.
+    :param inference_params: Dictionary of extended inference parameters (None for the basic inference).
+    :return: Dictionary of field name to ColumnTypeDetector (None for the basic inference).
+    """
+
+    if inference_params is None:
+        return None
+
+    return dict([(fieldname, ColumnTypeDetector(true_values, false_values, inference_params, tpe))
+                 for fieldname, tpe in schema.items() if tpe in [DataType.date, DataType.datetime]])
+
+
+def check_values(schema, data, true_values, false_values, temporal_detectors=None):
+    """
+    Check that the values of a row can be converted to the types of their columns.
+
+    :param schema: Dictionary of field name to type.
+    :param data: Dictionary of field name to value.
+    :param true_values: List of values deemed True.
+    :param false_values: List of values deemed False.
+    :param temporal_detectors: Dictionary of field name to ColumnTypeDetector to parse the dates and datetimes (if
+        None, they must be in ISO format).
+    """
+
+    for fieldname, tpe in schema.items():
+        value = data[fieldname]
+        if tpe in [DataType.string, DataType.null] or is_null(value):
+            continue
+
+        if temporal_detectors is not None and fieldname in temporal_detectors:
+            temporal_detectors[fieldname].temporal_value(value)
+            continue
+
+        try:
+            if tpe == DataType.int:
+                int(value)
+            elif tpe == DataType.float:
+                float(value)
+            elif tpe == DataType.decimal:
+                decimal.Decimal(value)
+            elif tpe == DataType.boolean:
+                if value not in true_values and value not in false_values:
+                    raise ValueError()
+            elif tpe == DataType.date:
+                datetime.date.fromisoformat(value)
+            elif tpe == DataType.datetime:
+                datetime.datetime.fromisoformat(value)
+        except (ValueError, decimal.InvalidOperation):
+            raise ValueError("Invalid %s value of %s: %s" % (tpe.name, fieldname, value))
+
+
 def infer_overall_type(list_inferred_types):
     """
     Given a list of inferred types, determine the overall (most likely) type.
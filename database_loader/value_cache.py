@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Default maximum number of distinct values held per column
+DEFAULT_MAX_ENTRIES = 1024
+
+# Default number of lookups between checks of the hit rate, and the hit rate below which the cache is disabled
+DEFAULT_CHECK_INTERVAL = 1000
+DEFAULT_MIN_HIT_RATE = 0.5
+
+
+class ValueCache(object):
+    """
+    Bounded cache of the classification or conversion of the raw String values of a column.
+
+    Low-cardinality columns (e.g. Booleans or country codes) repeat a few values many times, so each distinct value
+    is only converted once. The cache stops admitting values once it holds max_entries, and from then on the hit rate is
+    checked every check_interval lookups: below min_hit_rate the column has too many distinct values to benefit, so
+    the cache disables itself and releases its entries.
+    """
+
+    def __init__(self, convert=None, max_entries=DEFAULT_MAX_ENTRIES, check_interval=DEFAULT_CHECK_INTERVAL,
+                 min_hit_rate=DEFAULT_MIN_HIT_RATE):
+        """
+        :param convert: Default function converting a raw value (an exception it raises isn't cached).
+        :param max_entries: Maximum number of values held.
+        :param check_interval: Number of lookups between checks of the hit rate.
+        :param min_hit_rate: Hit rate below which the cache is disabled.
+        """
+
+        assert max_entries > 0
+        assert check_interval > 0
+        assert 0.0 <= min_hit_rate <= 1.0
+
+        self.convert = convert
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.min_hit_rate = min_hit_rate
+
+        self.entries = {}
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self._next_check = check_interval
+
+    def get(self, str_value, convert=None):
+        """
+        Get the converted value of a raw value, converting it on a miss.
+
+        :param str_value: Raw String value.
+        :param convert: Function converting the raw value (defaults to the cache's function).
+        :return: Converted value.
+        """
+
+        if convert is None:
+            convert = self.convert
+
+        if not self.enabled:
+            return convert(str_value)
+
+        try:
+            value = self.entries[str_value]
+            self.hits += 1
+            return value
+        except KeyError:
+            pass
+
+        value = convert(str_value)
+        self.misses += 1
+        if len(self.entries) < self.max_entries:
+            self.entries[str_value] = value
+
+        # Once the cache is full, the hit rate is checked at the first miss (only a miss can lower it) after each
+        # interval
+        if len(self.entries) >= self.max_entries and self.hits + self.misses >= self._next_check:
+            self._next_check = self.hits + self.misses + self.check_interval
+            if self.hit_rate() < self.min_hit_rate:
+                self.enabled = False
+                self.entries = {}
+
+        return value
+
+    def invalidate(self):
+        """Forget the cached values (e.g. when the classification of the column changes)."""
+
+        self.entries = {}
+
+    def hit_rate(self):
+        """
+        Get the fraction of the lookups that were hits.
+
+        :return: Hit rate (0 if there have been no lookups).
+        """
+
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def report(self):
+        """
+        Build the report of the cache's use.
+
+        :return: Dictionary of the hits, misses, hit rate, number of entries and whether the cache is enabled.
+        """
+
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate(),
+                "entries": len(self.entries),
+                "enabled": self.enabled}
+
+
+def log_cache_reports(description, value_caches):
+    """
+    Log the hit rates of the value caches of a table's columns on a single line.
+
+    :param description: Description of the caches' use (e.g. the file name).
+    :param value_caches: Dictionary of field name to ValueCache.
+    """
+
+    if len(value_caches) == 0:
+        return
+
+    reports = ["%s %.1f%%%s" % (fieldname, 100 * cache.hit_rate(), "" if cache.enabled else " (disabled)")
+               for fieldname, cache in value_caches.items()]
+    module_logger.info("Value cache hit rates of %s: %s", description, ", ".join(reports))
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+import collections
+import logging
+import os
+import threading
+import time
+
+from database_loader import checkpoints, database_utilities
+from database_loader.database_utilities import alter_table_statement, database_errors
+from database_loader.loader import table_name_from_filename, build_schema_from_files, insert_data_from_files, \
+    DEFAULT_BATCH_SIZE, DEFAULT_REJECT_PATH
+from database_loader.metrics import LoadMetrics
+from database_loader.rejects import RejectWriter, DEFAULT_MAX_ERROR_RATE
+from database_loader.type_inference import merge_field_types
+from logger import logger
+
+# Initialise the module logger
+logger.initialise_logger("loader", log_level=logging.INFO)
+module_logger = logging.getLogger('loader')
+
+# Default interval in seconds between scans of the folder
+DEFAULT_POLL_INTERVAL = 2.0
+
+# Default number of seconds a file's size and modification time must be unchanged before it is deemed complete
+DEFAULT_SETTLE_SECONDS = 5.0
+
+# Number of seconds before a file that failed to load is first retried (doubled after each further failure)
+DEFAULT_RETRY_SECONDS = 10.0
+
+# Maximum number of seconds between the retries of a file that keeps failing to load
+MAX_RETRY_SECONDS = 600.0
+
+# Size and modification time of a file when it was scanned
+FileState = collections.namedtuple("FileState", ["size", "mtime_ns"])
+
+
+def scan_folder(folder, extension=".csv"):
+    """
+    Get the state of the files in a folder.
+
+    :param folder: Folder to scan.
+    :param extension: Extension of the files to include.
+    :return: Dictionary of file path to FileState.
+    """
+
+    states = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.endswith(extension) and entry.is_file():
+                stat = entry.stat()
+                states[entry.path] = FileState(stat.st_size, stat.st_mtime_ns)
+
+    return states
+
+
+class FileWatcher(object):
+    """
+    Polls a folder for new files whose writes have finished.
+
+    A file is deemed complete once its size and modification time have been unchanged for settle_seconds. Each file
+    is only reported once, unless it is retried after it failed to load, in which case it is reported again after a
+    backoff that doubles with each failure.
+    """
+
+    def __init__(self, folder, settle_seconds=DEFAULT_SETTLE_SECONDS, retry_seconds=DEFAULT_RETRY_SECONDS):
+        """
+        :param folder: Folder to watch.
+        :param settle_seconds: Number of seconds a file must be unchanged before it is deemed complete.
+        :param retry_seconds: Number of seconds before a file that failed to load is first reported again.
+        """
+
+        assert settle_seconds >= 0
+        assert retry_seconds >= 0
+
+        self.folder = folder
+        self.settle_seconds = settle_seconds
+        self.retry_seconds = retry_seconds
+
+        self._pending = {}
+        self._reported = set()
+
+        # File path to (number of failures, monotonic time before which it isn't reported again)
+        self._retries = {}
+
+    def ignore(self, file_paths):
+        """
+        Don't report files (e.g. ones that have already been loaded).
+
+        :param file_paths: Iterable of file paths.
+        """
+
+        for file_path in file_paths:
+            self._reported.add(file_path)
+            self._pending.pop(file_path, None)
+
+    def retry(self, file_paths, now=None):
+        """
+        Report files again after a backoff (e.g. ones that failed to load).
+
+        :param file_paths: Iterable of file paths.
+        :param now: Current monotonic time in seconds (defaults to time.monotonic()).
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        for file_path in file_paths:
+            num_failures = self._retries.get(file_path, (0, now))[0] + 1
+            delay = min(MAX_RETRY_SECONDS, self.retry_seconds * 2 ** (num_failures - 1))
+            self._retries[file_path] = (num_failures, now + delay)
+            self._reported.discard(file_path)
+            module_logger.info("Retrying %s in %.1f s (failure %d)", file_path, delay, num_failures)
+
+    def poll(self, now=None):
+        """
+        Scan the folder for the files that have completed since the last poll.
+
+        :param now: Current monotonic time in seconds (defaults to time.monotonic()).
+        :return: Sorted list of the completed file paths.
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        states = scan_folder(self.folder)
+        completed = []
+        for file_path, state in states.items():
+            if file_path in self._reported:
+                continue
+            if file_path in self._retries and now < self._retries[file_path][1]:
+                continue
+
+            # Restart the clock whenever the file changes
+            previous = self._pending.get(file_path)
+            if previous is None or previous[0] != state:
+                self._pending[file_path] = (state, now)
+            elif now - previous[1] >= self.settle_seconds:
+                completed.append(file_path)
+
+        # Forget the files that were removed before they completed (or were retried)
+        for file_path in list(self._pending.keys()):
+            if file_path not in states:
+                del self._pending[file_path]
+        for file_path in list(self._retries.keys()):
+            if file_path not in states:
+                del self._retries[file_path]
+
+        self.ignore(completed)
+        return sorted(completed)
+
+
+def widen_schema(schema, new_schema):
+    """
+    Widen a table's schema to hold the values of new files.
+
+    :param schema: Dictionary of field name to type of the table.
+    :param new_schema: Dictionary of field name to type inferred from the new files.
+    :return: Tuple of (widened schema, dictionary of field name to type of the columns that changed).
+    """
+
+    if list(schema.keys()) != list(new_schema.keys()):
+        raise ValueError("Fields %s don't match the fields of the table: %s" % (list(new_schema.keys()),
+                                                                              list(schema.keys())))
+
+    widened = merge_field_types(schema, new_schema)
+    changed = dict([(name, tpe) for name, tpe in widened.items() if tpe != schema[name]])
+
+    return widened, changed
+
+
+class IngestDaemon(object):
+    """
+    Loads the CSV files dropped into a folder as their writes finish (MariaDB backend).
+
+    The files found in each poll are grouped into tables by their filename. A single database connection is kept
+    open between loads and the schema of each table is cached, so only the new files are inferred (widening the
+    table's columns if needed) and appended. The progress through each file is checkpointed, so a restarted daemon
+    skips the files that have already been loaded and resumes the ones that were interrupted.
+    """
+
+    def __init__(self, folder, delimiter, encapsulator, encoding, true_values, false_values, db_params,
+                 poll_interval=DEFAULT_POLL_INTERVAL, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 batch_size=DEFAULT_BATCH_SIZE, inference_params=None, reject_params=None, widen=True,
+                 column_params=None):
+        """
+        :param folder: Folder to watch.
+        :param delimiter: Delimiter in the CSV files.
+        :param encapsulator: Encapsulator in the CSV files.
+        :param encoding: Encoding of the CSV files.
+        :param true_values: Values deemed True.
+        :param false_values: Values deemed False.
+        :param db_params: Dictionary of database parameters.
+        :param poll_interval: Number of seconds between scans of the folder.
+        :param settle_seconds: Number of seconds a file must be unchanged before it is loaded.
+        :param batch_size: Maximum number of rows per INSERT statement and transaction.
+        :param inference_params: Dictionary of extended inference parameters (None for the basic inference).
+        :param reject_params: Dictionary of parameters to quarantine the bad rows ('path' and 'max-error-rate'), or
+            None to fail the file on the first bad row.
+        :param widen: Infer the schema of the new files of a known table and widen its columns? If False, the cached
+            schema is used as is.
+        :param column_params: Dictionary of the columns to load ('include' and 'exclude', lists of field names), or
+            None to load all of the columns.
+        """
+
+        # Preconditions
+        assert poll_interval > 0
+
+        self.delimiter = delimiter
+        self.encapsulator = encapsulator
+        self.encoding = encoding
+        self.true_values = true_values
+        self.false_values = false_values
+        self.db_params = db_params
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.inference_params = inference_params
+        self.reject_params = reject_params
+        self.widen = widen
+        self.column_params = column_params
+
+        self.watcher = FileWatcher(folder, settle_seconds)
+        self.schemas = {}
+        self.metrics = LoadMetrics()
+        self.num_files_loaded = 0
+
+        self._connection = None
+        self._stop = threading.Event()
+
+    def connection(self):
+        """
+        Get the warm database connection, reconnecting if it has been lost.
+
+        :return: Database connection.
+        """
+
+        if self._connection is not None:
+            try:
+                self._connection.ping(reconnect=True)
+                return self._connection
+            except database_errors():
+                module_logger.warning("Lost the database connection, reconnecting")
+
+        self._connection = database_utilities.build_database_connection(self.db_params)
+        return self._connection
+
+    def _table_state(self, cursor, table_name):
+        """Get the cached (or recorded) schema of a table and the checkpoints of its files."""
+
+        file_checkpoints = checkpoints.load_file_checkpoints(cursor, table_name)
+        if table_name not in self.schemas:
+            schema, _ = checkpoints.load_table_state(cursor, table_name)
+            if schema is not None:
+                self.schemas[table_name] = schema
+
+        return self.schemas.get(table_name), file_checkpoints
+
+    def load_files(self, table_name, files):
+        """
+        Append files to a table, creating the table or widening its columns as needed.
+
+        :param table_name: Table name.
+        :param files: List of files.
+        :return: Number of rows inserted.
+        """
+
+        mydb = self.connection()
+        cursor = mydb.cursor()
+        schema, file_checkpoints = self._table_state(cursor, table_name)
+        files = [f for f in files if f not in file_checkpoints or not file_checkpoints[f].complete]
+        if len(files) == 0:
+            cursor.close()
+            return 0
+
+        if schema is None or self.widen:
+            new_schema = build_schema_from_files(files, self.delimiter, self.encapsulator, self.encoding,
+                                                 self.true_values, self.false_values, self.metrics, table_name,
+                                                 inference_params=self.inference_params,
+                                                 column_params=self.column_params)
+
+            if schema is None:
+                schema = new_schema
+                database_utilities.create_table(self.db_params, table_name, schema)
+                checkpoints.save_schema(cursor, table_name, schema)
+                mydb.commit()
+            else:
+                schema, changed = widen_schema(schema, new_schema)
+                if len(changed) > 0:
+                    stmt = alter_table_statement(table_name, changed)
+                    module_logger.info("Widening table %s with: %s", table_name, stmt)
+                    cursor.execute(stmt)
+                    checkpoints.save_schema(cursor, table_name, schema)
+                    mydb.commit()
+            self.schemas[table_name] = schema
+        cursor.close()
+
+        rejects = None
+        if self.reject_params is not None:
+            rejects = RejectWriter(self.reject_params.get('path', DEFAULT_REJECT_PATH), table_name,
+                                   self.reject_params.get('max-error-rate', DEFAULT_MAX_ERROR_RATE), append=True)
+            rejects.discard_replayed(files, file_checkpoints)
+
+        try:
+            num_rows = insert_data_from_files(files, self.delimiter, self.encapsulator, self.encoding,
+                                              self.db_params, table_name, schema, self.true_values, self.false_values,
+                                              self.metrics, self.batch_size, True, file_checkpoints,
+                                              self.inference_params, rejects=rejects, connection=mydb,
+                                              column_params=self.column_params)
+            if rejects is not None:
+                rejects.check_error_rate(final=True)
+        finally:
+            if rejects is not None:
+                rejects.close()
+
+        return num_rows
+
+    def poll(self):
+        """
+        Load the files that have completed since the last poll.
+
+        :return: Number of files loaded.
+        """
+
+        try:
+            completed = self.watcher.poll()
+        except OSError:
+            # e.g. the folder is on a share that is briefly unavailable
+            module_logger.exception("Failed to scan folder %s", self.watcher.folder)
+            return 0
+
+        table_name_to_files = {}
+        for file_path in completed:
+            table_name_to_files.setdefault(table_name_from_filename(file_path), []).append(file_path)
+
+        num_files = 0
+        for table_name, files in table_name_to_files.items():
+            start = time.perf_counter()
+            try:
+                num_rows = self.load_files(table_name, files)
+            except (ValueError, OSError) + database_errors():
+                # The files are retried after a backoff, resuming from their checkpoints
+                module_logger.exception("Failed to load files %s into table %s", files, table_name)
+                self.watcher.retry(files)
+                continue
+
+            module_logger.info("Loaded %d rows from %d files into table %s in %.3f s", num_rows, len(files),
+                               table_name, time.perf_counter() - start)
+            num_files += len(files)
+
+        self.num_files_loaded += num_files
+        return num_files
+
+    def run(self, max_polls=None):
+        """
+        Watch the folder until stop() is called.
+
+        :param max_polls: Maximum number of polls (if None, run until stopped).
+        """
+
+        module_logger.info("Watching folder %s every %.1f s", self.watcher.folder, self.poll_interval)
+        database_utilities.create_database(self.db_params)
+
+        mydb = self.connection()
+        cursor = mydb.cursor()
+        checkpoints.create_state_tables(cursor)
+        mydb.commit()
+        cursor.close()
+
+        num_polls = 0
+        while not self._stop.is_set() and (max_polls is None or num_polls < max_polls):
+            self.poll()
+            num_polls += 1
+            self._stop.wait(self.poll_interval)
+
+        self.close()
+        module_logger.info("Stopped watching folder %s (%d files loaded)", self.watcher.folder,
+                           self.num_files_loaded)
+
+    def stop(self):
+        """Stop watching the folder (e.g. from a signal handler or another thread)."""
+
+        self._stop.set()
+
+    def close(self):
+        """Close the database connection."""
+
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -1,12 +1,92 @@
+import atexit
+import contextlib
+import datetime
+import decimal
+import enum
 import logging
+import logging.handlers
+import queue
+import time
 
+# Queue listeners of the loggers initialised in asynchronous mode (logger name to listener)
+_listeners = {}
 
-def initialise_logger(logger_name, log_level=logging.INFO):
-    """Initialise the logger."""
+# Types of the logging arguments that can't change before the listener formats the message
+IMMUTABLE_TYPES = (str, bytes, int, float, complex, bool, type(None), decimal.Decimal, datetime.date, datetime.time,
+                   datetime.timedelta, enum.Enum)
+
+
+def is_immutable(value):
+    """
+    Can a logging argument be formatted later with the same result?
+
+    :param value: Logging argument.
+    :return: True if the value (and any value it holds) is immutable.
+    """
+
+    if isinstance(value, (tuple, frozenset)):
+        return all([is_immutable(item) for item in value])
+
+    return isinstance(value, IMMUTABLE_TYPES)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves the formatting of a record to the listener thread.
+
+    The standard QueueHandler formats the message in the calling thread, which is the cost we want to move off the
+    hot path. The records are passed between threads of the same process, so they don't need to be made picklable.
+    A record with a mutable argument (e.g. a list or dict.keys()) is formatted eagerly, as the argument could change
+    before the listener formats it.
+    """
+
+    def prepare(self, record):
+        args = record.args.values() if isinstance(record.args, dict) else record.args
+        if args and not all([is_immutable(arg) for arg in args]):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def stop_listener(logger_name):
+    """
+    Stop the queue listener of a logger (if it has one), flushing any queued records.
+
+    :param logger_name: Name of the logger.
+    """
+
+    listener = _listeners.pop(logger_name, None)
+    if listener is not None:
+        listener.stop()
+
+
+def stop_all_listeners():
+    """Stop all of the queue listeners, flushing any queued records."""
+
+    for logger_name in list(_listeners.keys()):
+        stop_listener(logger_name)
+
+
+atexit.register(stop_all_listeners)
+
+
+def initialise_logger(logger_name, log_level=logging.INFO, asynchronous=False):
+    """
+    Initialise the logger.
+
+    While the logger is in asynchronous mode, it is left as it is (apart from its level), so that the modules that
+    initialise the logger when they are first imported don't revert it to synchronous mode (see asynchronous_logging).
+
+    :param logger_name: Name of the logger.
+    :param log_level: Logging level.
+    :param asynchronous: If True, records are put on a queue and written by a background thread.
+    """
 
     # Create a logger for the application
     logger = logging.getLogger(logger_name)
     logger.setLevel(log_level)
+    if logger_name in _listeners:
+        return
 
     # Create a file handler
     fh = logging.FileHandler('./logs/loader.log')
@@ -22,7 +102,96 @@ def initialise_logger(logger_name, log_level=logging.INFO):
 
     # Clear the handlers and add the logging handlers
     logger.handlers = []
-    logger.addHandler(ch)
-    logger.addHandler(fh)
+    if asynchronous:
+        log_queue = queue.Queue()
+        listener = logging.handlers.QueueListener(log_queue, ch, fh, respect_handler_level=True)
+        listener.start()
+        _listeners[logger_name] = listener
+        logger.addHandler(LazyQueueHandler(log_queue))
+    else:
+        logger.addHandler(ch)
+        logger.addHandler(fh)
 
     logger.info("Logging initialised")
+
+
+@contextlib.contextmanager
+def asynchronous_logging(logger_names, log_level=logging.INFO, enabled=True):
+    """
+    Context manager to switch loggers to asynchronous mode, reverting to synchronous logging (after flushing the
+    queued records) on exit.
+
+    :param logger_names: Names of the loggers.
+    :param log_level: Logging level.
+    :param enabled: If False, the loggers are left unchanged.
+    """
+
+    if not enabled:
+        yield
+        return
+
+    for logger_name in logger_names:
+        initialise_logger(logger_name, log_level, asynchronous=True)
+
+    try:
+        yield
+    finally:
+        for logger_name in logger_names:
+            stop_listener(logger_name)
+            initialise_logger(logger_name, log_level)
+
+
+class ProgressReporter(object):
+    """
+    Reports progress every N rows or T seconds (whichever comes first) instead of logging per event.
+
+    The per-row cost of update() is an integer addition and comparison; the clock is only read every CHECK_INTERVAL
+    rows, so the logging overhead is bounded regardless of the number of rows.
+    """
+
+    # Maximum number of rows between checks of the clock
+    CHECK_INTERVAL = 1000
+
+    def __init__(self, logger, description, every_rows=100000, every_seconds=10.0):
+        assert every_rows > 0
+        assert every_seconds > 0
+
+        self.logger = logger
+        self.description = description
+        self.every_rows = every_rows
+        self.every_seconds = every_seconds
+
+        self.count = 0
+        self.start_time = time.monotonic()
+        self._last_time = self.start_time
+        self._last_count = 0
+        self._next_check = min(every_rows, self.CHECK_INTERVAL)
+
+    def update(self, num_rows=1):
+        """
+        Record processed rows, logging the progress if it is due.
+
+        :param num_rows: Number of rows processed.
+        """
+
+        self.count += num_rows
+        if self.count >= self._next_check:
+            self._check()
+
+    def _check(self):
+        """Log the progress if enough rows have been processed or enough time has elapsed."""
+
+        now = time.monotonic()
+        if self.count - self._last_count >= self.every_rows or now - self._last_time >= self.every_seconds:
+            self.logger.info("%s: %d rows (%.1f rows/s)", self.description, self.count,
+                             (self.count - self._last_count) / max(now - self._last_time, 1e-9))
+            self._last_time = now
+            self._last_count = self.count
+
+        self._next_check = self.count + min(self.every_rows, self.CHECK_INTERVAL)
+
+    def finish(self):
+        """Log the final count."""
+
+        elapsed = time.monotonic() - self.start_time
+        self.logger.info("%s: finished, %d rows in %.3f s", self.description, self.count, elapsed)
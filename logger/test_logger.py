@@ -0,0 +1,64 @@
+import logging
+
+from logger.logger import initialise_logger, asynchronous_logging, ProgressReporter, LazyQueueHandler, _listeners
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_progress_reporter_every_rows():
+    test_logger = logging.getLogger("test-progress")
+    test_logger.propagate = False
+    handler = ListHandler()
+    test_logger.handlers = [handler]
+    test_logger.setLevel(logging.INFO)
+
+    progress = ProgressReporter(test_logger, "Test", every_rows=10, every_seconds=3600)
+    for _ in range(25):
+        progress.update()
+    progress.finish()
+
+    assert len(handler.messages) == 3
+    assert handler.messages[0].startswith("Test: 10 rows")
+    assert handler.messages[1].startswith("Test: 20 rows")
+    assert handler.messages[2].startswith("Test: finished, 25 rows")
+
+
+def test_initialise_logger_asynchronous():
+    test_logger = logging.getLogger("test-async")
+
+    with asynchronous_logging(["test-async"]):
+        assert "test-async" in _listeners
+        assert isinstance(test_logger.handlers[0], LazyQueueHandler)
+
+        # A module imported during the load initialises the logger again, which leaves it asynchronous
+        initialise_logger("test-async")
+        assert "test-async" in _listeners
+        assert len(test_logger.handlers) == 1 and isinstance(test_logger.handlers[0], LazyQueueHandler)
+
+    # The logger reverts to synchronous mode on exit
+    assert "test-async" not in _listeners
+    assert not isinstance(test_logger.handlers[0], LazyQueueHandler)
+
+
+def test_lazy_queue_handler_formats_mutable_arguments():
+    handler = LazyQueueHandler(None)
+
+    def prepare(*args):
+        return handler.prepare(logging.LogRecord("test", logging.INFO, __file__, 1, "Values %s %s", args, None))
+
+    # Immutable arguments are left to the listener ...
+    record = prepare("a", (1, 2.5))
+    assert (record.msg, record.args) == ("Values %s %s", ("a", (1, 2.5)))
+
+    # ... but the message of a mutable argument is formatted before the argument can change
+    values = {"ID": 1}
+    record = prepare(1, values.keys())
+    values["Own"] = 2
+    assert (record.getMessage(), record.args) == ("Values 1 dict_keys(['ID'])", None)